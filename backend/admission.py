@@ -0,0 +1,276 @@
+"""
+Admission control: per-route-class concurrency limits, bounded queues and per-client rate limits
+
+Requests are sorted into classes (reads, writes, files) that each admit a
+limited number of requests at once; the rest wait in a short FIFO queue. A
+request that cannot get a slot within its class's max wait, or would not by
+the current estimate, is rejected at once with 503 and Retry-After instead of
+piling up on the Mongo pool. Limits shrink while observed Mongo command
+latency is over target and grow back while it is under (AIMD), never beyond
+the configured limit. Clients over their token-bucket rate get 429.
+"""
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Optional
+
+from pymongo import monitoring
+
+from metrics import ADMISSION_LIMIT, ADMISSION_QUEUED, ADMISSION_REJECTED
+
+ROUTE_CLASSES = ("reads", "writes", "files")
+DEFAULT_LIMITS = {"reads": 64, "writes": 32, "files": 8}
+DEFAULT_QUEUE_SIZE = 128
+DEFAULT_MAX_WAIT = 1.0
+DEFAULT_TARGET_LATENCY = 0.05
+ADJUST_INTERVAL = 1.0
+DECREASE_FACTOR = 0.8
+MAX_TRACKED_CLIENTS = 10_000
+# Commands that reflect load on the server; getMore on change streams blocks by design
+TRACKED_COMMANDS = {"find", "insert", "update", "delete", "findAndModify", "aggregate", "count", "distinct"}
+
+
+def parse_limits(spec: Optional[str]) -> dict:
+    """Parse "reads=64,writes=32,files=8" into per-class concurrency limits"""
+    limits = dict(DEFAULT_LIMITS)
+    for part in (spec or "").split(","):
+        if not part.strip():
+            continue
+        route_class, _, limit = part.partition("=")
+        if route_class.strip() not in ROUTE_CLASSES:
+            raise ValueError(f"Unknown route class {route_class.strip()!r}")
+        limits[route_class.strip()] = int(limit)
+    return limits
+
+
+def route_class(method: str, path: str) -> Optional[str]:
+    """Class of an API request, or None for requests that are never limited"""
+    # Readiness probes must see the server's real state, not a shed response
+    if not path.startswith("/api/") or path == "/api/ready":
+        return None
+    if path.startswith(("/api/upload", "/api/download/")) or path.endswith("/import"):
+        return "files"
+    if method in ("GET", "HEAD"):
+        return "reads"
+    return "writes"
+
+
+class MongoLatencyTracker(monitoring.CommandListener):
+    """Mean Mongo command latency since the last take(); fed from pymongo's threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._total = 0.0
+        self._count = 0
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._observe(event)
+
+    def failed(self, event):
+        self._observe(event)
+
+    def _observe(self, event):
+        if event.command_name in TRACKED_COMMANDS:
+            with self._lock:
+                self._total += event.duration_micros / 1e6
+                self._count += 1
+
+    def take(self) -> Optional[float]:
+        with self._lock:
+            total, count = self._total, self._count
+            self._total, self._count = 0.0, 0
+        return total / count if count else None
+
+
+class ConcurrencyLimiter:
+    """At most `limit` requests at once; up to queue_size more wait in FIFO order"""
+
+    def __init__(self, name: str, limit: int, queue_size: int = DEFAULT_QUEUE_SIZE, max_wait: float = DEFAULT_MAX_WAIT):
+        self.name = name
+        self.max_limit = limit
+        self.min_limit = max(1, limit // 4)
+        self.limit = float(limit)
+        self.queue_size = queue_size
+        self.max_wait = max_wait
+        self.in_flight = 0
+        # Moving average of how long an admitted request holds its slot
+        self.service_time: Optional[float] = None
+        self._waiters = deque()
+        self._limit_gauge = ADMISSION_LIMIT.labels(name)
+        self._queued_gauge = ADMISSION_QUEUED.labels(name)
+        self._limit_gauge.set(limit)
+
+    @property
+    def capacity(self) -> int:
+        return int(self.limit)
+
+    def estimated_wait(self) -> float:
+        if self.service_time is None:
+            return 0.0
+        return (len(self._waiters) + 1) * self.service_time / self.capacity
+
+    async def acquire(self) -> Optional[str]:
+        """None once admitted, else why the request was rejected ("queue_full" or "deadline")"""
+        if self.in_flight < self.capacity and not self._waiters:
+            self.in_flight += 1
+            return None
+        if len(self._waiters) >= self.queue_size:
+            return "queue_full"
+        if self.estimated_wait() > self.max_wait:
+            return "deadline"
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self._queued_gauge.inc()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.max_wait)
+            return None
+        except asyncio.TimeoutError:
+            if waiter.done():
+                return None
+            return "deadline"
+        except asyncio.CancelledError:
+            if waiter.done():
+                # The slot was handed over just as the client went away
+                self.release(None)
+            raise
+        finally:
+            self._queued_gauge.dec()
+            if not waiter.done():
+                waiter.cancel()
+                self._waiters.remove(waiter)
+
+    def release(self, service_time: Optional[float]):
+        if service_time is not None:
+            self.service_time = service_time if self.service_time is None else (
+                0.9 * self.service_time + 0.1 * service_time
+            )
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self.in_flight < self.capacity:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def adjust(self, latency: float, target: float):
+        """Shrink on slow Mongo; grow by one while saturated and Mongo is fast"""
+        if latency > target:
+            self.limit = max(self.min_limit, self.limit * DECREASE_FACTOR)
+        elif self.in_flight >= self.capacity or self._waiters:
+            self.limit = min(self.max_limit, self.limit + 1)
+            self._wake()
+        self._limit_gauge.set(self.capacity)
+
+
+class ClientRateLimiter:
+    """Token bucket per client: `rate` requests per second, bursts of up to `burst`"""
+
+    def __init__(self, rate: float, burst: float, max_clients: int = MAX_TRACKED_CLIENTS):
+        self.rate = rate
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+
+    def wait_time(self, client: str) -> float:
+        """0 if the request may go ahead (and take a token), else seconds until a token is free"""
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+        wait = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            wait = (1 - tokens) / self.rate
+        self._buckets[client] = (tokens, now)
+        if len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+        return wait
+
+
+class AdmissionMiddleware:
+    """Pure ASGI middleware applying the class limits and client rate limits to /api requests"""
+
+    def __init__(
+        self,
+        app,
+        limits: Optional[dict] = None,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+        max_wait: float = DEFAULT_MAX_WAIT,
+        client_rate: Optional[float] = None,
+        client_burst: Optional[float] = None,
+        latency_tracker: Optional[MongoLatencyTracker] = None,
+        target_latency: float = DEFAULT_TARGET_LATENCY,
+    ):
+        self.app = app
+        self.limiters = {
+            name: ConcurrencyLimiter(name, limit, queue_size, max_wait)
+            for name, limit in (limits or DEFAULT_LIMITS).items()
+        }
+        self.clients = ClientRateLimiter(client_rate, client_burst or client_rate) if client_rate else None
+        self.latency_tracker = latency_tracker
+        self.target_latency = target_latency
+        self._next_adjust = time.monotonic() + ADJUST_INTERVAL
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        name = route_class(scope["method"], scope["path"])
+        limiter = self.limiters.get(name)
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+
+        if self.clients:
+            client = scope.get("client")
+            wait = self.clients.wait_time(client[0] if client else "")
+            if wait:
+                ADMISSION_REJECTED.labels(name, "rate_limited").inc()
+                await reject(send, 429, "Too many requests from this client", wait)
+                return
+
+        self._maybe_adjust()
+        rejected = await limiter.acquire()
+        if rejected:
+            ADMISSION_REJECTED.labels(name, rejected).inc()
+            await reject(send, 503, "Server is busy, retry shortly", max(limiter.estimated_wait(), 1.0))
+            return
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release(time.perf_counter() - started)
+
+    def _maybe_adjust(self):
+        if self.latency_tracker is None:
+            return
+        now = time.monotonic()
+        if now < self._next_adjust:
+            return
+        self._next_adjust = now + ADJUST_INTERVAL
+        latency = self.latency_tracker.take()
+        if latency is not None:
+            for limiter in self.limiters.values():
+                limiter.adjust(latency, self.target_latency)
+
+
+async def reject(send, status: int, detail: str, retry_after: float):
+    body = f'{{"detail":"{detail}"}}'.encode()
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(math.ceil(retry_after)).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,46 @@
+"""
+Script to add search keys to reimbursement records stored before search existed
+
+Records without ``search_keys`` and ``search_rank_keys`` are invisible to
+/api/reimbursement/search; this fills them in batches and can be re-run
+safely.
+
+Usage: python backfill_search_keys.py [--batch-size 1000]
+"""
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent))
+
+import typer
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from indexes import ensure_indexes
+from search import backfill_search_keys
+
+# Load environment variables
+load_dotenv(Path(__file__).parent / '.env')
+
+
+def main(batch_size: int = typer.Option(1000, help="Records per bulk_write")):
+    """Compute the search fields for every record that has none and build the search indexes"""
+
+    async def run():
+        client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+        db = client[os.environ['DB_NAME']]
+        try:
+            started = time.perf_counter()
+            updated = await backfill_search_keys(db.reimbursement_records, batch_size)
+            await ensure_indexes(db)
+            typer.echo(f"Added search keys to {updated} records in {time.perf_counter() - started:.1f}s")
+        finally:
+            client.close()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    typer.run(main)
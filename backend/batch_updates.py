@@ -0,0 +1,202 @@
+"""
+Batch edits of reimbursement records: many partial updates in one unordered bulk_write
+
+The records' pre-images are read in one query. Each update is then guarded
+by the version it was read at, so an edit that races another writer is
+reported as a conflict instead of overwriting it. The pre-images also give
+the summary deltas and new search keys without another read.
+"""
+import logging
+from datetime import datetime
+from typing import Optional
+
+from pydantic import ValidationError
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from models import MAX_BATCH_UPDATES, ReimbursementCreate, ReimbursementRecord
+from search import SEARCH_FIELDS, search_fields, touches_search_fields
+from summaries import SUMMED_FIELDS, mark_summaries_stale
+
+logger = logging.getLogger(__name__)
+
+EDITABLE_FIELDS = set(ReimbursementCreate.model_fields)
+FILTER_FIELDS = set(ReimbursementRecord.model_fields) - {"created_at", "updated_at"}
+# What summary deltas and search keys need from a record's pre-image
+PRE_IMAGE_PROJECTION = {
+    "_id": 0,
+    "id": 1,
+    "version": 1,
+    **{f"{base}_{side}": 1 for base in ("state", "city_assigned", *SEARCH_FIELDS) for side in ("excel", "user")},
+    **{f"{name}_user": 1 for name in SUMMED_FIELDS},
+}
+
+
+class BatchAborted(Exception):
+    """Raised inside a transaction to roll back a batch in which some update failed"""
+
+    def __init__(self, results: list):
+        super().__init__("Batch rolled back")
+        self.results = results
+
+
+class TooManyMatches(Exception):
+    pass
+
+
+def validate_fields(fields: dict) -> tuple:
+    """(the $set for a partial update, None), or (None, why it is invalid)"""
+    unknown = sorted(set(fields) - EDITABLE_FIELDS)
+    if unknown:
+        return None, f"Fields cannot be edited: {', '.join(unknown)}"
+    if not fields:
+        return None, "No data provided for update"
+    try:
+        return ReimbursementCreate.model_validate(fields).model_dump(exclude_unset=True), None
+    except ValidationError as e:
+        return None, "; ".join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors())
+
+
+def prepare_updates(updates: list) -> list:
+    """Validated items for apply_updates from BatchUpdate requests; a repeated id is invalid"""
+    items, seen = [], set()
+    for update in updates:
+        fields, error = validate_fields(update.fields)
+        if error is None and update.id in seen:
+            error = "Record appears more than once in the batch"
+        seen.add(update.id)
+        if error:
+            items.append({"id": update.id, "error": error})
+        else:
+            items.append({"id": update.id, "set": fields, "version": update.version})
+    return items
+
+
+def record_query(filter: dict) -> dict:
+    """Mongo filter from {field: value or [values]} equality conditions on record fields"""
+    if not filter:
+        raise ValueError("filter must name at least one field")
+    query = {}
+    for name, value in filter.items():
+        if name not in FILTER_FIELDS:
+            raise ValueError(f"Cannot filter on {name!r}")
+        if isinstance(value, dict) or (isinstance(value, list) and any(isinstance(v, (dict, list)) for v in value)):
+            raise ValueError(f"Filter on {name!r} must be a value or a list of values")
+        query[name] = {"$in": value} if isinstance(value, list) else value
+    return query
+
+
+async def read_pre_images(collection, query: dict, session=None, limit: int = 0) -> dict:
+    """Pre-images of the records matching query, by id"""
+    cursor = collection.find(query, PRE_IMAGE_PROJECTION, session=session, limit=limit)
+    return {document["id"]: document async for document in cursor}
+
+
+async def matching_updates(collection, query: dict, fields: dict, session=None) -> tuple:
+    """(items, pre-images) that apply one $set to every record matching query"""
+    pre_images = await read_pre_images(collection, query, session, limit=MAX_BATCH_UPDATES + 1)
+    if len(pre_images) > MAX_BATCH_UPDATES:
+        raise TooManyMatches(f"filter matches more than {MAX_BATCH_UPDATES} records")
+    return [{"id": record_id, "set": fields} for record_id in pre_images], pre_images
+
+
+async def apply_updates(collection, items: list, session=None, pre_images: Optional[dict] = None) -> tuple:
+    """Apply validated items in one unordered bulk_write.
+
+    Returns the per-item results, in item order, and the (before, after)
+    pairs of the records that were updated. Pass pre_images (by id) when the
+    caller already read them.
+    """
+    if pre_images is None:
+        ids = [item["id"] for item in items if "set" in item]
+        pre_images = await read_pre_images(collection, {"id": {"$in": ids}}, session)
+    # Millisecond precision, so it compares equal to the stored value
+    now = datetime.utcnow()
+    now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+    results, operations, pending = [], [], []
+    for item in items:
+        record_id = item["id"]
+        before = pre_images.get(record_id)
+        if "error" in item:
+            results.append({"id": record_id, "status": "invalid", "error": item["error"]})
+            continue
+        if before is None:
+            results.append({"id": record_id, "status": "not_found", "error": "Record not found"})
+            continue
+        version = before.get("version") or 0
+        if item.get("version") is not None and item["version"] != version:
+            results.append({"id": record_id, "status": "conflict", "error": "Record was modified by another request"})
+            continue
+        after = {**before, **item["set"], "version": version + 1}
+        update = {**item["set"], "updated_at": now}
+        if touches_search_fields(item["set"]):
+            update.update(search_fields(after))
+        # Records written before versioning have no version field
+        operations.append(UpdateOne(
+            {"id": record_id, "version": before.get("version")}, {"$set": update, "$inc": {"version": 1}}
+        ))
+        result = {"id": record_id, "status": "updated", "version": version + 1}
+        results.append(result)
+        pending.append((result, before, after))
+
+    if operations:
+        try:
+            matched = (await collection.bulk_write(operations, ordered=False, session=session)).matched_count
+        except BulkWriteError as e:
+            matched = e.details.get("nMatched", 0)
+            for write_error in e.details.get("writeErrors", []):
+                result = pending[write_error["index"]][0]
+                result.update(status="error", error=write_error.get("errmsg", "Write error"))
+                del result["version"]
+        written = [entry for entry in pending if entry[0]["status"] == "updated"]
+        if matched < len(written):
+            await _find_conflicts(collection, written, matched, now, session)
+
+    changes = [(before, after) for result, before, after in pending if result["status"] == "updated"]
+    return results, changes
+
+
+async def _find_conflicts(collection, written: list, matched: int, now: datetime, session=None):
+    """Mark the updates whose version guard matched nothing, i.e. lost a race with another writer.
+
+    The bulk_write result only has totals, so the records are read back. A
+    record at our new version with our updated_at is ours; one at our new
+    version with another updated_at, or gone, lost the race. A record past
+    our new version was changed again after one write, which may or may not
+    have been ours: the count of guards that matched nothing settles it
+    unless both kinds are left, in which case those records are reported as
+    conflicts (retrying a $set is harmless) and the summaries are marked for
+    a rebuild, since their deltas cannot be told apart.
+    """
+    ids = [result["id"] for result, _, _ in written]
+    current = {
+        document["id"]: document
+        async for document in collection.find(
+            {"id": {"$in": ids}}, {"_id": 0, "id": 1, "version": 1, "updated_at": 1}, session=session
+        )
+    }
+    lost, changed_again = [], []
+    for result, _, after in written:
+        document = current.get(result["id"], {})
+        version = document.get("version") or 0
+        if version > after["version"]:
+            changed_again.append(result)
+        elif version != after["version"] or document.get("updated_at") != now:
+            lost.append(result)
+    unmatched = len(written) - matched - len(lost)
+    if unmatched == len(changed_again):
+        lost.extend(changed_again)
+    elif unmatched > 0:
+        lost.extend(changed_again)
+        await mark_summaries_stale(
+            collection.database, f"Batch update could not tell which of {len(changed_again)} records it wrote"
+        )
+    for result in lost:
+        result.update(status="conflict", error="Record was modified by another request")
+        del result["version"]
+
+
+def summarize(results: list) -> dict:
+    updated = sum(1 for result in results if result["status"] == "updated")
+    return {"updated": updated, "failed": len(results) - updated, "results": results}
@@ -0,0 +1,135 @@
+"""
+Load test of admission control at 10x overload against a simulated MongoDB
+
+Mongo is simulated as a 100-connection pool in front of a server whose
+per-operation time grows with the operations it is running concurrently
+(base * (1 + active / knee)), so throughput saturates and latency climbs
+like a real mongod under too many concurrent writes. Requests arrive open-
+loop (Poisson) at --overload times the rate the server sustains at the
+target latency, and are sent straight to the ASGI middleware stack: once
+with no admission control and once with AdmissionMiddleware (adapting its
+limit from the simulated command latency). Reported latencies are for
+admitted requests only; shed requests are counted separately.
+Usage: python benchmarks/bench_admission.py [--duration 10] [--overload 10] [--base-ms 20] [--knee 4]
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import numpy as np
+
+from admission import AdmissionMiddleware, MongoLatencyTracker
+
+POOL_SIZE = 100
+
+
+class SimulatedMongo:
+    def __init__(self, base: float, knee: float, tracker: MongoLatencyTracker):
+        self.pool = asyncio.Semaphore(POOL_SIZE)
+        self.base = base
+        self.knee = knee
+        self.active = 0
+        self.tracker = tracker
+
+    async def insert(self):
+        async with self.pool:
+            self.active += 1
+            duration = self.base * (1 + self.active / self.knee)
+            await asyncio.sleep(duration)
+            self.active -= 1
+        self.tracker.succeeded(SimpleNamespace(command_name="insert", duration_micros=duration * 1e6))
+
+
+def save_app(mongo: SimulatedMongo):
+    async def app(scope, receive, send):
+        await mongo.insert()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+    return app
+
+
+async def request(app, latencies: list, shed: list):
+    status = None
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    scope = {"type": "http", "method": "POST", "path": "/api/reimbursement", "headers": [], "client": ("10.0.0.1", 1)}
+    started = time.perf_counter()
+    await app(scope, receive, send)
+    if status == 200:
+        latencies.append(time.perf_counter() - started)
+    else:
+        shed.append(status)
+
+
+async def run(args, admission: bool) -> dict:
+    tracker = MongoLatencyTracker()
+    mongo = SimulatedMongo(args.base_ms / 1000, args.knee, tracker)
+    app = save_app(mongo)
+    if admission:
+        app = AdmissionMiddleware(
+            app, limits={"writes": args.limit}, max_wait=args.max_wait_ms / 1000,
+            latency_tracker=tracker, target_latency=args.target_ms / 1000,
+        )
+    # Throughput at the target latency: active = knee * (target / base - 1)
+    sustainable = args.knee * (args.target_ms / args.base_ms - 1) / (args.target_ms / 1000)
+    rate = sustainable * args.overload
+    rng = random.Random(args.seed)
+    latencies, shed, tasks = [], [], []
+    started = time.perf_counter()
+    deadline = started + args.duration
+    next_arrival = time.perf_counter()
+    while next_arrival < deadline:
+        await asyncio.sleep(max(0.0, next_arrival - time.perf_counter()))
+        tasks.append(asyncio.ensure_future(request(app, latencies, shed)))
+        next_arrival += rng.expovariate(rate)
+    done, pending = await asyncio.wait(tasks, timeout=args.drain)
+    elapsed = time.perf_counter() - started
+    for task in pending:
+        task.cancel()
+    ms = np.asarray(latencies) * 1000
+    return {
+        "offered_rps": rate,
+        "admitted": len(latencies),
+        "shed": len(shed),
+        "unfinished": len(pending),
+        "goodput_rps": len(latencies) / elapsed,
+        "p50_ms": float(np.percentile(ms, 50)) if len(ms) else float("nan"),
+        "p99_ms": float(np.percentile(ms, 99)) if len(ms) else float("nan"),
+        "limit": app.limiters["writes"].capacity if admission else None,
+    }
+
+
+async def main(args):
+    for admission in (False, True):
+        result = await run(args, admission)
+        label = "admission control" if admission else "no admission control"
+        print(f"{label:<22} offered {result['offered_rps']:7.0f} req/s  admitted {result['admitted']:6}  "
+              f"shed {result['shed']:6}  unfinished {result['unfinished']:5}  goodput {result['goodput_rps']:6.0f} req/s  "
+              f"p50 {result['p50_ms']:8.1f} ms  p99 {result['p99_ms']:8.1f} ms"
+              + (f"  final limit {result['limit']}" if admission else ""))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Admission control under overload against a simulated MongoDB")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds of arrivals")
+    parser.add_argument("--overload", type=float, default=10.0, help="Offered load as a multiple of sustainable")
+    parser.add_argument("--base-ms", type=float, default=20.0, help="Operation time on an idle server")
+    parser.add_argument("--knee", type=float, default=4.0, help="Concurrent operations that double operation time")
+    parser.add_argument("--target-ms", type=float, default=50.0, help="Target Mongo latency for adaptation")
+    parser.add_argument("--limit", type=int, default=32, help="Configured writes concurrency limit")
+    parser.add_argument("--max-wait-ms", type=float, default=100.0, help="Longest queue wait before 503")
+    parser.add_argument("--drain", type=float, default=30.0, help="Seconds to wait for in-flight requests")
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,109 @@
+"""
+Benchmark PATCH /api/reimbursement/batch: 10k partial updates per request
+
+Loads --records synthetic records into a scratch database at MONGO_URL, then
+sends batches of --batch {id, fields} updates (touching a claim amount and,
+for every tenth record, the name so search keys are rebuilt) over ASGI, with
+and without a transaction, and one filter plus $set request. Reports the
+server-side seconds and updates/s of each. Transactions need a replica set
+(e.g. mongod --replSet rs0 and rs.initiate()); they are skipped otherwise.
+Exits with status 1 if the median plain batch is over --budget-ms.
+Usage: python benchmarks/bench_batch_update.py [--records 50000] [--batch 10000] [--budget-ms 1000]
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import httpx
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import server
+from settings import Settings
+from synthetic_data import generate_record_batch, generated_batches, insert_batches
+
+DB_NAME = "bench_batch_update"
+
+
+async def timed_batch(client, body: dict) -> dict:
+    response = await client.patch("/api/reimbursement/batch", json=body, timeout=120)
+    if response.status_code != 200:
+        raise RuntimeError(f"batch failed with {response.status_code}: {response.text[:500]}")
+    return response.json()
+
+
+def updates_for(ids: list, rng: random.Random) -> list:
+    return [
+        {"id": record_id, "fields": {
+            "refreshment_claim_user": round(rng.uniform(100, 5000), 2),
+            **({"name_user": f"Coordinator {rng.randrange(10**6)}"} if i % 10 == 0 else {}),
+        }}
+        for i, record_id in enumerate(ids)
+    ]
+
+
+async def main(args) -> int:
+    mongo_url = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+    mongo = AsyncIOMotorClient(mongo_url)
+    await mongo.drop_database(DB_NAME)
+    await insert_batches(
+        mongo[DB_NAME].reimbursement_records,
+        generated_batches(generate_record_batch, args.records, args.seed, 5000),
+        concurrency=4,
+    )
+    hello = await mongo.admin.command("hello")
+    transactions = "setName" in hello or hello.get("msg") == "isdbgrid"
+    ids = [document["id"] async for document in mongo[DB_NAME].reimbursement_records.find({}, {"id": 1})]
+
+    app = server.create_app(Settings(mongo_url, DB_NAME, admission_control=False))
+    rng = random.Random(args.seed)
+    failed = False
+    try:
+        async with app.router.lifespan_context(app):
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+                print(f"{args.records} records, {args.batch} updates per batch, median of {args.repeat}")
+                print(f"{'mode':<14} {'seconds':>8} {'updates/s':>10}")
+                modes = [("bulk", False)] + ([("transaction", True)] if transactions else [])
+                medians = {}
+                for name, transaction in modes:
+                    seconds = []
+                    for _ in range(args.repeat):
+                        body = {"updates": updates_for(rng.sample(ids, args.batch), rng), "transaction": transaction}
+                        result = await timed_batch(client, body)
+                        assert result["updated"] == args.batch, result["failed"]
+                        seconds.append(result["seconds"])
+                    medians[name] = statistics.median(seconds)
+                    print(f"{name:<14} {medians[name]:>8.3f} {args.batch / medians[name]:>10.0f}")
+                if not transactions:
+                    print("transaction    skipped: not a replica set")
+
+                city = (await mongo[DB_NAME].reimbursement_records.find_one(
+                    {"city_assigned_user": {"$ne": None}}, {"city_assigned_user": 1}
+                ))["city_assigned_user"]
+                result = await timed_batch(client, {"filter": {"city_assigned_user": city}, "set": {"bank_name_user": "SBI"}})
+                print(f"{'filter+$set':<14} {result['seconds']:>8.3f} {result['updated'] / max(result['seconds'], 1e-9):>10.0f}"
+                      f"  ({result['updated']} records)")
+
+                if medians["bulk"] * 1000 > args.budget_ms:
+                    print(f"Median batch {medians['bulk'] * 1000:.0f} ms is over the {args.budget_ms:.0f} ms budget")
+                    failed = True
+    finally:
+        if not args.keep:
+            await mongo.drop_database(DB_NAME)
+        mongo.close()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time 10k-update PATCH /api/reimbursement/batch requests")
+    parser.add_argument("--records", type=int, default=50_000)
+    parser.add_argument("--batch", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5, help="Batches per mode, median reported")
+    parser.add_argument("--budget-ms", type=float, default=1000.0, help="Budget for the median plain batch")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch database")
+    sys.exit(asyncio.run(main(parser.parse_args())))
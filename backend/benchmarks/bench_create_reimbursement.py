@@ -0,0 +1,108 @@
+"""
+Microbenchmark requests/s of POST /api/reimbursement, legacy path vs current
+
+Runs in-process over ASGI with Mongo stubbed out, so it measures validation and
+serialization only. The legacy handler reproduces the old four-pass flow
+(validate, dict, re-validate, dict, response_model re-serialization). The
+second table times just those passes, without the HTTP client and routing.
+Usage: python benchmarks/bench_create_reimbursement.py [requests]
+"""
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import logging
+import timeit
+
+import httpx
+import orjson
+from fastapi.encoders import jsonable_encoder
+
+import server
+from models import RECORD_SCHEMA, ReimbursementCreate, ReimbursementRecord, new_record_document
+from settings import MEMORY_MONGO_URL, Settings
+
+DEFAULT_REQUESTS = 5000
+
+
+class NullCollection:
+    async def insert_one(self, document):
+        document["_id"] = id(document)
+
+    async def bulk_write(self, operations, ordered=True):
+        pass
+
+
+class NullDatabase:
+    reimbursement_records = NullCollection()
+
+    def __getitem__(self, name):
+        return NullCollection()
+
+
+# The lifespan never runs, so Mongo is just the NullDatabase set in main
+app = server.create_app(Settings(MEMORY_MONGO_URL, "bench"))
+
+
+# Mounted on the same app so middleware and routing costs are identical
+@app.post("/legacy/reimbursement", response_model=ReimbursementRecord)
+async def legacy_create_reimbursement(input: ReimbursementCreate):
+    record_obj = ReimbursementRecord(**input.model_dump())
+    await NullCollection().insert_one(record_obj.model_dump())
+    return record_obj
+
+
+def full_payload() -> dict:
+    payload = {}
+    for _, fields in RECORD_SCHEMA:
+        for name, field_type in fields:
+            payload[f"{name}_user"] = {str: f"{name} value", int: 7, float: 1234.5}[field_type]
+    return payload
+
+
+async def measure(path: str, requests: int, payload: dict) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(100):
+            await client.post(path, json=payload)
+        started = time.perf_counter()
+        for _ in range(requests):
+            response = await client.post(path, json=payload)
+            assert response.status_code == 200
+        return requests / (time.perf_counter() - started)
+
+
+def legacy_passes(body: bytes) -> bytes:
+    data = ReimbursementCreate.model_validate_json(body)
+    record_obj = ReimbursementRecord(**data.model_dump())
+    record_obj.model_dump()
+    response = ReimbursementRecord.model_validate(record_obj.model_dump())
+    return json.dumps(jsonable_encoder(response)).encode()
+
+
+def current_passes(body: bytes) -> bytes:
+    document = new_record_document(ReimbursementCreate.model_validate_json(body))
+    return orjson.dumps(document)
+
+
+async def main(requests: int):
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    app.state.services.db = NullDatabase()
+    payload = full_payload()
+    legacy = await measure("/legacy/reimbursement", requests, payload)
+    current = await measure("/api/reimbursement", requests, payload)
+    print(f"legacy:  {legacy:8.0f} req/s")
+    print(f"current: {current:8.0f} req/s ({current / legacy:.2f}x)")
+
+    body = json.dumps(payload).encode()
+    legacy_us = min(timeit.repeat(lambda: legacy_passes(body), number=requests, repeat=3)) / requests * 1e6
+    current_us = min(timeit.repeat(lambda: current_passes(body), number=requests, repeat=3)) / requests * 1e6
+    print(f"legacy passes:  {legacy_us:6.1f} us/request")
+    print(f"current passes: {current_us:6.1f} us/request ({legacy_us / current_us:.2f}x)")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_REQUESTS))
@@ -0,0 +1,90 @@
+"""
+Benchmark download throughput with 100 concurrent clients
+
+Starts uvicorn on the app (needs MONGO_URL/DB_NAME for upload metadata, e.g. a
+local mongod) with a temporary UPLOADS_DIR, uploads one file through the API,
+then runs full and ranged downloads concurrently.
+Usage: python benchmarks/bench_downloads.py [--size-mb 8] [--concurrency 100] [--requests 1000]
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_until_up(client: httpx.AsyncClient, timeout: float = 15.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            await client.get("/api/")
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+async def run_downloads(client: httpx.AsyncClient, path: str, total: int, concurrency: int, headers=None):
+    semaphore = asyncio.Semaphore(concurrency)
+    received = 0
+
+    async def one():
+        nonlocal received
+        async with semaphore:
+            async with client.stream("GET", path, headers=headers) as response:
+                assert response.status_code in (200, 206), response.status_code
+                async for chunk in response.aiter_raw():
+                    received += len(chunk)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - started
+    return total / elapsed, received / elapsed / 1e6
+
+
+async def main(args):
+    port = free_port()
+    with tempfile.TemporaryDirectory() as uploads_dir:
+        env = {**os.environ, "UPLOADS_DIR": uploads_dir}
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "server:create_app", "--factory", "--port", str(port), "--log-level", "warning"],
+            cwd=BACKEND_DIR, env=env,
+        )
+        try:
+            limits = httpx.Limits(max_connections=args.concurrency)
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60) as client:
+                await wait_until_up(client)
+                payload = os.urandom(args.size_mb * 1024 * 1024)
+                response = await client.post("/api/upload", files={"file": ("bill.pdf", payload)})
+                response.raise_for_status()
+                path = f"/api/download/{response.json()['filename']}"
+
+                for label, headers in (("full", None), ("range 1MiB", {"Range": "bytes=0-1048575"})):
+                    rps, mbps = await run_downloads(client, path, args.requests, args.concurrency, headers)
+                    print(f"{label:>11}: {rps:8.1f} req/s {mbps:9.1f} MB/s "
+                          f"({args.concurrency} concurrent, {args.requests} requests)")
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=1000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,102 @@
+"""
+Microbenchmark the cost of MetricsMiddleware and the Mongo command listener
+
+Serves a small JSON route over ASGI with and without the middleware (slow-request
+log off and on), best of interleaved rounds, then times one started/succeeded
+listener pair and the middleware on its own.
+Usage: python benchmarks/bench_metrics_overhead.py [requests]
+"""
+import asyncio
+import sys
+import time
+import timeit
+from pathlib import Path
+from types import SimpleNamespace
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
+
+from metrics import CommandTimer, MetricsMiddleware
+
+DEFAULT_REQUESTS = 5000
+
+
+def build_app() -> FastAPI:
+    app = FastAPI(default_response_class=ORJSONResponse)
+
+    @app.get("/api/reimbursement/{record_id}")
+    async def read(record_id: str):
+        return {"id": record_id, "version": 1}
+
+    return app
+
+
+async def measure(app, requests: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(100):
+            await client.get("/api/reimbursement/abc")
+        started = time.perf_counter()
+        for _ in range(requests):
+            response = await client.get("/api/reimbursement/abc")
+            assert response.status_code == 200
+        return requests / (time.perf_counter() - started)
+
+
+async def middleware_us(requests: int, slow_request_seconds=None) -> float:
+    """Per-request cost of the middleware alone, around an app that does nothing"""
+    route = build_app().routes[-1]
+
+    async def bare_app(scope, receive, send):
+        scope["route"] = route
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def noop(message=None):
+        pass
+
+    async def per_request_us(app) -> float:
+        scope = {"type": "http", "method": "GET", "path": "/api/reimbursement/abc"}
+        started = time.perf_counter()
+        for _ in range(requests):
+            await app(dict(scope), noop, noop)
+        return (time.perf_counter() - started) / requests * 1e6
+
+    instrumented = MetricsMiddleware(bare_app, slow_request_seconds)
+    return min([await per_request_us(instrumented) - await per_request_us(bare_app) for _ in range(3)])
+
+
+def listener_pair_us(requests: int) -> float:
+    timer = CommandTimer()
+    started = SimpleNamespace(
+        command={"find": "reimbursement_records"}, command_name="find", connection_id=("db", 27017), request_id=1
+    )
+    succeeded = SimpleNamespace(command_name="find", connection_id=("db", 27017), request_id=1, duration_micros=800)
+
+    def pair():
+        timer.started(started)
+        timer.succeeded(succeeded)
+
+    return min(timeit.repeat(pair, number=requests, repeat=3)) / requests * 1e6
+
+
+async def main(requests: int, rounds: int = 3):
+    apps = [build_app(), MetricsMiddleware(build_app()), MetricsMiddleware(build_app(), slow_request_seconds=10.0)]
+    # Interleaved rounds, best of each, to keep machine noise out of the comparison
+    best = [0.0] * len(apps)
+    for _ in range(rounds):
+        for i, app in enumerate(apps):
+            best[i] = max(best[i], await measure(app, requests))
+    plain, instrumented, with_slow_log = best
+    print(f"no metrics:      {plain:8.0f} req/s")
+    print(f"metrics:         {instrumented:8.0f} req/s ({(plain / instrumented - 1) * 100:+.1f}% time)")
+    print(f"metrics + slow:  {with_slow_log:8.0f} req/s ({(plain / with_slow_log - 1) * 100:+.1f}% time)")
+    print(f"middleware alone: {await middleware_us(requests):5.1f} us per request")
+    print(f"middleware + slow log: {await middleware_us(requests, 10.0):5.1f} us per request")
+    print(f"command listener: {listener_pair_us(requests):5.1f} us per command")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_REQUESTS))
@@ -0,0 +1,112 @@
+"""
+Benchmark search_records latency at 1M records: p50/p95/p99 per query kind
+
+Loads --records synthetic records (seed_data's generator) into a scratch
+database at MONGO_URL unless it already holds that many, builds the indexes,
+then times queries taken from the data itself: 1-4 character name prefixes,
+two-token "first last-prefix" queries, email, mobile and IFSC prefixes, and
+whole-word text searches. Exits with status 1 if the p95 of any autocomplete
+kind (the endpoint's default mode) is over --p95-ms; the text-index
+fallback is reported but not held to that budget.
+Usage: python benchmarks/bench_search.py [--records 1000000] [--queries 500] [--p95-ms 20] [--keep]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+import numpy as np
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from indexes import ensure_indexes
+from search import SEARCH_RANK_FIELD, backfill_search_keys, search_records
+from synthetic_data import generate_record_batch, generated_batches, insert_batches
+
+DB_NAME = "bench_search"
+
+
+def sample_queries(documents: list, count: int, rng: random.Random) -> dict:
+    """Queries per kind, cut from real values so most of them match something"""
+    kinds = {"name_prefix": [], "two_tokens": [], "email": [], "mobile": [], "ifsc": [], "text": []}
+    for document in rng.sample(documents, min(count, len(documents))):
+        first, *rest = document["name_excel"].split()
+        kinds["name_prefix"].append(first[:rng.randint(1, 4)])
+        kinds["two_tokens"].append(f"{first} {(rest or [first])[-1][:2]}")
+        kinds["email"].append(document["email_excel"][:rng.randint(4, 12)])
+        kinds["mobile"].append(document["mobile_excel"][:rng.randint(4, 7)])
+        kinds["ifsc"].append(document["ifsc_excel"][:rng.randint(4, 8)])
+        kinds["text"].append(f"{first} {document['city_assigned_excel']}")
+    return kinds
+
+
+async def main(args):
+    client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    db = client[DB_NAME]
+    collection = db.reimbursement_records
+    try:
+        if await collection.estimated_document_count() < args.records:
+            await collection.drop()
+            started = time.perf_counter()
+            with ProcessPoolExecutor() as executor:
+                await insert_batches(
+                    collection,
+                    generated_batches(generate_record_batch, args.records, args.seed, 5000, executor, prefetch=8),
+                    concurrency=4,
+                )
+            print(f"Loaded {args.records} records in {time.perf_counter() - started:.1f}s")
+        elif await collection.count_documents({SEARCH_RANK_FIELD: {"$exists": False}}, limit=1):
+            # A database kept from a run before rank keys were stored
+            started = time.perf_counter()
+            updated = await backfill_search_keys(collection)
+            print(f"Backfilled search fields on {updated} records in {time.perf_counter() - started:.1f}s")
+        started = time.perf_counter()
+        await ensure_indexes(db)
+        print(f"Indexes ready in {time.perf_counter() - started:.1f}s")
+
+        rng = random.Random(args.seed)
+        sample = await collection.aggregate([
+            {"$sample": {"size": args.queries}},
+            {"$project": {"_id": 0, "name_excel": 1, "email_excel": 1, "mobile_excel": 1,
+                          "ifsc_excel": 1, "city_assigned_excel": 1}},
+        ]).to_list(None)
+        kinds = sample_queries(sample, args.queries, rng)
+
+        failed = False
+        print(f"{'query kind':<14} {'count':>6} {'hits':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        for kind, queries in kinds.items():
+            mode = "text" if kind == "text" else "auto"
+            for q in queries[:10]:
+                await search_records(collection, q, args.limit, mode=mode)
+            latencies, hits = [], 0
+            for q in queries:
+                started = time.perf_counter()
+                result = await search_records(collection, q, args.limit, mode=mode)
+                latencies.append((time.perf_counter() - started) * 1000)
+                hits += bool(result["results"])
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            failed |= mode == "auto" and p95 > args.p95_ms
+            print(f"{kind:<14} {len(queries):>6} {hits:>6} {p50:>8.2f} {p95:>8.2f} {p99:>8.2f}"
+                  + ("  (fallback, not budgeted)" if mode == "text" else ""))
+        if failed:
+            print(f"p95 over the {args.p95_ms} ms budget")
+        return 1 if failed else 0
+    finally:
+        if not args.keep:
+            await client.drop_database(DB_NAME)
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="search_records latency against a large synthetic collection")
+    parser.add_argument("--records", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=500, help="Queries per kind")
+    parser.add_argument("--limit", type=int, default=10, help="Results per query")
+    parser.add_argument("--p95-ms", type=float, default=20.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch database for the next run")
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,97 @@
+"""
+Benchmark worker startup: from a fresh interpreter to the first served request
+
+Each run starts a new Python process that imports server, calls
+create_app(), runs the lifespan startup (Mongo client, pool warm-up, indexes)
+and serves GET /api/ over ASGI, timing each phase. Uses MONGO_URL/DB_NAME when
+set, otherwise the in-memory stand-in (mongomock-motor). Exits with status 1 if
+the median total is over --budget-ms or if pandas was imported before the
+first request (it should only load with the reconciliation report).
+Usage: python benchmarks/bench_startup.py [--runs 10] [--budget-ms 2000]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+CHILD = """
+import asyncio, json, sys, time
+started = time.time()
+phases = {}
+mark = time.perf_counter()
+def phase(name):
+    global mark
+    now = time.perf_counter()
+    phases[name] = (now - mark) * 1000
+    mark = now
+import server
+phase("import")
+app = server.create_app()
+phase("create_app")
+import httpx
+async def main():
+    async with app.router.lifespan_context(app):
+        phase("startup")
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://startup") as client:
+            response = await client.get("/api/")
+        assert response.status_code == 200, response.status_code
+        phase("first_request")
+        print(json.dumps({"started": started, "phases": phases, "pandas": "pandas" in sys.modules}))
+asyncio.run(main())
+"""
+
+PHASES = ("interpreter", "import", "create_app", "startup", "first_request", "total")
+
+
+def run_once(env: dict) -> dict:
+    spawned = time.time()
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD], cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=120
+    )
+    finished = time.time()
+    if result.returncode != 0:
+        raise RuntimeError(f"startup run failed:\n{result.stderr}")
+    report = json.loads(result.stdout.strip().splitlines()[-1])
+    phases = {"interpreter": (report["started"] - spawned) * 1000, **report["phases"]}
+    # Spawn to the response, not counting the child's shutdown
+    phases["total"] = phases["interpreter"] + sum(report["phases"].values())
+    return {"phases": phases, "pandas": report["pandas"], "wall_ms": (finished - spawned) * 1000}
+
+
+def main(args) -> int:
+    env = {**os.environ, "METRICS_ENABLED": os.environ.get("METRICS_ENABLED", "true")}
+    if not env.get("MONGO_URL"):
+        env.update(MONGO_URL="memory://", DB_NAME="bench_startup")
+    runs = [run_once(env) for _ in range(args.runs)]
+
+    print(f"{args.runs} runs against {'the in-memory stand-in' if env['MONGO_URL'] == 'memory://' else env['MONGO_URL']}")
+    print(f"{'phase':<14} {'median ms':>10} {'max ms':>8}")
+    for name in PHASES:
+        values = [run["phases"][name] for run in runs]
+        print(f"{name:<14} {statistics.median(values):>10.1f} {max(values):>8.1f}")
+
+    failed = False
+    median_total = statistics.median(run["phases"]["total"] for run in runs)
+    if median_total > args.budget_ms:
+        print(f"Median startup {median_total:.0f} ms is over the {args.budget_ms:.0f} ms budget")
+        failed = True
+    if any(run["pandas"] for run in runs):
+        print("pandas was imported before the first request")
+        failed = True
+    if args.output:
+        Path(args.output).write_text(json.dumps({"runs": runs, "median_total_ms": median_total}, indent=2))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time from a fresh interpreter to the first served request")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--budget-ms", type=float, default=2000.0, help="Budget for the median total")
+    parser.add_argument("--output", help="Write every run's phases as JSON")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,95 @@
+"""
+Benchmark status_checks as history grows: storage per heartbeat and windowed query latency
+
+Creates status_checks in a scratch database the way the API does (time-series
+unless --plain), then grows it in steps up to --checks synthetic heartbeats
+spread over the last --days. After each step it reports storage bytes per
+status check and the median latency of the latest-per-client query, the
+last-hour per-minute counts and a one-hour listing page. Flat columns down
+the table mean cost does not grow with retained history.
+Usage: python benchmarks/bench_status_history.py [--checks 2000000] [--steps 4] [--plain]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from indexes import INDEXES, ensure_indexes
+from pagination import fetch_page
+from status_history import (
+    STATUS_COLLECTION, counts_per_interval, ensure_status_collection, latest_per_client, window_filter
+)
+from synthetic_data import generate_status_check_batch, generated_batches, insert_batches
+
+DB_NAME = "bench_status_history"
+
+
+async def storage_bytes(db) -> int:
+    stats = await db.command("collStats", STATUS_COLLECTION)
+    # Time-series stats describe the underlying buckets collection
+    return stats.get("storageSize", 0) + stats.get("totalIndexSize", 0)
+
+
+async def median_ms(query, repeat: int) -> float:
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await query()
+        latencies.append((time.perf_counter() - started) * 1000)
+    return statistics.median(latencies)
+
+
+async def main(args):
+    client = AsyncIOMotorClient(os.environ.get("MONGO_URL", "mongodb://localhost:27017"))
+    db = client[DB_NAME]
+    collection = db[STATUS_COLLECTION]
+    try:
+        await client.drop_database(DB_NAME)
+        kind = await ensure_status_collection(db, ttl=0, timeseries=not args.plain)
+        await ensure_indexes(db, {STATUS_COLLECTION: INDEXES[STATUS_COLLECTION]})
+        print(f"status_checks as {kind}")
+        print(f"{'checks':>10} {'bytes/check':>12} {'latest ms':>10} {'counts ms':>10} {'page ms':>8}")
+
+        # The newest heartbeats are always "now"; each step adds older history
+        end = datetime.utcnow().replace(second=0, microsecond=0)
+        per_step = args.checks // args.steps
+        span = args.days / args.steps
+        for step in range(args.steps):
+            start = end - timedelta(days=span * (step + 1))
+            await insert_batches(
+                collection,
+                generated_batches(generate_status_check_batch, per_step, args.seed + step, 10_000,
+                                  span_days=span, start=start),
+                concurrency=4,
+            )
+            total = per_step * (step + 1)
+            hour = (end - timedelta(hours=1), end)
+            latest = await median_ms(lambda: latest_per_client(collection), args.repeat)
+            counts = await median_ms(lambda: counts_per_interval(collection, *hour), args.repeat)
+            page = await median_ms(
+                lambda: fetch_page(collection, window_filter(*hour), "timestamp", 100), args.repeat
+            )
+            print(f"{total:>10} {await storage_bytes(db) / total:>12.1f} {latest:>10.2f} {counts:>10.2f} {page:>8.2f}")
+    finally:
+        if not args.keep:
+            await client.drop_database(DB_NAME)
+        client.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="status_checks storage and query cost as history grows")
+    parser.add_argument("--checks", type=int, default=2_000_000)
+    parser.add_argument("--steps", type=int, default=4, help="Measure after each of this many equal loads")
+    parser.add_argument("--days", type=float, default=120, help="History the final load spans")
+    parser.add_argument("--repeat", type=int, default=20, help="Runs per query, median reported")
+    parser.add_argument("--plain", action="store_true", help="Regular collection instead of time-series")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch database")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,64 @@
+"""
+Benchmark template workbook reload time and per-lookup latency
+
+Usage: python benchmarks/bench_template_data.py [rows]
+"""
+import asyncio
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from openpyxl import Workbook
+
+from template_data import EXCEL_FIELDS, TemplateStore
+
+DEFAULT_ROWS = 50_000
+LOOKUPS = 100_000
+
+
+def write_workbook(path: Path, rows: int):
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append(EXCEL_FIELDS)
+    for i in range(rows):
+        sheet.append([
+            f"C{i:06d}" if field == "city_code_excel"
+            else f"City {i}" if field == "city_assigned_excel"
+            else f"coordinator{i}@nta.gov.in" if field == "email_excel"
+            else i if field.startswith("num_")
+            else float(i % 10_000) if "claim" in field or "staff" in field
+            else f"{field} {i}"
+            for field in EXCEL_FIELDS
+        ])
+    workbook.save(path)
+
+
+async def run(rows: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "master.xlsx"
+        started = time.perf_counter()
+        write_workbook(path, rows)
+        print(f"wrote {rows} rows in {time.perf_counter() - started:.2f}s")
+
+        store = TemplateStore(path, check_interval=3600)
+        await store.get_index()
+        print(f"reload: {store.last_reload_seconds:.2f}s")
+
+        codes = [f"C{random.randrange(rows):06d}" for _ in range(LOOKUPS)]
+        started = time.perf_counter()
+        for code in codes:
+            assert await store.lookup(city_code=code) is not None
+        elapsed = time.perf_counter() - started
+        print(f"lookup: {elapsed / LOOKUPS * 1e6:.2f} us/op over {LOOKUPS} lookups")
+
+        store.check_interval = 0
+        started = time.perf_counter()
+        await store.get_index()
+        print(f"unchanged-file check: {(time.perf_counter() - started) * 1e3:.2f} ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(run(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_ROWS))
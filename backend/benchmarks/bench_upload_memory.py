@@ -0,0 +1,63 @@
+"""
+Benchmark peak RSS of the streaming upload path as file size grows
+
+Each size runs in a fresh subprocess so ru_maxrss reflects only that upload.
+Usage: python benchmarks/bench_upload_memory.py [size_mb ...]
+"""
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from storage import save_upload
+from storage_backends import LocalStorage
+
+DEFAULT_SIZES_MB = [1, 16, 64, 256]
+
+
+class SyntheticUpload:
+    """Minimal stand-in for UploadFile that produces bytes on demand"""
+
+    def __init__(self, size: int, filename: str = "bill.pdf"):
+        self.filename = filename
+        self._remaining = size
+        self._block = os.urandom(64 * 1024)
+
+    async def read(self, size: int = -1) -> bytes:
+        if self._remaining <= 0:
+            return b""
+        n = min(size if size > 0 else self._remaining, self._remaining)
+        self._remaining -= n
+        reps, rest = divmod(n, len(self._block))
+        return self._block * reps + self._block[:rest]
+
+
+def run_single(size_mb: int):
+    with tempfile.TemporaryDirectory() as tmp:
+        baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        stored = asyncio.run(save_upload(SyntheticUpload(size_mb * 1024 * 1024), LocalStorage(Path(tmp)),
+                                         max_bytes=sys.maxsize))
+        elapsed = time.perf_counter() - start
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(f"{size_mb}\t{baseline // 1024}\t{peak // 1024}\t{stored['size'] / elapsed / 1e6:.1f}")
+
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] == "--single":
+        run_single(int(sys.argv[2]))
+        return
+
+    sizes = [int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES_MB
+    print("size_mb\tbaseline_rss_mb\tpeak_rss_mb\tthroughput_mb_s")
+    for size_mb in sizes:
+        subprocess.run([sys.executable, __file__, "--single", str(size_mb)], check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Benchmark inserts/s at 1k concurrent clients: one insert_one per document vs WriteCoalescer
+
+By default Mongo is simulated by a collection with a 100-connection pool (the
+Motor default), a fixed round-trip time and a small per-document cost, so
+the pool bottleneck shows up without a server. With --mongo the real
+MONGO_URL/DB_NAME is used (a scratch collection is dropped afterwards).
+Usage: python benchmarks/bench_write_coalescing.py [--clients 1000] [--inserts 20] [--rtt-ms 1.0] [--mongo]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent))
+
+from write_batching import WriteCoalescer, DEFAULT_MAX_BATCH, DEFAULT_MAX_DELAY
+
+
+class SimulatedCollection:
+    """Round trips wait for one of pool_size connections, then take rtt plus per-document time"""
+
+    def __init__(self, pool_size: int, rtt: float, per_document: float):
+        self.name = "status_checks"
+        self.pool = asyncio.Semaphore(pool_size)
+        self.rtt = rtt
+        self.per_document = per_document
+        self.round_trips = 0
+
+    async def _round_trip(self, documents: int):
+        async with self.pool:
+            self.round_trips += 1
+            await asyncio.sleep(self.rtt + self.per_document * documents)
+
+    async def insert_one(self, document):
+        await self._round_trip(1)
+        document["_id"] = uuid.uuid4().hex
+
+    async def insert_many(self, documents, ordered=True):
+        await self._round_trip(len(documents))
+        for document in documents:
+            document["_id"] = uuid.uuid4().hex
+
+
+def status_document(client: int) -> dict:
+    return {"id": str(uuid.uuid4()), "client_name": f"client-{client}", "timestamp": datetime.utcnow()}
+
+
+async def run_clients(insert, clients: int, inserts: int) -> float:
+    async def client(number: int):
+        for _ in range(inserts):
+            await insert(status_document(number))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(number) for number in range(clients)))
+    return clients * inserts / (time.perf_counter() - started)
+
+
+async def main(args):
+    client = None
+    if args.mongo:
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        client = AsyncIOMotorClient(os.environ["MONGO_URL"])
+        collection = client[os.environ["DB_NAME"]]["bench_write_coalescing"]
+        await collection.drop()
+    else:
+        collection = SimulatedCollection(args.pool_size, args.rtt_ms / 1000, args.per_document_us / 1e6)
+
+    try:
+        direct = await run_clients(collection.insert_one, args.clients, args.inserts)
+        direct_trips = getattr(collection, "round_trips", None)
+        coalescer = WriteCoalescer(args.max_batch, args.max_delay_ms / 1000)
+        batched = await run_clients(lambda document: coalescer.insert(collection, document), args.clients, args.inserts)
+        await coalescer.close()
+    finally:
+        if client:
+            await collection.drop()
+            client.close()
+
+    target = "mongo" if args.mongo else f"simulated, {args.pool_size} connections, {args.rtt_ms}ms round trip"
+    print(f"{args.clients} concurrent clients x {args.inserts} inserts ({target})")
+    print(f"insert_one:  {direct:9.0f} inserts/s")
+    print(f"coalesced:   {batched:9.0f} inserts/s ({batched / direct:.1f}x, "
+          f"batch <= {args.max_batch} docs / {args.max_delay_ms}ms)")
+    if direct_trips is not None:
+        print(f"round trips: {direct_trips} -> {collection.round_trips - direct_trips}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--inserts", type=int, default=20, help="Inserts per client, one after another")
+    parser.add_argument("--max-batch", type=int, default=DEFAULT_MAX_BATCH)
+    parser.add_argument("--max-delay-ms", type=float, default=DEFAULT_MAX_DELAY * 1000)
+    parser.add_argument("--pool-size", type=int, default=100)
+    parser.add_argument("--rtt-ms", type=float, default=1.0)
+    parser.add_argument("--per-document-us", type=float, default=20.0)
+    parser.add_argument("--mongo", action="store_true", help="Insert into MONGO_URL instead of the simulation")
+    asyncio.run(main(parser.parse_args()))
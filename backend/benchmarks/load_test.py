@@ -0,0 +1,407 @@
+"""
+Concurrent load test of the API: latency percentiles and req/s per endpoint
+
+Virtual users run a weighted mix of scenarios until the duration is up: claim
+bursts (create, then read and edit with If-Match), template-data reads,
+record listing, uploads and full/ranged downloads. Every request is timed and
+reported per endpoint with p50/p95/p99 latency and requests per second.
+Requests shed by admission control (503/429) are counted per endpoint and
+left out of the latency and req/s figures, which then describe admitted
+requests; the shed rate has its own budget.
+
+The app runs under uvicorn (default, temporary UPLOADS_DIR), in-process over
+ASGI (--in-process), or is an already running server (--url). The first two
+need MONGO_URL/DB_NAME pointing at a mongod, e.g. a local one.
+
+Results can be saved with --output and compared against a saved run with
+--baseline; --budget takes a JSON file of per-endpoint limits:
+
+    {"*": {"max_error_rate": 0.01, "max_shed_rate": 0.05},
+     "POST /api/reimbursement": {"p95_ms": 50, "p99_ms": 150, "min_rps": 100}}
+
+The exit status is 1 if any budget or the baseline regression limit is exceeded,
+or if a budgeted endpoint had no request admitted;
+benchmarks/load_budget.json holds the budgets for a single worker on a local mongod.
+Usage: python benchmarks/load_test.py [--duration 30] [--users 50] [--mix create=2,template=4,...]
+                                      [--output run.json] [--baseline old.json] [--budget budget.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from contextlib import AsyncExitStack
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+import numpy as np
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.append(str(BACKEND_DIR))
+
+from models import RECORD_SCHEMA
+
+DEFAULT_MIX = "create=2,edit=3,template=4,list=2,upload=1,download=2"
+SCENARIOS = ("create", "edit", "template", "list", "upload", "download")
+SHED_STATUSES = (429, 503)
+BUDGET_METRICS = ("p50_ms", "p95_ms", "p99_ms", "max_ms", "min_rps", "max_error_rate", "max_shed_rate")
+
+CITIES = [
+    ("Maharashtra", "Mumbai", "MUM"), ("Maharashtra", "Pune", "PUN"), ("Delhi", "New Delhi", "DEL"),
+    ("Karnataka", "Bengaluru", "BLR"), ("Tamil Nadu", "Chennai", "CHE"), ("Gujarat", "Ahmedabad", "AMD"),
+    ("Uttar Pradesh", "Lucknow", "LKO"), ("Kerala", "Kochi", "COK"), ("West Bengal", "Kolkata", "CCU"),
+    ("Telangana", "Hyderabad", "HYD"),
+]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_until_up(client: httpx.AsyncClient, timeout: float = 15.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            await client.get("/api/")
+            return
+        except httpx.TransportError:
+            await asyncio.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+def parse_mix(mix: str) -> dict:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise SystemExit(f"Unknown scenario {name!r} (expected one of {', '.join(SCENARIOS)})")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def claim_payload(rng: random.Random) -> dict:
+    """A filled-in claim form for one of CITIES, with plausible amounts and counts"""
+    state, city, prefix = rng.choice(CITIES)
+    payload = {}
+    for _, fields in RECORD_SCHEMA:
+        for name, field_type in fields:
+            if field_type is float:
+                payload[f"{name}_user"] = round(rng.uniform(500, 25000), 2)
+            elif field_type is int:
+                payload[f"{name}_user"] = rng.randint(1, 20)
+            else:
+                payload[f"{name}_user"] = f"{name.replace('_', ' ')} {rng.randint(1, 9999)}"
+    payload.update(
+        city_code_user=f"{prefix}{rng.randint(1, 999):03d}",
+        state_user=state,
+        city_assigned_user=city,
+        mobile_user=f"9{rng.randint(100000000, 999999999)}",
+        email_user=f"coordinator{rng.randint(1, 99999)}@nta.gov.in",
+        ifsc_user=f"SBIN000{rng.randint(1000, 9999)}",
+    )
+    return payload
+
+
+class Recorder:
+    """Latencies and errors per endpoint label"""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        # 503/429 from admission control: counted, but not as errors or latency samples
+        self.shed = defaultdict(int)
+
+    async def request(self, client: httpx.AsyncClient, label: str, method: str, url: str, expected=(200,), **kwargs):
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.latencies[label].append(time.perf_counter() - started)
+            self.errors[label] += 1
+            return None
+        if response.status_code in SHED_STATUSES:
+            self.shed[label] += 1
+            return None
+        self.latencies[label].append(time.perf_counter() - started)
+        if response.status_code not in expected:
+            self.errors[label] += 1
+            return None
+        return response
+
+    def summary(self, elapsed: float) -> dict:
+        endpoints = {}
+        for label in sorted(set(self.latencies) | set(self.shed)):
+            endpoints[label] = summarize(self.latencies[label], self.errors[label], self.shed[label], elapsed)
+        all_latencies = [latency for latencies in self.latencies.values() for latency in latencies]
+        total = summarize(all_latencies, sum(self.errors.values()), sum(self.shed.values()), elapsed)
+        return {"endpoints": endpoints, "total": total}
+
+
+def summarize(latencies: list, errors: int, shed: int, elapsed: float) -> dict:
+    """Stats of the admitted requests (count, rps, latencies) plus the share that was shed"""
+    shed_rate = round(shed / (len(latencies) + shed), 4) if shed else 0.0
+    if not latencies:
+        return {"count": 0, "errors": errors, "shed": shed, "error_rate": 0.0, "shed_rate": shed_rate, "rps": 0.0}
+    ms = np.asarray(latencies) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {
+        "count": len(latencies),
+        "errors": errors,
+        "shed": shed,
+        "error_rate": round(errors / len(latencies), 4),
+        "shed_rate": shed_rate,
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(float(p50), 2),
+        "p95_ms": round(float(p95), 2),
+        "p99_ms": round(float(p99), 2),
+        "max_ms": round(float(ms.max()), 2),
+    }
+
+
+class Workload:
+    """Scenario implementations sharing pools of created records and uploaded files"""
+
+    def __init__(self, client: httpx.AsyncClient, recorder: Recorder, upload_kb: int, seed: int):
+        self.client = client
+        self.recorder = recorder
+        self.upload_kb = upload_kb
+        self.rng = random.Random(seed)
+        self.record_ids = []
+        self.filenames = []
+
+    async def create(self):
+        response = await self.recorder.request(
+            self.client, "POST /api/reimbursement", "POST", "/api/reimbursement", json=claim_payload(self.rng)
+        )
+        if response is not None:
+            self.record_ids.append(response.json()["id"])
+
+    async def edit(self):
+        """Open a claim, then save edits a few times as a user working through the form would"""
+        if not self.record_ids:
+            return await self.create()
+        record_id = self.rng.choice(self.record_ids)
+        response = await self.recorder.request(
+            self.client, "GET /api/reimbursement/{id}", "GET", f"/api/reimbursement/{record_id}"
+        )
+        if response is None:
+            return
+        etag = response.headers.get("ETag")
+        for _ in range(self.rng.randint(1, 3)):
+            changes = {
+                "admin_staff_claim_user": round(self.rng.uniform(500, 25000), 2),
+                "num_observers_user": self.rng.randint(1, 20),
+            }
+            # A concurrent editor may win the race; 409 is the expected answer then
+            response = await self.recorder.request(
+                self.client, "PUT /api/reimbursement/{id}", "PUT", f"/api/reimbursement/{record_id}",
+                expected=(200, 409), json=changes, headers={"If-Match": etag} if etag else {},
+            )
+            if response is None or response.status_code != 200:
+                return
+            etag = response.headers.get("ETag")
+
+    async def template(self):
+        _, city, _ = self.rng.choice(CITIES)
+        await self.recorder.request(
+            self.client, "GET /api/template-data", "GET", "/api/template-data",
+            expected=(200, 404), params={"city": city},
+        )
+
+    async def list(self):
+        state, _, _ = self.rng.choice(CITIES)
+        await self.recorder.request(
+            self.client, "GET /api/reimbursement", "GET", "/api/reimbursement",
+            params={"state": state, "limit": 50, "fields": "basic"},
+        )
+
+    async def upload(self):
+        size = self.rng.randint(self.upload_kb // 2, self.upload_kb) * 1024
+        content = self.rng.randbytes(size)
+        response = await self.recorder.request(
+            self.client, "POST /api/upload", "POST", "/api/upload",
+            files={"file": (f"bill-{self.rng.randint(1, 10**6)}.pdf", content, "application/pdf")},
+        )
+        if response is not None:
+            self.filenames.append(response.json()["filename"])
+
+    async def download(self):
+        if not self.filenames:
+            return await self.upload()
+        filename = self.rng.choice(self.filenames)
+        if self.rng.random() < 0.3:
+            await self.recorder.request(
+                self.client, "GET /api/download/{filename} (range)", "GET", f"/api/download/{filename}",
+                expected=(206,), headers={"Range": "bytes=0-65535"},
+            )
+        else:
+            await self.recorder.request(
+                self.client, "GET /api/download/{filename}", "GET", f"/api/download/{filename}"
+            )
+
+
+async def run_load(client: httpx.AsyncClient, args) -> dict:
+    weights = parse_mix(args.mix)
+    recorder = Recorder()
+    workload = Workload(client, recorder, args.upload_kb, args.seed)
+    names, scenario_weights = list(weights), list(weights.values())
+
+    # Seed the pools so edits and downloads have something to work on
+    for _ in range(min(args.users, 20)):
+        await workload.create()
+    if weights.get("download"):
+        await workload.upload()
+    recorder.latencies.clear()
+    recorder.errors.clear()
+    recorder.shed.clear()
+
+    deadline = time.monotonic() + args.duration
+
+    async def user():
+        while time.monotonic() < deadline:
+            scenario = workload.rng.choices(names, scenario_weights)[0]
+            await getattr(workload, scenario)()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user() for _ in range(args.users)))
+    elapsed = time.perf_counter() - started
+    return {
+        "meta": {
+            "started_at": datetime.utcnow().isoformat(),
+            "mode": args.mode,
+            "duration_s": round(elapsed, 2),
+            "users": args.users,
+            "mix": weights,
+            "upload_kb": args.upload_kb,
+        },
+        **recorder.summary(elapsed),
+    }
+
+
+def check_budget(results: dict, budget: dict) -> list:
+    """Budget violations; "*" limits apply to every endpoint without its own entry.
+
+    An endpoint with limits but no admitted request fails outright: its
+    latency and error figures would otherwise pass vacuously.
+    """
+    violations = []
+    for label, stats in results["endpoints"].items():
+        limits = {**budget.get("*", {}), **budget.get(label, {})}
+        if limits and not stats["count"]:
+            violations.append(f"{label}: no requests admitted ({stats['shed']} shed)")
+        for metric, limit in limits.items():
+            if metric not in BUDGET_METRICS:
+                raise SystemExit(f"Unknown budget metric {metric!r} (expected one of {', '.join(BUDGET_METRICS)})")
+            if metric == "min_rps":
+                if stats["rps"] < limit:
+                    violations.append(f"{label}: {stats['rps']} req/s below the {limit} req/s budget")
+            elif metric == "max_error_rate":
+                if stats["error_rate"] > limit:
+                    violations.append(f"{label}: error rate {stats['error_rate']:.2%} above {limit:.2%}")
+            elif metric == "max_shed_rate":
+                if stats["shed_rate"] > limit:
+                    violations.append(f"{label}: shed rate {stats['shed_rate']:.2%} above {limit:.2%}")
+            elif metric in stats and stats[metric] > limit:
+                violations.append(f"{label}: {metric} {stats[metric]} over the {limit} budget")
+    return violations
+
+
+def compare_baseline(results: dict, baseline: dict, max_regression: float) -> list:
+    """p95 regressions beyond max_regression (a fraction) against a saved run"""
+    regressions = []
+    for label, stats in results["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(label)
+        if not before or "p95_ms" not in before or "p95_ms" not in stats:
+            continue
+        change = stats["p95_ms"] / before["p95_ms"] - 1 if before["p95_ms"] else 0.0
+        print(f"{label:<42} p95 {before['p95_ms']:8.2f} -> {stats['p95_ms']:8.2f} ms ({change:+.1%})")
+        if change > max_regression:
+            regressions.append(f"{label}: p95 regressed {change:+.1%} (limit {max_regression:+.0%})")
+    return regressions
+
+
+def print_report(results: dict):
+    print(f"{'endpoint':<42} {'count':>7} {'err':>5} {'shed':>6} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    rows = list(results["endpoints"].items()) + [("total", results["total"])]
+    for label, stats in rows:
+        if not stats["count"]:
+            print(f"{label:<42} {0:>7} {stats['errors']:>5} {stats['shed']:>6} {0:>8.1f}")
+            continue
+        print(f"{label:<42} {stats['count']:>7} {stats['errors']:>5} {stats['shed']:>6} {stats['rps']:>8.1f} "
+              f"{stats['p50_ms']:>8.2f} {stats['p95_ms']:>8.2f} {stats['p99_ms']:>8.2f} {stats['max_ms']:>8.2f}")
+    print(f"({results['meta']['users']} users for {results['meta']['duration_s']}s, {results['meta']['mode']}; "
+          f"latencies in ms)")
+
+
+async def main(args):
+    async with AsyncExitStack() as stack:
+        limits = httpx.Limits(max_connections=args.users)
+        if args.mode == "url":
+            base_url, transport = args.url.rstrip("/"), None
+        elif args.mode == "in-process":
+            os.environ.setdefault("UPLOADS_DIR", stack.enter_context(tempfile.TemporaryDirectory()))
+            import server
+            app = server.create_app()
+            await stack.enter_async_context(server.lifespan(app))
+            base_url, transport = "http://load-test", httpx.ASGITransport(app=app)
+        else:
+            port = free_port()
+            uploads_dir = stack.enter_context(tempfile.TemporaryDirectory())
+            server = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "server:create_app", "--factory", "--port", str(port),
+                 "--workers", str(args.workers), "--log-level", "warning"],
+                cwd=BACKEND_DIR, env={**os.environ, "UPLOADS_DIR": uploads_dir},
+            )
+            stack.callback(server.wait)
+            stack.callback(server.terminate)
+            base_url, transport = f"http://127.0.0.1:{port}", None
+
+        client = await stack.enter_async_context(
+            httpx.AsyncClient(base_url=base_url, transport=transport, limits=limits, timeout=args.timeout)
+        )
+        await wait_until_up(client)
+        results = await run_load(client, args)
+
+    print_report(results)
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+
+    failures = []
+    if args.baseline:
+        failures += compare_baseline(results, json.loads(Path(args.baseline).read_text()), args.max_regression)
+    if args.budget:
+        failures += check_budget(results, json.loads(Path(args.budget).read_text()))
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent load test of the reimbursement API")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--url", help="Load an already running server instead of starting one")
+    target.add_argument("--in-process", action="store_true", help="Serve the app in this process over ASGI")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers when starting a server")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of load after warm-up")
+    parser.add_argument("--users", type=int, default=50, help="Concurrent virtual users")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Scenario weights, e.g. create=2,template=4")
+    parser.add_argument("--upload-kb", type=int, default=256, help="Largest upload size in KiB")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write results as JSON")
+    parser.add_argument("--baseline", help="Saved results to compare p95 latency against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="Allowed p95 increase vs baseline")
+    parser.add_argument("--budget", help="JSON file of per-endpoint latency/throughput/error budgets")
+    args = parser.parse_args()
+    args.mode = "url" if args.url else "in-process" if args.in_process else "uvicorn"
+    sys.exit(asyncio.run(main(args)))
@@ -0,0 +1,176 @@
+"""
+Batched bulk import of reimbursement records from NDJSON, CSV or XLSX input
+"""
+import asyncio
+import csv
+import io
+import json
+import time
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
+
+from pydantic import ValidationError
+from pymongo.errors import BulkWriteError
+
+from models import ReimbursementRecord
+from search import with_search_keys
+
+DEFAULT_CHUNK_SIZE = 1000
+DEFAULT_MAX_ERRORS = 1000
+IMPORT_FORMATS = ("ndjson", "csv", "xlsx")
+
+# Spreadsheet cells for mobiles, account numbers etc. arrive as numbers
+STRING_FIELDS = {
+    name for name, field in ReimbursementRecord.model_fields.items()
+    if field.annotation in (str, Optional[str])
+}
+
+
+def detect_format(filename: str) -> Optional[str]:
+    """Guess the import format from a filename extension"""
+    suffix = Path(filename or "").suffix.lower().lstrip(".")
+    if suffix in ("ndjson", "jsonl"):
+        return "ndjson"
+    return suffix if suffix in IMPORT_FORMATS else None
+
+
+def iter_rows(stream, fmt: str) -> Iterator:
+    """Yield raw rows from a binary file object without loading it whole.
+
+    CSV and XLSX rows are dicts; NDJSON rows are the undecoded lines, which
+    parse_row decodes, so a malformed line is reported like any invalid row.
+    """
+    if fmt == "ndjson":
+        for line in io.TextIOWrapper(stream, encoding="utf-8-sig"):
+            if line.strip():
+                yield line
+    elif fmt == "csv":
+        yield from csv.DictReader(io.TextIOWrapper(stream, encoding="utf-8-sig", newline=""))
+    elif fmt == "xlsx":
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(stream, read_only=True, data_only=True)
+        try:
+            rows = workbook.active.iter_rows(values_only=True)
+            header = [str(cell).strip() if cell is not None else "" for cell in next(rows, ())]
+            for values in rows:
+                if any(value is not None for value in values):
+                    yield dict(zip(header, values))
+        finally:
+            workbook.close()
+    else:
+        raise ValueError(f"Unsupported import format: {fmt}")
+
+
+def parse_row(row) -> dict:
+    """A row from iter_rows as a dict; raises ValueError for lines that are not JSON objects"""
+    if isinstance(row, str):
+        row = json.loads(row)
+    if not isinstance(row, dict):
+        raise ValueError(f"Expected a JSON object, got {type(row).__name__}")
+    return row
+
+
+def clean_row(row: dict) -> dict:
+    """Drop blank cells and stringify numeric cells destined for text fields"""
+    cleaned = {}
+    for key, value in row.items():
+        if not key or value is None or (isinstance(value, str) and not value.strip()):
+            continue
+        if key in STRING_FIELDS and isinstance(value, (int, float)) and not isinstance(value, bool):
+            value = str(int(value)) if float(value).is_integer() else str(value)
+        cleaned[key] = value
+    return cleaned
+
+
+def _read_chunk(rows: Iterator, first_row: int, chunk_size: int) -> dict:
+    """Parse and validate rows until chunk_size documents are ready or the input ends"""
+    chunk = {"documents": [], "row_numbers": [], "errors": [], "rows": 0, "done": False, "read_error": None}
+    while len(chunk["documents"]) < chunk_size:
+        row_number = first_row + chunk["rows"]
+        try:
+            row = next(rows)
+        except StopIteration:
+            chunk["done"] = True
+            break
+        except Exception as e:
+            # The file itself is unreadable from here on (bad encoding, corrupt workbook, ...)
+            chunk["read_error"] = f"Could not read row {row_number}: {e}"
+            chunk["done"] = True
+            break
+        chunk["rows"] += 1
+        try:
+            chunk["documents"].append(with_search_keys(ReimbursementRecord(**clean_row(parse_row(row))).model_dump()))
+            chunk["row_numbers"].append(row_number)
+        except (ValidationError, TypeError, ValueError) as e:
+            chunk["errors"].append((row_number, str(e)))
+    return chunk
+
+
+async def import_records(
+    collection,
+    rows: Iterable,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    max_errors: int = DEFAULT_MAX_ERRORS,
+    on_inserted=None,
+) -> dict:
+    """Validate rows against ReimbursementRecord and insert them in unordered batches.
+
+    Invalid rows (including NDJSON lines that are not JSON objects) and rows
+    rejected by Mongo (e.g. duplicate ids) are reported by their 1-based row
+    number; the rest of the load carries on. If the file stops being readable
+    part-way, the rows before it are still inserted and the summary's
+    ``error`` says where reading stopped. Rows are parsed and validated in a
+    thread, overlapping with the insert of the previous batch.
+    ``on_inserted`` is awaited with the documents of each batch that were
+    actually written.
+    """
+    started = time.perf_counter()
+    summary = {"rows": 0, "inserted": 0, "failed": 0, "errors": []}
+
+    def record_error(row_number: int, message: str):
+        summary["failed"] += 1
+        if len(summary["errors"]) < max_errors:
+            summary["errors"].append({"row": row_number, "error": message})
+
+    async def flush(documents: list, row_numbers: list):
+        failed = set()
+        try:
+            result = await collection.insert_many(documents, ordered=False)
+            summary["inserted"] += len(result.inserted_ids)
+        except BulkWriteError as e:
+            details = e.details
+            summary["inserted"] += details.get("nInserted", 0)
+            for write_error in details.get("writeErrors", []):
+                failed.add(write_error["index"])
+                record_error(row_numbers[write_error["index"]], write_error.get("errmsg", "Write error"))
+        if on_inserted:
+            await on_inserted([document for i, document in enumerate(documents) if i not in failed])
+
+    rows = iter(rows)
+    pending = None
+    try:
+        while True:
+            chunk = await asyncio.to_thread(_read_chunk, rows, summary["rows"] + 1, chunk_size)
+            summary["rows"] += chunk["rows"]
+            for row_number, message in chunk["errors"]:
+                record_error(row_number, message)
+            if chunk["documents"]:
+                if pending:
+                    await pending
+                pending = asyncio.ensure_future(flush(chunk["documents"], chunk["row_numbers"]))
+            if chunk["read_error"]:
+                summary["error"] = chunk["read_error"]
+            if chunk["done"]:
+                break
+        if pending:
+            await pending
+    finally:
+        # Never leave an insert (and its summary deltas) running unobserved
+        if pending and not pending.done():
+            await asyncio.gather(pending, return_exceptions=True)
+
+    elapsed = time.perf_counter() - started
+    summary["seconds"] = round(elapsed, 3)
+    summary["rows_per_second"] = round(summary["rows"] / elapsed, 1) if elapsed else None
+    return summary
@@ -0,0 +1,116 @@
+"""
+Streaming CSV / NDJSON / XLSX export of reimbursement records
+"""
+import asyncio
+import csv
+import io
+import json
+import os
+import tempfile
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Optional
+
+from models import ReimbursementRecord
+
+DEFAULT_BATCH_SIZE = 1000
+FILE_CHUNK_SIZE = 256 * 1024
+
+# Stable column order: the declaration order of ReimbursementRecord
+EXPORT_COLUMNS = list(ReimbursementRecord.model_fields)
+EXPORT_PROJECTION = {"_id": 0, **{column: 1 for column in EXPORT_COLUMNS}}
+
+EXPORT_FORMATS = {
+    "csv": "text/csv; charset=utf-8",
+    "ndjson": "application/x-ndjson",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+
+async def _batches(collection, query: dict, batch_size: int) -> AsyncIterator[list]:
+    cursor = collection.find(query, EXPORT_PROJECTION, batch_size=batch_size)
+    cursor = cursor.sort([("created_at", 1), ("id", 1)])
+    while True:
+        batch = await cursor.to_list(batch_size)
+        if not batch:
+            return
+        yield batch
+
+
+async def _csv_chunks(collection, query: dict, batch_size: int) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    # Header goes out before the first Mongo round trip
+    yield buffer.getvalue().encode()
+    async for batch in _batches(collection, query, batch_size):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows([document.get(column) for column in EXPORT_COLUMNS] for document in batch)
+        yield buffer.getvalue().encode()
+
+
+async def _ndjson_chunks(collection, query: dict, batch_size: int) -> AsyncIterator[bytes]:
+    async for batch in _batches(collection, query, batch_size):
+        yield "".join(
+            json.dumps({column: document.get(column) for column in EXPORT_COLUMNS}, default=_json_default) + "\n"
+            for document in batch
+        ).encode()
+
+
+def _append_rows(sheet, batch: list):
+    for document in batch:
+        sheet.append([document.get(column) for column in EXPORT_COLUMNS])
+
+
+async def _xlsx_chunks(collection, query: dict, batch_size: int) -> AsyncIterator[bytes]:
+    """XLSX needs a finished zip, so rows go to a write-only workbook on disk first.
+
+    openpyxl serializes each row to XML and writes it to a temp file, so
+    every batch is appended in a worker thread, off the event loop.
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Reimbursements")
+    sheet.append(EXPORT_COLUMNS)
+    async for batch in _batches(collection, query, batch_size):
+        await asyncio.to_thread(_append_rows, sheet, batch)
+
+    fd, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(fd)
+    try:
+        await asyncio.to_thread(workbook.save, path)
+        with open(path, "rb") as f:
+            while chunk := await asyncio.to_thread(f.read, FILE_CHUNK_SIZE):
+                yield chunk
+    finally:
+        os.remove(path)
+
+
+async def _gzip(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def export_records(
+    collection,
+    fmt: str,
+    query: Optional[dict] = None,
+    gzip: bool = False,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> AsyncIterator[bytes]:
+    """Return an async iterator of encoded export bytes for a StreamingResponse"""
+    producers = {"csv": _csv_chunks, "ndjson": _ndjson_chunks, "xlsx": _xlsx_chunks}
+    chunks = producers[fmt](collection, query or {}, batch_size)
+    return _gzip(chunks) if gzip else chunks
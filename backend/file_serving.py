@@ -0,0 +1,176 @@
+"""
+Byte-range (206/416) file responses, with zero-copy send where the server supports it
+and chunked streaming for files held in remote storage
+"""
+import mimetypes
+import os
+import re
+from typing import AsyncIterator, Callable, Optional
+
+import anyio
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+CHUNK_SIZE = 256 * 1024
+ZEROCOPY_EXTENSION = "http.response.zerocopysend"
+
+# Types a browser may render in place; everything else is an attachment
+INLINE_MEDIA_TYPES = {"application/pdf", "image/png", "image/jpeg", "image/gif", "image/webp"}
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class RangeNotSatisfiableError(Exception):
+    """Raised for a Range header that selects no bytes of the file"""
+
+
+def guess_media_type(filename: str) -> str:
+    media_type, _ = mimetypes.guess_type(filename)
+    return media_type or "application/octet-stream"
+
+
+def parse_range(range_header: Optional[str], size: int) -> Optional[tuple]:
+    """Return the inclusive (start, end) of a single byte range, or None for the whole file.
+
+    Multi-range and malformed headers are ignored (served as a full 200),
+    which RFC 9110 allows.
+    """
+    if not range_header:
+        return None
+    match = _RANGE_RE.match(range_header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        suffix = int(last)
+        if suffix == 0 or size == 0:
+            raise RangeNotSatisfiableError()
+        return max(size - suffix, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise RangeNotSatisfiableError()
+    return start, end
+
+
+def range_not_satisfiable(size: int) -> Response:
+    return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+
+
+def content_disposition(filename: str, media_type: str) -> str:
+    disposition = "inline" if media_type in INLINE_MEDIA_TYPES else "attachment"
+    return f'{disposition}; filename="{filename}"'
+
+
+class _RangeResponse(Response):
+    """Status, Content-Range and Content-Length for a whole file or one byte range"""
+
+    def __init__(
+        self,
+        size: int,
+        media_type: str,
+        byte_range: Optional[tuple] = None,
+        headers: Optional[dict] = None,
+    ):
+        if byte_range:
+            self.start, end = byte_range
+            status_code = 206
+        else:
+            self.start, end = 0, size - 1
+            status_code = 200
+        self.length = max(end - self.start + 1, 0)
+        self.bytes_sent = 0
+
+        all_headers = {"Accept-Ranges": "bytes", "X-Content-Type-Options": "nosniff", **(headers or {})}
+        if byte_range:
+            all_headers["Content-Range"] = f"bytes {self.start}-{end}/{size}"
+        super().__init__(status_code=status_code, headers=all_headers, media_type=media_type)
+        self.headers["content-length"] = str(self.length)
+
+
+class FileRangeResponse(_RangeResponse):
+    """Serve an already-open file descriptor, whole or as one byte range.
+
+    Uses the ASGI zerocopysend extension (sendfile) when the server offers it,
+    otherwise pread()s chunks in a worker thread. The descriptor is always
+    closed once the response is done.
+    """
+
+    def __init__(
+        self,
+        fd: int,
+        size: int,
+        media_type: str,
+        byte_range: Optional[tuple] = None,
+        headers: Optional[dict] = None,
+    ):
+        self.fd = fd
+        super().__init__(size, media_type, byte_range, headers)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await send({
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            })
+            if scope.get("method") == "HEAD" or self.length == 0:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+            elif ZEROCOPY_EXTENSION in scope.get("extensions", {}):
+                await send({
+                    "type": ZEROCOPY_EXTENSION,
+                    "file": self.fd,
+                    "offset": self.start,
+                    "count": self.length,
+                    "more_body": False,
+                })
+                self.bytes_sent = self.length
+            else:
+                offset, remaining = self.start, self.length
+                while remaining > 0:
+                    chunk = await anyio.to_thread.run_sync(os.pread, self.fd, min(CHUNK_SIZE, remaining), offset)
+                    if not chunk:
+                        break
+                    offset += len(chunk)
+                    remaining -= len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+                    self.bytes_sent += len(chunk)
+                if remaining > 0:
+                    await send({"type": "http.response.body", "body": b"", "more_body": False})
+        finally:
+            os.close(self.fd)
+        if self.background is not None:
+            await self.background()
+
+
+class StreamRangeResponse(_RangeResponse):
+    """Serve a whole file or one byte range from ``read_range(start, length)``,
+    an async iterator of chunks such as a remote storage backend provides.
+    """
+
+    def __init__(
+        self,
+        read_range: Callable[[int, int], AsyncIterator[bytes]],
+        size: int,
+        media_type: str,
+        byte_range: Optional[tuple] = None,
+        headers: Optional[dict] = None,
+    ):
+        self.read_range = read_range
+        super().__init__(size, media_type, byte_range, headers)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({
+            "type": "http.response.start",
+            "status": self.status_code,
+            "headers": self.raw_headers,
+        })
+        if scope.get("method") != "HEAD" and self.length > 0:
+            async for chunk in self.read_range(self.start, self.length):
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+                self.bytes_sent += len(chunk)
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+        if self.background is not None:
+            await self.background()
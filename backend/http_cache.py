@@ -0,0 +1,84 @@
+"""
+ETag / If-None-Match helpers and a small in-process cache of record versions
+"""
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from fastapi import Response
+
+DEFAULT_VERSION_CACHE_SIZE = 10_000
+DEFAULT_VERSION_CACHE_TTL = 5.0
+
+# Records can change at any time: always revalidate, but 304s are cheap
+RECORD_CACHE_CONTROL = "private, no-cache"
+TEMPLATE_CACHE_CONTROL = "private, max-age=60, must-revalidate"
+# Content-addressed uploads never change under the same name
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+FILE_CACHE_CONTROL = "private, no-cache"
+
+
+def content_etag(payload) -> str:
+    """Strong ETag from the SHA-256 of a JSON-serializable payload"""
+    body = json.dumps(payload, sort_keys=True, default=str, separators=(",", ":"))
+    return f'"{hashlib.sha256(body.encode()).hexdigest()[:32]}"'
+
+
+def record_etag(record: dict) -> str:
+    """Strong ETag for a reimbursement record, matching the PUT If-Match format"""
+    return f'"{record.get("version", 0)}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def not_modified(etag: str, cache_control: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": cache_control})
+
+
+class VersionCache:
+    """Bounded LRU of key -> ETag with a short TTL.
+
+    Lets a conditional GET be answered with 304 without a Mongo read. The TTL
+    bounds how long another worker's write can go unnoticed.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_VERSION_CACHE_SIZE, ttl: float = DEFAULT_VERSION_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        etag, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return etag
+
+    def set(self, key: str, etag: str):
+        self._entries[key] = (etag, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key: str):
+        self._entries.pop(key, None)
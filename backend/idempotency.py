@@ -0,0 +1,209 @@
+"""
+Idempotency-Key support: replay the stored response of a request that already ran
+
+Keys live in a Mongo collection with a TTL index so every worker sees them,
+and completed responses are also kept in a small in-process LRU. The first
+request with a key claims it by inserting a "processing" document; duplicates
+that arrive meanwhile wait for it to finish (in-process through a shared
+future, across workers by polling) and then get the same response. The claim
+is refreshed while the request runs, so only one whose worker died is taken
+over.
+"""
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+
+from fastapi import HTTPException, Response
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+IDEMPOTENCY_COLLECTION = "idempotency_keys"
+DEFAULT_TTL = 24 * 3600.0
+DEFAULT_CACHE_SIZE = 1000
+# How long a duplicate waits for the original before giving up with 409
+DEFAULT_WAIT_TIMEOUT = 30.0
+# A claim older than this is treated as abandoned (its worker died mid-request)
+DEFAULT_LOCK_TIMEOUT = 60.0
+MAX_KEY_LENGTH = 255
+REPLAYED_HEADERS = ("etag", "content-type", "location")
+
+
+def request_fingerprint(*parts) -> str:
+    """Hash of what identifies a request body, to reject a key reused for a different request"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class IdempotencyStore:
+    """Runs a handler at most once per (scope, Idempotency-Key) within the TTL"""
+
+    def __init__(
+        self,
+        ttl: float = DEFAULT_TTL,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+        wait_timeout: float = DEFAULT_WAIT_TIMEOUT,
+        lock_timeout: float = DEFAULT_LOCK_TIMEOUT,
+    ):
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self.wait_timeout = wait_timeout
+        self.lock_timeout = lock_timeout
+        self._completed = OrderedDict()
+        self._in_flight = {}
+
+    async def run(
+        self,
+        db,
+        scope: str,
+        key: str,
+        fingerprint: str,
+        handler: Callable[[], Awaitable[Response]],
+    ) -> Response:
+        """Return the stored response for this key, or run handler and store its response.
+
+        Only 2xx responses are stored; errors release the key so the client
+        can retry.
+        """
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise HTTPException(status_code=400, detail=f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters")
+        key_id = f"{scope}:{key}"
+
+        stored = self._cache_get(key_id)
+        if stored is not None:
+            return _replay(stored, fingerprint)
+
+        in_flight = self._in_flight.get(key_id)
+        if in_flight is not None:
+            # Same worker: share the first request's outcome
+            stored = await asyncio.shield(in_flight)
+            if stored is None:
+                raise HTTPException(status_code=409, detail="The original request with this Idempotency-Key failed; retry")
+            return _replay(stored, fingerprint)
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key_id] = future
+        try:
+            stored = await self._claim_or_wait(db, key_id, fingerprint)
+            if stored is not None:
+                future.set_result(stored)
+                return _replay(stored, fingerprint)
+            heartbeat = asyncio.ensure_future(self._heartbeat(db, key_id))
+            try:
+                response = await handler()
+            except BaseException:
+                await db[IDEMPOTENCY_COLLECTION].delete_one({"_id": key_id, "state": "processing"})
+                raise
+            finally:
+                heartbeat.cancel()
+            stored = await self._store(db, key_id, fingerprint, response)
+            future.set_result(stored)
+            return response
+        finally:
+            if not future.done():
+                future.set_result(None)
+            self._in_flight.pop(key_id, None)
+
+    async def _claim_or_wait(self, db, key_id: str, fingerprint: str) -> Optional[dict]:
+        """Claim the key (None) or return the response of whoever already completed it"""
+        collection = db[IDEMPOTENCY_COLLECTION]
+        deadline = time.monotonic() + self.wait_timeout
+        delay = 0.05
+        while True:
+            now = datetime.utcnow()
+            try:
+                await collection.insert_one({
+                    "_id": key_id,
+                    "state": "processing",
+                    "fingerprint": fingerprint,
+                    "created_at": now,
+                    "locked_at": now,
+                    "expires_at": now + timedelta(seconds=self.ttl),
+                })
+                return None
+            except DuplicateKeyError:
+                pass
+
+            existing = await collection.find_one({"_id": key_id})
+            if existing is None:
+                continue
+            if existing["state"] == "completed":
+                self._cache_set(key_id, existing)
+                return existing
+            # Claims from before heartbeats have no locked_at
+            locked_at = existing.get("locked_at")
+            if (locked_at or existing["created_at"]) < now - timedelta(seconds=self.lock_timeout):
+                # Abandoned claim (no heartbeat for lock_timeout): take it over
+                await collection.delete_one({"_id": key_id, "state": "processing", "locked_at": locked_at})
+                continue
+            if existing["fingerprint"] != fingerprint:
+                raise _mismatch()
+            if time.monotonic() >= deadline:
+                raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 1.0)
+
+    async def _heartbeat(self, db, key_id: str):
+        """Refresh a claim while its handler runs, so a slow request is not taken over as abandoned"""
+        while True:
+            await asyncio.sleep(self.lock_timeout / 3)
+            try:
+                await db[IDEMPOTENCY_COLLECTION].update_one(
+                    {"_id": key_id, "state": "processing"}, {"$set": {"locked_at": datetime.utcnow()}}
+                )
+            except PyMongoError:
+                # Retried on the next beat; only a claim missed for lock_timeout is taken over
+                pass
+
+    async def _store(self, db, key_id: str, fingerprint: str, response: Response) -> Optional[dict]:
+        collection = db[IDEMPOTENCY_COLLECTION]
+        if not 200 <= response.status_code < 300:
+            await collection.delete_one({"_id": key_id, "state": "processing"})
+            return None
+        stored = {
+            "_id": key_id,
+            "state": "completed",
+            "fingerprint": fingerprint,
+            "status_code": response.status_code,
+            "headers": {name: value for name, value in response.headers.items() if name in REPLAYED_HEADERS},
+            "body": bytes(response.body),
+        }
+        now = datetime.utcnow()
+        await collection.update_one(
+            {"_id": key_id},
+            {"$set": {**stored, "completed_at": now, "expires_at": now + timedelta(seconds=self.ttl)}},
+        )
+        self._cache_set(key_id, stored)
+        return stored
+
+    def _cache_get(self, key_id: str) -> Optional[dict]:
+        entry = self._completed.get(key_id)
+        if entry is None:
+            return None
+        stored, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._completed[key_id]
+            return None
+        self._completed.move_to_end(key_id)
+        return stored
+
+    def _cache_set(self, key_id: str, stored: dict):
+        self._completed[key_id] = (stored, time.monotonic() + self.ttl)
+        self._completed.move_to_end(key_id)
+        while len(self._completed) > self.cache_size:
+            self._completed.popitem(last=False)
+
+
+def _mismatch() -> HTTPException:
+    return HTTPException(status_code=422, detail="Idempotency-Key was already used for a different request")
+
+
+def _replay(stored: dict, fingerprint: str) -> Response:
+    if stored["fingerprint"] != fingerprint:
+        raise _mismatch()
+    headers = {**stored["headers"], "Idempotent-Replayed": "true"}
+    return Response(content=stored["body"], status_code=stored["status_code"], headers=headers)
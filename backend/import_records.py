@@ -0,0 +1,55 @@
+"""
+Command-line bulk import of reimbursement records
+
+Usage: python import_records.py master.xlsx --chunk-size 2000
+"""
+import asyncio
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Optional
+sys.path.append(str(Path(__file__).parent))
+
+import typer
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from bulk_import import DEFAULT_CHUNK_SIZE, IMPORT_FORMATS, detect_format, import_records, iter_rows
+from summaries import record_summary_inserts
+
+load_dotenv(Path(__file__).parent / '.env')
+
+
+def main(
+    path: Path = typer.Argument(..., exists=True, dir_okay=False, help="NDJSON, CSV or XLSX file"),
+    format: Optional[str] = typer.Option(None, help="One of ndjson, csv, xlsx; guessed from the extension"),
+    chunk_size: int = typer.Option(DEFAULT_CHUNK_SIZE, help="Documents per insert_many batch"),
+):
+    """Import reimbursement records into MongoDB and print a JSON summary"""
+    fmt = format or detect_format(path.name)
+    if fmt not in IMPORT_FORMATS:
+        raise typer.BadParameter(f"format must be one of: {', '.join(IMPORT_FORMATS)}")
+
+    async def run():
+        client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+        db = client[os.environ['DB_NAME']]
+        try:
+            with open(path, "rb") as stream:
+                return await import_records(
+                    db.reimbursement_records,
+                    iter_rows(stream, fmt),
+                    chunk_size=chunk_size,
+                    on_inserted=lambda documents: record_summary_inserts(db, documents),
+                )
+        finally:
+            client.close()
+
+    summary = asyncio.run(run())
+    typer.echo(json.dumps(summary, indent=2))
+    typer.echo(f"{summary['inserted']} inserted, {summary['failed']} failed, "
+               f"{summary['rows_per_second']} rows/s", err=True)
+
+
+if __name__ == "__main__":
+    typer.run(main)
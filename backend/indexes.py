@@ -0,0 +1,84 @@
+"""
+MongoDB index definitions and an idempotent bootstrap run at startup
+"""
+import logging
+
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+from pymongo.errors import PyMongoError
+
+from search import RANK_INDEX, SEARCH_FIELDS, SEARCH_RANK_FIELD
+
+logger = logging.getLogger(__name__)
+
+# Every field the API filters or sorts on, per collection. Listing endpoints
+# page on (created_at, id) / (timestamp, id), so filters carry that suffix too.
+INDEXES = {
+    "reimbursement_records": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("city_code_user", ASCENDING)], name="city_code_user"),
+        IndexModel(
+            [("city_assigned_user", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)],
+            name="city_assigned_user_created_at",
+        ),
+        IndexModel(
+            [("state_user", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)],
+            name="state_user_created_at",
+        ),
+        IndexModel([("created_at", ASCENDING), ("id", ASCENDING)], name="created_at_id"),
+        # Autocomplete: anchored prefix regexes on the weighted tokens, cut off per rank tier
+        IndexModel([(SEARCH_RANK_FIELD, ASCENDING), ("id", ASCENDING)], name=RANK_INDEX),
+        # Whole-word fallback search; a collection can have only one text index
+        IndexModel(
+            [(f"{base}_{side}", TEXT) for base in SEARCH_FIELDS for side in ("excel", "user")],
+            name="search_text",
+            weights={f"{base}_{side}": weight for base, weight in SEARCH_FIELDS.items() for side in ("excel", "user")},
+            default_language="none",
+        ),
+    ],
+    "uploaded_files": [
+        IndexModel([("filename", ASCENDING)], name="filename_unique", unique=True),
+    ],
+    # A time-series collection (see status_history.py), which cannot have unique indexes
+    "status_checks": [
+        IndexModel([("timestamp", ASCENDING), ("id", ASCENDING)], name="timestamp_id"),
+        IndexModel(
+            [("client_name", ASCENDING), ("timestamp", ASCENDING), ("id", ASCENDING)],
+            name="client_name_timestamp",
+        ),
+        # Latest heartbeat per client
+        IndexModel([("client_name", ASCENDING), ("timestamp", DESCENDING)], name="client_name_latest"),
+    ],
+    # Stored Idempotency-Key responses expire on their own
+    "idempotency_keys": [
+        IndexModel([("expires_at", ASCENDING)], name="expires_at_ttl", expireAfterSeconds=0),
+    ],
+    # Background jobs are polled by id; startup recovery looks up unfinished ones by status
+    "jobs": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("status", ASCENDING)], name="status"),
+    ],
+}
+
+
+async def ensure_indexes(db, indexes: dict = INDEXES) -> dict:
+    """Create any missing indexes and return the names created per collection.
+
+    Indexes that already exist are left alone, so this is safe to run on
+    every startup.
+    """
+    created = {}
+    for collection_name, models in indexes.items():
+        collection = db[collection_name]
+        existing = set((await collection.index_information()).keys())
+        missing = [model for model in models if model.document["name"] not in existing]
+        if not missing:
+            logger.info(f"Indexes on {collection_name} already present")
+            continue
+        try:
+            names = await collection.create_indexes(missing)
+        except PyMongoError as e:
+            logger.error(f"Error creating indexes on {collection_name}: {e}")
+            continue
+        created[collection_name] = names
+        logger.info(f"Created indexes on {collection_name}: {', '.join(names)}")
+    return created
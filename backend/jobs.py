@@ -0,0 +1,397 @@
+"""
+Background jobs for heavy operations, run in a local process pool
+
+A job is a document in the ``jobs`` collection (status, progress, result)
+plus one call of a job function in a worker process. Worker processes run
+their own event loop and Mongo client, so exports, reconciliation reports and
+bulk imports never block the API's event loop. File results are written to a
+spool file in the worker and moved into upload storage by the API process,
+where /api/download serves them. Concurrency is limited per job type and
+per API process (each worker process has its own JobManager and limits);
+cancellation is cooperative (workers check for it whenever they report
+progress).
+
+Every job records the JobManager that owns it and a heartbeat that manager
+refreshes while the job is queued or running. Recovery only fails jobs whose
+owner's heartbeat has expired, so one API worker (re)starting does not fail
+jobs that other workers are still running.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import time
+import uuid
+from concurrent.futures import Executor, ProcessPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional
+
+JOBS_COLLECTION = "jobs"
+JOB_TYPES = ("export", "reconciliation", "import")
+DEFAULT_WORKERS = 2
+DEFAULT_TYPE_LIMIT = 1
+PROGRESS_INTERVAL = 0.5
+ACTIVE_STATUSES = ("queued", "running")
+# Seconds between heartbeats, and without one before a job counts as orphaned
+HEARTBEAT_INTERVAL = 10.0
+HEARTBEAT_TIMEOUT = 60.0
+
+logger = logging.getLogger(__name__)
+
+
+class JobCancelled(Exception):
+    """Raised inside a worker when the job was cancelled while running"""
+
+
+def parse_type_limits(spec: Optional[str]) -> dict:
+    """Parse "export=2,import=1" into per-type concurrency limits"""
+    limits = {job_type: DEFAULT_TYPE_LIMIT for job_type in JOB_TYPES}
+    for part in (spec or "").split(","):
+        if not part.strip():
+            continue
+        job_type, _, limit = part.partition("=")
+        if job_type.strip() not in JOB_TYPES:
+            raise ValueError(f"Unknown job type {job_type.strip()!r}")
+        limits[job_type.strip()] = int(limit)
+    return limits
+
+
+# --- worker side -----------------------------------------------------------
+
+class JobProgress:
+    """Throttled progress writes from a worker; notices cancellation requests"""
+
+    def __init__(self, jobs, job_id: str, total: Optional[int] = None, unit: str = "records"):
+        self.jobs = jobs
+        self.job_id = job_id
+        self.done = 0
+        self.total = total
+        self.unit = unit
+        self.cancelled = False
+        self._last_flush = 0.0
+
+    def advance(self, count: int):
+        """Count work done; raises JobCancelled once a cancellation has been seen"""
+        if self.cancelled:
+            raise JobCancelled()
+        self.done += count
+
+    async def flush(self, force: bool = False, raise_cancelled: bool = True):
+        """Write progress at most every PROGRESS_INTERVAL and pick up cancellation requests"""
+        now = time.monotonic()
+        if not force and now - self._last_flush < PROGRESS_INTERVAL:
+            return
+        self._last_flush = now
+        job = await self.jobs.find_one_and_update(
+            {"id": self.job_id},
+            {"$set": {"progress": {"done": self.done, "total": self.total, "unit": self.unit}}},
+            projection={"cancel_requested": 1},
+        )
+        if job and job.get("cancel_requested"):
+            self.cancelled = True
+            if raise_cancelled:
+                raise JobCancelled()
+
+
+async def _export_job(db, params: dict, output: Path, progress: JobProgress) -> dict:
+    from export import export_records
+
+    progress.unit = "bytes"
+    digest = hashlib.sha256()
+    with open(output, "wb") as out:
+        async for chunk in export_records(
+            db.reimbursement_records, params["format"], params.get("query"), gzip=params.get("gzip", False)
+        ):
+            out.write(chunk)
+            digest.update(chunk)
+            progress.advance(len(chunk))
+            await progress.flush()
+    return {"sha256": digest.hexdigest()}
+
+
+async def _reconciliation_job(db, params: dict, output: Path, progress: JobProgress) -> dict:
+    from reconciliation import reconcile
+
+    query = params.get("query") or {}
+    progress.total = await db.reimbursement_records.count_documents(query)
+    flushes = []
+
+    def on_chunk(rows):
+        # Called synchronously by reconcile; the write happens in the background
+        progress.advance(len(rows))
+        flushes.append(asyncio.ensure_future(progress.flush(raise_cancelled=False)))
+
+    report = await reconcile(
+        db.reimbursement_records,
+        query,
+        tolerance_pct=params.get("tolerance_pct", 0.0),
+        tolerance_abs=params.get("tolerance_abs", 0.0),
+        top=params.get("top", 50),
+        on_chunk=on_chunk,
+    )
+    await asyncio.gather(*flushes)
+    progress.advance(0)
+    body = json.dumps(report, default=str).encode()
+    output.write_bytes(body)
+    return {"sha256": hashlib.sha256(body).hexdigest(), "summary": {
+        key: value for key, value in report.items() if not isinstance(value, (list, dict))
+    }}
+
+
+async def _import_job(db, params: dict, output: Path, progress: JobProgress) -> dict:
+    from bulk_import import import_records, iter_rows
+    from summaries import record_summary_inserts
+
+    async def on_inserted(documents):
+        await record_summary_inserts(db, documents)
+        progress.advance(len(documents))
+        await progress.flush()
+
+    with open(params["input_path"], "rb") as stream:
+        summary = await import_records(
+            db.reimbursement_records,
+            iter_rows(stream, params["format"]),
+            chunk_size=params.get("chunk_size", 1000),
+            on_inserted=on_inserted,
+        )
+    return {"summary": summary}
+
+
+JOB_FUNCTIONS = {
+    "export": _export_job,
+    "reconciliation": _reconciliation_job,
+    "import": _import_job,
+}
+
+
+async def _run(db, job_type: str, job_id: str, params: dict, output_path: str) -> dict:
+    progress = JobProgress(db[JOBS_COLLECTION], job_id)
+    result = await JOB_FUNCTIONS[job_type](db, params, Path(output_path), progress)
+    await progress.flush(force=True)
+    result["progress"] = {"done": progress.done, "total": progress.total, "unit": progress.unit}
+    return result
+
+
+def run_job(job_type: str, job_id: str, params: dict, output_path: str, mongo_url: str, db_name: str) -> dict:
+    """Worker-process entry point: run one job with its own event loop and Mongo client"""
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    async def run():
+        client = AsyncIOMotorClient(mongo_url)
+        try:
+            return await _run(client[db_name], job_type, job_id, params, output_path)
+        finally:
+            client.close()
+
+    return asyncio.run(run())
+
+
+def in_process_runner(db):
+    """Runner for a thread pool that uses the API's own database object (the in-memory test mode)"""
+    def run(job_type: str, job_id: str, params: dict, output_path: str, mongo_url: str, db_name: str) -> dict:
+        return asyncio.run(_run(db, job_type, job_id, params, output_path))
+
+    return run
+
+
+# --- API side --------------------------------------------------------------
+
+class JobManager:
+    """Submits jobs to the process pool and records their lifecycle in Mongo
+
+    type_limits cap concurrent jobs per type in this process only; with
+    several API worker processes the cluster-wide cap is limit x workers.
+    """
+
+    def __init__(
+        self,
+        db,
+        storage,
+        mongo_url: str,
+        db_name: str,
+        workers: int = DEFAULT_WORKERS,
+        type_limits: Optional[dict] = None,
+        on_result=None,
+        executor: Optional[Executor] = None,
+        runner=run_job,
+        owner: Optional[str] = None,
+        heartbeat_interval: float = HEARTBEAT_INTERVAL,
+        heartbeat_timeout: float = HEARTBEAT_TIMEOUT,
+    ):
+        self.db = db
+        self.storage = storage
+        self.mongo_url = mongo_url
+        self.db_name = db_name
+        self.workers = workers
+        self.limits = {
+            job_type: asyncio.Semaphore(limit)
+            for job_type, limit in (type_limits or parse_type_limits(None)).items()
+        }
+        # Awaited with upload metadata for each stored result file
+        self.on_result = on_result
+        # Tests pass a thread pool and a fake runner instead of worker processes
+        self._executor = executor
+        self.runner = runner
+        self._tasks = {}
+        # Identifies this manager's jobs; unique per process and per start
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self._maintenance = None
+
+    @property
+    def jobs(self):
+        return self.db[JOBS_COLLECTION]
+
+    def _pool(self) -> Executor:
+        if self._executor is None:
+            # spawn: forking a process that runs Motor's threads is not safe
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+    async def start(self):
+        """Recover orphaned jobs, then keep heartbeating this manager's jobs and recovering others'"""
+        await self.recover()
+        self._maintenance = asyncio.ensure_future(self._maintain())
+
+    async def _maintain(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await self.heartbeat()
+                await self.recover()
+            except Exception as e:
+                logger.error(f"Error maintaining jobs: {e}")
+
+    async def heartbeat(self):
+        await self.jobs.update_many(
+            {"owner": self.owner, "status": {"$in": list(ACTIVE_STATUSES)}},
+            {"$set": {"heartbeat_at": datetime.utcnow()}},
+        )
+
+    async def recover(self):
+        """Mark queued/running jobs whose owner stopped heartbeating as failed"""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.heartbeat_timeout)
+        result = await self.jobs.update_many(
+            {
+                "status": {"$in": list(ACTIVE_STATUSES)},
+                "owner": {"$ne": self.owner},
+                # Jobs from before heartbeats have none
+                "$or": [{"heartbeat_at": {"$lt": cutoff}}, {"heartbeat_at": None}],
+            },
+            {"$set": {"status": "failed", "error": "Interrupted by a server restart", "finished_at": datetime.utcnow()}},
+        )
+        if result.modified_count:
+            logger.warning(f"Marked {result.modified_count} interrupted jobs as failed")
+
+    async def submit(self, job_type: str, params: dict, result_ext: Optional[str] = None,
+                     content_type: Optional[str] = None, cleanup: tuple = ()) -> dict:
+        """Record a queued job and schedule it; returns the job document.
+
+        Jobs with a ``result_ext`` store their output as ``job-<id><ext>`` in
+        upload storage; ``cleanup`` paths are removed once the job is over.
+        """
+        job_id = str(uuid.uuid4())
+        result_name = f"job-{job_id}{result_ext}" if result_ext else None
+        now = datetime.utcnow()
+        job = {
+            "id": job_id,
+            "type": job_type,
+            "params": {key: value for key, value in params.items() if key != "input_path"},
+            "status": "queued",
+            "progress": {"done": 0, "total": None, "unit": None},
+            "result": None,
+            "error": None,
+            "cancel_requested": False,
+            "owner": self.owner,
+            "heartbeat_at": now,
+            "created_at": now,
+            "started_at": None,
+            "finished_at": None,
+        }
+        await self.jobs.insert_one(dict(job))
+        task = asyncio.ensure_future(self._execute(job_id, job_type, params, result_name, content_type, cleanup))
+        self._tasks[job_id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job_id, None))
+        return job
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        return await self.jobs.find_one({"id": job_id}, {"_id": 0})
+
+    async def cancel(self, job_id: str) -> Optional[dict]:
+        """Cancel a queued job at once; ask a running one to stop at its next progress report"""
+        result = await self.jobs.update_one(
+            {"id": job_id, "status": "queued"},
+            {"$set": {"status": "cancelled", "cancel_requested": True, "finished_at": datetime.utcnow()}},
+        )
+        if not result.modified_count:
+            await self.jobs.update_one({"id": job_id, "status": "running"}, {"$set": {"cancel_requested": True}})
+        return await self.get(job_id)
+
+    async def _execute(self, job_id, job_type, params, result_name, content_type, cleanup):
+        output = self.storage.spool_dir / f".job-{job_id}.part"
+        try:
+            async with self.limits[job_type]:
+                started = await self.jobs.update_one(
+                    {"id": job_id, "status": "queued"},
+                    {"$set": {"status": "running", "started_at": datetime.utcnow()}},
+                )
+                if not started.modified_count:
+                    return  # cancelled while queued
+
+                loop = asyncio.get_running_loop()
+                try:
+                    outcome = await loop.run_in_executor(
+                        self._pool(), self.runner, job_type, job_id, params, str(output), self.mongo_url, self.db_name
+                    )
+                except JobCancelled:
+                    await self._finish(job_id, "cancelled")
+                    return
+
+                result = {key: value for key, value in outcome.items() if key not in ("progress", "sha256")}
+                if result_name and output.exists():
+                    size = output.stat().st_size
+                    await self.storage.put_file(result_name, output, content_type)
+                    metadata = {
+                        "filename": result_name,
+                        "original_name": result_name,
+                        "size": size,
+                        "sha256": outcome.get("sha256"),
+                        "content_type": content_type,
+                    }
+                    if self.on_result:
+                        await self.on_result(metadata)
+                    result.update(filename=result_name, size=size, download_url=f"/api/download/{result_name}")
+                await self._finish(job_id, "succeeded", result=result, progress=outcome.get("progress"))
+        except asyncio.CancelledError:
+            await self._finish(job_id, "failed", error="Server shut down before the job finished")
+            raise
+        except Exception as e:
+            logger.error(f"Job {job_id} ({job_type}) failed: {e}")
+            await self._finish(job_id, "failed", error=str(e))
+        finally:
+            for path in (output, *cleanup):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    async def _finish(self, job_id: str, status: str, **fields):
+        update = {"status": status, "finished_at": datetime.utcnow()}
+        update.update({key: value for key, value in fields.items() if value is not None})
+        # A job another worker already recovered as failed stays failed
+        await self.jobs.update_one({"id": job_id, "status": {"$in": list(ACTIVE_STATUSES)}}, {"$set": update})
+
+    async def close(self):
+        if self._maintenance is not None:
+            self._maintenance.cancel()
+        for task in list(self._tasks.values()):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
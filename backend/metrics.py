@@ -0,0 +1,233 @@
+"""
+Prometheus metrics: HTTP latency, MongoDB commands and pool waits, file bytes, record cache and admission control
+
+MetricsMiddleware times every request by its route template; the pymongo
+listeners time each command by collection and operation and the wait for a
+pooled connection. With a slow-request threshold set, requests slower than it
+are logged together with the Mongo commands they issued.
+"""
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest
+from pymongo import monitoring
+from starlette.routing import Match
+
+REGISTRY = CollectorRegistry(auto_describe=True)
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests by route and status", ["method", "route", "status"], registry=REGISTRY
+)
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ["method", "route"], registry=REGISTRY
+)
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests currently being served, by route", ["method", "route"], registry=REGISTRY
+)
+MONGO_COMMAND_LATENCY = Histogram(
+    "mongodb_command_duration_seconds",
+    "MongoDB command latency by collection and operation",
+    ["collection", "command", "outcome"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+    registry=REGISTRY,
+)
+MONGO_POOL_WAIT = Histogram(
+    "mongodb_pool_checkout_wait_seconds",
+    "Time spent waiting to check a connection out of the pool",
+    ["outcome"],
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0),
+    registry=REGISTRY,
+)
+UPLOAD_BYTES = Counter("upload_bytes_total", "Bytes received in file uploads", registry=REGISTRY)
+DOWNLOAD_BYTES = Counter("download_bytes_total", "Bytes sent in file downloads", registry=REGISTRY)
+RECORD_CACHE_LOOKUPS = Counter(
+    "record_cache_lookups_total", "By-id record cache lookups by result (hit/miss)", ["result"], registry=REGISTRY
+)
+RECORD_CACHE_EVICTIONS = Counter(
+    "record_cache_evictions_total", "By-id record cache evictions by reason", ["reason"], registry=REGISTRY
+)
+ADMISSION_REJECTED = Counter(
+    "admission_rejected_total", "Requests shed by admission control", ["route_class", "reason"], registry=REGISTRY
+)
+ADMISSION_LIMIT = Gauge(
+    "admission_concurrency_limit", "Current concurrency limit per route class", ["route_class"], registry=REGISTRY
+)
+ADMISSION_QUEUED = Gauge(
+    "admission_queued_requests", "Requests waiting for a slot per route class", ["route_class"], registry=REGISTRY
+)
+RECORD_CACHE_COHERENT = Gauge(
+    "record_cache_change_stream_active", "1 while the record cache is invalidated by a change stream", registry=REGISTRY
+)
+
+# Label for requests that matched no route, so unknown paths can't blow up cardinality
+UNMATCHED_ROUTE = "unmatched"
+
+# Commands issued by the current request, when the slow-request log is on.
+# Motor runs pymongo in a thread pool with a copy of the caller's context,
+# so the listeners see the request's list.
+_request_commands: ContextVar[Optional[list]] = ContextVar("request_commands", default=None)
+
+
+def route_template(routes, scope) -> str:
+    """Template of the route the router will pick for scope, or UNMATCHED_ROUTE.
+
+    Matches the way Starlette's router does: the first full match, else
+    the first route whose path matched but not its method (a 405).
+    """
+    partial = None
+    for route in routes:
+        match, _ = route.matches(scope)
+        if match is Match.FULL:
+            return route.path_format
+        if match is Match.PARTIAL and partial is None:
+            partial = route.path_format
+    return partial or UNMATCHED_ROUTE
+
+
+def render_metrics() -> tuple:
+    """Body and content type of the Prometheus text exposition"""
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+class CommandTimer(monitoring.CommandListener):
+    """Times MongoDB commands, labelled by collection and command name"""
+
+    def __init__(self):
+        self._collections = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        self._collections[(event.connection_id, event.request_id)] = (
+            collection if isinstance(collection, str) else ""
+        )
+
+    def succeeded(self, event):
+        self._observe(event, "success")
+
+    def failed(self, event):
+        self._observe(event, "failure")
+
+    def _observe(self, event, outcome: str):
+        collection = self._collections.pop((event.connection_id, event.request_id), "")
+        seconds = event.duration_micros / 1e6
+        MONGO_COMMAND_LATENCY.labels(collection, event.command_name, outcome).observe(seconds)
+        commands = _request_commands.get()
+        if commands is not None:
+            commands.append(f"{event.command_name} {collection} {seconds * 1000:.1f}ms {outcome}")
+
+
+class PoolWaitTimer(monitoring.ConnectionPoolListener):
+    """Times connection checkouts; start and end arrive on the same thread"""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        self._observe("success")
+
+    def connection_check_out_failed(self, event):
+        self._observe("failure")
+
+    def _observe(self, outcome: str):
+        started = getattr(self._local, "started", None)
+        if started is not None:
+            MONGO_POOL_WAIT.labels(outcome).observe(time.perf_counter() - started)
+            self._local.started = None
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+    def connection_checked_in(self, event):
+        pass
+
+
+def mongo_listeners() -> list:
+    """Listeners to pass as event_listeners when creating the Mongo client"""
+    return [CommandTimer(), PoolWaitTimer()]
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording per-route count, latency and in-flight requests.
+
+    Everything is labelled by route template (e.g.
+    /api/reimbursement/{record_id}). Count and latency take it from the
+    route the router picked; the in-flight gauge goes up before routing, so
+    it matches the app's routes itself. If slow_request_seconds is set,
+    slower requests are logged with their Mongo commands.
+    """
+
+    def __init__(self, app, slow_request_seconds: Optional[float] = None):
+        self.app = app
+        self.slow_request_seconds = slow_request_seconds
+        # labels() is a locked dict lookup; keep the children we have already resolved
+        self._children = {}
+
+    def _child(self, metric, *labels):
+        key = (metric, labels)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = metric.labels(*labels)
+        return child
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        commands = [] if self.slow_request_seconds is not None else None
+        token = _request_commands.set(commands)
+        # Starlette puts the app in the scope before its middleware stack; bare apps are wrapped directly
+        app = scope.get("app", self.app)
+        in_flight = self._child(HTTP_IN_FLIGHT, method, route_template(getattr(app, "routes", ()), scope))
+        in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            in_flight.dec()
+            _request_commands.reset(token)
+            route = scope.get("route")
+            route_name = getattr(route, "path_format", None) or UNMATCHED_ROUTE
+            self._child(HTTP_REQUESTS, method, route_name, status).inc()
+            self._child(HTTP_LATENCY, method, route_name).observe(elapsed)
+            if commands is not None and elapsed >= self.slow_request_seconds:
+                logging.warning(
+                    f"Slow request: {method} {scope['path']} ({route_name}) -> {status} "
+                    f"in {elapsed * 1000:.1f}ms; {len(commands)} Mongo commands: {'; '.join(commands) or 'none'}"
+                )
@@ -0,0 +1,54 @@
+"""
+Script to convert a regular status_checks collection into a time-series collection
+
+The API creates status_checks as a time-series collection only when it does
+not exist yet. This renames an existing one to status_checks_legacy, creates
+the time-series collection with STATUS_CHECK_TTL_SECONDS and copies the status
+checks still within the TTL. Stop the API while it runs.
+
+Usage: python migrate_status_checks.py [--batch-size 10000] [--keep-legacy]
+"""
+import asyncio
+import os
+import sys
+import time
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent))
+
+import typer
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from indexes import ensure_indexes
+from status_history import DEFAULT_TTL, STATUS_COLLECTION, migrate_to_timeseries
+
+# Load environment variables
+load_dotenv(Path(__file__).parent / '.env')
+
+
+def main(
+    batch_size: int = typer.Option(10_000, help="Status checks per insert_many"),
+    keep_legacy: bool = typer.Option(False, help="Keep status_checks_legacy after copying"),
+):
+    """Copy status_checks into a new time-series collection with a TTL"""
+
+    async def run():
+        client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+        db = client[os.environ['DB_NAME']]
+        try:
+            started = time.perf_counter()
+            ttl = int(os.environ.get('STATUS_CHECK_TTL_SECONDS', DEFAULT_TTL))
+            copied = await migrate_to_timeseries(db, ttl, batch_size)
+            await ensure_indexes(db)
+            if not keep_legacy:
+                await db[f"{STATUS_COLLECTION}_legacy"].drop()
+            typer.echo(f"Copied {copied} status checks into the time-series collection "
+                       f"in {time.perf_counter() - started:.1f}s")
+        finally:
+            client.close()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,147 @@
+"""
+Pydantic models for reimbursement records, batch updates and status checks
+
+Every reimbursement field comes as a pair: an uneditable ``<name>_excel``
+value from the master sheet and an editable ``<name>_user`` value. The
+pairs are declared once in RECORD_SCHEMA and both models are derived from it.
+"""
+import uuid
+from datetime import datetime
+from typing import List, Optional
+
+from pydantic import BaseModel, Field, create_model
+
+
+# (group, [(base field name, type), ...]) in display order
+RECORD_SCHEMA = [
+    # Basic Information
+    ("basic", [
+        ("city_code", str),
+        ("name", str),
+        ("state", str),
+        ("city_assigned", str),
+        ("mobile", str),
+        ("email", str),
+        ("num_exam_centres", int),
+    ]),
+    # Bank Details
+    ("bank", [
+        ("bank_name", str),
+        ("ifsc", str),
+        ("beneficiary_name", str),
+        ("bank_account_number", str),
+    ]),
+    # Claim Fields
+    ("claims", [
+        ("city_coordinator_claim", float),
+        ("admin_staff_claim", float),
+        ("support_staff_claim", float),
+        ("refreshment_claim", float),
+        ("observer_claim", float),
+        ("num_observers", int),
+        ("claim_district_personnel", float),
+        ("assistant_staff_district", float),
+        ("support_staff_district", float),
+        ("claim_police_personnel", float),
+        ("support_staff_police", float),
+        ("duty_magistrate_claim", float),
+        ("num_duty_magistrates", int),
+        ("team_leader_claim", float),
+        ("num_team_leaders", int),
+        ("police_escort_claim", float),
+        ("num_police_escort", int),
+        ("police_frisking_claim", float),
+        ("num_police_frisking", int),
+        ("security_personnel_claim", float),
+        ("num_security_personnel", int),
+        ("bank_custodian_claim", float),
+        ("district_education_officer_claim", float),
+        ("support_staff_deo_claim", float),
+    ]),
+]
+
+# Named field subsets for list projections; each base name expands to its
+# _excel and _user pair
+RECORD_FIELD_GROUPS = {group: [name for name, _ in fields] for group, fields in RECORD_SCHEMA}
+
+
+def _paired_fields(side: str) -> dict:
+    return {
+        f"{name}_{side}": (Optional[field_type], None)
+        for _, fields in RECORD_SCHEMA for name, field_type in fields
+    }
+
+
+def _interleaved_fields() -> dict:
+    """Excel then user fields per group, matching the historical column order"""
+    fields = {}
+    for group, group_fields in RECORD_SCHEMA:
+        for side in ("excel", "user"):
+            fields.update({
+                f"{name}_{side}": (Optional[field_type], None) for name, field_type in group_fields
+            })
+    return fields
+
+
+ReimbursementCreate = create_model(
+    "ReimbursementCreate",
+    **_paired_fields("user"),
+    supporting_document_bills=(Optional[str], None),
+)
+
+ReimbursementRecord = create_model(
+    "ReimbursementRecord",
+    id=(str, Field(default_factory=lambda: str(uuid.uuid4()))),
+    sno=(Optional[int], None),
+    **_interleaved_fields(),
+    supporting_document_bills=(Optional[str], None),
+    version=(int, 1),
+    created_at=(datetime, Field(default_factory=datetime.utcnow)),
+    updated_at=(datetime, Field(default_factory=datetime.utcnow)),
+)
+
+
+# Stored document skeleton in field order; filled in by new_record_document
+_EMPTY_RECORD = {name: None for name in ReimbursementRecord.model_fields}
+
+
+def new_record_document(data: ReimbursementCreate) -> dict:
+    """Build the stored document for an already-validated create request.
+
+    Skips a second validation pass: the user fields were validated by
+    ReimbursementCreate and everything else is a default.
+    """
+    now = datetime.utcnow()
+    document = dict(_EMPTY_RECORD)
+    document.update(data.model_dump())
+    document.update(id=str(uuid.uuid4()), version=1, created_at=now, updated_at=now)
+    return document
+
+
+class StatusCheck(BaseModel):
+    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
+    client_name: str
+    timestamp: datetime = Field(default_factory=datetime.utcnow)
+
+class StatusCheckCreate(BaseModel):
+    client_name: str
+
+
+# Most records one PATCH /api/reimbursement/batch request may change
+MAX_BATCH_UPDATES = 10_000
+
+
+class BatchUpdate(BaseModel):
+    id: str
+    # Partial update, validated against ReimbursementCreate
+    fields: dict
+    # Only update if the record is still at this version (like If-Match)
+    version: Optional[int] = None
+
+class BatchUpdateRequest(BaseModel):
+    """Either updates, or filter plus set to apply one change to every matching record"""
+    updates: Optional[List[BatchUpdate]] = Field(None, max_length=MAX_BATCH_UPDATES)
+    filter: Optional[dict] = None
+    set: Optional[dict] = None
+    # All-or-nothing in a multi-document transaction (needs a replica set)
+    transaction: bool = False
@@ -0,0 +1,121 @@
+"""
+Mongo client lifecycle: creation, connection-pool warm-up and health for readiness checks
+
+PoolMonitor follows pymongo's connection pool events, so readiness can
+report how many connections are open and checked out without reaching into
+driver internals. The in-memory stand-in (MONGO_URL=memory://) has no pool;
+its health is just a ping.
+"""
+import asyncio
+import logging
+import threading
+import time
+
+from pymongo import monitoring
+from pymongo.errors import PyMongoError
+
+# A readiness probe should answer quickly even when the server is gone
+DEFAULT_PING_TIMEOUT = 2.0
+
+logger = logging.getLogger(__name__)
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Open and checked-out connection counts across the client's pools; fed from pymongo's threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.open = 0
+        self.in_use = 0
+        self.check_out_failures = 0
+        self.cleared = 0
+
+    def _add(self, name: str, amount: int = 1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self._add("cleared")
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self._add("open")
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self._add("open", -1)
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self._add("check_out_failures")
+
+    def connection_checked_out(self, event):
+        self._add("in_use")
+
+    def connection_checked_in(self, event):
+        self._add("in_use", -1)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "open": self.open,
+                "in_use": self.in_use,
+                "check_out_failures": self.check_out_failures,
+                "cleared": self.cleared,
+            }
+
+
+def create_mongo_client(settings, event_listeners: list):
+    """Motor client for settings.mongo_url, or the in-memory stand-in for memory://"""
+    if settings.in_memory:
+        # Test-only dependency, imported only in the test mode
+        from mongomock_motor import AsyncMongoMockClient
+
+        return AsyncMongoMockClient()
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    return AsyncIOMotorClient(
+        settings.mongo_url,
+        minPoolSize=settings.mongo_min_pool_size,
+        maxPoolSize=settings.mongo_max_pool_size,
+        event_listeners=event_listeners,
+    )
+
+
+async def warm_pool(client, connections: int) -> bool:
+    """Open `connections` pooled connections with concurrent pings; False if Mongo is unreachable"""
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(client.admin.command("ping") for _ in range(max(connections, 1))))
+    except PyMongoError as e:
+        logger.warning(f"Mongo pool warm-up failed: {e}")
+        return False
+    logger.info(f"Mongo pool warmed with {connections} connections in {(time.perf_counter() - started) * 1000:.0f} ms")
+    return True
+
+
+async def pool_health(client, monitor, min_size: int, max_size: int, timeout: float = DEFAULT_PING_TIMEOUT) -> dict:
+    """Ping round trip and pool usage; "ok" is False if the ping failed or timed out"""
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(client.admin.command("ping"), timeout)
+        health = {"ok": True, "ping_ms": round((time.perf_counter() - started) * 1000, 2)}
+    except (PyMongoError, asyncio.TimeoutError) as e:
+        health = {"ok": False, "error": str(e) or "ping timed out"}
+    if monitor is None:
+        health["pool"] = None
+    else:
+        health["pool"] = {**monitor.stats(), "min_size": min_size, "max_size": max_size}
+    return health
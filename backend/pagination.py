@@ -0,0 +1,73 @@
+"""
+Keyset (cursor) pagination over (sort_field, id) for Mongo collections
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Optional
+
+
+class InvalidCursorError(ValueError):
+    """Raised when a continuation cursor cannot be decoded"""
+
+
+def encode_cursor(sort_value: Optional[datetime], record_id: str) -> str:
+    """Encode the last (sort value, id) of a page as an opaque token"""
+    payload = json.dumps([sort_value and sort_value.isoformat(), record_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple:
+    """Decode a token produced by encode_cursor back into (datetime or None, id)"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, record_id = json.loads(base64.urlsafe_b64decode(padded))
+        return sort_value and datetime.fromisoformat(sort_value), str(record_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursorError("Invalid pagination cursor") from e
+
+
+async def fetch_page(
+    collection,
+    query: dict,
+    sort_field: str,
+    limit: int,
+    cursor: Optional[str] = None,
+    projection: Optional[dict] = None,
+) -> dict:
+    """Return one page of documents sorted on (sort_field, id).
+
+    Only documents strictly after the cursor are read, so every page costs
+    the same regardless of how deep into the collection it is. Documents
+    without sort_field (written before it existed) sort first, as null.
+    """
+    if cursor:
+        after_value, after_id = decode_cursor(cursor)
+        # $gt does not compare null with dates, so every set value is after a null
+        after = {"$ne": None} if after_value is None else {"$gt": after_value}
+        keyset = {"$or": [
+            {sort_field: after},
+            {sort_field: after_value, "id": {"$gt": after_id}},
+        ]}
+        query = {"$and": [query, keyset]} if query else keyset
+
+    projection = dict(projection or {})
+    if projection and any(projection.values()):
+        projection[sort_field] = 1
+        projection["id"] = 1
+    projection["_id"] = 0
+
+    documents = await (
+        collection.find(query, projection)
+        .sort([(sort_field, 1), ("id", 1)])
+        .limit(limit + 1)
+        .to_list(limit + 1)
+    )
+
+    next_cursor = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        last = documents[-1]
+        next_cursor = encode_cursor(last.get(sort_field), last["id"])
+
+    return {"items": documents, "next_cursor": next_cursor}
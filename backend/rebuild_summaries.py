@@ -0,0 +1,30 @@
+"""
+Rebuild the materialized reimbursement summaries from scratch
+
+Usage: python rebuild_summaries.py
+"""
+import asyncio
+import os
+import sys
+from pathlib import Path
+sys.path.append(str(Path(__file__).parent))
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from dotenv import load_dotenv
+
+from summaries import rebuild_summaries
+
+load_dotenv(Path(__file__).parent / '.env')
+
+
+async def main():
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    try:
+        count = await rebuild_summaries(client[os.environ['DB_NAME']].reimbursement_records)
+        print(f"Rebuilt summaries for {count} cities")
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
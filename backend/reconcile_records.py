@@ -0,0 +1,63 @@
+"""
+Command-line excel-vs-user reconciliation report
+
+Usage: python reconcile_records.py --state Delhi --records-csv variance.csv
+"""
+import asyncio
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Optional
+sys.path.append(str(Path(__file__).parent))
+
+import typer
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from reconciliation import DEFAULT_BATCH_SIZE, DEFAULT_TOP, reconcile
+
+load_dotenv(Path(__file__).parent / '.env')
+
+
+def main(
+    state: Optional[str] = typer.Option(None, help="Only records with this state_user"),
+    city: Optional[str] = typer.Option(None, help="Only records with this city_assigned_user"),
+    tolerance_pct: float = typer.Option(0.0, help="Allowed over-claim as a percentage of the Excel value"),
+    tolerance_abs: float = typer.Option(0.0, help="Allowed absolute over-claim per category"),
+    top: int = typer.Option(DEFAULT_TOP, help="Number of largest over-claims to list"),
+    batch_size: int = typer.Option(DEFAULT_BATCH_SIZE, help="Records per chunk"),
+    records_csv: Optional[Path] = typer.Option(None, help="Also write per-record variance rows to this CSV"),
+):
+    """Print a JSON reconciliation summary for the reimbursement records"""
+    query = {}
+    if state:
+        query["state_user"] = state
+    if city:
+        query["city_assigned_user"] = city
+
+    def write_rows(rows):
+        rows.to_csv(records_csv, mode="a", header=not records_csv.exists(), index=False)
+
+    async def run():
+        client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+        try:
+            return await reconcile(
+                client[os.environ['DB_NAME']].reimbursement_records,
+                query,
+                tolerance_pct=tolerance_pct,
+                tolerance_abs=tolerance_abs,
+                top=top,
+                batch_size=batch_size,
+                on_chunk=write_rows if records_csv else None,
+            )
+        finally:
+            client.close()
+
+    if records_csv and records_csv.exists():
+        records_csv.unlink()
+    typer.echo(json.dumps(asyncio.run(run()), indent=2))
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,154 @@
+"""
+Vectorized reconciliation of Excel (approved) versus user (claimed) values
+"""
+import asyncio
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from models import RECORD_FIELD_GROUPS
+
+DEFAULT_BATCH_SIZE = 10_000
+DEFAULT_TOP = 50
+
+# Claim categories plus the head counts that go with them
+CATEGORIES = ["num_exam_centres"] + RECORD_FIELD_GROUPS["claims"]
+AMOUNT_CATEGORIES = [name for name in CATEGORIES if not name.startswith("num_")]
+EXCEL_COLUMNS = [f"{name}_excel" for name in CATEGORIES]
+USER_COLUMNS = [f"{name}_user" for name in CATEGORIES]
+VALUE_COLUMNS = EXCEL_COLUMNS + USER_COLUMNS
+PROJECTION = {"_id": 0, "id": 1, **{column: 1 for column in VALUE_COLUMNS}}
+
+
+class ReconciliationReport:
+    """Accumulates per-category totals and the largest over-claims chunk by chunk.
+
+    Values are compared only where a record has both the Excel and the user
+    value. A value on one side only is counted as missing (missing_excel:
+    claimed with no approved value, missing_user: approved but not claimed)
+    rather than compared against 0. Memory is bounded by the chunk size plus
+    the top-N list, whatever the number of records.
+    """
+
+    def __init__(self, tolerance_pct: float = 0.0, tolerance_abs: float = 0.0, top: int = DEFAULT_TOP):
+        self.tolerance_pct = tolerance_pct
+        self.tolerance_abs = tolerance_abs
+        self.top = top
+        self.records = 0
+        self.flagged_records = 0
+        size = len(CATEGORIES)
+        self.excel_sum = np.zeros(size)
+        self.user_sum = np.zeros(size)
+        self.variance_sum = np.zeros(size)
+        self.missing_excel = np.zeros(size, dtype=np.int64)
+        self.missing_user = np.zeros(size, dtype=np.int64)
+        self.records_with_missing = 0
+        self.mismatches = np.zeros(size, dtype=np.int64)
+        self.over_claims = np.zeros(size, dtype=np.int64)
+        self._amount_mask = np.array([name in AMOUNT_CATEGORIES for name in CATEGORIES])
+        self._top = pd.DataFrame(
+            columns=["id", "excel_total", "user_total", "variance", "over_claim_categories", "missing_values"]
+        )
+
+    def add_chunk(self, documents: list) -> pd.DataFrame:
+        """Reconcile one chunk of records and return its per-record rows"""
+        # One row per record, Excel columns then user columns; None becomes NaN
+        values = np.array(
+            [[document.get(column) for column in VALUE_COLUMNS] for document in documents],
+            dtype=float,
+        ).reshape(len(documents), len(VALUE_COLUMNS))
+        excel, user = values[:, :len(CATEGORIES)], values[:, len(CATEGORIES):]
+        excel_missing, user_missing = np.isnan(excel), np.isnan(user)
+        paired = ~excel_missing & ~user_missing
+        missing_excel = excel_missing & ~user_missing
+        missing_user = user_missing & ~excel_missing
+
+        # Unpaired cells compare as 0 == 0, so they are never mismatches or over-claims
+        diff = np.where(paired, user - excel, 0.0)
+        over = paired & (diff > (np.abs(np.nan_to_num(excel)) * self.tolerance_pct / 100.0 + self.tolerance_abs))
+
+        self.records += len(documents)
+        self.excel_sum += np.nansum(excel, axis=0)
+        self.user_sum += np.nansum(user, axis=0)
+        self.variance_sum += diff.sum(axis=0)
+        self.mismatches += (diff != 0).sum(axis=0)
+        self.over_claims += over.sum(axis=0)
+        self.missing_excel += missing_excel.sum(axis=0)
+        self.missing_user += missing_user.sum(axis=0)
+
+        over_count = over.sum(axis=1)
+        missing_count = (missing_excel | missing_user).sum(axis=1)
+        self.flagged_records += int((over_count > 0).sum())
+        self.records_with_missing += int((missing_count > 0).sum())
+        rows = pd.DataFrame({
+            "id": [document.get("id") for document in documents],
+            "excel_total": np.nansum(excel[:, self._amount_mask], axis=1),
+            "user_total": np.nansum(user[:, self._amount_mask], axis=1),
+            "variance": diff[:, self._amount_mask].sum(axis=1),
+            "over_claim_categories": over_count,
+            "missing_values": missing_count,
+        })
+
+        if self.top:
+            candidates = rows[rows["over_claim_categories"] > 0]
+            if not candidates.empty:
+                merged = pd.concat([self._top, candidates]) if not self._top.empty else candidates
+                self._top = merged.nlargest(self.top, "variance")
+        return rows
+
+    def summary(self) -> dict:
+        """Collection-wide totals, per-category variance and the top over-claims"""
+        amount = self._amount_mask
+        categories = [
+            {
+                "category": name,
+                "excel_total": float(self.excel_sum[i]),
+                "user_total": float(self.user_sum[i]),
+                "variance": float(self.variance_sum[i]),
+                "mismatched_records": int(self.mismatches[i]),
+                "over_claim_records": int(self.over_claims[i]),
+                "missing_excel_records": int(self.missing_excel[i]),
+                "missing_user_records": int(self.missing_user[i]),
+            }
+            for i, name in enumerate(CATEGORIES)
+        ]
+        return {
+            "records": self.records,
+            "flagged_records": self.flagged_records,
+            "records_with_missing_values": self.records_with_missing,
+            "tolerance_pct": self.tolerance_pct,
+            "tolerance_abs": self.tolerance_abs,
+            "excel_total": float(self.excel_sum[amount].sum()),
+            "user_total": float(self.user_sum[amount].sum()),
+            # Over the records that have both values; the totals above include one-sided values
+            "variance": float(self.variance_sum[amount].sum()),
+            "categories": categories,
+            "top_over_claims": self._top.to_dict(orient="records"),
+        }
+
+
+async def reconcile(
+    collection,
+    query: Optional[dict] = None,
+    tolerance_pct: float = 0.0,
+    tolerance_abs: float = 0.0,
+    top: int = DEFAULT_TOP,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    on_chunk=None,
+) -> dict:
+    """Stream records from Mongo in batches and reconcile them chunk by chunk.
+
+    ``on_chunk`` is called with each chunk's per-record DataFrame, e.g. to
+    append it to a CSV.
+    """
+    report = ReconciliationReport(tolerance_pct, tolerance_abs, top)
+    cursor = collection.find(query or {}, PROJECTION, batch_size=batch_size)
+    while True:
+        chunk = await cursor.to_list(batch_size)
+        if not chunk:
+            break
+        rows = await asyncio.to_thread(report.add_chunk, chunk)
+        if on_chunk:
+            on_chunk(rows)
+    return report.summary()
@@ -0,0 +1,190 @@
+"""
+In-process cache of serialized reimbursement records for GET by id
+
+Entries are evicted LRU-first when the cache is full and expire after a TTL.
+While a MongoDB change stream on the records collection is open, writes from
+any worker evict the affected entries within milliseconds, so the TTL can be
+long; without one (standalone mongod, or the stream is down) entries expire
+after the short fallback TTL instead.
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from metrics import RECORD_CACHE_COHERENT, RECORD_CACHE_EVICTIONS, RECORD_CACHE_LOOKUPS
+
+DEFAULT_RECORD_CACHE_SIZE = 10_000
+DEFAULT_RECORD_CACHE_TTL = 300.0
+DEFAULT_FALLBACK_TTL = 5.0
+# Invalidations remembered for reads that were in flight when they arrived
+RECENT_INVALIDATIONS = 10_000
+RETRY_DELAY = 1.0
+MAX_RETRY_DELAY = 30.0
+# "$changeStream is only supported on replica sets" and similar
+CHANGE_STREAMS_UNSUPPORTED = {40573, 40324, 136}
+CHANGE_STREAM_HISTORY_LOST = 286
+# Events after which the stream cannot simply be resumed
+STREAM_RESETS = {"drop", "rename", "dropDatabase", "invalidate"}
+
+logger = logging.getLogger(__name__)
+
+_HITS = RECORD_CACHE_LOOKUPS.labels("hit")
+_MISSES = RECORD_CACHE_LOOKUPS.labels("miss")
+
+
+class RecordCache:
+    """Bounded LRU/TTL map of record id -> (JSON body, ETag).
+
+    Entries also remember the document's _id, because change events only
+    carry the _id of the changed document.
+    """
+
+    def __init__(
+        self,
+        max_size: int = DEFAULT_RECORD_CACHE_SIZE,
+        ttl: float = DEFAULT_RECORD_CACHE_TTL,
+        fallback_ttl: float = DEFAULT_FALLBACK_TTL,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.fallback_ttl = fallback_ttl
+        self.watching = False
+        self.hits = 0
+        self.misses = 0
+        self.evictions = {}
+        self._entries = OrderedDict()
+        self._ids = {}
+        self._sequence = 0
+        self._cleared_at = 0
+        self._recent = OrderedDict()
+
+    def sequence(self) -> int:
+        """Take before reading a record from Mongo; pass to set()"""
+        return self._sequence
+
+    def get(self, record_id: str) -> Optional[tuple]:
+        """(body, etag) of a fresh entry, or None"""
+        entry = self._entries.get(record_id)
+        if entry is not None:
+            body, etag, object_id, expires_at = entry
+            if expires_at >= time.monotonic():
+                self._entries.move_to_end(record_id)
+                self.hits += 1
+                _HITS.inc()
+                return body, etag
+            self._evict(record_id, "expired")
+        self.misses += 1
+        _MISSES.inc()
+        return None
+
+    def set(self, record_id: str, object_id, body: bytes, etag: str, read_sequence: int):
+        """Cache a record read at read_sequence, unless it changed while the read was in flight"""
+        if self.max_size <= 0:
+            return
+        if read_sequence < self._cleared_at:
+            return
+        if object_id is not None and self._recent.get(object_id, -1) > read_sequence:
+            return
+        if record_id in self._entries:
+            self._ids.pop(self._entries[record_id][2], None)
+        ttl = self.ttl if self.watching else self.fallback_ttl
+        self._entries[record_id] = (body, etag, object_id, time.monotonic() + ttl)
+        self._entries.move_to_end(record_id)
+        if object_id is not None:
+            self._ids[object_id] = record_id
+        while len(self._entries) > self.max_size:
+            self._evict(next(iter(self._entries)), "capacity")
+
+    def invalidate(self, record_id: str, reason: str = "write"):
+        if record_id in self._entries:
+            self._evict(record_id, reason)
+
+    def invalidate_object_id(self, object_id, reason: str = "change_stream"):
+        self._sequence += 1
+        self._recent[object_id] = self._sequence
+        self._recent.move_to_end(object_id)
+        while len(self._recent) > RECENT_INVALIDATIONS:
+            self._recent.popitem(last=False)
+        record_id = self._ids.get(object_id)
+        if record_id is not None:
+            self.invalidate(record_id, reason)
+
+    def clear(self, reason: str):
+        """Drop everything, e.g. when change events may have been missed"""
+        for record_id in list(self._entries):
+            self._evict(record_id, reason)
+        # Reads in flight started before this point may be stale too
+        self._sequence += 1
+        self._cleared_at = self._sequence
+        self._recent.clear()
+
+    def _evict(self, record_id: str, reason: str):
+        _, _, object_id, _ = self._entries.pop(record_id)
+        self._ids.pop(object_id, None)
+        self.evictions[reason] = self.evictions.get(reason, 0) + 1
+        RECORD_CACHE_EVICTIONS.labels(reason).inc()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "evictions": dict(self.evictions),
+            "change_stream": self.watching,
+        }
+
+    def _set_watching(self, watching: bool):
+        self.watching = watching
+        RECORD_CACHE_COHERENT.set(1 if watching else 0)
+
+    async def watch(self, collection):
+        """Evict entries as the collection changes; run as a task for the app's lifetime.
+
+        Returns (leaving TTL-only expiry) if the server does not support
+        change streams; other errors are retried with backoff, and the cache
+        is cleared whenever events may have been missed.
+        """
+        resume_token = None
+        delay = RETRY_DELAY
+        pipeline = [{"$match": {"operationType": {"$in": ["update", "replace", "delete", *STREAM_RESETS]}}}]
+        while True:
+            try:
+                async with collection.watch(pipeline, resume_after=resume_token) as stream:
+                    if resume_token is None:
+                        # Entries cached before the stream opened saw no events
+                        self.clear("resync")
+                    self._set_watching(True)
+                    delay = RETRY_DELAY
+                    async for change in stream:
+                        if change["operationType"] in STREAM_RESETS:
+                            self.clear("resync")
+                            resume_token = None
+                            break
+                        self.invalidate_object_id(change["documentKey"]["_id"])
+                        resume_token = stream.resume_token
+                    continue
+            except asyncio.CancelledError:
+                self._set_watching(False)
+                raise
+            except OperationFailure as e:
+                if e.code in CHANGE_STREAMS_UNSUPPORTED:
+                    logger.warning(f"Change streams unavailable ({e}); record cache entries expire after "
+                                   f"{self.fallback_ttl}s instead")
+                    self._set_watching(False)
+                    return
+                if e.code == CHANGE_STREAM_HISTORY_LOST:
+                    resume_token = None
+                logger.warning(f"Record cache change stream failed: {e}")
+            except PyMongoError as e:
+                logger.warning(f"Record cache change stream failed: {e}")
+            if self.watching:
+                self._set_watching(False)
+                self.clear("stream_lost")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, MAX_RETRY_DELAY)
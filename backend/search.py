@@ -0,0 +1,251 @@
+"""
+Search and autocomplete over names, cities, emails, mobiles and IFSC codes
+
+Every record stores ``search_keys``: the normalized tokens of the _excel and
+_user values of the searchable fields (lowercase, accents and punctuation
+stripped, mobiles as digits without the country code). It also stores
+``search_rank_keys``: the same tokens prefixed with their field's weight
+and whether they are the field's first word ("10a:priya"). rank() scores a
+token by exactly those two things, so the candidates for a query are read
+from a multikey index on the rank keys tier by tier, best possible score
+first, each tier an anchored-regex range scan cut off at the number of
+candidates still needed. Short prefixes that match much of the collection
+touch only as many index entries as the limit needs. Whole-word queries that match no prefix fall
+back to the collection's text index, ranked by textScore.
+"""
+import logging
+import re
+import unicodedata
+from typing import Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+SEARCH_KEYS_FIELD = "search_keys"
+SEARCH_RANK_FIELD = "search_rank_keys"
+RANK_INDEX = "search_rank_keys_id"
+# Base field -> ranking weight; both the _excel and _user values are indexed
+SEARCH_FIELDS = {"name": 10, "city_assigned": 6, "email": 5, "mobile": 4, "ifsc": 4}
+SEARCH_MODES = ("auto", "prefix", "text")
+DEFAULT_LIMIT = 10
+MAX_QUERY_TOKENS = 5
+# Candidates read from the rank-key index and ranked exactly by rank()
+CANDIDATES_PER_RESULT = 5
+MIN_CANDIDATES = 50
+# Mongo's code for a $text query without a text index
+INDEX_NOT_FOUND = 27
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+
+def normalize(value) -> str:
+    """Lowercase ASCII with accents dropped and anything but letters and digits turned into spaces"""
+    text = unicodedata.normalize("NFKD", str(value))
+    text = text.encode("ascii", "ignore").decode().lower()
+    return _NON_ALNUM.sub(" ", text).strip()
+
+
+def field_tokens(base: str, value) -> list:
+    if value is None or value == "":
+        return []
+    if base == "mobile":
+        digits = re.sub(r"\D", "", str(value))
+        # +91 98765 43210 and 9876543210 are the same number
+        return [digits[-10:]] if digits else []
+    return normalize(value).split()
+
+
+def search_keys(document: dict) -> list:
+    """Sorted distinct search tokens of a record's searchable fields"""
+    keys = set()
+    for base in SEARCH_FIELDS:
+        for side in ("excel", "user"):
+            keys.update(field_tokens(base, document.get(f"{base}_{side}")))
+    return sorted(keys)
+
+
+def search_rank_keys(document: dict) -> list:
+    """Sorted distinct "<weight><a: first word, b: later word>:<token>" keys of a record's searchable fields"""
+    keys = set()
+    for base, weight in SEARCH_FIELDS.items():
+        for side in ("excel", "user"):
+            for position, word in enumerate(field_tokens(base, document.get(f"{base}_{side}"))):
+                keys.add(f"{weight:02d}{'a' if position == 0 else 'b'}:{word}")
+    return sorted(keys)
+
+
+def search_fields(document: dict) -> dict:
+    """The stored search fields of a record, for $set after an edit"""
+    return {SEARCH_KEYS_FIELD: search_keys(document), SEARCH_RANK_FIELD: search_rank_keys(document)}
+
+
+def with_search_keys(document: dict) -> dict:
+    """Copy of a record document with its search fields, for storing"""
+    return {**document, **search_fields(document)}
+
+
+def without_search_fields(projection: Optional[dict] = None) -> dict:
+    """Exclusion projection that keeps the stored search fields out of API responses"""
+    return {**(projection or {}), SEARCH_KEYS_FIELD: 0, SEARCH_RANK_FIELD: 0}
+
+
+def touches_search_fields(update: dict) -> bool:
+    return any(name.rsplit("_", 1)[0] in SEARCH_FIELDS for name in update)
+
+
+def query_tokens(q: str) -> list:
+    tokens = normalize(q).split()
+    # A typed mobile like "98765 43210" is one number
+    if len(tokens) > 1 and all(token.isdigit() for token in tokens):
+        tokens = ["".join(tokens)]
+    return tokens[:MAX_QUERY_TOKENS]
+
+
+def prefix_filter(tokens: list) -> dict:
+    """Every token must prefix one of the record's keys"""
+    clauses = [{SEARCH_KEYS_FIELD: {"$regex": f"^{re.escape(token)}"}} for token in tokens]
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+
+def rank(document: dict, tokens: list) -> float:
+    """Sum over tokens of the best field match: field weight x how well the token matches"""
+    fields = [
+        (weight, words)
+        for base, weight in SEARCH_FIELDS.items() for side in ("excel", "user")
+        if (words := field_tokens(base, document.get(f"{base}_{side}")))
+    ]
+    score = 0.0
+    for token in tokens:
+        best = 0.0
+        for weight, words in fields:
+            if token in words:
+                quality = 3.0
+            elif words[0].startswith(token):
+                quality = 2.0
+            elif any(word.startswith(token) for word in words):
+                quality = 1.0
+            else:
+                continue
+            best = max(best, weight * quality)
+        score += best
+    return score
+
+
+def rank_tiers(token: str) -> list:
+    """(score, rank-key filter) pairs for one token, best score first.
+
+    A record's rank() for the token is the score of the first tier it
+    matches: an exact word scores 3x its field's weight, a prefix of the
+    first word 2x and a prefix of a later word 1x.
+    """
+    levels = {}
+    for weight in sorted(set(SEARCH_FIELDS.values()), reverse=True):
+        levels.setdefault(3 * weight, []).extend([f"{weight:02d}a:{token}", f"{weight:02d}b:{token}"])
+        levels.setdefault(2 * weight, []).append(re.compile(f"^{weight:02d}a:{re.escape(token)}"))
+        levels.setdefault(weight, []).append(re.compile(f"^{weight:02d}b:{re.escape(token)}"))
+    return [(score, {SEARCH_RANK_FIELD: {"$in": levels[score]}}) for score in sorted(levels, reverse=True)]
+
+
+def search_projection(projection: Optional[dict]) -> dict:
+    """Requested fields plus what ranking needs; _id and the keys never leave the server"""
+    fields = {f"{base}_{side}": 1 for base in SEARCH_FIELDS for side in ("excel", "user")}
+    fields.update(projection or {})
+    fields.update({"id": 1, "_id": 0})
+    return fields
+
+
+async def prefix_candidates(collection, tokens: list, fetched: dict, query: Optional[dict], wanted: int) -> list:
+    """Up to `wanted` prefix matches, read from the rank-key index best tier first.
+
+    Tiers are walked for the longest token, the most selective one; the
+    other tokens only filter. For a single token the candidates are
+    exactly the best-ranked matches. Within a cut-off tier, records come
+    in index order (matched key, then id), never in storage order.
+    """
+    pivot = max(tokens, key=len)
+    others = [token for token in tokens if token != pivot]
+    base = {**(query or {}), **(prefix_filter(others) if others else {})}
+    candidates = []
+    for _, tier in rank_tiers(pivot):
+        seen = [document["id"] for document in candidates]
+        tier_query = {**base, **tier, **({"id": {"$nin": seen}} if seen else {})}
+        candidates += await collection.find(tier_query, fetched).hint(RANK_INDEX).limit(
+            wanted - len(candidates)
+        ).to_list(None)
+        if len(candidates) >= wanted:
+            break
+    return candidates
+
+
+async def text_matches(collection, tokens: list, fetched: dict, query: Optional[dict], limit: int) -> list:
+    """Whole-word matches from the text index, best textScore first; none if there is no text index"""
+    try:
+        return await collection.find(
+            {**(query or {}), "$text": {"$search": " ".join(tokens)}},
+            {**fetched, "score": {"$meta": "textScore"}},
+        ).sort([("score", {"$meta": "textScore"})]).limit(limit).to_list(None)
+    except OperationFailure as e:
+        if e.code != INDEX_NOT_FOUND:
+            raise
+        logger.warning(f"No text index for the search fallback: {e}")
+        return []
+
+
+async def search_records(
+    collection,
+    q: str,
+    limit: int = DEFAULT_LIMIT,
+    projection: Optional[dict] = None,
+    mode: str = "auto",
+    query: Optional[dict] = None,
+    text_index: bool = True,
+) -> dict:
+    """Top `limit` records for q, best first, each with its score.
+
+    ``projection`` selects the returned fields (default: id and the
+    searchable fields); ``query`` is an extra Mongo filter such as a state.
+    Without ``text_index`` (the in-memory stand-in has no $text) there is
+    no whole-word fallback.
+    """
+    tokens = query_tokens(q)
+    if not tokens:
+        return {"query": q, "mode": mode, "results": []}
+    fetched = search_projection(projection)
+    results = []
+    used = mode
+
+    if mode in ("auto", "prefix"):
+        used = "prefix"
+        candidates = await prefix_candidates(
+            collection, tokens, fetched, query, max(limit * CANDIDATES_PER_RESULT, MIN_CANDIDATES)
+        )
+        for document in candidates:
+            document["score"] = rank(document, tokens)
+        candidates.sort(key=lambda document: (-document["score"], document["id"]))
+        results = candidates[:limit]
+
+    if mode == "text" or (mode == "auto" and not results):
+        used = "text"
+        results = await text_matches(collection, tokens, fetched, query, limit) if text_index else []
+
+    if projection:
+        keep = set(projection) | {"id", "score"}
+        results = [{name: value for name, value in document.items() if name in keep} for document in results]
+    return {"query": q, "mode": used, "results": results}
+
+
+async def backfill_search_keys(collection, batch_size: int = 1000) -> int:
+    """Compute the search fields for records stored without them; returns how many were updated"""
+    fields = {f"{base}_{side}": 1 for base in SEARCH_FIELDS for side in ("excel", "user")}
+    cursor = collection.find({SEARCH_RANK_FIELD: {"$exists": False}}, {"_id": 1, **fields}, batch_size=batch_size)
+    updated, operations = 0, []
+    async for document in cursor:
+        operations.append(UpdateOne({"_id": document["_id"]}, {"$set": search_fields(document)}))
+        if len(operations) >= batch_size:
+            updated += (await collection.bulk_write(operations, ordered=False)).modified_count
+            operations = []
+    if operations:
+        updated += (await collection.bulk_write(operations, ordered=False)).modified_count
+    return updated
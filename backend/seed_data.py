@@ -1,136 +1,105 @@
 """
-Script to seed the database with sample NTA reimbursement records
+Script to seed the database with synthetic NTA reimbursement records and status checks
+
+Records are generated deterministically from --seed in batches (in worker
+processes with --workers) and streamed into Mongo with several insert_many
+calls in flight, so large datasets never sit in memory at once.
+
+Usage: python seed_data.py --records 1000000 --status-checks 200000 --seed 42
 """
 import asyncio
+import os
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
 from pathlib import Path
 sys.path.append(str(Path(__file__).parent))
 
-from motor.motor_asyncio import AsyncIOMotorClient
+import typer
 from dotenv import load_dotenv
-import os
-import uuid
-from datetime import datetime
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from indexes import ensure_indexes
+from status_history import DEFAULT_TTL as DEFAULT_STATUS_CHECK_TTL, ensure_status_collection
+from summaries import SUMMARY_COLLECTION, rebuild_summaries
+from synthetic_data import (
+    DEFAULT_BATCH_SIZE, DEFAULT_MISMATCH_RATE, DEFAULT_UNSUBMITTED_RATE, generate_record_batch,
+    generate_status_check_batch, generated_batches, insert_batches
+)
 
 # Load environment variables
-load_dotenv()
+load_dotenv(Path(__file__).parent / '.env')
+
+
+def main(
+    records: int = typer.Option(1000, help="Reimbursement records to generate"),
+    status_checks: int = typer.Option(1000, help="Status checks to generate"),
+    status_days: int = typer.Option(30, help="Days of status-check history, ending now"),
+    seed: int = typer.Option(42, help="Same seed, same dataset"),
+    mismatch_rate: float = typer.Option(DEFAULT_MISMATCH_RATE, help="Share of submitted claims that differ from the master sheet"),
+    unsubmitted_rate: float = typer.Option(DEFAULT_UNSUBMITTED_RATE, help="Share of claims with no user values yet"),
+    batch_size: int = typer.Option(DEFAULT_BATCH_SIZE, help="Documents per insert_many"),
+    concurrency: int = typer.Option(4, help="insert_many calls in flight"),
+    workers: int = typer.Option(os.cpu_count() or 1, help="Generator processes; 0 generates inline"),
+    append: bool = typer.Option(False, help="Keep existing documents instead of dropping the collections"),
+):
+    """Seed reimbursement_records and status_checks with a synthetic dataset"""
+
+    async def run():
+        client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+        db = client[os.environ['DB_NAME']]
+        executor = ProcessPoolExecutor(workers) if workers > 0 else None
+        try:
+            if not append:
+                # Dropping is much faster than delete_many; indexes are rebuilt after the load
+                await db.reimbursement_records.drop()
+                await db.status_checks.drop()
+                await db[SUMMARY_COLLECTION].drop()
+            # Time-series with the server's TTL; history older than the TTL expires right away
+            await ensure_status_collection(
+                db, int(os.environ.get('STATUS_CHECK_TTL_SECONDS', DEFAULT_STATUS_CHECK_TTL))
+            )
+
+            started = time.perf_counter()
+            inserted = await insert_batches(
+                db.reimbursement_records,
+                generated_batches(
+                    generate_record_batch, records, seed, batch_size, executor,
+                    prefetch=max(workers, 1) * 2,
+                    mismatch_rate=mismatch_rate, unsubmitted_rate=unsubmitted_rate,
+                ),
+                concurrency=concurrency,
+            )
+            elapsed = time.perf_counter() - started
+            typer.echo(f"Inserted {inserted} reimbursement records in {elapsed:.1f}s "
+                       f"({inserted / elapsed if elapsed else 0:.0f}/s)")
+
+            started = time.perf_counter()
+            checks = await insert_batches(
+                db.status_checks,
+                generated_batches(
+                    generate_status_check_batch, status_checks, seed, batch_size, executor,
+                    prefetch=max(workers, 1) * 2,
+                    span_days=status_days,
+                    start=datetime.utcnow().replace(second=0, microsecond=0) - timedelta(days=status_days),
+                ),
+                concurrency=concurrency,
+            )
+            typer.echo(f"Inserted {checks} status checks in {time.perf_counter() - started:.1f}s")
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+            started = time.perf_counter()
+            created = sum(len(names) for names in (await ensure_indexes(db)).values())
+            cities = await rebuild_summaries(db.reimbursement_records)
+            typer.echo(f"Built {created} indexes and summaries for {cities} cities "
+                       f"in {time.perf_counter() - started:.1f}s")
+        finally:
+            if executor:
+                executor.shutdown(cancel_futures=True)
+            client.close()
 
-# Sample data for NTA reimbursement records
-sample_records = [
-    {
-        "id": str(uuid.uuid4()),
-        "sno": 1,
-        "centre_no": "NTA001",
-        "name": "Rajesh Kumar",
-        "state": "Delhi",
-        "city_assigned": "New Delhi",
-        "mobile": "9876543210",
-        "email": "rajesh.kumar@nta.gov.in",
-        "num_exam_centres": 5,
-        "bank_name": "State Bank of India",
-        "ifsc": "SBIN0001234",
-        "beneficiary_name": "Rajesh Kumar",
-        "bank_account_number": "12345678901",
-        "created_at": datetime.utcnow(),
-        "updated_at": datetime.utcnow()
-    },
-    {
-        "id": str(uuid.uuid4()),
-        "sno": 2,
-        "centre_no": "NTA002",
-        "name": "Priya Sharma",
-        "state": "Maharashtra",
-        "city_assigned": "Mumbai",
-        "mobile": "9876543211",
-        "email": "priya.sharma@nta.gov.in",
-        "num_exam_centres": 8,
-        "bank_name": "HDFC Bank",
-        "ifsc": "HDFC0001234",
-        "beneficiary_name": "Priya Sharma",
-        "bank_account_number": "12345678902",
-        "created_at": datetime.utcnow(),
-        "updated_at": datetime.utcnow()
-    },
-    {
-        "id": str(uuid.uuid4()),
-        "sno": 3,
-        "centre_no": "NTA003",
-        "name": "Suresh Patel",
-        "state": "Gujarat",
-        "city_assigned": "Ahmedabad",
-        "mobile": "9876543212",
-        "email": "suresh.patel@nta.gov.in",
-        "num_exam_centres": 6,
-        "bank_name": "Bank of Baroda",
-        "ifsc": "BARB0001234",
-        "beneficiary_name": "Suresh Patel",
-        "bank_account_number": "12345678903",
-        "created_at": datetime.utcnow(),
-        "updated_at": datetime.utcnow()
-    },
-    {
-        "id": str(uuid.uuid4()),
-        "sno": 4,
-        "centre_no": "NTA004",
-        "name": "Lakshmi Nair",
-        "state": "Kerala",
-        "city_assigned": "Kochi",
-        "mobile": "9876543213",
-        "email": "lakshmi.nair@nta.gov.in",
-        "num_exam_centres": 4,
-        "bank_name": "Canara Bank",
-        "ifsc": "CNRB0001234",
-        "beneficiary_name": "Lakshmi Nair",
-        "bank_account_number": "12345678904",
-        "created_at": datetime.utcnow(),
-        "updated_at": datetime.utcnow()
-    },
-    {
-        "id": str(uuid.uuid4()),
-        "sno": 5,
-        "centre_no": "NTA005",
-        "name": "Anil Singh",
-        "state": "Uttar Pradesh",
-        "city_assigned": "Lucknow",
-        "mobile": "9876543214",
-        "email": "anil.singh@nta.gov.in",
-        "num_exam_centres": 7,
-        "bank_name": "Punjab National Bank",
-        "ifsc": "PUNB0001234",
-        "beneficiary_name": "Anil Singh",
-        "bank_account_number": "12345678905",
-        "created_at": datetime.utcnow(),
-        "updated_at": datetime.utcnow()
-    }
-]
+    asyncio.run(run())
 
-async def seed_database():
-    """Seed the database with sample records"""
-    try:
-        # Clear existing records
-        await db.reimbursement_records.delete_many({})
-        
-        # Insert sample records
-        result = await db.reimbursement_records.insert_many(sample_records)
-        print(f"Inserted {len(result.inserted_ids)} sample records")
-        
-        # Verify the records
-        count = await db.reimbursement_records.count_documents({})
-        print(f"Total records in database: {count}")
-        
-        # List all cities
-        cities = await db.reimbursement_records.distinct("city_assigned")
-        print(f"Cities available: {cities}")
-        
-    except Exception as e:
-        print(f"Error seeding database: {e}")
-    finally:
-        client.close()
 
 if __name__ == "__main__":
-    asyncio.run(seed_database())
\ No newline at end of file
+    typer.run(main)
@@ -1,280 +1,639 @@
-from fastapi import FastAPI, APIRouter, HTTPException, File, UploadFile
-from fastapi.responses import FileResponse
-from dotenv import load_dotenv
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, File, UploadFile, Header, Request, Response, Query
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument
+from pymongo.errors import OperationFailure
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field
-from typing import List, Optional
-import uuid
+import re
+import anyio
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Annotated, Optional
+from contextlib import asynccontextmanager
 from datetime import datetime
 import base64
-import aiofiles
 
+from bulk_import import IMPORT_FORMATS, detect_format, import_records, iter_rows
+from bulk_import import DEFAULT_CHUNK_SIZE as DEFAULT_IMPORT_CHUNK_SIZE
+from export import EXPORT_FORMATS, export_records
+from http_cache import (
+    FILE_CACHE_CONTROL, IMMUTABLE_CACHE_CONTROL, RECORD_CACHE_CONTROL, TEMPLATE_CACHE_CONTROL,
+    VersionCache, content_etag, etag_matches, not_modified, record_etag
+)
+from indexes import ensure_indexes
+from models import (
+    RECORD_FIELD_GROUPS, BatchUpdateRequest, ReimbursementCreate, ReimbursementRecord, StatusCheck,
+    StatusCheckCreate, new_record_document
+)
+from pagination import InvalidCursorError, fetch_page
+from template_data import SAMPLE_TEMPLATE_DATA, TemplateStore
+from summaries import (
+    SUMMARY_COLLECTION, SUMMARY_GROUPS, live_summary, materialized_summary, record_summary_change,
+    record_summary_changes, record_summary_inserts, summaries_stale
+)
+from file_serving import (
+    FileRangeResponse, RangeNotSatisfiableError, StreamRangeResponse, content_disposition, guess_media_type,
+    parse_range, range_not_satisfiable
+)
+from storage import (
+    UploadInProgressError, UploadMetadataCache, UploadSizeLimitMiddleware, UploadTooLargeError, content_sha256,
+    find_upload, record_upload, resolve_upload_path, save_upload
+)
+from storage_backends import create_storage_backend
+from metrics import DOWNLOAD_BYTES, UPLOAD_BYTES, MetricsMiddleware, mongo_listeners, render_metrics
+from starlette.background import BackgroundTask
+from idempotency import IdempotencyStore, request_fingerprint
+from write_batching import WriteCoalescer
+from jobs import JobManager, in_process_runner, parse_type_limits
+from record_cache import RecordCache
+from admission import AdmissionMiddleware, MongoLatencyTracker, parse_limits
+from batch_updates import (
+    BatchAborted, TooManyMatches, apply_updates, matching_updates, prepare_updates, record_query, summarize,
+    validate_fields
+)
+from search import (
+    SEARCH_MODES, search_fields, search_records, touches_search_fields, with_search_keys, without_search_fields
+)
+from settings import Settings
+from mongo_pool import PoolMonitor, create_mongo_client, pool_health, warm_pool
+from status_history import (
+    DEFAULT_WINDOW as DEFAULT_STATUS_WINDOW, MAX_INTERVALS, counts_per_interval, ensure_status_collection,
+    latest_per_client, utc, window_filter
+)
+import shutil
+import uuid
+
+
+logger = logging.getLogger(__name__)
+
+class AppServices:
+    """One app's settings, caches and connections.
 
-ROOT_DIR = Path(__file__).parent
-load_dotenv(ROOT_DIR / '.env')
+    create_app builds it and hangs it on app.state.services; the lifespan
+    opens the Mongo client, upload storage and job pool on it, and handlers
+    get it through the Services dependency. Two apps in one process share
+    nothing.
+    """
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+    def __init__(self, settings: Settings):
+        self.settings = settings
+        # Size/hash/type of stored uploads, so downloads need no stat
+        self.upload_metadata = UploadMetadataCache()
+        self.template_store = TemplateStore(settings.template_xlsx_path, check_interval=settings.template_check_interval)
+        # Responses of requests sent with an Idempotency-Key, replayed on retries
+        self.idempotency = IdempotencyStore(ttl=settings.idempotency_ttl, cache_size=settings.idempotency_cache_size)
+        # Opt-in group commit: concurrent status/record inserts share one insert_many
+        self.write_coalescer = WriteCoalescer(
+            max_batch=settings.write_batch_max_docs,
+            max_delay=settings.write_batch_max_delay
+        ) if settings.write_batching else None
+        # Record ETags seen by this worker, so conditional GETs can skip Mongo
+        self.record_versions = VersionCache(max_size=settings.version_cache_size, ttl=settings.version_cache_ttl)
+        # Serialized records for GET by id, evicted by a change stream (TTL-only without a replica set)
+        self.record_cache = RecordCache(
+            max_size=settings.record_cache_size,
+            ttl=settings.record_cache_ttl,
+            fallback_ttl=settings.record_cache_fallback_ttl
+        )
+        self.mongo_latency = MongoLatencyTracker() if settings.admission_control else None
+        self.pool_monitor = None if settings.in_memory else PoolMonitor()
+        # Opened by the lifespan
+        self.client = None
+        self.db = None
+        self.upload_storage = None
+        self.job_manager = None
+        # Set once startup has finished, cleared at shutdown; reported by /api/ready
+        self.ready = False
+
+    async def record_job_result(self, metadata: dict):
+        await record_upload(self.db, metadata)
+        self.upload_metadata.set(metadata["filename"], metadata)
+
+    async def insert_document(self, collection, document: dict):
+        """insert_one, or a batched insert when write batching is on; returns after the ack either way"""
+        if self.write_coalescer:
+            await self.write_coalescer.insert(collection, document)
+        else:
+            await collection.insert_one(document)
 
-# Create uploads directory
-UPLOADS_DIR = ROOT_DIR / "uploads"
-UPLOADS_DIR.mkdir(exist_ok=True)
+    def mongo_event_listeners(self) -> list:
+        listeners = mongo_listeners() if self.settings.metrics_enabled else []
+        return listeners + [listener for listener in (self.mongo_latency, self.pool_monitor) if listener]
 
-# Create the main app without a prefix
-app = FastAPI()
+
+def get_services(request: Request) -> AppServices:
+    return request.app.state.services
+
+
+Services = Annotated[AppServices, Depends(get_services)]
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open Mongo, storage and the job pool, warm the connection pool, then serve; close it all on shutdown"""
+    services = app.state.services
+    settings = services.settings
+    started = time.perf_counter()
+    services.client = client = create_mongo_client(settings, services.mongo_event_listeners())
+    services.db = db = client[settings.db_name]
+    services.upload_storage = create_storage_backend(settings, db)
+    # Exports, reconciliation reports and imports run as background jobs in worker processes;
+    # worker processes cannot reach the in-memory stand-in, so there they run in threads
+    services.job_manager = JobManager(
+        db,
+        services.upload_storage,
+        settings.mongo_url,
+        settings.db_name,
+        workers=settings.job_workers,
+        type_limits=parse_type_limits(settings.job_limits),
+        on_result=services.record_job_result,
+        **({"executor": ThreadPoolExecutor(settings.job_workers), "runner": in_process_runner(db)}
+           if settings.in_memory else {})
+    )
+    await warm_pool(client, settings.mongo_min_pool_size)
+    # Before ensure_indexes, which would create status_checks as a plain collection
+    try:
+        await ensure_status_collection(db, settings.status_check_ttl, timeseries=not settings.in_memory)
+    except Exception as e:
+        logger.error(f"Error setting up status_checks: {e}")
+    await ensure_indexes(db)
+    await services.template_store.get_index()
+    await services.job_manager.start()
+    # The stand-in has no change streams; cached records then just expire
+    record_cache_watcher = None if settings.in_memory else asyncio.create_task(
+        services.record_cache.watch(db.reimbursement_records)
+    )
+    services.ready = True
+    logger.info(f"Started in {(time.perf_counter() - started) * 1000:.0f} ms")
+    try:
+        yield
+    finally:
+        services.ready = False
+        if record_cache_watcher:
+            record_cache_watcher.cancel()
+        await services.job_manager.close()
+        if services.write_coalescer:
+            await services.write_coalescer.close()
+        await services.upload_storage.close()
+        client.close()
+
+SAMPLE_TEMPLATE_ETAG = content_etag(SAMPLE_TEMPLATE_DATA)
+
+# Uploads stored under their SHA-256 never change
+CONTENT_ADDRESSED_NAME = re.compile(r"^([0-9a-f]{64})(\.[a-z0-9]{1,10})?$")
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
 
-# Define Models
-class ReimbursementRecord(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    sno: Optional[int] = None
-    
-    # Basic Information - Excel Data (uneditable)
-    city_code_excel: Optional[str] = None
-    name_excel: Optional[str] = None
-    state_excel: Optional[str] = None
-    city_assigned_excel: Optional[str] = None
-    mobile_excel: Optional[str] = None
-    email_excel: Optional[str] = None
-    num_exam_centres_excel: Optional[int] = None
-    
-    # Basic Information - User Input (editable)
-    city_code_user: Optional[str] = None
-    name_user: Optional[str] = None
-    state_user: Optional[str] = None
-    city_assigned_user: Optional[str] = None
-    mobile_user: Optional[str] = None
-    email_user: Optional[str] = None
-    num_exam_centres_user: Optional[int] = None
-    
-    # Bank Details - Excel Data (uneditable)
-    bank_name_excel: Optional[str] = None
-    ifsc_excel: Optional[str] = None
-    beneficiary_name_excel: Optional[str] = None
-    bank_account_number_excel: Optional[str] = None
-    
-    # Bank Details - User Input (editable)
-    bank_name_user: Optional[str] = None
-    ifsc_user: Optional[str] = None
-    beneficiary_name_user: Optional[str] = None
-    bank_account_number_user: Optional[str] = None
-    
-    # Claim Fields - Excel Data (uneditable)
-    city_coordinator_claim_excel: Optional[float] = None
-    admin_staff_claim_excel: Optional[float] = None
-    support_staff_claim_excel: Optional[float] = None
-    refreshment_claim_excel: Optional[float] = None
-    observer_claim_excel: Optional[float] = None
-    num_observers_excel: Optional[int] = None
-    claim_district_personnel_excel: Optional[float] = None
-    assistant_staff_district_excel: Optional[float] = None
-    support_staff_district_excel: Optional[float] = None
-    claim_police_personnel_excel: Optional[float] = None
-    support_staff_police_excel: Optional[float] = None
-    duty_magistrate_claim_excel: Optional[float] = None
-    num_duty_magistrates_excel: Optional[int] = None
-    team_leader_claim_excel: Optional[float] = None
-    num_team_leaders_excel: Optional[int] = None
-    police_escort_claim_excel: Optional[float] = None
-    num_police_escort_excel: Optional[int] = None
-    police_frisking_claim_excel: Optional[float] = None
-    num_police_frisking_excel: Optional[int] = None
-    security_personnel_claim_excel: Optional[float] = None
-    num_security_personnel_excel: Optional[int] = None
-    bank_custodian_claim_excel: Optional[float] = None
-    district_education_officer_claim_excel: Optional[float] = None
-    support_staff_deo_claim_excel: Optional[float] = None
-    
-    # Claim Fields - User Input (editable)
-    city_coordinator_claim_user: Optional[float] = None
-    admin_staff_claim_user: Optional[float] = None
-    support_staff_claim_user: Optional[float] = None
-    refreshment_claim_user: Optional[float] = None
-    observer_claim_user: Optional[float] = None
-    num_observers_user: Optional[int] = None
-    claim_district_personnel_user: Optional[float] = None
-    assistant_staff_district_user: Optional[float] = None
-    support_staff_district_user: Optional[float] = None
-    claim_police_personnel_user: Optional[float] = None
-    support_staff_police_user: Optional[float] = None
-    duty_magistrate_claim_user: Optional[float] = None
-    num_duty_magistrates_user: Optional[int] = None
-    team_leader_claim_user: Optional[float] = None
-    num_team_leaders_user: Optional[int] = None
-    police_escort_claim_user: Optional[float] = None
-    num_police_escort_user: Optional[int] = None
-    police_frisking_claim_user: Optional[float] = None
-    num_police_frisking_user: Optional[int] = None
-    security_personnel_claim_user: Optional[float] = None
-    num_security_personnel_user: Optional[int] = None
-    bank_custodian_claim_user: Optional[float] = None
-    district_education_officer_claim_user: Optional[float] = None
-    support_staff_deo_claim_user: Optional[float] = None
-    
-    supporting_document_bills: Optional[str] = None
-    created_at: datetime = Field(default_factory=datetime.utcnow)
-    updated_at: datetime = Field(default_factory=datetime.utcnow)
-
-class ReimbursementCreate(BaseModel):
-    # Basic Information - User Input
-    city_code_user: Optional[str] = None
-    name_user: Optional[str] = None
-    state_user: Optional[str] = None
-    city_assigned_user: Optional[str] = None
-    mobile_user: Optional[str] = None
-    email_user: Optional[str] = None
-    num_exam_centres_user: Optional[int] = None
-    
-    # Bank Details - User Input
-    bank_name_user: Optional[str] = None
-    ifsc_user: Optional[str] = None
-    beneficiary_name_user: Optional[str] = None
-    bank_account_number_user: Optional[str] = None
-    
-    # Claim Fields - User Input
-    city_coordinator_claim_user: Optional[float] = None
-    admin_staff_claim_user: Optional[float] = None
-    support_staff_claim_user: Optional[float] = None
-    refreshment_claim_user: Optional[float] = None
-    observer_claim_user: Optional[float] = None
-    num_observers_user: Optional[int] = None
-    claim_district_personnel_user: Optional[float] = None
-    assistant_staff_district_user: Optional[float] = None
-    support_staff_district_user: Optional[float] = None
-    claim_police_personnel_user: Optional[float] = None
-    support_staff_police_user: Optional[float] = None
-    duty_magistrate_claim_user: Optional[float] = None
-    num_duty_magistrates_user: Optional[int] = None
-    team_leader_claim_user: Optional[float] = None
-    num_team_leaders_user: Optional[int] = None
-    police_escort_claim_user: Optional[float] = None
-    num_police_escort_user: Optional[int] = None
-    police_frisking_claim_user: Optional[float] = None
-    num_police_frisking_user: Optional[int] = None
-    security_personnel_claim_user: Optional[float] = None
-    num_security_personnel_user: Optional[int] = None
-    bank_custodian_claim_user: Optional[float] = None
-    district_education_officer_claim_user: Optional[float] = None
-    support_staff_deo_claim_user: Optional[float] = None
-    
-    supporting_document_bills: Optional[str] = None
+def record_filter(state: Optional[str], city: Optional[str]) -> dict:
+    """Mongo filter for the state/city query parameters of listings, exports and reports"""
+    query = {}
+    if state:
+        query["state_user"] = state
+    if city:
+        query["city_assigned_user"] = city
+    return query
 
-class StatusCheck(BaseModel):
-    id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    client_name: str
-    timestamp: datetime = Field(default_factory=datetime.utcnow)
 
-class StatusCheckCreate(BaseModel):
-    client_name: str
+def record_projection(fields: Optional[str]) -> Optional[dict]:
+    """Build a Mongo projection from "excel", "user", a group name or a comma-separated field list"""
+    if not fields:
+        return None
+    all_fields = ReimbursementRecord.model_fields
+    if fields in ("excel", "user"):
+        selected = [name for name in all_fields if name.endswith(f"_{fields}")]
+    elif fields in RECORD_FIELD_GROUPS:
+        selected = [f"{base}_{side}" for base in RECORD_FIELD_GROUPS[fields] for side in ("excel", "user")]
+    else:
+        selected = [name.strip() for name in fields.split(",") if name.strip()]
+        unknown = [name for name in selected if name not in all_fields]
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    return {name: 1 for name in selected}
 
 # Add your routes to the router instead of directly to app
 @api_router.get("/")
 async def root():
     return {"message": "NTA Expense Reimbursement System"}
 
+@api_router.get("/ready")
+async def readiness(services: Services):
+    """200 once startup has finished and Mongo answers a ping, else 503; reports connection pool usage"""
+    if not services.ready:
+        return ORJSONResponse({"status": "starting", "mongo": None}, status_code=503)
+    settings = services.settings
+    mongo = await pool_health(services.client, services.pool_monitor, settings.mongo_min_pool_size, settings.mongo_max_pool_size)
+    return ORJSONResponse(
+        {"status": "ready" if mongo["ok"] else "unavailable", "in_memory": settings.in_memory, "mongo": mongo},
+        status_code=200 if mongo["ok"] else 503
+    )
+
 @api_router.post("/status", response_model=StatusCheck)
-async def create_status_check(input: StatusCheckCreate):
+async def create_status_check(services: Services, input: StatusCheckCreate):
     status_dict = input.dict()
     status_obj = StatusCheck(**status_dict)
-    _ = await db.status_checks.insert_one(status_obj.dict())
+    await services.insert_document(services.db.status_checks, status_obj.dict())
     return status_obj
 
-@api_router.get("/status", response_model=List[StatusCheck])
-async def get_status_checks():
-    status_checks = await db.status_checks.find().to_list(1000)
-    return [StatusCheck(**status_check) for status_check in status_checks]
+@api_router.get("/status")
+async def get_status_checks(
+    services: Services,
+    client_name: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None
+):
+    """List status checks oldest first, one page at a time, optionally within [start, end)"""
+    query = window_filter(start, end, client_name)
+    try:
+        return ORJSONResponse(await fetch_page(services.db.status_checks, query, "timestamp", limit, cursor))
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-# Get Excel template data (this would be fetched from OneDrive in real implementation)
+@api_router.get("/status/latest")
+async def get_latest_status_checks(services: Services, since: Optional[datetime] = None):
+    """Most recent status check of every client, optionally only clients seen since `since`"""
+    try:
+        return ORJSONResponse({"clients": await latest_per_client(services.db.status_checks, since)})
+    except Exception as e:
+        logging.error(f"Error getting latest status checks: {e}")
+        raise HTTPException(status_code=500, detail="Error retrieving status checks")
+
+@api_router.get("/status/counts")
+async def get_status_check_counts(
+    services: Services,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    minutes: int = Query(1, ge=1, le=1440),
+    client_name: Optional[str] = None
+):
+    """Status checks per minute (or per `minutes`) over [start, end), by default the last hour"""
+    # Naive UTC like the stored timestamps, so ?start=...Z compares with utcnow()
+    end = utc(end) if end else datetime.utcnow()
+    start = utc(start) if start else end - DEFAULT_STATUS_WINDOW
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    if (end - start).total_seconds() / 60 / minutes > MAX_INTERVALS:
+        raise HTTPException(status_code=400, detail=f"Window spans more than {MAX_INTERVALS} intervals; raise minutes")
+    try:
+        counts = await counts_per_interval(services.db.status_checks, start, end, minutes, client_name)
+    except Exception as e:
+        logging.error(f"Error counting status checks: {e}")
+        raise HTTPException(status_code=500, detail="Error counting status checks")
+    return ORJSONResponse({
+        "start": start,
+        "end": end,
+        "minutes": minutes,
+        "total": sum(interval["count"] for interval in counts),
+        "counts": counts
+    })
+
+# Get Excel template data from the master workbook
 @api_router.get("/template-data")
-async def get_template_data():
-    """Get template data from Excel (simulated - in real implementation this would fetch from OneDrive)"""
+async def get_template_data(
+    services: Services,
+    response: Response,
+    city: Optional[str] = None,
+    email: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None)
+):
+    """Get template data by assigned city or email (sample data when no workbook is configured).
+
+    Without either, the first row of the workbook, as the endpoint returned
+    before lookups.
+    """
     try:
-        # This would normally fetch from OneDrive Excel file
-        # For now, returning sample template data
-        template_data = {
-            "city_code_excel": "MUM001",
-            "name_excel": "John Doe",
-            "state_excel": "Maharashtra",
-            "city_assigned_excel": "Mumbai",
-            "mobile_excel": "9876543210",
-            "email_excel": "john.doe@nta.gov.in",
-            "num_exam_centres_excel": 5,
-            "bank_name_excel": "State Bank of India",
-            "ifsc_excel": "SBIN0001234",
-            "beneficiary_name_excel": "John Doe",
-            "bank_account_number_excel": "12345678901",
-            "city_coordinator_claim_excel": 5000.0,
-            "admin_staff_claim_excel": 3000.0,
-            "support_staff_claim_excel": 2000.0,
-            "refreshment_claim_excel": 1500.0,
-            "observer_claim_excel": 4000.0,
-            "num_observers_excel": 3,
-            "claim_district_personnel_excel": 2500.0,
-            "assistant_staff_district_excel": 2000.0,
-            "support_staff_district_excel": 1800.0,
-            "claim_police_personnel_excel": 3000.0,
-            "support_staff_police_excel": 2200.0,
-            "duty_magistrate_claim_excel": 4500.0,
-            "num_duty_magistrates_excel": 2,
-            "team_leader_claim_excel": 3500.0,
-            "num_team_leaders_excel": 4,
-            "police_escort_claim_excel": 2800.0,
-            "num_police_escort_excel": 6,
-            "police_frisking_claim_excel": 2600.0,
-            "num_police_frisking_excel": 8,
-            "security_personnel_claim_excel": 3200.0,
-            "num_security_personnel_excel": 10,
-            "bank_custodian_claim_excel": 2400.0,
-            "district_education_officer_claim_excel": 5500.0,
-            "support_staff_deo_claim_excel": 2800.0
-        }
-        return template_data
+        if not services.template_store.configured:
+            if etag_matches(if_none_match, SAMPLE_TEMPLATE_ETAG):
+                return not_modified(SAMPLE_TEMPLATE_ETAG, TEMPLATE_CACHE_CONTROL)
+            response.headers["ETag"] = SAMPLE_TEMPLATE_ETAG
+            response.headers["Cache-Control"] = TEMPLATE_CACHE_CONTROL
+            return SAMPLE_TEMPLATE_DATA
+        if (city is not None or email is not None) and not (city or email):
+            raise HTTPException(status_code=400, detail="Provide a city or email to look up")
+        return await template_response(services, response, if_none_match, city=city, email=email)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logging.error(f"Error getting template data: {e}")
+        raise HTTPException(status_code=500, detail="Error retrieving template data")
+
+@api_router.get("/template-data/{city_code}")
+async def get_template_data_by_city_code(
+    services: Services,
+    city_code: str,
+    response: Response,
+    if_none_match: Optional[str] = Header(None)
+):
+    """Get template data for one city code from the in-memory workbook index"""
+    try:
+        return await template_response(services, response, if_none_match, city_code=city_code)
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error getting template data: {e}")
         raise HTTPException(status_code=500, detail="Error retrieving template data")
 
+async def template_response(services: AppServices, response: Response, if_none_match: Optional[str], **lookup):
+    """Look up a template row, answering 304 if the client has the current workbook version"""
+    etag = await services.template_store.etag()
+    if etag and etag_matches(if_none_match, etag):
+        return not_modified(etag, TEMPLATE_CACHE_CONTROL)
+    template_data = await services.template_store.lookup(**lookup)
+    if template_data is None:
+        raise HTTPException(status_code=404, detail="Template data not found")
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = TEMPLATE_CACHE_CONTROL
+    return template_data
+
 # Create new reimbursement record
 @api_router.post("/reimbursement", response_model=ReimbursementRecord)
-async def create_reimbursement(input: ReimbursementCreate):
-    """Create new reimbursement record"""
+async def create_reimbursement(services: Services, input: ReimbursementCreate, idempotency_key: Optional[str] = Header(None)):
+    """Create new reimbursement record; a retry with the same Idempotency-Key gets the original response"""
+    if idempotency_key is not None:
+        fingerprint = request_fingerprint(input.model_dump_json())
+        return await services.idempotency.run(
+            services.db, "POST /api/reimbursement", idempotency_key, fingerprint, lambda: insert_reimbursement(services, input)
+        )
+    return await insert_reimbursement(services, input)
+
+async def insert_reimbursement(services: AppServices, input: ReimbursementCreate) -> ORJSONResponse:
     try:
-        record_dict = input.dict()
-        record_obj = ReimbursementRecord(**record_dict)
-        _ = await db.reimbursement_records.insert_one(record_obj.dict())
-        return record_obj
+        # The body was validated once as ReimbursementCreate; the same dict
+        # is stored and returned
+        document = new_record_document(input)
+        await services.insert_document(services.db.reimbursement_records, with_search_keys(document))
+        etag = record_etag(document)
+        services.record_versions.set(document["id"], etag)
+        await record_summary_change(services.db, after=document)
+        return ORJSONResponse(document, headers={"ETag": etag})
     except Exception as e:
         logging.error(f"Error creating reimbursement: {e}")
         raise HTTPException(status_code=500, detail="Error creating reimbursement record")
 
+def parse_if_match(if_match: Optional[str]) -> Optional[int]:
+    """Parse an If-Match header holding a record version (e.g. "3")"""
+    if if_match is None or if_match.strip() == "*":
+        return None
+    value = if_match.strip()
+    if value.startswith("W/"):
+        value = value[2:]
+    try:
+        return int(value.strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="If-Match must be a record version")
+
+@api_router.get("/reimbursement")
+async def list_reimbursements(
+    services: Services,
+    state: Optional[str] = None,
+    city: Optional[str] = None,
+    fields: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None
+):
+    """List reimbursement records page by page, optionally filtered and projected"""
+    query = record_filter(state, city)
+    projection = record_projection(fields) or without_search_fields()
+    try:
+        page = await fetch_page(services.db.reimbursement_records, query, "created_at", limit, cursor, projection)
+        return ORJSONResponse(page)
+    except InvalidCursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logging.error(f"Error listing reimbursements: {e}")
+        raise HTTPException(status_code=500, detail="Error listing reimbursement records")
+
+@api_router.get("/reimbursement/export")
+async def export_reimbursements(
+    services: Services,
+    format: str = "csv",
+    state: Optional[str] = None,
+    city: Optional[str] = None,
+    gzip: bool = False
+):
+    """Stream all (or filtered) reimbursement records as CSV, NDJSON or XLSX"""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Format must be one of: {', '.join(EXPORT_FORMATS)}")
+    query = record_filter(state, city)
+    
+    filename = f"reimbursements-{datetime.utcnow():%Y%m%d-%H%M%S}.{format}"
+    media_type = EXPORT_FORMATS[format]
+    if gzip:
+        filename += ".gz"
+        media_type = "application/gzip"
+    
+    return StreamingResponse(
+        export_records(services.db.reimbursement_records, format, query, gzip=gzip),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@api_router.post("/reimbursement/import")
+async def import_reimbursements(
+    services: Services,
+    file: UploadFile = File(...),
+    format: Optional[str] = None,
+    chunk_size: int = Query(DEFAULT_IMPORT_CHUNK_SIZE, ge=1, le=10000)
+):
+    """Bulk import reimbursement records from an NDJSON, CSV or XLSX file.
+
+    Bad rows are reported per row. A file that becomes unreadable part-way
+    gets a 400 whose body is the import summary: the rows before the error
+    were inserted and are counted there.
+    """
+    fmt = format or detect_format(file.filename)
+    if fmt not in IMPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Format must be one of: {', '.join(IMPORT_FORMATS)}")
+    try:
+        # Parsing runs in a thread inside import_records, off the event loop
+        summary = await import_records(
+            services.db.reimbursement_records,
+            iter_rows(file.file, fmt),
+            chunk_size=chunk_size,
+            on_inserted=lambda documents: record_summary_inserts(services.db, documents)
+        )
+    except Exception as e:
+        logging.error(f"Error importing reimbursements: {e}")
+        raise HTTPException(status_code=500, detail="Error importing reimbursement records")
+    if "error" in summary:
+        return ORJSONResponse({"detail": f"Could not parse {fmt} file", **summary}, status_code=400)
+    return summary
+
+@api_router.get("/reimbursement/search")
+async def search_reimbursements(
+    services: Services,
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(10, ge=1, le=50),
+    fields: Optional[str] = None,
+    mode: str = "auto",
+    state: Optional[str] = None,
+    city: Optional[str] = None
+):
+    """Ranked search by partial name, city, email, mobile or IFSC, for lookups and autocomplete"""
+    if mode not in SEARCH_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of: {', '.join(SEARCH_MODES)}")
+    projection = record_projection(fields)
+    try:
+        return ORJSONResponse(await search_records(
+            services.db.reimbursement_records, q, limit, projection, mode, record_filter(state, city),
+            text_index=not services.settings.in_memory
+        ))
+    except Exception as e:
+        logging.error(f"Error searching reimbursements: {e}")
+        raise HTTPException(status_code=500, detail="Error searching reimbursement records")
+
+@api_router.patch("/reimbursement/batch")
+async def batch_update_reimbursements(services: Services, request: BatchUpdateRequest):
+    """Apply up to 10,000 partial updates, or one $set to every record matching a filter, in one bulk_write"""
+    if (request.updates is None) == (request.filter is None):
+        raise HTTPException(status_code=400, detail="Provide either updates, or filter and set")
+    collection = services.db.reimbursement_records
+    if request.filter is not None:
+        fields, error = validate_fields(request.set or {})
+        try:
+            query = record_query(request.filter)
+        except ValueError as e:
+            error = error or str(e)
+        if error:
+            raise HTTPException(status_code=400, detail=error)
+    else:
+        items = prepare_updates(request.updates)
+
+    async def run(session=None):
+        if request.filter is not None:
+            matched, pre_images = await matching_updates(collection, query, fields, session)
+            outcome = await apply_updates(collection, matched, session, pre_images)
+        else:
+            outcome = await apply_updates(collection, items, session)
+        if session is not None and any(result["status"] != "updated" for result in outcome[0]):
+            raise BatchAborted(outcome[0])
+        return outcome
+
+    started = time.perf_counter()
+    try:
+        if request.transaction:
+            async with await services.client.start_session() as session:
+                results, changes = await session.with_transaction(run)
+        else:
+            results, changes = await run()
+    except BatchAborted as e:
+        for result in e.results:
+            if result["status"] == "updated":
+                result.update(status="rolled_back")
+                del result["version"]
+        return ORJSONResponse(
+            {"detail": "Batch rolled back: some updates failed", **summarize(e.results)}, status_code=409
+        )
+    except TooManyMatches as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except (NotImplementedError, OperationFailure) as e:
+        # Standalone servers (and the in-memory stand-in) have no transactions
+        if request.transaction and (isinstance(e, NotImplementedError) or e.code == 20):
+            raise HTTPException(status_code=400, detail="Transactions need a replica set or sharded cluster")
+        logging.error(f"Error batch updating reimbursements: {e}")
+        raise HTTPException(status_code=500, detail="Error updating reimbursement records")
+    except Exception as e:
+        logging.error(f"Error batch updating reimbursements: {e}")
+        raise HTTPException(status_code=500, detail="Error updating reimbursement records")
+
+    # Other workers hear about these writes from the change stream
+    for _, after in changes:
+        services.record_cache.invalidate(after["id"])
+        services.record_versions.set(after["id"], record_etag(after))
+    await record_summary_changes(services.db, changes)
+    return ORJSONResponse({**summarize(results), "seconds": round(time.perf_counter() - started, 3)})
+
+@api_router.get("/reimbursement/{record_id}")
+async def get_reimbursement(
+    services: Services,
+    record_id: str,
+    if_none_match: Optional[str] = Header(None)
+):
+    """Get one reimbursement record; If-None-Match with its current ETag returns 304"""
+    cached = services.record_cache.get(record_id)
+    if cached is not None:
+        body, etag = cached
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag, RECORD_CACHE_CONTROL)
+        return Response(body, media_type="application/json", headers={"ETag": etag, "Cache-Control": RECORD_CACHE_CONTROL})
+    cached_etag = services.record_versions.get(record_id)
+    if cached_etag and etag_matches(if_none_match, cached_etag):
+        return not_modified(cached_etag, RECORD_CACHE_CONTROL)
+    try:
+        read_sequence = services.record_cache.sequence()
+        record = await services.db.reimbursement_records.find_one({"id": record_id}, without_search_fields())
+    except Exception as e:
+        logging.error(f"Error getting reimbursement: {e}")
+        raise HTTPException(status_code=500, detail="Error retrieving reimbursement record")
+    if record is None:
+        raise HTTPException(status_code=404, detail="Record not found")
+    
+    # Change events identify documents by _id
+    object_id = record.pop("_id", None)
+    etag = record_etag(record)
+    services.record_versions.set(record_id, etag)
+    response = ORJSONResponse(record, headers={"ETag": etag, "Cache-Control": RECORD_CACHE_CONTROL})
+    services.record_cache.set(record_id, object_id, response.body, etag, read_sequence)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag, RECORD_CACHE_CONTROL)
+    return response
+
 @api_router.put("/reimbursement/{record_id}")
-async def update_reimbursement(record_id: str, update_data: ReimbursementCreate):
-    """Update reimbursement record"""
+async def update_reimbursement(
+    services: Services,
+    record_id: str,
+    update_data: ReimbursementCreate,
+    if_match: Optional[str] = Header(None)
+):
+    """Update reimbursement record, optionally only if it is still at the If-Match version"""
     try:
         update_dict = update_data.dict(exclude_unset=True)
         if update_dict:
             update_dict["updated_at"] = datetime.utcnow()
+            expected_version = parse_if_match(if_match)
+            
+            query = {"id": record_id}
+            if expected_version is not None:
+                # Records written before versioning have no version field
+                query["version"] = expected_version or None
             
-            result = await db.reimbursement_records.update_one(
-                {"id": record_id},
-                {"$set": update_dict}
+            # Update in one round trip; the pre-image feeds the summary deltas
+            previous_record = await services.db.reimbursement_records.find_one_and_update(
+                query,
+                {"$set": update_dict, "$inc": {"version": 1}},
+                projection=without_search_fields({"_id": 0}),
+                return_document=ReturnDocument.BEFORE
             )
             
-            if result.matched_count == 0:
+            # Other workers hear about this write from the change stream
+            services.record_cache.invalidate(record_id)
+            if previous_record is None:
+                services.record_versions.invalidate(record_id)
+                if expected_version is not None and await services.db.reimbursement_records.count_documents({"id": record_id}, limit=1):
+                    raise HTTPException(status_code=409, detail="Record was modified by another request")
                 raise HTTPException(status_code=404, detail="Record not found")
             
-            # Get updated record
-            updated_record = await db.reimbursement_records.find_one({"id": record_id})
-            updated_record.pop("_id", None)
-            return updated_record
+            updated_record = {
+                **previous_record,
+                **update_dict,
+                "version": previous_record.get("version", 0) + 1
+            }
+            await record_summary_change(services.db, before=previous_record, after=updated_record)
+            if touches_search_fields(update_dict):
+                # Skipped if a later update already wrote keys from a newer state
+                await services.db.reimbursement_records.update_one(
+                    {"id": record_id, "version": updated_record["version"]},
+                    {"$set": search_fields(updated_record)}
+                )
+            
+            etag = record_etag(updated_record)
+            services.record_versions.set(record_id, etag)
+            return ORJSONResponse(updated_record, headers={"ETag": etag})
         else:
             raise HTTPException(status_code=400, detail="No data provided for update")
     except HTTPException:
@@ -283,66 +642,361 @@ async def update_reimbursement(record_id: str, update_data: ReimbursementCreate)
         logging.error(f"Error updating reimbursement: {e}")
         raise HTTPException(status_code=500, detail="Error updating reimbursement record")
 
+@api_router.get("/reports/reconciliation")
+async def get_reconciliation_report(
+    services: Services,
+    state: Optional[str] = None,
+    city: Optional[str] = None,
+    tolerance_pct: float = Query(0.0, ge=0),
+    tolerance_abs: float = Query(0.0, ge=0),
+    top: int = Query(50, ge=0, le=1000)
+):
+    """Excel-vs-user variance per category, totals and the largest over-claims"""
+    # pandas is only loaded by the workers that build this report
+    from reconciliation import reconcile
+    query = record_filter(state, city)
+    try:
+        return await reconcile(
+            services.db.reimbursement_records,
+            query,
+            tolerance_pct=tolerance_pct,
+            tolerance_abs=tolerance_abs,
+            top=top
+        )
+    except Exception as e:
+        logging.error(f"Error building reconciliation report: {e}")
+        raise HTTPException(status_code=500, detail="Error building reconciliation report")
+
+@api_router.get("/reports/summary")
+async def get_summary(
+    services: Services,
+    group_by: str = "city",
+    state: Optional[str] = None,
+    city: Optional[str] = None,
+    live: bool = False
+):
+    """Totals per state or city, from the maintained summary collection (or live with live=true).
+
+    While the maintained summaries are marked stale (a delta was lost), the
+    totals are computed live until rebuild_summaries runs.
+    """
+    if group_by not in SUMMARY_GROUPS:
+        raise HTTPException(status_code=400, detail=f"group_by must be one of: {', '.join(SUMMARY_GROUPS)}")
+    try:
+        if live or await summaries_stale(services.db):
+            return await live_summary(services.db.reimbursement_records, group_by, state, city)
+        return await materialized_summary(services.db[SUMMARY_COLLECTION], group_by, state, city)
+    except Exception as e:
+        logging.error(f"Error building summary: {e}")
+        raise HTTPException(status_code=500, detail="Error building summary")
+
+@api_router.post("/jobs/export", status_code=202)
+async def submit_export_job(
+    services: Services,
+    format: str = "csv",
+    state: Optional[str] = None,
+    city: Optional[str] = None,
+    gzip: bool = False
+):
+    """Export records to a file in upload storage in the background; poll GET /api/jobs/{id}"""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Format must be one of: {', '.join(EXPORT_FORMATS)}")
+    params = {"format": format, "query": record_filter(state, city), "gzip": gzip}
+    return await submit_job(
+        services,
+        "export",
+        params,
+        result_ext=f".{format}.gz" if gzip else f".{format}",
+        content_type="application/gzip" if gzip else EXPORT_FORMATS[format]
+    )
+
+@api_router.post("/jobs/reconciliation", status_code=202)
+async def submit_reconciliation_job(
+    services: Services,
+    state: Optional[str] = None,
+    city: Optional[str] = None,
+    tolerance_pct: float = Query(0.0, ge=0),
+    tolerance_abs: float = Query(0.0, ge=0),
+    top: int = Query(50, ge=0, le=1000)
+):
+    """Build the reconciliation report in the background; the result is a JSON file"""
+    params = {
+        "query": record_filter(state, city),
+        "tolerance_pct": tolerance_pct,
+        "tolerance_abs": tolerance_abs,
+        "top": top
+    }
+    return await submit_job(services, "reconciliation", params, result_ext=".json", content_type="application/json")
+
+@api_router.post("/jobs/import", status_code=202)
+async def submit_import_job(
+    services: Services,
+    file: UploadFile = File(...),
+    format: Optional[str] = None,
+    chunk_size: int = Query(DEFAULT_IMPORT_CHUNK_SIZE, ge=1, le=10000)
+):
+    """Bulk import records in the background; the job result holds the import summary"""
+    fmt = format or detect_format(file.filename)
+    if fmt not in IMPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Format must be one of: {', '.join(IMPORT_FORMATS)}")
+    # The worker process reads the upload from a local spool file
+    input_path = services.upload_storage.spool_dir / f".job-input-{uuid.uuid4()}.part"
+    try:
+        with open(input_path, "wb") as spool:
+            await anyio.to_thread.run_sync(shutil.copyfileobj, file.file, spool)
+    except Exception as e:
+        input_path.unlink(missing_ok=True)
+        logging.error(f"Error spooling import file: {e}")
+        raise HTTPException(status_code=500, detail="Error receiving import file")
+    params = {"format": fmt, "chunk_size": chunk_size, "input_path": str(input_path)}
+    return await submit_job(services, "import", params, cleanup=(input_path,))
+
+async def submit_job(services: AppServices, job_type: str, params: dict, **options) -> ORJSONResponse:
+    try:
+        job = await services.job_manager.submit(job_type, params, **options)
+    except Exception as e:
+        for path in options.get("cleanup", ()):
+            Path(path).unlink(missing_ok=True)
+        logging.error(f"Error submitting {job_type} job: {e}")
+        raise HTTPException(status_code=500, detail="Error submitting job")
+    return ORJSONResponse(job, status_code=202, headers={"Location": f"/api/jobs/{job['id']}"})
+
+@api_router.get("/jobs/{job_id}")
+async def get_job(services: Services, job_id: str):
+    """Status, progress and (once finished) result or error of a background job"""
+    try:
+        job = await services.job_manager.get(job_id)
+    except Exception as e:
+        logging.error(f"Error fetching job: {e}")
+        raise HTTPException(status_code=500, detail="Error fetching job")
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@api_router.post("/jobs/{job_id}/cancel")
+async def cancel_job(services: Services, job_id: str):
+    """Cancel a queued job, or ask a running one to stop at its next progress report"""
+    try:
+        job = await services.job_manager.cancel(job_id)
+    except Exception as e:
+        logging.error(f"Error cancelling job: {e}")
+        raise HTTPException(status_code=500, detail="Error cancelling job")
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
 @api_router.post("/upload")
-async def upload_file(file: UploadFile = File(...)):
-    """Handle file upload for supporting documents"""
+async def upload_file(services: Services, file: UploadFile = File(...), idempotency_key: Optional[str] = Header(None)):
+    """Handle file upload for supporting documents; retries with the same Idempotency-Key are not stored again"""
+    if idempotency_key is not None:
+        # The body is already spooled; hash it so a reused key with other content is a mismatch
+        fingerprint = request_fingerprint(file.filename, await content_sha256(file, services.settings.upload_chunk_size))
+        return await services.idempotency.run(services.db, "POST /api/upload", idempotency_key, fingerprint, lambda: store_upload(services, file))
+    return await store_upload(services, file)
+
+async def store_upload(services: AppServices, file: UploadFile) -> ORJSONResponse:
     try:
-        # Generate unique filename
-        file_extension = file.filename.split(".")[-1] if "." in file.filename else ""
-        unique_filename = f"{str(uuid.uuid4())}.{file_extension}"
-        file_path = UPLOADS_DIR / unique_filename
-        
-        # Save file
-        content = await file.read()
-        async with aiofiles.open(file_path, "wb") as f:
-            await f.write(content)
-        
-        return {
-            "filename": unique_filename,
+        # Stream to a spool file in chunks; identical files share one stored copy
+        stored = await save_upload(
+            file,
+            services.upload_storage,
+            max_bytes=services.settings.max_upload_bytes,
+            chunk_size=services.settings.upload_chunk_size,
+            db=services.db,
+        )
+        metadata = {
+            "filename": stored["filename"],
             "original_name": file.filename,
-            "size": len(content)
+            "size": stored["size"],
+            "sha256": stored["sha256"],
+            "content_type": stored["content_type"]
         }
+        await record_upload(services.db, metadata)
+        if not stored["deduplicated"]:
+            # A duplicate's entry keeps the first upload's original name
+            services.upload_metadata.set(stored["filename"], metadata)
+        UPLOAD_BYTES.inc(stored["size"])
+        
+        return ORJSONResponse({
+            "filename": stored["filename"],
+            "original_name": file.filename,
+            "size": stored["size"],
+            "sha256": stored["sha256"],
+            "content_type": metadata["content_type"],
+            "deduplicated": stored["deduplicated"]
+        })
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except UploadInProgressError as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         logging.error(f"Error uploading file: {e}")
         raise HTTPException(status_code=500, detail="Error uploading file")
 
-@api_router.get("/download/{filename}")
-async def download_file(filename: str):
-    """Download uploaded file"""
+@api_router.api_route("/download/{filename}", methods=["GET", "HEAD"])
+async def download_file(
+    services: Services,
+    filename: str,
+    range: Optional[str] = Header(None),
+    if_range: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None)
+):
+    """Download uploaded file, whole or as a byte range"""
+    if resolve_upload_path(services.settings.uploads_dir, filename) is None:
+        raise HTTPException(status_code=404, detail="File not found")
     try:
-        file_path = UPLOADS_DIR / filename
-        if not file_path.exists():
+        metadata = await find_upload(services.db, services.upload_metadata, filename)
+        content_addressed = CONTENT_ADDRESSED_NAME.match(filename)
+        etag, cache_control = None, FILE_CACHE_CONTROL
+        if content_addressed:
+            # The name is the content hash, so the file can never change
+            etag, cache_control = f'"{content_addressed.group(1)}"', IMMUTABLE_CACHE_CONTROL
+        elif metadata:
+            etag = f'"{metadata["sha256"]}"'
+        if metadata and etag_matches(if_none_match, etag):
+            return not_modified(etag, cache_control)
+        
+        media_type = metadata["content_type"] if metadata else guess_media_type(filename)
+        headers = {"Content-Disposition": content_disposition(filename, media_type)}
+        file_path = services.upload_storage.local_path(filename)
+        if file_path is None:
+            return await remote_download(services, filename, metadata, media_type, headers, etag, cache_control,
+                                         range, if_range, if_none_match)
+        if services.settings.download_accel_prefix and metadata:
+            # Let nginx serve the bytes (sendfile, ranges) from its internal location
+            headers.update({
+                "X-Accel-Redirect": f"{services.settings.download_accel_prefix.rstrip('/')}/{filename}",
+                "ETag": etag,
+                "Cache-Control": cache_control
+            })
+            return Response(media_type=media_type, headers=headers)
+        
+        try:
+            fd = await anyio.to_thread.run_sync(os.open, file_path, os.O_RDONLY)
+        except FileNotFoundError:
             raise HTTPException(status_code=404, detail="File not found")
         
-        return FileResponse(
-            path=file_path,
-            filename=filename,
-            media_type='application/octet-stream'
-        )
+        try:
+            if metadata:
+                size = metadata["size"]
+            else:
+                # Upload from before metadata was recorded
+                stat_result = await anyio.to_thread.run_sync(os.fstat, fd)
+                size = stat_result.st_size
+                etag = etag or f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+            
+            if etag_matches(if_none_match, etag):
+                os.close(fd)
+                return not_modified(etag, cache_control)
+            
+            # A Range only applies if the client's copy is still current
+            byte_range = None
+            if range and (not if_range or etag_matches(if_range, etag)):
+                byte_range = parse_range(range, size)
+        except RangeNotSatisfiableError:
+            os.close(fd)
+            return range_not_satisfiable(size)
+        except BaseException:
+            os.close(fd)
+            raise
+        
+        headers.update({"ETag": etag, "Cache-Control": cache_control})
+        return count_download(FileRangeResponse(fd, size, media_type, byte_range, headers))
     except HTTPException:
         raise
     except Exception as e:
         logging.error(f"Error downloading file: {e}")
         raise HTTPException(status_code=500, detail="Error downloading file")
 
-# Include the router in the main app
-app.include_router(api_router)
+async def remote_download(services: AppServices, filename, metadata, media_type, headers, etag, cache_control,
+                          range, if_range, if_none_match):
+    """Stream a download from a GridFS/S3 backend using ranged reads"""
+    size = metadata["size"] if metadata else await services.upload_storage.size(filename)
+    if size is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    # Without metadata nothing identifies the content (a same-size replacement would look
+    # unchanged), so no ETag is sent: conditional requests get the whole current file
+    if etag and etag_matches(if_none_match, etag):
+        return not_modified(etag, cache_control)
+    
+    byte_range = None
+    if range and (not if_range or (etag and etag_matches(if_range, etag))):
+        try:
+            byte_range = parse_range(range, size)
+        except RangeNotSatisfiableError:
+            return range_not_satisfiable(size)
+    
+    headers["Cache-Control"] = cache_control
+    if etag:
+        headers["ETag"] = etag
+    return count_download(StreamRangeResponse(
+        lambda start, length: services.upload_storage.read_range(filename, start, length),
+        size, media_type, byte_range, headers
+    ))
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=["*"],
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+def count_download(response):
+    """Add the bytes a download response actually sent to the download counter"""
+    response.background = BackgroundTask(lambda: DOWNLOAD_BYTES.inc(response.bytes_sent))
+    return response
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
+async def metrics():
+    """Prometheus text exposition of request, Mongo and file transfer metrics"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
+def create_app(app_settings: Optional[Settings] = None) -> FastAPI:
+    """Build an app with its own caches (app.state.services); Mongo and storage are opened by its lifespan.
+
+    Run with ``uvicorn server:create_app --factory``; without settings they
+    are read from the environment and backend/.env.
+    """
+    settings = app_settings or Settings.from_env()
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    services = AppServices(settings)
+    
+    app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+    app.state.services = services
+    app.include_router(api_router)
+    app.add_api_route("/metrics", metrics, include_in_schema=False)
+    
+    # Before Starlette spools the multipart body, which happens ahead of the endpoint
+    app.add_middleware(UploadSizeLimitMiddleware, paths=("/api/upload",), max_bytes=settings.max_upload_bytes)
+    
+    if settings.admission_control:
+        # Inside CORS and metrics, so shed requests still get CORS headers and show up in metrics
+        app.add_middleware(
+            AdmissionMiddleware,
+            limits=parse_limits(settings.admission_limits),
+            queue_size=settings.admission_queue_size,
+            max_wait=settings.admission_max_wait,
+            client_rate=settings.client_rate_limit,
+            client_burst=settings.client_rate_burst,
+            latency_tracker=services.mongo_latency,
+            target_latency=settings.admission_target_latency
+        )
+    
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=["*"],
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    
+    if settings.metrics_enabled:
+        app.add_middleware(MetricsMiddleware, slow_request_seconds=settings.slow_request_seconds)
+    return app
+
+_default_app = None
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+def __getattr__(name):
+    # `server.app` (e.g. `uvicorn server:app`) still works: the app is built from the environment on first use
+    global _default_app
+    if name == "app":
+        if _default_app is None:
+            _default_app = create_app()
+        return _default_app
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
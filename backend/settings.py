@@ -0,0 +1,141 @@
+"""
+Server configuration, read from the environment (and backend/.env) by Settings.from_env
+
+create_app(settings) takes a Settings, so tests and benchmarks can build an
+app without touching os.environ. MONGO_URL=memory:// selects the in-memory
+Mongo stand-in (mongomock-motor) for tests.
+"""
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Mapping, Optional
+
+from admission import DEFAULT_MAX_WAIT, DEFAULT_QUEUE_SIZE, DEFAULT_TARGET_LATENCY
+from idempotency import DEFAULT_TTL as DEFAULT_IDEMPOTENCY_TTL
+from jobs import DEFAULT_WORKERS as DEFAULT_JOB_WORKERS
+from record_cache import DEFAULT_FALLBACK_TTL, DEFAULT_RECORD_CACHE_SIZE, DEFAULT_RECORD_CACHE_TTL
+from status_history import DEFAULT_TTL as DEFAULT_STATUS_CHECK_TTL
+from storage import DEFAULT_CHUNK_SIZE, DEFAULT_MAX_UPLOAD_BYTES
+from storage_backends import DEFAULT_MULTIPART_THRESHOLD
+from template_data import DEFAULT_CHECK_INTERVAL
+from write_batching import DEFAULT_MAX_BATCH, DEFAULT_MAX_DELAY
+
+ROOT_DIR = Path(__file__).parent
+MEMORY_MONGO_URL = "memory://"
+# Connections opened at startup and kept open by the driver
+DEFAULT_MIN_POOL_SIZE = 4
+DEFAULT_MAX_POOL_SIZE = 100
+
+
+def _flag(environ: Mapping, name: str, default: str) -> bool:
+    return environ.get(name, default).lower() in ("1", "true", "yes")
+
+
+def _optional_float(environ: Mapping, name: str) -> Optional[float]:
+    return float(environ[name]) if environ.get(name) else None
+
+
+@dataclass(frozen=True)
+class Settings:
+    mongo_url: str
+    db_name: str
+    mongo_min_pool_size: int = DEFAULT_MIN_POOL_SIZE
+    mongo_max_pool_size: int = DEFAULT_MAX_POOL_SIZE
+    # Prometheus metrics at /metrics; requests slower than slow_request_seconds are logged with their Mongo commands
+    metrics_enabled: bool = True
+    slow_request_seconds: Optional[float] = None
+    # Admission control (see admission.py); limits like "reads=64,writes=32,files=8"
+    admission_control: bool = True
+    admission_limits: Optional[str] = None
+    admission_queue_size: int = DEFAULT_QUEUE_SIZE
+    admission_max_wait: float = DEFAULT_MAX_WAIT
+    client_rate_limit: Optional[float] = None
+    client_rate_burst: Optional[float] = None
+    admission_target_latency: float = DEFAULT_TARGET_LATENCY
+    # Uploads: local (uploads_dir), gridfs (gridfs_bucket) or s3 (s3_*); remote backends spool
+    # uploads in upload_spool_dir (the system temp dir by default)
+    uploads_dir: Path = ROOT_DIR / "uploads"
+    storage_backend: str = "local"
+    upload_spool_dir: Optional[Path] = None
+    gridfs_bucket: str = "uploads"
+    s3_bucket: Optional[str] = None
+    s3_prefix: str = ""
+    s3_endpoint_url: Optional[str] = None
+    s3_multipart_threshold: int = DEFAULT_MULTIPART_THRESHOLD
+    download_accel_prefix: Optional[str] = None
+    max_upload_bytes: int = DEFAULT_MAX_UPLOAD_BYTES
+    upload_chunk_size: int = DEFAULT_CHUNK_SIZE
+    # Master Excel workbook for template data (sample data when unset)
+    template_xlsx_path: Optional[str] = None
+    template_check_interval: float = DEFAULT_CHECK_INTERVAL
+    idempotency_ttl: float = DEFAULT_IDEMPOTENCY_TTL
+    idempotency_cache_size: int = 1000
+    # Opt-in group commit of status/record inserts
+    write_batching: bool = False
+    write_batch_max_docs: int = DEFAULT_MAX_BATCH
+    write_batch_max_delay: float = DEFAULT_MAX_DELAY
+    job_workers: int = DEFAULT_JOB_WORKERS
+    # Per-type concurrent jobs like "export=2,import=1", per API worker process
+    job_limits: Optional[str] = None
+    version_cache_size: int = 10000
+    version_cache_ttl: float = 5.0
+    record_cache_size: int = DEFAULT_RECORD_CACHE_SIZE
+    record_cache_ttl: float = DEFAULT_RECORD_CACHE_TTL
+    record_cache_fallback_ttl: float = DEFAULT_FALLBACK_TTL
+    # Seconds status checks are kept; 0 keeps them forever
+    status_check_ttl: int = DEFAULT_STATUS_CHECK_TTL
+
+    @property
+    def in_memory(self) -> bool:
+        return self.mongo_url == MEMORY_MONGO_URL
+
+    @classmethod
+    def from_env(cls, environ: Optional[Mapping] = None) -> "Settings":
+        """Settings from environment variables; with no mapping given, backend/.env is loaded first"""
+        if environ is None:
+            from dotenv import load_dotenv
+
+            load_dotenv(ROOT_DIR / ".env")
+            environ = os.environ
+        get = environ.get
+        return cls(
+            mongo_url=environ["MONGO_URL"],
+            db_name=environ["DB_NAME"],
+            mongo_min_pool_size=int(get("MONGO_MIN_POOL_SIZE", DEFAULT_MIN_POOL_SIZE)),
+            mongo_max_pool_size=int(get("MONGO_MAX_POOL_SIZE", DEFAULT_MAX_POOL_SIZE)),
+            metrics_enabled=_flag(environ, "METRICS_ENABLED", "true"),
+            slow_request_seconds=_optional_float(environ, "SLOW_REQUEST_SECONDS"),
+            admission_control=_flag(environ, "ADMISSION_CONTROL", "true"),
+            admission_limits=get("ADMISSION_LIMITS"),
+            admission_queue_size=int(get("ADMISSION_QUEUE_SIZE", DEFAULT_QUEUE_SIZE)),
+            admission_max_wait=float(get("ADMISSION_MAX_WAIT_MS", DEFAULT_MAX_WAIT * 1000)) / 1000,
+            client_rate_limit=_optional_float(environ, "CLIENT_RATE_LIMIT"),
+            client_rate_burst=_optional_float(environ, "CLIENT_RATE_BURST"),
+            admission_target_latency=float(get("ADMISSION_TARGET_MONGO_MS", DEFAULT_TARGET_LATENCY * 1000)) / 1000,
+            uploads_dir=Path(get("UPLOADS_DIR", ROOT_DIR / "uploads")),
+            storage_backend=get("STORAGE_BACKEND", "local"),
+            upload_spool_dir=Path(get("UPLOAD_SPOOL_DIR")) if get("UPLOAD_SPOOL_DIR") else None,
+            gridfs_bucket=get("GRIDFS_BUCKET", "uploads"),
+            s3_bucket=get("S3_BUCKET"),
+            s3_prefix=get("S3_PREFIX", ""),
+            s3_endpoint_url=get("S3_ENDPOINT_URL"),
+            s3_multipart_threshold=int(get("S3_MULTIPART_THRESHOLD", DEFAULT_MULTIPART_THRESHOLD)),
+            download_accel_prefix=get("DOWNLOAD_ACCEL_PREFIX"),
+            max_upload_bytes=int(get("MAX_UPLOAD_BYTES", DEFAULT_MAX_UPLOAD_BYTES)),
+            upload_chunk_size=int(get("UPLOAD_CHUNK_SIZE", DEFAULT_CHUNK_SIZE)),
+            template_xlsx_path=get("TEMPLATE_XLSX_PATH"),
+            template_check_interval=float(get("TEMPLATE_CHECK_INTERVAL", DEFAULT_CHECK_INTERVAL)),
+            idempotency_ttl=float(get("IDEMPOTENCY_TTL_SECONDS", DEFAULT_IDEMPOTENCY_TTL)),
+            idempotency_cache_size=int(get("IDEMPOTENCY_CACHE_SIZE", 1000)),
+            write_batching=_flag(environ, "WRITE_BATCHING", "false"),
+            write_batch_max_docs=int(get("WRITE_BATCH_MAX_DOCS", DEFAULT_MAX_BATCH)),
+            write_batch_max_delay=float(get("WRITE_BATCH_MAX_DELAY_MS", DEFAULT_MAX_DELAY * 1000)) / 1000,
+            job_workers=int(get("JOB_WORKERS", DEFAULT_JOB_WORKERS)),
+            job_limits=get("JOB_LIMITS"),
+            version_cache_size=int(get("VERSION_CACHE_SIZE", 10000)),
+            version_cache_ttl=float(get("VERSION_CACHE_TTL", 5.0)),
+            record_cache_size=int(get("RECORD_CACHE_SIZE", DEFAULT_RECORD_CACHE_SIZE)),
+            record_cache_ttl=float(get("RECORD_CACHE_TTL", DEFAULT_RECORD_CACHE_TTL)),
+            record_cache_fallback_ttl=float(get("RECORD_CACHE_FALLBACK_TTL", DEFAULT_FALLBACK_TTL)),
+            status_check_ttl=int(get("STATUS_CHECK_TTL_SECONDS", DEFAULT_STATUS_CHECK_TTL)),
+        )
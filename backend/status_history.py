@@ -0,0 +1,162 @@
+"""
+Time-series storage and windowed queries for status_checks heartbeats
+
+status_checks is a MongoDB time-series collection (timeField timestamp,
+metaField client_name): heartbeats are stored in compressed per-client
+buckets and whole buckets expire after the configured TTL. Windowed queries
+are filtered on the buckets' time bounds, so their cost follows the window
+rather than the retained history. Servers without time-series collections
+(before 5.0, and the in-memory test stand-in) get a plain collection that
+expires through a TTL index.
+"""
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from pymongo import ASCENDING
+from pymongo.errors import CollectionInvalid, OperationFailure
+
+STATUS_COLLECTION = "status_checks"
+DEFAULT_TTL = 30 * 86400
+TIMESERIES_OPTIONS = {"timeField": "timestamp", "metaField": "client_name", "granularity": "seconds"}
+TTL_INDEX = "timestamp_ttl"
+DEFAULT_WINDOW = timedelta(hours=1)
+# Most intervals one counts query may return (a day of minutes)
+MAX_INTERVALS = 1440
+EPOCH = datetime(1970, 1, 1)
+
+logger = logging.getLogger(__name__)
+
+
+def utc(value: datetime) -> datetime:
+    """Naive UTC, the way timestamps are stored"""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+async def ensure_status_collection(db, ttl: int = DEFAULT_TTL, timeseries: bool = True) -> str:
+    """Create status_checks as a time-series collection, or bring its TTL up to date.
+
+    Returns "timeseries" or "collection" (the TTL-index fallback). A ttl of 0
+    keeps heartbeats forever. Run before ensure_indexes, which would
+    otherwise create a plain collection.
+    """
+    if timeseries:
+        cursor = await db.list_collections(filter={"name": STATUS_COLLECTION})
+        found = await cursor.to_list(None)
+        if not found:
+            try:
+                await db.create_collection(
+                    STATUS_COLLECTION, timeseries=TIMESERIES_OPTIONS, **({"expireAfterSeconds": ttl} if ttl else {})
+                )
+                logger.info(f"Created time-series collection {STATUS_COLLECTION} (TTL {ttl or 'off'})")
+                return "timeseries"
+            except CollectionInvalid:
+                # Another worker created it first
+                return "timeseries"
+            except OperationFailure as e:
+                logger.warning(f"Time-series collections unavailable ({e}); status checks expire by a TTL index")
+        elif found[0].get("type") == "timeseries":
+            if found[0]["options"].get("expireAfterSeconds") != (ttl or None):
+                await db.command("collMod", STATUS_COLLECTION, expireAfterSeconds=ttl or "off")
+                logger.info(f"Set {STATUS_COLLECTION} TTL to {ttl or 'off'}")
+            return "timeseries"
+        else:
+            logger.warning(f"{STATUS_COLLECTION} is a regular collection; run migrate_status_checks.py "
+                           f"to convert it to a time-series collection")
+    await ensure_ttl_index(db[STATUS_COLLECTION], ttl)
+    return "collection"
+
+
+async def ensure_ttl_index(collection, ttl: int):
+    """TTL index on timestamp for the plain-collection fallback; recreated if the TTL changed"""
+    indexes = await collection.index_information()
+    if indexes.get(TTL_INDEX, {}).get("expireAfterSeconds") == (ttl or None):
+        return
+    if TTL_INDEX in indexes:
+        await collection.drop_index(TTL_INDEX)
+    if ttl:
+        await collection.create_index([("timestamp", ASCENDING)], name=TTL_INDEX, expireAfterSeconds=ttl)
+
+
+def window_filter(start: Optional[datetime], end: Optional[datetime], client_name: Optional[str] = None) -> dict:
+    query = {}
+    if start or end:
+        query["timestamp"] = {
+            **({"$gte": utc(start)} if start else {}),
+            **({"$lt": utc(end)} if end else {}),
+        }
+    if client_name:
+        query["client_name"] = client_name
+    return query
+
+
+async def latest_per_client(collection, since: Optional[datetime] = None) -> list:
+    """Most recent heartbeat of every client, by client name; only clients seen since `since` if given"""
+    pipeline = [{"$match": window_filter(since, None)}] if since else []
+    pipeline += [
+        # Backed by the (client_name, timestamp desc) index; on time-series
+        # collections this is a "last point" query that reads one bucket per client
+        {"$sort": {"client_name": 1, "timestamp": -1}},
+        {"$group": {"_id": "$client_name", "last_seen": {"$first": "$timestamp"}, "id": {"$first": "$id"}}},
+    ]
+    documents = await collection.aggregate(pipeline).to_list(None)
+    return sorted(
+        ({"client_name": document["_id"], "last_seen": document["last_seen"], "id": document["id"]}
+         for document in documents),
+        key=lambda check: check["client_name"],
+    )
+
+
+def interval_start(value: datetime, minutes: int) -> datetime:
+    width = timedelta(minutes=minutes)
+    return value - (value - EPOCH) % width
+
+
+async def counts_per_interval(
+    collection, start: datetime, end: datetime, minutes: int = 1, client_name: Optional[str] = None
+) -> list:
+    """Heartbeats per `minutes`-wide interval over [start, end), oldest first, with empty intervals as 0"""
+    start, end = utc(start), utc(end)
+    width_ms = minutes * 60000
+    pipeline = [
+        {"$match": window_filter(start, end, client_name)},
+        # Round down to a multiple of the width since the epoch; unlike
+        # $dateTrunc this works on every server version
+        {"$group": {
+            "_id": {"$subtract": ["$timestamp", {"$mod": [{"$subtract": ["$timestamp", EPOCH]}, width_ms]}]},
+            "count": {"$sum": 1},
+        }},
+    ]
+    counts = {document["_id"]: document["count"] for document in await collection.aggregate(pipeline).to_list(None)}
+    intervals = []
+    current = interval_start(start, minutes)
+    while current < end:
+        intervals.append({"start": current, "count": counts.get(current, 0)})
+        current += timedelta(minutes=minutes)
+    return intervals
+
+
+async def migrate_to_timeseries(db, ttl: int = DEFAULT_TTL, batch_size: int = 10_000) -> int:
+    """Copy a regular status_checks collection into a new time-series one; returns the checks copied.
+
+    The old collection is renamed to status_checks_legacy and only status
+    checks within the TTL are copied. Time-series collections cannot be
+    renamed, so the new one is created in place: run this with the API stopped.
+    """
+    legacy = db[f"{STATUS_COLLECTION}_legacy"]
+    await db[STATUS_COLLECTION].rename(legacy.name)
+    if await ensure_status_collection(db, ttl) != "timeseries":
+        raise RuntimeError("This server cannot create time-series collections")
+    query = {"timestamp": {"$gte": datetime.utcnow() - timedelta(seconds=ttl)}} if ttl else {}
+    copied, batch = 0, []
+    async for document in legacy.find(query, {"_id": 0}, batch_size=batch_size):
+        batch.append(document)
+        if len(batch) >= batch_size:
+            await db[STATUS_COLLECTION].insert_many(batch, ordered=False)
+            copied, batch = copied + len(batch), []
+    if batch:
+        await db[STATUS_COLLECTION].insert_many(batch, ordered=False)
+        copied += len(batch)
+    return copied
@@ -0,0 +1,302 @@
+"""
+Streaming, content-addressed storage for uploaded supporting documents
+"""
+import asyncio
+import hashlib
+import re
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional
+
+import aiofiles
+import aiofiles.os
+from pymongo.errors import DuplicateKeyError
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import JSONResponse
+
+from file_serving import guess_media_type
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+DEFAULT_MAX_UPLOAD_BYTES = 25 * 1024 * 1024
+DEFAULT_METADATA_CACHE_SIZE = 10_000
+UPLOAD_METADATA_COLLECTION = "uploaded_files"
+# Boundaries, part headers and small form fields around the file in a multipart body
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+# A write claimed longer ago than this is taken to have died with its process
+STALE_CLAIM_AGE = timedelta(minutes=10)
+# How long a duplicate upload waits for the claimed write to finish before giving up
+DEFAULT_UPLOAD_WAIT_TIMEOUT = 30.0
+
+_EXTENSION_RE = re.compile(r"^[a-z0-9]{1,10}$")
+_STORED_NAME_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]{0,254}$")
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an upload grows past the configured maximum size"""
+
+    def __init__(self, max_bytes: int):
+        super().__init__(f"Upload exceeds the maximum size of {max_bytes} bytes")
+        self.max_bytes = max_bytes
+
+
+class UploadInProgressError(Exception):
+    """Raised when an identical upload is still being written after the wait timeout"""
+
+    def __init__(self):
+        super().__init__("An identical file is still being uploaded; retry")
+
+
+class UploadSizeLimitMiddleware:
+    """Reject upload requests over the size limit before their body is parsed.
+
+    Starlette spools the whole multipart body before the endpoint runs, so
+    the check in save_upload alone comes too late. A Content-Length over the
+    limit gets 413 without reading the body; a chunked body is counted as it
+    is received and cut off with 413 once it passes the limit.
+    """
+
+    def __init__(self, app, paths: tuple, max_bytes: int):
+        self.app = app
+        self.paths = set(paths)
+        self.max_bytes = max_bytes
+        self.limit = max_bytes + MULTIPART_OVERHEAD_BYTES
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in self.paths:
+            return await self.app(scope, receive, send)
+        detail = str(UploadTooLargeError(self.max_bytes))
+        content_length = Headers(scope=scope).get("content-length", "")
+        if content_length.isdigit() and int(content_length) > self.limit:
+            return await JSONResponse({"detail": detail}, status_code=413)(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.limit:
+                    # FastAPI re-raises HTTPExceptions from body parsing as they are
+                    raise HTTPException(status_code=413, detail=detail)
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+def file_extension(filename: str) -> str:
+    """Return a lowercase, filesystem-safe extension for an uploaded filename"""
+    suffix = Path(filename or "").suffix.lstrip(".").lower()
+    return suffix if _EXTENSION_RE.match(suffix) else ""
+
+
+def resolve_upload_path(uploads_dir: Path, filename: str) -> Optional[Path]:
+    """Map a requested download name to a path inside uploads_dir, or None.
+
+    Only plain stored names are accepted (no separators, no leading dot), so
+    "..", hidden temp files and absolute paths never resolve.
+    """
+    if not _STORED_NAME_RE.match(filename or "") or ".." in filename:
+        return None
+    return uploads_dir / filename
+
+
+async def save_upload(
+    file,
+    backend,
+    max_bytes: int = DEFAULT_MAX_UPLOAD_BYTES,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    db=None,
+    wait_timeout: float = DEFAULT_UPLOAD_WAIT_TIMEOUT,
+) -> dict:
+    """Stream an upload to a spool file chunk by chunk, hashing it in the same pass.
+
+    The spool file is then handed to the storage backend as
+    ``<sha256>.<ext>``, so identical bills are stored once. Only one chunk
+    is held in memory at a time. With db, the write is claimed by an upsert
+    of the file's uploaded_files entry (see claim_upload), so of several
+    concurrent identical uploads only one writes, and the others wait until
+    it is stored (see claim_or_wait_for_upload); without it, the backend is
+    asked whether the file exists.
+    """
+    extension = file_extension(file.filename)
+    temp_path = backend.spool_dir / f".{uuid.uuid4()}.part"
+    digest = hashlib.sha256()
+    size = 0
+
+    try:
+        async with aiofiles.open(temp_path, "wb") as out:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLargeError(max_bytes)
+                digest.update(chunk)
+                await out.write(chunk)
+    except BaseException:
+        await _remove_quietly(temp_path)
+        raise
+
+    sha256 = digest.hexdigest()
+    stored_name = f"{sha256}.{extension}" if extension else sha256
+    content_type = guess_media_type(stored_name)
+
+    stored = {
+        "filename": stored_name,
+        "size": size,
+        "sha256": sha256,
+        "content_type": content_type,
+    }
+
+    try:
+        if db is None:
+            deduplicated = await backend.exists(stored_name)
+            if not deduplicated:
+                await backend.put_file(stored_name, temp_path, content_type)
+        else:
+            deduplicated = not await claim_or_wait_for_upload(
+                db, {**stored, "original_name": file.filename}, wait_timeout
+            )
+            if not deduplicated:
+                try:
+                    await backend.put_file(stored_name, temp_path, content_type)
+                except BaseException:
+                    await release_upload_claim(db, stored_name)
+                    raise
+                await db[UPLOAD_METADATA_COLLECTION].update_one(
+                    {"filename": stored_name}, {"$set": {"stored": True}, "$unset": {"claimed_at": ""}}
+                )
+    finally:
+        await _remove_quietly(temp_path)
+
+    return {**stored, "deduplicated": deduplicated}
+
+
+async def claim_upload(db, metadata: dict) -> bool:
+    """Claim the write of a stored upload; False if another request has stored or is storing it.
+
+    The claim is an upsert on the file's entry in uploaded_files (unique on
+    the content-addressed filename), so exactly one of several concurrent
+    identical uploads inserts it. The entry stays ``stored: False`` until
+    the file is written; a claim older than STALE_CLAIM_AGE is taken over.
+    """
+    now = datetime.utcnow()
+    collection = db[UPLOAD_METADATA_COLLECTION]
+    try:
+        result = await collection.update_one(
+            {"filename": metadata["filename"]},
+            {"$setOnInsert": {**metadata, "stored": False, "claimed_at": now, "created_at": now}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        # Lost the race to insert the entry
+        return False
+    if result.upserted_id is not None:
+        return True
+    # Entries from before claims have no "stored" field and are stored
+    result = await collection.update_one(
+        {"filename": metadata["filename"], "stored": False, "claimed_at": {"$lt": now - STALE_CLAIM_AGE}},
+        {"$set": {**metadata, "claimed_at": now}},
+    )
+    return result.modified_count == 1
+
+
+async def claim_or_wait_for_upload(db, metadata: dict, wait_timeout: float = DEFAULT_UPLOAD_WAIT_TIMEOUT) -> bool:
+    """Claim the write of a stored upload (True), or wait until another request has stored it (False).
+
+    A write that fails releases its claim, and the wait then claims the
+    write itself. Raises UploadInProgressError if the other write is still
+    running after wait_timeout.
+    """
+    collection = db[UPLOAD_METADATA_COLLECTION]
+    deadline = time.monotonic() + wait_timeout
+    delay = 0.05
+    while True:
+        if await claim_upload(db, metadata):
+            return True
+        entry = await collection.find_one({"filename": metadata["filename"]}, {"_id": 0, "stored": 1})
+        if entry is None:
+            continue
+        # Entries from before claims have no "stored" field and are stored
+        if entry.get("stored", True):
+            return False
+        if time.monotonic() >= deadline:
+            raise UploadInProgressError()
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 1.0)
+
+
+async def release_upload_claim(db, filename: str):
+    """Drop a claim whose write failed, so the next upload of the file writes it"""
+    await db[UPLOAD_METADATA_COLLECTION].delete_one({"filename": filename, "stored": False})
+
+
+async def content_sha256(file, chunk_size: int = DEFAULT_CHUNK_SIZE) -> str:
+    """sha256 of an UploadFile's body, read in chunks; the file is rewound for save_upload"""
+    digest = hashlib.sha256()
+    while chunk := await file.read(chunk_size):
+        digest.update(chunk)
+    await file.seek(0)
+    return digest.hexdigest()
+
+
+async def _remove_quietly(path: Path):
+    try:
+        await aiofiles.os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class UploadMetadataCache:
+    """In-process LRU of upload metadata (size, hash, type) keyed by stored name.
+
+    Stored names are content hashes, so entries never go stale.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_METADATA_CACHE_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+
+    def get(self, filename: str) -> Optional[dict]:
+        metadata = self._entries.get(filename)
+        if metadata is not None:
+            self._entries.move_to_end(filename)
+        return metadata
+
+    def set(self, filename: str, metadata: dict):
+        self._entries[filename] = metadata
+        self._entries.move_to_end(filename)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+async def record_upload(db, metadata: dict):
+    """Persist metadata for a stored upload; the first original name wins on dedup"""
+    now = datetime.utcnow()
+    await db[UPLOAD_METADATA_COLLECTION].update_one(
+        {"filename": metadata["filename"]},
+        {
+            "$setOnInsert": {**metadata, "created_at": now},
+            "$set": {"last_uploaded_at": now},
+        },
+        upsert=True,
+    )
+
+
+async def find_upload(db, cache: UploadMetadataCache, filename: str) -> Optional[dict]:
+    """Metadata for a stored upload from the cache, falling back to Mongo"""
+    metadata = cache.get(filename)
+    if metadata is None:
+        # Files still being written are not there yet
+        metadata = await db[UPLOAD_METADATA_COLLECTION].find_one(
+            {"filename": filename, "stored": {"$ne": False}}, {"_id": 0, "stored": 0, "claimed_at": 0}
+        )
+        if metadata is not None:
+            cache.set(filename, metadata)
+    return metadata
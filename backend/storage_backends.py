@@ -0,0 +1,223 @@
+"""
+Upload storage backends: local disk, MongoDB GridFS and S3-compatible object storage
+
+Files are addressed by their stored name (``<sha256>.<ext>``). Every backend
+takes a finished, hashed spool file on write and streams byte ranges on read,
+so the API can run on several workers or hosts with gridfs or s3.
+"""
+import asyncio
+import tempfile
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+import aiofiles
+import aiofiles.os
+
+DEFAULT_READ_CHUNK_SIZE = 256 * 1024
+DEFAULT_MULTIPART_THRESHOLD = 8 * 1024 * 1024
+STORAGE_BACKENDS = ("local", "gridfs", "s3")
+
+
+class StorageBackend:
+    """Interface shared by all upload stores"""
+
+    name = "base"
+
+    def __init__(self, spool_dir: Optional[Path] = None):
+        self.spool_dir = Path(spool_dir or tempfile.gettempdir())
+
+    def local_path(self, filename: str) -> Optional[Path]:
+        """Path on this host for zero-copy serving, if the backend has one"""
+        return None
+
+    async def exists(self, filename: str) -> bool:
+        raise NotImplementedError
+
+    async def size(self, filename: str) -> Optional[int]:
+        """Stored size in bytes, or None if the file does not exist"""
+        raise NotImplementedError
+
+    async def put_file(self, filename: str, spool_path: Path, content_type: str):
+        """Store a finished spool file under filename; the spool file may be consumed"""
+        raise NotImplementedError
+
+    def read_range(self, filename: str, start: int, length: int) -> AsyncIterator[bytes]:
+        """Stream ``length`` bytes starting at ``start``"""
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class LocalStorage(StorageBackend):
+    """Files in a directory on this host; spool files are renamed into place"""
+
+    name = "local"
+
+    def __init__(self, root: Path):
+        root = Path(root)
+        root.mkdir(parents=True, exist_ok=True)
+        super().__init__(spool_dir=root)
+        self.root = root
+
+    def local_path(self, filename: str) -> Path:
+        return self.root / filename
+
+    async def exists(self, filename: str) -> bool:
+        return await aiofiles.os.path.exists(self.root / filename)
+
+    async def size(self, filename: str) -> Optional[int]:
+        try:
+            return (await aiofiles.os.stat(self.root / filename)).st_size
+        except FileNotFoundError:
+            return None
+
+    async def put_file(self, filename: str, spool_path: Path, content_type: str):
+        await aiofiles.os.replace(spool_path, self.root / filename)
+
+    async def read_range(self, filename: str, start: int, length: int) -> AsyncIterator[bytes]:
+        async with aiofiles.open(self.root / filename, "rb") as f:
+            await f.seek(start)
+            while length > 0:
+                chunk = await f.read(min(DEFAULT_READ_CHUNK_SIZE, length))
+                if not chunk:
+                    return
+                length -= len(chunk)
+                yield chunk
+
+
+class GridFSStorage(StorageBackend):
+    """Files in a GridFS bucket of the application database"""
+
+    name = "gridfs"
+
+    def __init__(self, db, bucket_name: str = "uploads", spool_dir: Optional[Path] = None):
+        from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+
+        super().__init__(spool_dir)
+        self.bucket = AsyncIOMotorGridFSBucket(db, bucket_name=bucket_name)
+        self.files = db[f"{bucket_name}.files"]
+
+    async def _file_doc(self, filename: str) -> Optional[dict]:
+        return await self.files.find_one({"filename": filename}, {"length": 1})
+
+    async def exists(self, filename: str) -> bool:
+        return await self._file_doc(filename) is not None
+
+    async def size(self, filename: str) -> Optional[int]:
+        document = await self._file_doc(filename)
+        return document["length"] if document else None
+
+    async def put_file(self, filename: str, spool_path: Path, content_type: str):
+        with open(spool_path, "rb") as source:
+            await self.bucket.upload_from_stream(
+                filename, source, metadata={"contentType": content_type}
+            )
+
+    async def read_range(self, filename: str, start: int, length: int) -> AsyncIterator[bytes]:
+        grid_out = await self.bucket.open_download_stream_by_name(filename)
+        try:
+            grid_out.seek(start)
+            while length > 0:
+                chunk = await grid_out.read(min(DEFAULT_READ_CHUNK_SIZE, length))
+                if not chunk:
+                    return
+                length -= len(chunk)
+                yield chunk
+        finally:
+            grid_out.close()
+
+
+class S3Storage(StorageBackend):
+    """Files in an S3-compatible bucket (AWS, MinIO, ...) via boto3 in worker threads.
+
+    Large files go up as multipart uploads; reads use ranged GETs.
+    """
+
+    name = "s3"
+
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "",
+        endpoint_url: Optional[str] = None,
+        multipart_threshold: int = DEFAULT_MULTIPART_THRESHOLD,
+        spool_dir: Optional[Path] = None,
+    ):
+        import boto3
+        from boto3.s3.transfer import TransferConfig
+
+        super().__init__(spool_dir)
+        self.bucket = bucket
+        self.prefix = prefix.strip("/") + "/" if prefix.strip("/") else ""
+        self.client = boto3.client("s3", endpoint_url=endpoint_url)
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_threshold,
+        )
+
+    def _key(self, filename: str) -> str:
+        return f"{self.prefix}{filename}"
+
+    async def size(self, filename: str) -> Optional[int]:
+        from botocore.exceptions import ClientError
+
+        try:
+            head = await asyncio.to_thread(self.client.head_object, Bucket=self.bucket, Key=self._key(filename))
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+        return head["ContentLength"]
+
+    async def exists(self, filename: str) -> bool:
+        return await self.size(filename) is not None
+
+    async def put_file(self, filename: str, spool_path: Path, content_type: str):
+        await asyncio.to_thread(
+            self.client.upload_file,
+            str(spool_path),
+            self.bucket,
+            self._key(filename),
+            ExtraArgs={"ContentType": content_type},
+            Config=self.transfer_config,
+        )
+
+    async def read_range(self, filename: str, start: int, length: int) -> AsyncIterator[bytes]:
+        if length <= 0:
+            return
+        response = await asyncio.to_thread(
+            self.client.get_object,
+            Bucket=self.bucket,
+            Key=self._key(filename),
+            Range=f"bytes={start}-{start + length - 1}",
+        )
+        body = response["Body"]
+        try:
+            while True:
+                chunk = await asyncio.to_thread(body.read, DEFAULT_READ_CHUNK_SIZE)
+                if not chunk:
+                    return
+                yield chunk
+        finally:
+            body.close()
+
+
+def create_storage_backend(settings, db) -> StorageBackend:
+    """Build the backend selected by settings.storage_backend from its gridfs_*/s3_* settings"""
+    name = settings.storage_backend
+    if name == "local":
+        return LocalStorage(settings.uploads_dir)
+    if name == "gridfs":
+        return GridFSStorage(db, settings.gridfs_bucket, settings.upload_spool_dir)
+    if name == "s3":
+        if not settings.s3_bucket:
+            raise ValueError("STORAGE_BACKEND=s3 needs S3_BUCKET")
+        return S3Storage(
+            settings.s3_bucket,
+            prefix=settings.s3_prefix,
+            endpoint_url=settings.s3_endpoint_url,
+            multipart_threshold=settings.s3_multipart_threshold,
+            spool_dir=settings.upload_spool_dir,
+        )
+    raise ValueError(f"Unknown storage backend: {name} (expected one of {', '.join(STORAGE_BACKENDS)})")
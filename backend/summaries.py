@@ -0,0 +1,203 @@
+"""
+Per-state/city reimbursement summaries: aggregation pipelines plus a
+materialized collection kept current with $inc deltas
+"""
+import logging
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from typing import Iterable, Optional
+
+from pymongo import UpdateOne
+
+from models import RECORD_FIELD_GROUPS
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_COLLECTION = "reimbursement_summaries"
+# Holds a marker while the materialized summaries are missing a delta or being rebuilt
+SUMMARY_STATE_COLLECTION = "reimbursement_summaries_state"
+
+# Summed per city: exam centres, claimed amounts and head counts (user values)
+SUMMED_FIELDS = ["num_exam_centres"] + RECORD_FIELD_GROUPS["claims"]
+SUMMARY_GROUPS = ("state", "city")
+
+
+def summary_key(document: dict) -> dict:
+    """The (state, city) a record is counted under; user values win over Excel"""
+    state = document.get("state_user")
+    city = document.get("city_assigned_user")
+    return {
+        "state": state if state is not None else document.get("state_excel"),
+        "city": city if city is not None else document.get("city_assigned_excel"),
+    }
+
+
+def _city_group_stage() -> dict:
+    return {"$group": {
+        "_id": {
+            "state": {"$ifNull": ["$state_user", "$state_excel"]},
+            "city": {"$ifNull": ["$city_assigned_user", "$city_assigned_excel"]},
+        },
+        "records": {"$sum": 1},
+        **{name: {"$sum": {"$ifNull": [f"${name}_user", 0]}} for name in SUMMED_FIELDS},
+    }}
+
+
+def _state_group_stage() -> dict:
+    return {"$group": {
+        "_id": {"state": "$_id.state"},
+        "records": {"$sum": "$records"},
+        **{name: {"$sum": f"${name}"} for name in SUMMED_FIELDS},
+    }}
+
+
+def _output_stages() -> list:
+    return [
+        {"$match": {"records": {"$gt": 0}}},
+        {"$sort": {"_id": 1}},
+        {"$project": {
+            "_id": 0,
+            "state": "$_id.state",
+            "city": "$_id.city",
+            "records": 1,
+            **{name: {"$ifNull": [f"${name}", 0]} for name in SUMMED_FIELDS},
+        }},
+    ]
+
+
+def _key_match(state: Optional[str], city: Optional[str], prefix: str) -> list:
+    match = {}
+    if state:
+        match[f"{prefix}state"] = state
+    if city:
+        match[f"{prefix}city"] = city
+    return [{"$match": match}] if match else []
+
+
+async def live_summary(
+    records, group_by: str = "city", state: Optional[str] = None, city: Optional[str] = None
+) -> list:
+    """Aggregate straight from reimbursement_records (O(records); for checks and recovery)"""
+    pipeline = [_city_group_stage(), *_key_match(state, city, "_id.")]
+    if group_by == "state":
+        pipeline.append(_state_group_stage())
+    pipeline += _output_stages()
+    return await records.aggregate(pipeline).to_list(None)
+
+
+async def materialized_summary(
+    summaries, group_by: str = "city", state: Optional[str] = None, city: Optional[str] = None
+) -> list:
+    """Read the maintained per-city rows (O(cities))"""
+    pipeline = _key_match(state, city, "_id.")
+    if group_by == "state":
+        pipeline.append(_state_group_stage())
+    pipeline += _output_stages()
+    return await summaries.aggregate(pipeline).to_list(None)
+
+
+async def rebuild_summaries(records) -> int:
+    """Recompute the materialized collection from scratch with $out.
+
+    The summaries are marked stale for the duration, since $out drops any
+    delta applied meanwhile. The marker is cleared at the end unless a delta
+    landed or was lost while the rebuild ran.
+    """
+    db = records.database
+    rebuild = uuid.uuid4().hex
+    started = datetime.utcnow()
+    await db[SUMMARY_STATE_COLLECTION].update_one(
+        {"_id": SUMMARY_COLLECTION},
+        {"$setOnInsert": {"stale_since": started, "marked_at": started, "reason": "Rebuilding"},
+         "$set": {"rebuild": rebuild}},
+        upsert=True,
+    )
+    await records.aggregate([_city_group_stage(), {"$out": SUMMARY_COLLECTION}]).to_list(None)
+    await db[SUMMARY_STATE_COLLECTION].delete_one({"_id": SUMMARY_COLLECTION, "rebuild": rebuild})
+    count = await db[SUMMARY_COLLECTION].count_documents({})
+    logger.info(f"Rebuilt {SUMMARY_COLLECTION}: {count} cities")
+    return count
+
+
+async def mark_summaries_stale(db, reason: str):
+    """Record that a delta was lost; readers use live totals until rebuild_summaries runs"""
+    now = datetime.utcnow()
+    await db[SUMMARY_STATE_COLLECTION].update_one(
+        {"_id": SUMMARY_COLLECTION},
+        {"$setOnInsert": {"stale_since": now}, "$set": {"marked_at": now, "reason": reason}, "$unset": {"rebuild": ""}},
+        upsert=True,
+    )
+
+
+async def _mark_if_rebuilding(db):
+    """Keep the summaries marked after a rebuild in progress, whose $out drops the delta just applied"""
+    await db[SUMMARY_STATE_COLLECTION].update_one(
+        {"_id": SUMMARY_COLLECTION, "rebuild": {"$exists": True}},
+        {"$set": {"marked_at": datetime.utcnow(), "reason": "Delta applied during a rebuild"},
+         "$unset": {"rebuild": ""}},
+    )
+
+
+async def summaries_stale(db) -> bool:
+    return await db[SUMMARY_STATE_COLLECTION].find_one({"_id": SUMMARY_COLLECTION}, {"_id": 1}) is not None
+
+
+async def apply_summary_deltas(
+    summaries, removed: Iterable[dict] = (), added: Iterable[dict] = ()
+):
+    """$inc the per-city rows for records that were removed and/or added.
+
+    Deltas are combined per (state, city) first, so an edit that does not
+    move a record between cities is a single update, and a batch of inserts
+    costs one update per city touched.
+    """
+    deltas = defaultdict(lambda: defaultdict(int))
+    for sign, documents in ((-1, removed), (1, added)):
+        for document in documents:
+            key = summary_key(document)
+            delta = deltas[(key["state"], key["city"])]
+            delta["records"] += sign
+            for name in SUMMED_FIELDS:
+                value = document.get(f"{name}_user")
+                if value:
+                    delta[name] += sign * value
+
+    operations = []
+    for (state, city), delta in deltas.items():
+        increments = {name: value for name, value in delta.items() if value}
+        if increments:
+            operations.append(UpdateOne(
+                {"_id": {"state": state, "city": city}}, {"$inc": increments}, upsert=True
+            ))
+    if operations:
+        await summaries.bulk_write(operations, ordered=False)
+
+
+async def record_summary_change(db, before: Optional[dict] = None, after: Optional[dict] = None):
+    """Best-effort summary maintenance after a write; a miss marks the summaries for a rebuild"""
+    await record_summary_changes(db, [(before, after)])
+
+
+async def record_summary_inserts(db, documents: list):
+    """record_summary_change for a batch of inserted records, e.g. from a bulk import"""
+    await record_summary_changes(db, [(None, document) for document in documents])
+
+
+async def record_summary_changes(db, changes: list):
+    """record_summary_change for many (before, after) pairs, in one bulk_write"""
+    if not changes:
+        return
+    try:
+        await apply_summary_deltas(
+            db[SUMMARY_COLLECTION],
+            removed=[before for before, _ in changes if before],
+            added=[after for _, after in changes if after],
+        )
+        await _mark_if_rebuilding(db)
+    except Exception as e:
+        logger.error(f"Error updating reimbursement summaries: {e}")
+        try:
+            await mark_summaries_stale(db, str(e))
+        except Exception as e:
+            logger.error(f"Error marking reimbursement summaries for rebuild: {e}")
@@ -0,0 +1,277 @@
+"""
+Deterministic synthetic reimbursement records and status-check history for load testing
+
+Each batch is generated from its own seed derived from (seed, kind, batch
+index), so batches can be produced in any order or in parallel and the
+dataset is still identical for the same seed. Documents follow
+ReimbursementRecord: the master-sheet ``_excel`` values are always filled,
+and the ``_user`` values copy them except for unsubmitted claims and a
+configurable share of records with edited amounts or bank details.
+"""
+import asyncio
+import random
+import uuid
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Optional
+
+from models import RECORD_SCHEMA, ReimbursementRecord
+from search import search_fields
+
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_MISMATCH_RATE = 0.15
+# Share of coordinators who have not submitted their claim yet (all _user fields empty)
+DEFAULT_UNSUBMITTED_RATE = 0.1
+DATASET_START = datetime(2025, 5, 1)
+
+# (state, weight, [(city, city code prefix), ...]); weights roughly follow exam-centre counts
+STATES = [
+    ("Uttar Pradesh", 16, [("Lucknow", "LKO"), ("Kanpur", "KNP"), ("Prayagraj", "PRG"), ("Varanasi", "VNS")]),
+    ("Maharashtra", 12, [("Mumbai", "MUM"), ("Pune", "PUN"), ("Nagpur", "NAG"), ("Nashik", "NSK")]),
+    ("Bihar", 9, [("Patna", "PAT"), ("Gaya", "GAY"), ("Muzaffarpur", "MZF")]),
+    ("West Bengal", 8, [("Kolkata", "CCU"), ("Durgapur", "DGP"), ("Siliguri", "SLG")]),
+    ("Rajasthan", 7, [("Jaipur", "JAI"), ("Kota", "KTA"), ("Jodhpur", "JDH")]),
+    ("Madhya Pradesh", 7, [("Bhopal", "BPL"), ("Indore", "IDR"), ("Gwalior", "GWL")]),
+    ("Tamil Nadu", 7, [("Chennai", "CHE"), ("Coimbatore", "CBE"), ("Madurai", "MDU")]),
+    ("Karnataka", 6, [("Bengaluru", "BLR"), ("Mysuru", "MYS"), ("Hubballi", "HBL")]),
+    ("Gujarat", 6, [("Ahmedabad", "AMD"), ("Surat", "SUR"), ("Vadodara", "VAD")]),
+    ("Andhra Pradesh", 5, [("Visakhapatnam", "VTZ"), ("Vijayawada", "VJA"), ("Tirupati", "TPT")]),
+    ("Telangana", 5, [("Hyderabad", "HYD"), ("Warangal", "WGL")]),
+    ("Kerala", 4, [("Thiruvananthapuram", "TRV"), ("Kochi", "COK"), ("Kozhikode", "CCJ")]),
+    ("Odisha", 4, [("Bhubaneswar", "BBI"), ("Cuttack", "CTC")]),
+    ("Delhi", 4, [("New Delhi", "DEL")]),
+    ("Haryana", 3, [("Gurugram", "GGN"), ("Faridabad", "FBD")]),
+    ("Punjab", 3, [("Ludhiana", "LDH"), ("Amritsar", "ATQ")]),
+    ("Jharkhand", 3, [("Ranchi", "IXR"), ("Jamshedpur", "IXW")]),
+    ("Assam", 2, [("Guwahati", "GAU")]),
+    ("Chhattisgarh", 2, [("Raipur", "RPR")]),
+    ("Uttarakhand", 1, [("Dehradun", "DED")]),
+]
+_STATE_WEIGHTS = [weight for _, weight, _ in STATES]
+
+FIRST_NAMES = [
+    "Aarav", "Aditi", "Amit", "Anjali", "Arjun", "Deepa", "Divya", "Gaurav", "Kavita", "Kiran", "Lakshmi",
+    "Manoj", "Meera", "Mohan", "Neha", "Pooja", "Priya", "Rahul", "Rajesh", "Ramesh", "Ritu", "Rohit",
+    "Sanjay", "Shalini", "Sunita", "Suresh", "Tanvi", "Vijay", "Vikram", "Yash",
+]
+LAST_NAMES = [
+    "Agarwal", "Banerjee", "Das", "Gupta", "Iyer", "Jain", "Joshi", "Khan", "Kumar", "Mehta", "Menon",
+    "Mishra", "Nair", "Patel", "Pillai", "Rao", "Reddy", "Sharma", "Singh", "Verma", "Yadav",
+]
+# (bank name, IFSC prefix, weight)
+BANKS = [
+    ("State Bank of India", "SBIN", 35), ("Punjab National Bank", "PUNB", 12), ("Bank of Baroda", "BARB", 10),
+    ("Canara Bank", "CNRB", 9), ("HDFC Bank", "HDFC", 9), ("ICICI Bank", "ICIC", 8), ("Union Bank of India", "UBIN", 7),
+    ("Axis Bank", "UTIB", 5), ("Indian Bank", "IDIB", 5),
+]
+_BANK_WEIGHTS = [weight for _, _, weight in BANKS]
+
+# Typical claim amounts in rupees; per-centre claims scale with num_exam_centres
+PER_CENTRE_CLAIMS = {
+    "admin_staff_claim": 1500, "support_staff_claim": 1200, "refreshment_claim": 800, "observer_claim": 1000,
+    "support_staff_district": 600, "support_staff_police": 500, "security_personnel_claim": 900,
+    "police_frisking_claim": 700,
+}
+FLAT_CLAIMS = {
+    "city_coordinator_claim": 15000, "claim_district_personnel": 6000, "assistant_staff_district": 3000,
+    "claim_police_personnel": 5000, "duty_magistrate_claim": 4000, "team_leader_claim": 3500,
+    "police_escort_claim": 4500, "bank_custodian_claim": 2500, "district_education_officer_claim": 5000,
+    "support_staff_deo_claim": 2000,
+}
+# Head counts per exam centre (low, high)
+PER_CENTRE_COUNTS = {
+    "num_observers": (1, 2), "num_duty_magistrates": (0, 1), "num_team_leaders": (1, 1),
+    "num_police_escort": (1, 3), "num_police_frisking": (2, 4), "num_security_personnel": (2, 6),
+}
+
+BASE_FIELDS = [name for _, fields in RECORD_SCHEMA for name, _ in fields]
+CLAIM_FIELDS = [name for name, field_type in dict(RECORD_SCHEMA)["claims"] if field_type is float]
+_EMPTY_DOCUMENT = dict.fromkeys(ReimbursementRecord.model_fields)
+
+STATUS_CLIENTS = ["web-frontend", "mobile-app", "uptime-probe", "admin-console", "nightly-report", "city-kiosk"]
+# Zipf-like: a few clients account for most checks
+_STATUS_CLIENT_WEIGHTS = [1 / (rank + 1) for rank in range(len(STATUS_CLIENTS))]
+
+
+def batch_rng(seed: int, kind: str, batch_index: int) -> random.Random:
+    return random.Random(f"{seed}:{kind}:{batch_index}")
+
+
+def _uuid(rng: random.Random) -> str:
+    return str(uuid.UUID(int=rng.getrandbits(128), version=4))
+
+
+def _excel_values(rng: random.Random, sno: int) -> dict:
+    """Master-sheet values for one coordinator"""
+    state, _, cities = rng.choices(STATES, _STATE_WEIGHTS)[0]
+    city, prefix = rng.choice(cities)
+    first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+    bank_name, ifsc_prefix, _ = rng.choices(BANKS, _BANK_WEIGHTS)[0]
+    centres = 1 + min(int(rng.expovariate(1 / 4)), 39)
+
+    values = {
+        "city_code": f"{prefix}{sno:06d}",
+        "name": f"{first} {last}",
+        "state": state,
+        "city_assigned": city,
+        "mobile": f"{rng.randint(6, 9)}{rng.randint(0, 999_999_999):09d}",
+        "email": f"{first.lower()}.{last.lower()}{sno}@nta.gov.in",
+        "num_exam_centres": centres,
+        "bank_name": bank_name,
+        "ifsc": f"{ifsc_prefix}0{rng.randint(0, 999_999):06d}",
+        "beneficiary_name": f"{first} {last}".upper(),
+        "bank_account_number": str(rng.randint(10**10, 10**16 - 1)),
+    }
+    for name, typical in PER_CENTRE_CLAIMS.items():
+        values[name] = float(round(typical * centres * rng.lognormvariate(0, 0.25)))
+    for name, typical in FLAT_CLAIMS.items():
+        values[name] = float(round(typical * rng.lognormvariate(0, 0.35)))
+    for name, (low, high) in PER_CENTRE_COUNTS.items():
+        values[name] = sum(rng.randint(low, high) for _ in range(min(centres, 10))) + max(centres - 10, 0) * low
+    return values
+
+
+def _user_values(rng: random.Random, excel: dict, mismatched: bool) -> dict:
+    """What the coordinator submitted: the master values, with edits if mismatched"""
+    user = dict(excel)
+    if mismatched:
+        for name in rng.sample(CLAIM_FIELDS, rng.randint(1, 4)):
+            user[name] = float(round(excel[name] * rng.uniform(0.5, 1.6)))
+        if rng.random() < 0.15:
+            user["bank_account_number"] = str(rng.randint(10**10, 10**16 - 1))
+            user["ifsc"] = f"{excel['ifsc'][:5]}{rng.randint(0, 999_999):06d}"
+        if rng.random() < 0.1:
+            user["mobile"] = f"{rng.randint(6, 9)}{rng.randint(0, 999_999_999):09d}"
+    return user
+
+
+def generate_record(
+    rng: random.Random,
+    sno: int,
+    mismatch_rate: float = DEFAULT_MISMATCH_RATE,
+    unsubmitted_rate: float = DEFAULT_UNSUBMITTED_RATE,
+) -> dict:
+    """One fully populated stored document, in ReimbursementRecord field order plus its search keys"""
+    excel = _excel_values(rng, sno)
+    created_at = DATASET_START + timedelta(seconds=rng.uniform(0, 30 * 86400))
+    document = dict(_EMPTY_DOCUMENT)
+    document.update(id=_uuid(rng), sno=sno, created_at=created_at, updated_at=created_at, version=1)
+    for name in BASE_FIELDS:
+        document[f"{name}_excel"] = excel[name]
+
+    if rng.random() >= unsubmitted_rate:
+        user = _user_values(rng, excel, rng.random() < mismatch_rate)
+        for name in BASE_FIELDS:
+            document[f"{name}_user"] = user[name]
+        document["supporting_document_bills"] = f"{rng.getrandbits(256):064x}.pdf"
+        edits = min(int(rng.expovariate(1)), 5)
+        document["version"] = 1 + edits
+        document["updated_at"] = created_at + timedelta(seconds=rng.uniform(60, 10 * 86400))
+    document.update(search_fields(document))
+    return document
+
+
+def generate_record_batch(
+    seed: int,
+    batch_index: int,
+    batch_size: int,
+    count: int,
+    mismatch_rate: float = DEFAULT_MISMATCH_RATE,
+    unsubmitted_rate: float = DEFAULT_UNSUBMITTED_RATE,
+) -> list:
+    """Records batch_index * batch_size + 1 .. (capped at count), identical for the same seed"""
+    rng = batch_rng(seed, "records", batch_index)
+    first = batch_index * batch_size
+    return [
+        generate_record(rng, sno, mismatch_rate, unsubmitted_rate)
+        for sno in range(first + 1, min(first + batch_size, count) + 1)
+    ]
+
+
+def generate_status_check_batch(
+    seed: int, batch_index: int, batch_size: int, count: int, span_days: int = 30, start: datetime = DATASET_START
+) -> list:
+    """Status checks spread evenly over span_days from start, oldest first, with jittered timestamps"""
+    rng = batch_rng(seed, "status_checks", batch_index)
+    step = span_days * 86400 / max(count, 1)
+    first = batch_index * batch_size
+    return [
+        {
+            "id": _uuid(rng),
+            "client_name": rng.choices(STATUS_CLIENTS, _STATUS_CLIENT_WEIGHTS)[0],
+            "timestamp": start + timedelta(seconds=(i + rng.random()) * step),
+        }
+        for i in range(first, min(first + batch_size, count))
+    ]
+
+
+async def insert_batches(collection, batches: AsyncIterator[list], concurrency: int = 4, on_inserted=None) -> int:
+    """insert_many each batch with up to ``concurrency`` inserts in flight; returns the documents written.
+
+    At most ``concurrency`` batches are held in memory. ``on_inserted`` is
+    awaited with the documents of each written batch.
+    """
+    inserted = 0
+    in_flight = set()
+
+    async def insert(documents: list):
+        nonlocal inserted
+        await collection.insert_many(documents, ordered=False)
+        inserted += len(documents)
+        if on_inserted:
+            await on_inserted(documents)
+
+    try:
+        async for documents in batches:
+            if len(in_flight) >= concurrency:
+                done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    task.result()
+            in_flight.add(asyncio.ensure_future(insert(documents)))
+        await asyncio.gather(*in_flight)
+    except BaseException:
+        for task in in_flight:
+            task.cancel()
+        raise
+    return inserted
+
+
+async def generated_batches(
+    generate,
+    count: int,
+    seed: int,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    executor=None,
+    prefetch: int = 2,
+    **options,
+) -> AsyncIterator[list]:
+    """Yield generate(seed, batch_index, batch_size, count, **options) batches in order.
+
+    With a process pool as ``executor``, up to ``prefetch`` batches are
+    generated ahead in parallel; otherwise batches are built inline.
+    """
+    batch_count = (count + batch_size - 1) // batch_size
+    if executor is None:
+        for batch_index in range(batch_count):
+            yield generate(seed, batch_index, batch_size, count, **options)
+            # Let in-flight inserts make progress between batches
+            await asyncio.sleep(0)
+        return
+
+    loop = asyncio.get_running_loop()
+    pending = []
+    next_index = 0
+    try:
+        while next_index < batch_count or pending:
+            while next_index < batch_count and len(pending) < prefetch:
+                pending.append(loop.run_in_executor(
+                    executor, _call_generate, generate, seed, next_index, batch_size, count, options
+                ))
+                next_index += 1
+            yield await pending.pop(0)
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def _call_generate(generate, seed: int, batch_index: int, batch_size: int, count: int, options: Optional[dict]):
+    return generate(seed, batch_index, batch_size, count, **(options or {}))
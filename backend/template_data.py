@@ -0,0 +1,205 @@
+"""
+Excel master-data loader with an in-memory index per city code, city and email
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Optional
+
+from bulk_import import clean_row
+from models import ReimbursementRecord
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHECK_INTERVAL = 5.0
+
+EXCEL_FIELDS = [name for name in ReimbursementRecord.model_fields if name.endswith("_excel")]
+
+# Returned when no master workbook is configured
+SAMPLE_TEMPLATE_DATA = {
+    "city_code_excel": "MUM001",
+    "name_excel": "John Doe",
+    "state_excel": "Maharashtra",
+    "city_assigned_excel": "Mumbai",
+    "mobile_excel": "9876543210",
+    "email_excel": "john.doe@nta.gov.in",
+    "num_exam_centres_excel": 5,
+    "bank_name_excel": "State Bank of India",
+    "ifsc_excel": "SBIN0001234",
+    "beneficiary_name_excel": "John Doe",
+    "bank_account_number_excel": "12345678901",
+    "city_coordinator_claim_excel": 5000.0,
+    "admin_staff_claim_excel": 3000.0,
+    "support_staff_claim_excel": 2000.0,
+    "refreshment_claim_excel": 1500.0,
+    "observer_claim_excel": 4000.0,
+    "num_observers_excel": 3,
+    "claim_district_personnel_excel": 2500.0,
+    "assistant_staff_district_excel": 2000.0,
+    "support_staff_district_excel": 1800.0,
+    "claim_police_personnel_excel": 3000.0,
+    "support_staff_police_excel": 2200.0,
+    "duty_magistrate_claim_excel": 4500.0,
+    "num_duty_magistrates_excel": 2,
+    "team_leader_claim_excel": 3500.0,
+    "num_team_leaders_excel": 4,
+    "police_escort_claim_excel": 2800.0,
+    "num_police_escort_excel": 6,
+    "police_frisking_claim_excel": 2600.0,
+    "num_police_frisking_excel": 8,
+    "security_personnel_claim_excel": 3200.0,
+    "num_security_personnel_excel": 10,
+    "bank_custodian_claim_excel": 2400.0,
+    "district_education_officer_claim_excel": 5500.0,
+    "support_staff_deo_claim_excel": 2800.0
+}
+
+
+def _normalize(value) -> str:
+    return str(value).strip().casefold() if value is not None else ""
+
+
+def _column_field(header) -> Optional[str]:
+    """Map a sheet header ("city_code_excel" or "city_code") to an _excel field"""
+    name = _normalize(header).replace(" ", "_")
+    if name in EXCEL_FIELDS:
+        return name
+    if f"{name}_excel" in EXCEL_FIELDS:
+        return f"{name}_excel"
+    return None
+
+
+def _file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def parse_workbook(path: Path) -> list:
+    """Read the first sheet of the master workbook into a list of _excel dicts"""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        columns = [(index, field) for index, field in enumerate(map(_column_field, next(rows, ()))) if field]
+        records = []
+        for values in rows:
+            record = clean_row({field: values[index] for index, field in columns if index < len(values)})
+            if record:
+                records.append(record)
+        return records
+    finally:
+        workbook.close()
+
+
+class TemplateIndex:
+    """Immutable lookup tables built from one parse of the workbook
+
+    Keys are case-insensitive; when several rows share a key (e.g. two
+    coordinators for one city) the first row in the sheet wins.
+    """
+
+    def __init__(self, records: list, content_hash: str):
+        self.records = records
+        self.content_hash = content_hash
+        self.by_city_code = {}
+        self.by_city = {}
+        self.by_email = {}
+        for record in records:
+            for table, field in (
+                (self.by_city_code, "city_code_excel"),
+                (self.by_city, "city_assigned_excel"),
+                (self.by_email, "email_excel"),
+            ):
+                key = _normalize(record.get(field))
+                if key:
+                    table.setdefault(key, record)
+
+
+class TemplateStore:
+    """Serves template rows from an in-memory index of the master workbook.
+
+    The file is re-stat'ed at most once per check interval; it is re-parsed
+    only when its mtime/size changed and its content hash differs from the
+    loaded one.
+    """
+
+    def __init__(self, path: Optional[Path], check_interval: float = DEFAULT_CHECK_INTERVAL):
+        self.path = Path(path) if path else None
+        self.check_interval = check_interval
+        self.index: Optional[TemplateIndex] = None
+        self.last_reload_seconds: Optional[float] = None
+        self._stat_key = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def configured(self) -> bool:
+        return self.path is not None
+
+    async def etag(self) -> Optional[str]:
+        """Strong ETag for the loaded workbook version, or None if nothing is loaded"""
+        index = await self.get_index()
+        return f'"{index.content_hash[:32]}"' if index else None
+
+    async def get_index(self) -> Optional[TemplateIndex]:
+        """Return the current index, reloading first if the file has changed"""
+        if not self.configured:
+            return None
+        if self.index is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return self.index
+        async with self._lock:
+            if self.index is None or time.monotonic() - self._checked_at >= self.check_interval:
+                await asyncio.to_thread(self._refresh)
+        return self.index
+
+    def _refresh(self):
+        self._checked_at = time.monotonic()
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            logger.error(f"Template workbook not found: {self.path}")
+            return
+        stat_key = (stat.st_mtime_ns, stat.st_size)
+        if stat_key == self._stat_key:
+            return
+        content_hash = _file_hash(self.path)
+        self._stat_key = stat_key
+        if self.index is not None and content_hash == self.index.content_hash:
+            return
+        started = time.perf_counter()
+        try:
+            self.index = TemplateIndex(parse_workbook(self.path), content_hash)
+        except Exception as e:
+            # Keep serving the previous index; retry after the next change
+            logger.error(f"Error loading template workbook {self.path}: {e}")
+            return
+        self.last_reload_seconds = time.perf_counter() - started
+        logger.info(
+            f"Loaded {len(self.index.records)} template rows from {self.path} "
+            f"in {self.last_reload_seconds:.2f}s"
+        )
+
+    async def lookup(
+        self,
+        city_code: Optional[str] = None,
+        city: Optional[str] = None,
+        email: Optional[str] = None,
+    ) -> Optional[dict]:
+        """Find a template row by city code, assigned city or email; with none of them, the first row"""
+        index = await self.get_index()
+        if index is None:
+            return None
+        if city_code:
+            return index.by_city_code.get(_normalize(city_code))
+        if city:
+            return index.by_city.get(_normalize(city))
+        if email:
+            return index.by_email.get(_normalize(email))
+        return index.records[0] if index.records else None
@@ -0,0 +1,102 @@
+"""
+Group commit for high-frequency inserts: many concurrent insert_one calls become one insert_many
+
+Callers await their own document's outcome. A batch is flushed when it
+holds max_batch documents or max_delay has passed since its first document,
+and a caller only returns once the insert_many carrying its document was
+acknowledged, so durability is the same as a plain insert_one.
+"""
+import asyncio
+import logging
+from typing import Optional
+
+from pymongo.errors import BulkWriteError, DuplicateKeyError, WriteError
+
+DEFAULT_MAX_BATCH = 100
+DEFAULT_MAX_DELAY = 0.002
+
+logger = logging.getLogger(__name__)
+
+
+class _Batch:
+    def __init__(self, collection):
+        self.collection = collection
+        self.documents = []
+        self.futures = []
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class WriteCoalescer:
+    """Coalesce inserts per collection into unordered insert_many batches.
+
+    ``insert`` resolves to the inserted _id, or raises the document's own
+    DuplicateKeyError/WriteError; an error that fails the whole batch (e.g. a
+    network error) is raised to every caller in it.
+    """
+
+    def __init__(self, max_batch: int = DEFAULT_MAX_BATCH, max_delay: float = DEFAULT_MAX_DELAY):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self._batches = {}
+        self._flushing = set()
+
+    async def insert(self, collection, document: dict):
+        """Queue a document for the next batch of its collection and wait for the ack"""
+        loop = asyncio.get_running_loop()
+        batch = self._batches.get(collection.name)
+        if batch is None:
+            batch = self._batches[collection.name] = _Batch(collection)
+            batch.timer = loop.call_later(self.max_delay, self._flush, collection.name)
+        future = loop.create_future()
+        batch.documents.append(document)
+        batch.futures.append(future)
+        if len(batch.documents) >= self.max_batch:
+            self._flush(collection.name)
+        return await future
+
+    def _flush(self, name: str):
+        batch = self._batches.pop(name, None)
+        if batch is None:
+            return
+        if batch.timer:
+            batch.timer.cancel()
+        task = asyncio.ensure_future(self._write(batch))
+        self._flushing.add(task)
+        task.add_done_callback(self._flushing.discard)
+
+    async def _write(self, batch: _Batch):
+        try:
+            await batch.collection.insert_many(batch.documents, ordered=False)
+            failed = {}
+        except BulkWriteError as e:
+            failed = {error["index"]: error for error in e.details.get("writeErrors", [])}
+            if not failed:
+                _fail_all(batch, e)
+                return
+        except Exception as e:
+            _fail_all(batch, e)
+            return
+
+        for index, (document, future) in enumerate(zip(batch.documents, batch.futures)):
+            if future.done():
+                continue
+            error = failed.get(index)
+            if error is None:
+                future.set_result(document.get("_id"))
+            else:
+                error_type = DuplicateKeyError if error.get("code") == 11000 else WriteError
+                future.set_exception(error_type(error.get("errmsg", "Write error"), error.get("code"), error))
+
+    async def close(self):
+        """Flush whatever is queued and wait for all batches to be written"""
+        for name in list(self._batches):
+            self._flush(name)
+        if self._flushing:
+            await asyncio.gather(*self._flushing, return_exceptions=True)
+
+
+def _fail_all(batch: _Batch, error: Exception):
+    logger.error(f"Batched insert of {len(batch.documents)} documents into {batch.collection.name} failed: {error}")
+    for future in batch.futures:
+        if not future.done():
+            future.set_exception(error)
@@ -0,0 +1,22 @@
+"""
+Shared setup for tests that run the API in its memory:// mode
+"""
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent / "backend"))
+
+import server
+from settings import MEMORY_MONGO_URL, Settings
+
+
+def memory_app(test: unittest.TestCase, db_name: str, **settings):
+    """Create an app on the in-memory stand-in, with uploads in a temp dir removed after the test"""
+    uploads = tempfile.TemporaryDirectory()
+    test.addCleanup(uploads.cleanup)
+    return server.create_app(Settings(MEMORY_MONGO_URL, db_name, uploads_dir=Path(uploads.name), **settings))
+
+
+def uploads_dir(app) -> Path:
+    return app.state.services.settings.uploads_dir
@@ -0,0 +1,99 @@
+"""
+Admission control tests: class limits, queueing, deadline rejection, client rate limits and AIMD
+"""
+import asyncio
+import sys
+import unittest
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent / "backend"))
+
+import httpx
+
+from admission import AdmissionMiddleware, ClientRateLimiter, ConcurrencyLimiter, route_class
+
+
+class SlowApp:
+    """ASGI app that holds each request for `delay` seconds and counts concurrency"""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.running = 0
+        self.peak = 0
+
+    async def __call__(self, scope, receive, send):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        await asyncio.sleep(self.delay)
+        self.running -= 1
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+
+async def fire(app, requests):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://t") as client:
+        return await asyncio.gather(*(client.request(method, path) for method, path in requests))
+
+
+class TestRouteClass(unittest.TestCase):
+    def test_classes(self):
+        self.assertEqual(route_class("POST", "/api/upload"), "files")
+        self.assertEqual(route_class("GET", "/api/download/a.pdf"), "files")
+        self.assertEqual(route_class("POST", "/api/reimbursement/import"), "files")
+        self.assertEqual(route_class("PUT", "/api/reimbursement/r1"), "writes")
+        self.assertEqual(route_class("GET", "/api/reimbursement/r1"), "reads")
+        self.assertIsNone(route_class("GET", "/metrics"))
+        self.assertIsNone(route_class("GET", "/api/ready"))
+
+
+class TestAdmissionMiddleware(unittest.TestCase):
+    def test_excess_requests_wait_in_queue(self):
+        app = SlowApp(0.02)
+        middleware = AdmissionMiddleware(app, limits={"writes": 2}, queue_size=10, max_wait=1.0)
+        responses = asyncio.run(fire(middleware, [("POST", "/api/reimbursement")] * 6))
+        self.assertEqual([response.status_code for response in responses], [200] * 6)
+        self.assertEqual(app.peak, 2)
+
+    def test_full_queue_and_deadline_rejected_with_retry_after(self):
+        app = SlowApp(0.2)
+        middleware = AdmissionMiddleware(app, limits={"writes": 1}, queue_size=2, max_wait=0.05)
+        responses = asyncio.run(fire(middleware, [("POST", "/api/reimbursement")] * 5))
+        statuses = sorted(response.status_code for response in responses)
+        self.assertEqual(statuses, [200, 503, 503, 503, 503])
+        rejected = next(response for response in responses if response.status_code == 503)
+        self.assertEqual(rejected.headers["retry-after"], "1")
+        self.assertIn("busy", rejected.json()["detail"])
+
+    def test_classes_are_limited_separately(self):
+        app = SlowApp(0.05)
+        middleware = AdmissionMiddleware(app, limits={"files": 1, "reads": 4}, queue_size=0, max_wait=0.01)
+        responses = asyncio.run(fire(middleware, [("POST", "/api/upload")] * 2 + [("GET", "/api/reimbursement")] * 4))
+        self.assertEqual(sorted(response.status_code for response in responses[:2]), [200, 503])
+        self.assertEqual([response.status_code for response in responses[2:]], [200] * 4)
+
+    def test_client_rate_limit(self):
+        middleware = AdmissionMiddleware(SlowApp(0), client_rate=1, client_burst=3)
+        responses = asyncio.run(fire(middleware, [("GET", "/api/reimbursement")] * 5))
+        self.assertEqual([response.status_code for response in responses].count(429), 2)
+        self.assertEqual(responses[-1].headers["retry-after"], "1")
+
+
+class TestLimits(unittest.TestCase):
+    def test_token_bucket_refills(self):
+        limiter = ClientRateLimiter(rate=1000, burst=1)
+        self.assertEqual(limiter.wait_time("a"), 0)
+        self.assertGreater(limiter.wait_time("a"), 0)
+        self.assertEqual(limiter.wait_time("b"), 0)
+
+    def test_limit_shrinks_on_slow_mongo_and_recovers(self):
+        limiter = ConcurrencyLimiter("writes", 20)
+        limiter.adjust(latency=0.5, target=0.05)
+        limiter.adjust(latency=0.5, target=0.05)
+        self.assertEqual(limiter.capacity, 12)
+        for _ in range(20):
+            limiter.adjust(latency=0.5, target=0.05)
+        self.assertEqual(limiter.capacity, 5)
+        limiter.in_flight = limiter.capacity
+        for _ in range(30):
+            limiter.adjust(latency=0.01, target=0.05)
+            limiter.in_flight = limiter.capacity
+        self.assertEqual(limiter.capacity, 20)
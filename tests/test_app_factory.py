@@ -0,0 +1,141 @@
+"""
+App factory tests: side-effect-free import, settings, readiness and the in-memory Mongo mode
+
+The app runs in-process through its lifespan against mongomock-motor
+(MONGO_URL=memory://), so no mongod is needed.
+"""
+import os
+import subprocess
+import sys
+import time
+import unittest
+from pathlib import Path
+from dataclasses import replace
+from types import SimpleNamespace
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+sys.path.append(str(BACKEND_DIR))
+
+from fastapi.testclient import TestClient
+
+from mongo_pool import PoolMonitor
+from settings import MEMORY_MONGO_URL, Settings
+from storage_backends import create_storage_backend
+from tests.memory_app import memory_app
+
+
+class TestImport(unittest.TestCase):
+    def test_import_needs_no_environment_and_skips_pandas(self):
+        env = {name: value for name, value in os.environ.items() if name not in ("MONGO_URL", "DB_NAME")}
+        result = subprocess.run(
+            [sys.executable, "-c", "import sys, server; print(sorted({'pandas', 'motor'} & set(sys.modules)))"],
+            cwd=BACKEND_DIR, env=env, capture_output=True, text=True, timeout=60,
+        )
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip(), "[]")
+
+
+class TestSettings(unittest.TestCase):
+    def test_from_env(self):
+        settings = Settings.from_env({
+            "MONGO_URL": "mongodb://db:27017", "DB_NAME": "claims", "ADMISSION_CONTROL": "false",
+            "ADMISSION_MAX_WAIT_MS": "250", "WRITE_BATCHING": "yes", "MONGO_MIN_POOL_SIZE": "8",
+            "UPLOADS_DIR": "/tmp/uploads",
+        })
+        self.assertEqual((settings.mongo_url, settings.db_name), ("mongodb://db:27017", "claims"))
+        self.assertFalse(settings.admission_control)
+        self.assertEqual(settings.admission_max_wait, 0.25)
+        self.assertTrue(settings.write_batching)
+        self.assertEqual(settings.mongo_min_pool_size, 8)
+        self.assertEqual(settings.uploads_dir, Path("/tmp/uploads"))
+        self.assertFalse(settings.in_memory)
+        self.assertIsNone(settings.slow_request_seconds)
+
+    def test_storage_settings(self):
+        settings = Settings.from_env({
+            "MONGO_URL": "mongodb://db:27017", "DB_NAME": "claims", "STORAGE_BACKEND": "s3",
+            "S3_BUCKET": "bills", "S3_PREFIX": "nta/", "UPLOAD_SPOOL_DIR": "/tmp/spool",
+        })
+        self.assertEqual((settings.s3_bucket, settings.s3_prefix), ("bills", "nta/"))
+        self.assertEqual(settings.upload_spool_dir, Path("/tmp/spool"))
+        self.assertEqual(settings.gridfs_bucket, "uploads")
+        with self.assertRaises(ValueError):
+            create_storage_backend(replace(settings, s3_bucket=None), None)
+        local = create_storage_backend(Settings(MEMORY_MONGO_URL, "claims", uploads_dir=Path("/tmp/uploads")), None)
+        self.assertEqual(local.local_path("a.pdf"), Path("/tmp/uploads/a.pdf"))
+
+    def test_missing_mongo_url(self):
+        with self.assertRaises(KeyError):
+            Settings.from_env({"DB_NAME": "claims"})
+
+
+class TestPoolMonitor(unittest.TestCase):
+    def test_counts_connections(self):
+        monitor = PoolMonitor()
+        event = SimpleNamespace()
+        for _ in range(3):
+            monitor.connection_created(event)
+        monitor.connection_checked_out(event)
+        monitor.connection_checked_out(event)
+        monitor.connection_checked_in(event)
+        monitor.connection_closed(event)
+        monitor.connection_check_out_failed(event)
+        self.assertEqual(monitor.stats(), {"open": 2, "in_use": 1, "check_out_failures": 1, "cleared": 0})
+
+
+class TestInMemoryApp(unittest.TestCase):
+    def setUp(self):
+        self.app = memory_app(self, "test_app_factory")
+
+    def test_01_not_ready_before_startup(self):
+        response = TestClient(self.app).get("/api/ready")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()["status"], "starting")
+
+    def test_02_ready_after_startup(self):
+        with TestClient(self.app) as client:
+            response = client.get("/api/ready")
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            self.assertEqual(body["status"], "ready")
+            self.assertTrue(body["in_memory"])
+            self.assertTrue(body["mongo"]["ok"])
+        self.assertFalse(self.app.state.services.ready)
+
+    def test_03_records_round_trip(self):
+        with TestClient(self.app) as client:
+            created = client.post("/api/reimbursement", json={"name_user": "Priya Sharma", "state_user": "Goa"})
+            self.assertEqual(created.status_code, 200)
+            record_id = created.json()["id"]
+            self.assertEqual(client.get(f"/api/reimbursement/{record_id}").json()["name_user"], "Priya Sharma")
+            self.assertEqual([item["id"] for item in client.get("/api/reimbursement").json()["items"]], [record_id])
+            report = client.get("/api/reports/reconciliation")
+            self.assertEqual(report.status_code, 200)
+
+    def test_04_apps_do_not_share_state(self):
+        other = memory_app(self, "test_app_factory_other")
+        self.assertIsNot(other.state.services.record_cache, self.app.state.services.record_cache)
+        with TestClient(self.app) as client, TestClient(other) as other_client:
+            record_id = client.post("/api/reimbursement", json={"name_user": "Priya Sharma"}).json()["id"]
+            self.assertEqual(client.get(f"/api/reimbursement/{record_id}").status_code, 200)
+            self.assertEqual(other_client.get(f"/api/reimbursement/{record_id}").status_code, 404)
+            self.assertEqual(other_client.get("/api/reimbursement").json()["items"], [])
+            self.assertEqual(self.app.state.services.db.name, "test_app_factory")
+            self.assertEqual(other.state.services.db.name, "test_app_factory_other")
+
+    def test_05_jobs_run_in_threads(self):
+        with TestClient(self.app) as client:
+            client.post("/api/reimbursement", json={"name_user": "Ananya Rao"})
+            job = client.post("/api/jobs/export?format=ndjson").json()
+            deadline = time.monotonic() + 10
+            while job["status"] in ("queued", "running") and time.monotonic() < deadline:
+                time.sleep(0.05)
+                job = client.get(f"/api/jobs/{job['id']}").json()
+            self.assertEqual(job["status"], "succeeded", job)
+            download = client.get(job["result"]["download_url"])
+            self.assertEqual(download.status_code, 200)
+            self.assertIn(b"Ananya Rao", download.content)
+
+
+if __name__ == "__main__":
+    unittest.main()
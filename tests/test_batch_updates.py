@@ -0,0 +1,227 @@
+"""
+Batch update tests: validation, version guards, per-item results and summaries
+
+Runs against the in-memory stand-in (mongomock-motor) and through the API in
+its memory:// mode. The transaction test needs a replica set at MONGO_URL and
+is skipped without one.
+"""
+import asyncio
+import os
+import sys
+import unittest
+import uuid
+from pathlib import Path
+from unittest import mock
+sys.path.append(str(Path(__file__).resolve().parent.parent / "backend"))
+
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+import server
+from batch_updates import apply_updates, prepare_updates, record_query, validate_fields
+from models import BatchUpdate
+from settings import Settings
+from summaries import summaries_stale
+from tests.memory_app import memory_app
+
+MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+
+
+def records():
+    return [
+        {"id": "r1", "version": 1, "name_user": "Priya", "state_user": "KA", "city_assigned_user": "Mysuru",
+         "refreshment_claim_user": 100.0},
+        {"id": "r2", "version": 4, "name_user": "Arjun", "state_user": "KA", "city_assigned_user": "Mysuru",
+         "refreshment_claim_user": 50.0},
+        # Written before records were versioned
+        {"id": "r3", "name_user": "Meera", "state_user": "TN", "city_assigned_user": "Madurai"},
+    ]
+
+
+class TestValidation(unittest.TestCase):
+    def test_validate_fields(self):
+        self.assertEqual(validate_fields({"num_exam_centres_user": "3"}), ({"num_exam_centres_user": 3}, None))
+        self.assertIn("name_excel", validate_fields({"name_excel": "x"})[1])
+        self.assertIn("num_exam_centres_user", validate_fields({"num_exam_centres_user": "three"})[1])
+        self.assertIsNotNone(validate_fields({})[1])
+
+    def test_repeated_id_is_invalid(self):
+        items = prepare_updates([BatchUpdate(id="r1", fields={"name_user": "A"}),
+                                 BatchUpdate(id="r1", fields={"name_user": "B"})])
+        self.assertIn("set", items[0])
+        self.assertIn("error", items[1])
+
+    def test_record_query(self):
+        self.assertEqual(record_query({"state_user": "KA", "city_assigned_user": ["Mysuru", "Udupi"]}),
+                         {"state_user": "KA", "city_assigned_user": {"$in": ["Mysuru", "Udupi"]}})
+        for bad in ({}, {"$where": "1"}, {"state_user": {"$ne": "KA"}}):
+            with self.assertRaises(ValueError):
+                record_query(bad)
+
+
+class TestApplyUpdates(unittest.TestCase):
+    def setUp(self):
+        self.collection = AsyncMongoMockClient()["test_batch_updates"].reimbursement_records
+        asyncio.run(self.collection.insert_many(records()))
+
+    def test_per_item_results(self):
+        items = prepare_updates([
+            BatchUpdate(id="r1", fields={"name_user": "Priya S"}),
+            BatchUpdate(id="r2", fields={"refreshment_claim_user": 75}, version=3),
+            BatchUpdate(id="r3", fields={"refreshment_claim_user": 20}),
+            BatchUpdate(id="missing", fields={"name_user": "x"}),
+            BatchUpdate(id="r1", fields={"bogus": 1}),
+        ])
+        results, changes = asyncio.run(apply_updates(self.collection, items))
+        self.assertEqual([(result["id"], result["status"]) for result in results], [
+            ("r1", "updated"), ("r2", "conflict"), ("r3", "updated"), ("missing", "not_found"), ("r1", "invalid"),
+        ])
+        self.assertEqual([result.get("version") for result in results[:3]], [2, None, 1])
+        self.assertEqual([after["id"] for _, after in changes], ["r1", "r3"])
+
+        r1 = asyncio.run(self.collection.find_one({"id": "r1"}))
+        self.assertEqual((r1["name_user"], r1["version"]), ("Priya S", 2))
+        self.assertIn("priya", r1["search_keys"])
+        r2 = asyncio.run(self.collection.find_one({"id": "r2"}))
+        self.assertEqual((r2["refreshment_claim_user"], r2["version"]), (50.0, 4))
+
+    def test_concurrent_write_is_a_conflict(self):
+        items = prepare_updates([BatchUpdate(id="r1", fields={"name_user": "A"}),
+                                 BatchUpdate(id="r2", fields={"name_user": "B"})])
+        pre_images = {document["id"]: document for document in asyncio.run(self.collection.find({}).to_list(None))}
+        # Another writer gets to r2 between the read and the bulk_write
+        asyncio.run(self.collection.update_one({"id": "r2"}, {"$set": {"name_user": "C"}, "$inc": {"version": 1}}))
+        results, changes = asyncio.run(apply_updates(self.collection, items, pre_images=pre_images))
+        self.assertEqual([result["status"] for result in results], ["updated", "conflict"])
+        self.assertEqual(len(changes), 1)
+        self.assertEqual(asyncio.run(self.collection.find_one({"id": "r2"}))["name_user"], "C")
+
+    def run_racing(self, after_write: dict, before_write: dict):
+        """apply_updates to r1 and r2 with other writers' updates before and after the bulk_write, by id"""
+        items = prepare_updates([BatchUpdate(id="r1", fields={"name_user": "A"}),
+                                 BatchUpdate(id="r2", fields={"name_user": "B"})])
+        pre_images = {document["id"]: document for document in asyncio.run(self.collection.find({}).to_list(None))}
+
+        async def other_writes(updates):
+            for record_id, times in updates.items():
+                for _ in range(times):
+                    await self.collection.update_one(
+                        {"id": record_id}, {"$set": {"name_user": "C"}, "$inc": {"version": 1}}
+                    )
+
+        bulk_write = self.collection.bulk_write
+
+        async def racing_bulk_write(*args, **kwargs):
+            await other_writes(before_write)
+            result = await bulk_write(*args, **kwargs)
+            await other_writes(after_write)
+            return result
+
+        with mock.patch.object(self.collection, "bulk_write", racing_bulk_write):
+            return asyncio.run(apply_updates(self.collection, items, pre_images=pre_images))
+
+    def test_write_changed_again_is_still_updated(self):
+        results, changes = self.run_racing(after_write={"r1": 1}, before_write={"r2": 1})
+        self.assertEqual([result["status"] for result in results], ["updated", "conflict"])
+        self.assertEqual([after["id"] for _, after in changes], ["r1"])
+        self.assertFalse(asyncio.run(summaries_stale(self.collection.database)))
+
+    def test_unknown_writes_mark_the_summaries_stale(self):
+        # r1 was written then changed again; r2 was changed twice before the write
+        results, changes = self.run_racing(after_write={"r1": 1}, before_write={"r2": 2})
+        self.assertEqual([result["status"] for result in results], ["conflict", "conflict"])
+        self.assertEqual(changes, [])
+        self.assertTrue(asyncio.run(summaries_stale(self.collection.database)))
+
+
+class TestBatchEndpoint(unittest.TestCase):
+    def setUp(self):
+        self.app = memory_app(self, "test_batch")
+
+    def load(self):
+        asyncio.run(self.app.state.services.db.reimbursement_records.insert_many(records()))
+        asyncio.run(self.app.state.services.db.reimbursement_summaries.insert_many([
+            {"_id": {"state": "KA", "city": "Mysuru"}, "records": 2, "refreshment_claim": 150.0},
+            {"_id": {"state": "TN", "city": "Madurai"}, "records": 1},
+        ]))
+
+    def test_updates(self):
+        with TestClient(self.app) as client:
+            self.load()
+            self.assertEqual(client.get("/api/reimbursement/r1").headers["etag"], '"1"')
+            response = client.patch("/api/reimbursement/batch", json={"updates": [
+                {"id": "r1", "fields": {"refreshment_claim_user": 120}},
+                {"id": "r3", "fields": {"city_assigned_user": "Chennai"}},
+                {"id": "r2", "fields": {"num_exam_centres_user": "many"}},
+            ]})
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            self.assertEqual((body["updated"], body["failed"]), (2, 1))
+            self.assertEqual(body["results"][2]["status"], "invalid")
+            # The cached record was invalidated
+            record = client.get("/api/reimbursement/r1")
+            self.assertEqual((record.headers["etag"], record.json()["refreshment_claim_user"]), ('"2"', 120.0))
+            cities = {(row["state"], row["city"]): row for row in client.get("/api/reports/summary").json()}
+            self.assertEqual(cities[("KA", "Mysuru")]["refreshment_claim"], 170.0)
+            self.assertEqual(cities[("TN", "Chennai")]["records"], 1)
+            self.assertNotIn(("TN", "Madurai"), cities)
+
+    def test_filter_and_set(self):
+        with TestClient(self.app) as client:
+            self.load()
+            response = client.patch("/api/reimbursement/batch", json={
+                "filter": {"city_assigned_user": "Mysuru"}, "set": {"bank_name_user": "SBI"}
+            })
+            self.assertEqual(response.json()["updated"], 2)
+            names = {document["id"]: document.get("bank_name_user")
+                     for document in asyncio.run(self.app.state.services.db.reimbursement_records.find({}).to_list(None))}
+            self.assertEqual(names, {"r1": "SBI", "r2": "SBI", "r3": None})
+
+    def test_bad_requests(self):
+        with TestClient(self.app) as client:
+            for body in (
+                {},
+                {"updates": [], "filter": {"state_user": "KA"}, "set": {"name_user": "x"}},
+                {"filter": {"state_user": {"$ne": "KA"}}, "set": {"name_user": "x"}},
+                {"filter": {"state_user": "KA"}, "set": {"name_excel": "x"}},
+                {"updates": [{"id": "r1", "fields": {"name_user": "x"}}], "transaction": True},
+            ):
+                self.assertEqual(client.patch("/api/reimbursement/batch", json=body).status_code, 400, body)
+            too_many = {"updates": [{"id": str(i), "fields": {}} for i in range(10_001)]}
+            self.assertEqual(client.patch("/api/reimbursement/batch", json=too_many).status_code, 422)
+
+
+class TestTransaction(unittest.TestCase):
+    """All-or-nothing batches against a real replica set"""
+
+    def setUp(self):
+        try:
+            hello = MongoClient(MONGO_URL, serverSelectionTimeoutMS=1000).admin.command("hello")
+        except PyMongoError:
+            self.skipTest(f"No MongoDB reachable at {MONGO_URL}")
+        if "setName" not in hello and hello.get("msg") != "isdbgrid":
+            self.skipTest("Transactions need a replica set or sharded cluster")
+        self.db_name = f"test_batch_updates_{uuid.uuid4().hex[:8]}"
+        MongoClient(MONGO_URL)[self.db_name].reimbursement_records.insert_many(records())
+        self.app = server.create_app(Settings(MONGO_URL, self.db_name))
+
+    def tearDown(self):
+        MongoClient(MONGO_URL).drop_database(self.db_name)
+
+    def test_failed_item_rolls_back_the_batch(self):
+        with TestClient(self.app) as client:
+            updates = [{"id": "r1", "fields": {"name_user": "A"}}, {"id": "missing", "fields": {"name_user": "B"}}]
+            response = client.patch("/api/reimbursement/batch", json={"updates": updates, "transaction": True})
+            self.assertEqual(response.status_code, 409)
+            self.assertEqual([result["status"] for result in response.json()["results"]],
+                             ["rolled_back", "not_found"])
+            self.assertEqual(MongoClient(MONGO_URL)[self.db_name].reimbursement_records.find_one({"id": "r1"})["name_user"],
+                             "Priya")
+            response = client.patch("/api/reimbursement/batch", json={"updates": updates[:1], "transaction": True})
+            self.assertEqual(response.json()["updated"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+"""
+Bulk import tests: per-row errors for bad NDJSON lines and partial loads of unreadable files
+
+Imports run against the in-memory stand-in (mongomock-motor), directly and
+through POST /api/reimbursement/import in the API's memory:// mode.
+"""
+import asyncio
+import io
+import json
+import sys
+import unittest
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent / "backend"))
+
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+from bulk_import import import_records, iter_rows, parse_row
+from tests.memory_app import memory_app
+
+
+def ndjson(*lines) -> io.BytesIO:
+    return io.BytesIO("\n".join(lines).encode())
+
+
+def csv_breaking_after(rows: int) -> bytes:
+    """CSV with `rows` valid rows, then a byte that is not UTF-8 well past the first read buffer"""
+    header = "name_user,city_assigned_user\n"
+    body = "".join(f"Coordinator {i:05d} {'x' * 150},Pune\n" for i in range(rows))
+    return (header + body).encode() + b"\xff\xfe broken\n"
+
+
+class TestParseRow(unittest.TestCase):
+    def test_parse_row(self):
+        self.assertEqual(parse_row('{"name_user": "A"}'), {"name_user": "A"})
+        self.assertEqual(parse_row({"name_user": "A"}), {"name_user": "A"})
+        for line in ("[1, 2]", "42", "{not json"):
+            with self.assertRaises(ValueError):
+                parse_row(line)
+
+
+class TestImportRecords(unittest.TestCase):
+    def setUp(self):
+        self.collection = AsyncMongoMockClient()["test_bulk_import"].reimbursement_records
+        self.inserted_batches = []
+
+    async def on_inserted(self, documents):
+        await asyncio.sleep(0.01)
+        self.inserted_batches.append(len(documents))
+
+    def run_import(self, stream, fmt, chunk_size=2):
+        return asyncio.run(import_records(
+            self.collection, iter_rows(stream, fmt), chunk_size=chunk_size, on_inserted=self.on_inserted
+        ))
+
+    def test_bad_lines_are_row_errors(self):
+        summary = self.run_import(ndjson(
+            '{"name_user": "A"}',
+            '{"name_user": ',
+            '[1, 2]',
+            '{"name_user": "B"}',
+            '{"num_exam_centres_user": "many"}',
+            '{"name_user": "C"}',
+        ), "ndjson")
+        self.assertEqual((summary["rows"], summary["inserted"], summary["failed"]), (6, 3, 3))
+        self.assertEqual([error["row"] for error in summary["errors"]], [2, 3, 5])
+        self.assertNotIn("error", summary)
+        self.assertEqual(asyncio.run(self.collection.count_documents({})), 3)
+        self.assertEqual(sum(self.inserted_batches), 3)
+
+    def test_unreadable_file_keeps_earlier_rows(self):
+        summary = self.run_import(io.BytesIO(csv_breaking_after(200)), "csv", chunk_size=10)
+        self.assertIn("Could not read row", summary["error"])
+        self.assertGreater(summary["inserted"], 0)
+        self.assertLess(summary["inserted"], 200)
+        # Every insert finished, with its callback, before the summary was returned
+        self.assertEqual(asyncio.run(self.collection.count_documents({})), summary["inserted"])
+        self.assertEqual(sum(self.inserted_batches), summary["inserted"])
+
+
+class TestImportEndpoint(unittest.TestCase):
+    def setUp(self):
+        self.app = memory_app(self, "test_import")
+
+    def test_bad_ndjson_lines(self):
+        body = "\n".join([json.dumps({"name_user": "A"}), "{oops", "[1, 2]", json.dumps({"name_user": "B"})])
+        with TestClient(self.app) as client:
+            response = client.post("/api/reimbursement/import", files={"file": ("rows.ndjson", body)})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()["inserted"], response.json()["failed"]), (2, 2))
+
+    def test_partial_import_is_reported(self):
+        with TestClient(self.app) as client:
+            response = client.post(
+                "/api/reimbursement/import", files={"file": ("rows.csv", csv_breaking_after(200))},
+                params={"chunk_size": 10},
+            )
+            stored = asyncio.run(self.app.state.services.db.reimbursement_records.count_documents({}))
+        self.assertEqual(response.status_code, 400)
+        body = response.json()
+        self.assertIn("error", body)
+        self.assertEqual(body["inserted"], stored)
+        self.assertGreater(stored, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,108 @@
+"""
+Export tests: CSV, NDJSON and XLSX streams, gzip, filters and XLSX rows written off the event loop
+
+Runs through GET /api/reimbursement/export in the API's memory:// mode and
+against the in-memory stand-in (mongomock-motor) directly.
+"""
+import asyncio
+import csv
+import gzip
+import io
+import json
+import sys
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+sys.path.append(str(Path(__file__).resolve().parent.parent / "backend"))
+
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+import export
+from export import EXPORT_COLUMNS, export_records
+from tests.memory_app import memory_app
+
+CLAIMS = [
+    {"name_user": "Priya Sharma", "state_user": "Karnataka", "city_assigned_user": "Mysuru",
+     "refreshment_claim_user": 120.5},
+    {"name_user": "Arjun Rao", "state_user": "Karnataka", "city_assigned_user": "Udupi", "num_exam_centres_user": 3},
+    {"name_user": "Meera Iyer", "state_user": "Tamil Nadu", "city_assigned_user": "Madurai"},
+]
+
+
+class TestExportEndpoint(unittest.TestCase):
+    def setUp(self):
+        self.app = memory_app(self, "test_export")
+        self.client = TestClient(self.app)
+        self.client.__enter__()
+        self.addCleanup(self.client.__exit__, None, None, None)
+        for claim in CLAIMS:
+            self.assertEqual(self.client.post("/api/reimbursement", json=claim).status_code, 200)
+
+    def export(self, **params):
+        response = self.client.get("/api/reimbursement/export", params=params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_csv(self):
+        response = self.export(format="csv")
+        self.assertTrue(response.headers["content-type"].startswith("text/csv"))
+        self.assertIn(".csv", response.headers["content-disposition"])
+        rows = list(csv.DictReader(io.StringIO(response.text)))
+        self.assertEqual(list(rows[0]), EXPORT_COLUMNS)
+        self.assertEqual([row["name_user"] for row in rows], [claim["name_user"] for claim in CLAIMS])
+        self.assertEqual(rows[0]["refreshment_claim_user"], "120.5")
+
+    def test_ndjson_with_filter(self):
+        response = self.export(format="ndjson", state="Karnataka")
+        records = [json.loads(line) for line in response.text.splitlines()]
+        self.assertEqual([record["city_assigned_user"] for record in records], ["Mysuru", "Udupi"])
+        self.assertEqual(set(records[0]), set(EXPORT_COLUMNS))
+        self.assertEqual(records[1]["num_exam_centres_user"], 3)
+
+    def test_gzip(self):
+        response = self.client.get("/api/reimbursement/export", params={"format": "ndjson", "gzip": True},
+                                   headers={"Accept-Encoding": "identity"})
+        self.assertEqual(response.headers["content-type"], "application/gzip")
+        self.assertTrue(response.headers["content-disposition"].endswith('.ndjson.gz"'))
+        lines = gzip.decompress(response.content).decode().splitlines()
+        self.assertEqual(len(lines), len(CLAIMS))
+
+    def test_xlsx(self):
+        from openpyxl import load_workbook
+
+        response = self.export(format="xlsx", city="Madurai")
+        sheet = load_workbook(io.BytesIO(response.content), read_only=True)["Reimbursements"]
+        rows = list(sheet.iter_rows(values_only=True))
+        self.assertEqual(list(rows[0]), EXPORT_COLUMNS)
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1][EXPORT_COLUMNS.index("name_user")], "Meera Iyer")
+
+    def test_unknown_format(self):
+        self.assertEqual(self.client.get("/api/reimbursement/export", params={"format": "pdf"}).status_code, 400)
+
+
+class TestXlsxRows(unittest.TestCase):
+    def test_rows_are_appended_in_worker_threads(self):
+        collection = AsyncMongoMockClient()["test_export"].reimbursement_records
+        asyncio.run(collection.insert_many([{"id": str(i), "name_user": f"Coordinator {i}"} for i in range(25)]))
+        threads = []
+        append_rows = export._append_rows
+
+        def record_thread(sheet, batch):
+            threads.append(threading.current_thread())
+            append_rows(sheet, batch)
+
+        async def run():
+            with mock.patch("export._append_rows", side_effect=record_thread):
+                return b"".join([chunk async for chunk in export_records(collection, "xlsx", batch_size=10)])
+
+        body = asyncio.run(run())
+        self.assertTrue(body.startswith(b"PK"))
+        self.assertTrue(threads)
+        self.assertNotIn(threading.main_thread(), threads)
+
+
+if __name__ == "__main__":
+    unittest.main()
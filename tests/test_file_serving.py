@@ -0,0 +1,119 @@
+"""
+Download tests: byte ranges, 416, path traversal and ETags for local and remote storage
+
+parse_range is checked directly; downloads go through the API in its
+memory:// mode, with a remote backend standing in for GridFS/S3.
+"""
+import sys
+import unittest
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent / "backend"))
+
+from fastapi.testclient import TestClient
+
+from file_serving import RangeNotSatisfiableError, parse_range
+from storage_backends import LocalStorage
+from tests.memory_app import memory_app, uploads_dir
+
+DATA = bytes(range(256)) * 40
+
+
+class RemoteStorage(LocalStorage):
+    """Local files served the way GridFS/S3 are: no local path, ranged reads only"""
+
+    name = "remote"
+
+    def local_path(self, filename):
+        return None
+
+
+class TestParseRange(unittest.TestCase):
+    def test_ranges(self):
+        self.assertEqual(parse_range("bytes=0-99", 1000), (0, 99))
+        self.assertEqual(parse_range("bytes=900-", 1000), (900, 999))
+        self.assertEqual(parse_range("bytes=-100", 1000), (900, 999))
+        self.assertEqual(parse_range("bytes=990-2000", 1000), (990, 999))
+        self.assertEqual(parse_range("bytes=-5000", 1000), (0, 999))
+        # Multi-range and malformed headers are served whole
+        for header in (None, "", "bytes=0-1,5-6", "items=0-1", "bytes=-"):
+            self.assertIsNone(parse_range(header, 1000))
+
+    def test_unsatisfiable(self):
+        for header in ("bytes=1000-", "bytes=5-4", "bytes=-0"):
+            with self.assertRaises(RangeNotSatisfiableError):
+                parse_range(header, 1000)
+        with self.assertRaises(RangeNotSatisfiableError):
+            parse_range("bytes=-10", 0)
+
+
+class TestDownloads(unittest.TestCase):
+    def setUp(self):
+        self.app = memory_app(self, "test_file_serving")
+
+    def upload(self, client, name="bill.pdf", data=DATA):
+        response = client.post("/api/upload", files={"file": (name, data, "application/pdf")})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_ranges(self):
+        with TestClient(self.app) as client:
+            filename = self.upload(client)["filename"]
+            response = client.get(f"/api/download/{filename}", headers={"Range": "bytes=100-199"})
+            self.assertEqual(response.status_code, 206)
+            self.assertEqual(response.headers["content-range"], f"bytes 100-199/{len(DATA)}")
+            self.assertEqual(response.content, DATA[100:200])
+
+            response = client.get(f"/api/download/{filename}", headers={"Range": "bytes=-10"})
+            self.assertEqual(response.content, DATA[-10:])
+
+            response = client.get(f"/api/download/{filename}", headers={"Range": f"bytes={len(DATA)}-"})
+            self.assertEqual(response.status_code, 416)
+            self.assertEqual(response.headers["content-range"], f"bytes */{len(DATA)}")
+
+            # A stale If-Range gets the whole file
+            response = client.get(f"/api/download/{filename}", headers={"Range": "bytes=0-9", "If-Range": '"old"'})
+            self.assertEqual((response.status_code, response.content), (200, DATA))
+
+            etag = response.headers["etag"]
+            self.assertEqual(client.get(f"/api/download/{filename}", headers={"If-None-Match": etag}).status_code, 304)
+
+    def test_path_traversal(self):
+        secret = uploads_dir(self.app).parent / "secret.txt"
+        secret.write_text("secret")
+        self.addCleanup(secret.unlink)
+        with TestClient(self.app) as client:
+            self.upload(client)
+            for name in ("..%2Fsecret.txt", "..%2F..%2Fsecret.txt", ".hidden", "%2Fetc%2Fpasswd", "a%5C..%5Csecret.txt"):
+                response = client.get(f"/api/download/{name}")
+                self.assertEqual(response.status_code, 404, name)
+                self.assertNotIn(b"secret", response.content)
+
+    def test_remote_file_without_metadata_has_no_size_etag(self):
+        with TestClient(self.app) as client:
+            storage = RemoteStorage(uploads_dir(self.app))
+            self.app.state.services.upload_storage = storage
+            # Stored before metadata was recorded, then replaced by a file of the same size
+            (uploads_dir(self.app) / "bill.pdf").write_bytes(DATA)
+            response = client.get("/api/download/bill.pdf")
+            self.assertEqual(response.content, DATA)
+            self.assertNotIn("etag", response.headers)
+
+            replaced = bytes(reversed(DATA))
+            (uploads_dir(self.app) / "bill.pdf").write_bytes(replaced)
+            response = client.get("/api/download/bill.pdf", headers={"If-None-Match": f'"{len(DATA):x}"'})
+            self.assertEqual((response.status_code, response.content), (200, replaced))
+            response = client.get("/api/download/bill.pdf",
+                                  headers={"Range": "bytes=0-9", "If-Range": f'"{len(DATA):x}"'})
+            self.assertEqual((response.status_code, response.content), (200, replaced))
+            response = client.get("/api/download/bill.pdf", headers={"Range": "bytes=0-9"})
+            self.assertEqual((response.status_code, response.content), (206, replaced[:10]))
+
+            # Content-addressed uploads keep their hash ETag
+            stored = self.upload(client)
+            response = client.get(f"/api/download/{stored['filename']}", headers={"Range": "bytes=10-19"})
+            self.assertEqual((response.status_code, response.content), (206, DATA[10:20]))
+            self.assertEqual(response.headers["etag"], f'"{stored["sha256"]}"')
+
+
+if __name__ == "__main__":
+    unittest.main()
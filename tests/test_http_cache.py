@@ -0,0 +1,81 @@
+"""
+Conditional GET tests: ETags, 304 responses and the warm version cache
+
+Runs in-process against the FastAPI app with Mongo replaced by a counting stub.
+"""
+import sys
+import unittest
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent / "backend"))
+
+from fastapi.testclient import TestClient
+
+from tests.memory_app import memory_app
+
+
+class CountingCollection:
+    """Stands in for a Motor collection and counts every read"""
+
+    def __init__(self, documents):
+        self.documents = {document["id"]: document for document in documents}
+        self.reads = 0
+
+    async def find_one(self, query, projection=None):
+        self.reads += 1
+        document = self.documents.get(query["id"])
+        return dict(document) if document else None
+
+
+class CountingDatabase:
+    def __init__(self, records):
+        self.reimbursement_records = records
+
+
+class TestConditionalGet(unittest.TestCase):
+    """ETag / If-None-Match behaviour of the read endpoints"""
+
+    def setUp(self):
+        self.records = CountingCollection([{"id": "rec-1", "version": 3, "name_user": "Priya"}])
+        app = memory_app(self, "test_http_cache")
+        # The lifespan is not run, so the app reads the counting stub
+        app.state.services.db = CountingDatabase(self.records)
+        self.client = TestClient(app)
+
+    def test_01_record_read_sets_etag(self):
+        response = self.client.get("/api/reimbursement/rec-1")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["etag"], '"3"')
+        self.assertIn("no-cache", response.headers["cache-control"])
+
+    def test_02_304_with_warm_cache_skips_mongo(self):
+        self.client.get("/api/reimbursement/rec-1")
+        reads = self.records.reads
+        response = self.client.get("/api/reimbursement/rec-1", headers={"If-None-Match": '"3"'})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.headers["etag"], '"3"')
+        self.assertEqual(self.records.reads, reads)
+
+    def test_03_stale_etag_gets_full_body(self):
+        response = self.client.get("/api/reimbursement/rec-1", headers={"If-None-Match": '"2"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["name_user"], "Priya")
+
+    def test_04_repeat_read_served_from_record_cache(self):
+        self.client.get("/api/reimbursement/rec-1")
+        reads = self.records.reads
+        response = self.client.get("/api/reimbursement/rec-1")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["name_user"], "Priya")
+        self.assertEqual(response.headers["etag"], '"3"')
+        self.assertEqual(self.records.reads, reads)
+
+    def test_05_template_data_revalidates(self):
+        response = self.client.get("/api/template-data")
+        self.assertEqual(response.status_code, 200)
+        etag = response.headers["etag"]
+        response = self.client.get("/api/template-data", headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+
+
+if __name__ == "__main__":
+    unittest.main()
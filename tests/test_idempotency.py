@@ -0,0 +1,161 @@
+"""
+Idempotency-Key tests: replay, concurrent duplicates, claim heartbeats and takeover,
+mismatches and failed originals
+
+Uses a dict-backed stand-in for the idempotency_keys collection; the upload
+tests go through the API in its memory:// mode.
+"""
+import asyncio
+import sys
+import unittest
+from datetime import datetime
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent / "backend"))
+
+from fastapi import HTTPException
+from fastapi.responses import ORJSONResponse
+from fastapi.testclient import TestClient
+from pymongo.errors import DuplicateKeyError
+
+from idempotency import IdempotencyStore
+from tests.memory_app import memory_app
+
+
+class KeyCollection:
+    def __init__(self):
+        self.documents = {}
+
+    async def insert_one(self, document):
+        if document["_id"] in self.documents:
+            raise DuplicateKeyError("duplicate key")
+        self.documents[document["_id"]] = dict(document)
+
+    async def find_one(self, query):
+        document = self.documents.get(query["_id"])
+        return dict(document) if document else None
+
+    async def update_one(self, query, update):
+        document = self.documents.get(query["_id"])
+        if document and all(document.get(field) == value for field, value in query.items()):
+            document.update(update["$set"])
+
+    async def delete_one(self, query):
+        document = self.documents.get(query["_id"])
+        if document and all(document.get(field) == value for field, value in query.items()):
+            del self.documents[query["_id"]]
+
+
+class KeyDatabase:
+    def __init__(self):
+        self.idempotency_keys = KeyCollection()
+
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+
+class CountingHandler:
+    def __init__(self, delay=0.0, fail=False):
+        self.calls = 0
+        self.delay = delay
+        self.fail = fail
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise HTTPException(status_code=500, detail="boom")
+        return ORJSONResponse({"call": self.calls}, headers={"ETag": '"1"'})
+
+
+class TestIdempotencyStore(unittest.TestCase):
+    def test_concurrent_duplicates_run_once(self):
+        async def run():
+            store, db, handler = IdempotencyStore(), KeyDatabase(), CountingHandler(delay=0.01)
+            responses = await asyncio.gather(*(store.run(db, "create", "k", "fp", handler) for _ in range(5)))
+            return handler, responses
+
+        handler, responses = asyncio.run(run())
+        self.assertEqual(handler.calls, 1)
+        self.assertEqual({response.body for response in responses}, {b'{"call":1}'})
+        self.assertEqual([response.headers.get("idempotent-replayed") for response in responses].count("true"), 4)
+        self.assertEqual(responses[1].headers["etag"], '"1"')
+
+    def test_other_worker_waits_then_replays(self):
+        async def run():
+            db, handler = KeyDatabase(), CountingHandler(delay=0.1)
+            first, second = IdempotencyStore(), IdempotencyStore()
+            original = asyncio.ensure_future(first.run(db, "create", "k", "fp", handler))
+            await asyncio.sleep(0.01)
+            replay = await second.run(db, "create", "k", "fp", handler)
+            return handler, await original, replay
+
+        handler, original, replay = asyncio.run(run())
+        self.assertEqual(handler.calls, 1)
+        self.assertEqual(replay.body, original.body)
+        self.assertEqual(replay.headers["idempotent-replayed"], "true")
+
+    def test_slow_original_is_not_taken_over(self):
+        async def run():
+            db, handler = KeyDatabase(), CountingHandler(delay=0.3)
+            # The original runs for several lock timeouts, refreshing its claim
+            first, second = IdempotencyStore(lock_timeout=0.06), IdempotencyStore(lock_timeout=0.06)
+            original = asyncio.ensure_future(first.run(db, "create", "k", "fp", handler))
+            await asyncio.sleep(0.15)
+            replay = await second.run(db, "create", "k", "fp", handler)
+            return handler, await original, replay
+
+        handler, original, replay = asyncio.run(run())
+        self.assertEqual(handler.calls, 1)
+        self.assertEqual(replay.body, original.body)
+
+    def test_abandoned_claim_is_taken_over(self):
+        async def run():
+            db, handler = KeyDatabase(), CountingHandler()
+            await db.idempotency_keys.insert_one({
+                "_id": "create:k", "state": "processing", "fingerprint": "fp",
+                "created_at": datetime(2020, 1, 1), "locked_at": datetime(2020, 1, 1),
+            })
+            return handler, await IdempotencyStore().run(db, "create", "k", "fp", handler)
+
+        handler, response = asyncio.run(run())
+        self.assertEqual(handler.calls, 1)
+        self.assertIsNone(response.headers.get("idempotent-replayed"))
+
+    def test_key_reused_for_different_request(self):
+        async def run():
+            store, db = IdempotencyStore(), KeyDatabase()
+            await store.run(db, "create", "k", "fp-1", CountingHandler())
+            await store.run(db, "create", "k", "fp-2", CountingHandler())
+
+        with self.assertRaises(HTTPException) as raised:
+            asyncio.run(run())
+        self.assertEqual(raised.exception.status_code, 422)
+
+    def test_failed_original_releases_key(self):
+        async def run():
+            store, db = IdempotencyStore(), KeyDatabase()
+            with self.assertRaises(HTTPException):
+                await store.run(db, "create", "k", "fp", CountingHandler(fail=True))
+            handler = CountingHandler()
+            response = await store.run(db, "create", "k", "fp", handler)
+            return handler, response, db
+
+        handler, response, db = asyncio.run(run())
+        self.assertEqual(handler.calls, 1)
+        self.assertIsNone(response.headers.get("idempotent-replayed"))
+        self.assertEqual(db.idempotency_keys.documents["create:k"]["state"], "completed")
+
+
+class TestUploadIdempotency(unittest.TestCase):
+    def setUp(self):
+        self.app = memory_app(self, "test_upload_keys")
+
+    def test_same_name_and_size_other_content_is_a_mismatch(self):
+        headers = {"Idempotency-Key": "bill-1"}
+        with TestClient(self.app) as client:
+            first = client.post("/api/upload", files={"file": ("bill.pdf", b"%PDF-aaaa")}, headers=headers)
+            replay = client.post("/api/upload", files={"file": ("bill.pdf", b"%PDF-aaaa")}, headers=headers)
+            other = client.post("/api/upload", files={"file": ("bill.pdf", b"%PDF-bbbb")}, headers=headers)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual((replay.headers.get("idempotent-replayed"), replay.json()), ("true", first.json()))
+        self.assertEqual(other.status_code, 422)
@@ -0,0 +1,118 @@
+"""
+Check that the API's hot queries are served by an index (IXSCAN, not COLLSCAN)
+
+Requires a reachable mongod; set MONGO_URL (defaults to localhost) to run.
+"""
+import asyncio
+import os
+import re
+import sys
+import unittest
+import uuid
+from datetime import datetime
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent / "backend"))
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+from indexes import ensure_indexes
+from search import rank_tiers
+
+MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+
+
+def plan_stages(plan: dict) -> set:
+    """Collect every stage name in an explain() winning plan"""
+    stages = {plan.get("stage")}
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            stages |= plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        stages |= plan_stages(child)
+    return stages
+
+
+class TestIndexUsage(unittest.TestCase):
+    """explain()-based checks for the queries used by the API"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.client = MongoClient(MONGO_URL, serverSelectionTimeoutMS=1000)
+        try:
+            cls.client.admin.command("ping")
+        except PyMongoError:
+            raise unittest.SkipTest(f"MongoDB not reachable at {MONGO_URL}")
+        cls.db_name = f"test_indexes_{uuid.uuid4().hex[:8]}"
+        cls.db = cls.client[cls.db_name]
+        cls.db.reimbursement_records.insert_many([
+            {"id": str(uuid.uuid4()), "city_code_user": f"C{i:03d}", "state_user": "Delhi",
+             "city_assigned_user": "New Delhi", "created_at": datetime.utcnow(),
+             "search_keys": ["delhi", "new", f"user{i}"], "search_rank_keys": ["06a:new", "06b:delhi", f"10a:user{i}"]}
+            for i in range(50)
+        ])
+
+        async def bootstrap():
+            motor_client = AsyncIOMotorClient(MONGO_URL)
+            try:
+                created = await ensure_indexes(motor_client[cls.db_name])
+                again = await ensure_indexes(motor_client[cls.db_name])
+                return created, again
+            finally:
+                motor_client.close()
+
+        cls.created, cls.created_again = asyncio.run(bootstrap())
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.client.drop_database(cls.db_name)
+        cls.client.close()
+
+    def assert_uses_index(self, collection, query, sort=None):
+        cursor = collection.find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = cursor.explain()
+        stages = plan_stages(explain["queryPlanner"]["winningPlan"])
+        self.assertIn("IXSCAN", stages)
+        self.assertNotIn("COLLSCAN", stages)
+        if sort:
+            self.assertNotIn("SORT", stages)
+
+    def test_01_bootstrap_is_idempotent(self):
+        self.assertIn("id_unique", self.created["reimbursement_records"])
+        self.assertEqual(self.created_again, {})
+
+    def test_02_update_by_id_uses_index(self):
+        record_id = self.db.reimbursement_records.find_one()["id"]
+        self.assert_uses_index(self.db.reimbursement_records, {"id": record_id})
+
+    def test_03_filters_use_index(self):
+        for query in ({"city_code_user": "C001"}, {"state_user": "Delhi"},
+                      {"city_assigned_user": "New Delhi"}):
+            self.assert_uses_index(self.db.reimbursement_records, query)
+
+    def test_04_status_check_windows_use_index(self):
+        window = {"timestamp": {"$gte": datetime(2026, 1, 1), "$lt": datetime(2026, 1, 2)}}
+        self.assert_uses_index(self.db.status_checks, window, [("timestamp", 1), ("id", 1)])
+        self.assert_uses_index(
+            self.db.status_checks, {"client_name": {"$gte": ""}}, [("client_name", 1), ("timestamp", -1)]
+        )
+
+    def test_05_paginated_listing_uses_index_order(self):
+        sort = [("created_at", 1), ("id", 1)]
+        self.assert_uses_index(self.db.reimbursement_records, {}, sort)
+        self.assert_uses_index(self.db.reimbursement_records, {"state_user": "Delhi"}, sort)
+        self.assert_uses_index(self.db.reimbursement_records, {"city_assigned_user": "New Delhi"}, sort)
+
+    def test_06_search_rank_tiers_use_index(self):
+        for _, tier in rank_tiers("user1"):
+            self.assert_uses_index(self.db.reimbursement_records, tier)
+        self.assert_uses_index(
+            self.db.reimbursement_records,
+            {"$and": [{"search_keys": {"$regex": "^new"}}, {"search_rank_keys": {"$in": [re.compile("^10a:user1")]}}]},
+        )
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,313 @@
+"""
+Background job tests: lifecycle, per-type limits, cancellation, failures and restart recovery
+
+Jobs run through a thread pool and fake runners against a dict-backed jobs
+collection; the process pool and Mongo are not involved.
+"""
+import asyncio
+import json
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent / "backend"))
+
+from jobs import JobCancelled, JobManager, JobProgress, parse_type_limits
+from storage_backends import LocalStorage
+
+
+class Result:
+    def __init__(self, modified_count):
+        self.modified_count = modified_count
+
+
+def matches(document, query):
+    for field, value in query.items():
+        if field == "$or":
+            if not any(matches(document, branch) for branch in value):
+                return False
+        elif isinstance(value, dict) and "$in" in value:
+            if document.get(field) not in value["$in"]:
+                return False
+        elif isinstance(value, dict) and "$ne" in value:
+            if document.get(field) == value["$ne"]:
+                return False
+        elif isinstance(value, dict) and "$lt" in value:
+            if document.get(field) is None or not document[field] < value["$lt"]:
+                return False
+        elif document.get(field) != value:
+            return False
+    return True
+
+
+class JobCollection:
+    def __init__(self):
+        self.documents = []
+
+    async def insert_one(self, document):
+        self.documents.append(dict(document))
+
+    async def find_one(self, query, projection=None):
+        for document in self.documents:
+            if matches(document, query):
+                return dict(document)
+        return None
+
+    async def update_one(self, query, update):
+        for document in self.documents:
+            if matches(document, query):
+                document.update(update["$set"])
+                return Result(1)
+        return Result(0)
+
+    async def update_many(self, query, update):
+        matched = [document for document in self.documents if matches(document, query)]
+        for document in matched:
+            document.update(update["$set"])
+        return Result(len(matched))
+
+    async def find_one_and_update(self, query, update, projection=None):
+        before = await self.find_one(query)
+        await self.update_one(query, update)
+        return before
+
+
+class JobDatabase:
+    def __init__(self):
+        self.jobs = JobCollection()
+
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+
+def write_report(job_type, job_id, params, output_path, mongo_url, db_name):
+    Path(output_path).write_text(json.dumps(params))
+    return {"sha256": "abc", "progress": {"done": 1, "total": 1, "unit": "records"}}
+
+
+def fail(*args):
+    raise RuntimeError("worker crashed")
+
+
+def cancelled(*args):
+    raise JobCancelled()
+
+
+class BlockingRunner:
+    """Holds every job until released and records how many ran at once"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.running = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, *args):
+        with self.lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        self.release.wait(5)
+        with self.lock:
+            self.running -= 1
+        return {}
+
+
+class TestJobManager(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.storage = LocalStorage(Path(self.tmp.name))
+        self.stored = []
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def manager(self, db, runner, **options):
+        async def on_result(metadata):
+            self.stored.append(metadata)
+
+        return JobManager(
+            db, self.storage, "mongodb://unused", "test", runner=runner,
+            executor=ThreadPoolExecutor(4), on_result=on_result, **options
+        )
+
+    async def wait_for(self, manager, job_id, statuses=("succeeded", "failed", "cancelled")):
+        for _ in range(500):
+            job = await manager.get(job_id)
+            if job["status"] in statuses:
+                return job
+            await asyncio.sleep(0.01)
+        self.fail(f"job {job_id} stuck in {job['status']}")
+
+    def test_result_file_is_stored_and_downloadable(self):
+        async def run():
+            db = JobDatabase()
+            manager = self.manager(db, write_report)
+            job = await manager.submit("reconciliation", {"top": 5}, result_ext=".json", content_type="application/json")
+            self.assertEqual(job["status"], "queued")
+            finished = await self.wait_for(manager, job["id"])
+            await manager.close()
+            return finished
+
+        job = asyncio.run(run())
+        name = f"job-{job['id']}.json"
+        self.assertEqual(job["status"], "succeeded")
+        self.assertEqual(job["result"]["download_url"], f"/api/download/{name}")
+        self.assertEqual(job["progress"]["done"], 1)
+        self.assertEqual(json.loads((Path(self.tmp.name) / name).read_text()), {"top": 5})
+        self.assertEqual(self.stored[0]["filename"], name)
+        self.assertEqual(list(Path(self.tmp.name).glob(".job-*")), [])
+
+    def test_concurrency_is_limited_per_type(self):
+        runner = BlockingRunner()
+
+        async def run():
+            db = JobDatabase()
+            manager = self.manager(db, runner, type_limits=parse_type_limits("export=2"))
+            jobs = [await manager.submit("export", {}) for _ in range(4)]
+            await asyncio.sleep(0.1)
+            statuses = [(await manager.get(job["id"]))["status"] for job in jobs]
+            runner.release.set()
+            for job in jobs:
+                await self.wait_for(manager, job["id"])
+            await manager.close()
+            return statuses
+
+        statuses = asyncio.run(run())
+        self.assertEqual(sorted(statuses), ["queued", "queued", "running", "running"])
+        self.assertEqual(runner.peak, 2)
+
+    def test_queued_job_cancelled_without_running(self):
+        runner = BlockingRunner()
+
+        async def run():
+            db = JobDatabase()
+            manager = self.manager(db, runner)
+            first = await manager.submit("import", {})
+            second = await manager.submit("import", {})
+            await asyncio.sleep(0.05)
+            cancelled_job = await manager.cancel(second["id"])
+            runner.release.set()
+            await self.wait_for(manager, first["id"])
+            await manager.close()
+            return cancelled_job
+
+        job = asyncio.run(run())
+        self.assertEqual(job["status"], "cancelled")
+        self.assertEqual(runner.peak, 1)
+
+    def test_worker_outcomes(self):
+        async def run(runner):
+            manager = self.manager(JobDatabase(), runner)
+            job = await manager.submit("export", {}, result_ext=".csv")
+            finished = await self.wait_for(manager, job["id"])
+            await manager.close()
+            return finished
+
+        failed = asyncio.run(run(fail))
+        self.assertEqual((failed["status"], failed["error"]), ("failed", "worker crashed"))
+        self.assertEqual(asyncio.run(run(cancelled))["status"], "cancelled")
+        self.assertEqual(self.stored, [])
+
+    def test_recover_fails_interrupted_jobs(self):
+        async def run():
+            db = JobDatabase()
+            for status in ("queued", "running", "succeeded"):
+                await db.jobs.insert_one({"id": status, "status": status})
+            await self.manager(db, write_report).recover()
+            return {document["id"]: document["status"] for document in db.jobs.documents}
+
+        self.assertEqual(asyncio.run(run()), {"queued": "failed", "running": "failed", "succeeded": "succeeded"})
+
+    def test_recover_spares_jobs_of_live_workers(self):
+        runner = BlockingRunner()
+
+        async def run():
+            db = JobDatabase()
+            live = self.manager(db, runner, heartbeat_timeout=60)
+            job = await live.submit("export", {})
+            await asyncio.sleep(0.05)
+            # A second worker process starts while the first one is running a job
+            await self.manager(db, write_report, heartbeat_timeout=60).recover()
+            while_alive = (await live.get(job["id"]))["status"]
+            # The first worker's heartbeats stop (it died); once they expire the job is recovered
+            db.jobs.documents[0]["heartbeat_at"] = datetime.utcnow() - timedelta(seconds=120)
+            await self.manager(db, write_report, heartbeat_timeout=60).recover()
+            after_expiry = (await live.get(job["id"]))["status"]
+            # The stalled worker finishing later does not overwrite the recovered status
+            runner.release.set()
+            await asyncio.sleep(0.1)
+            final = (await live.get(job["id"]))["status"]
+            await live.close()
+            return while_alive, after_expiry, final
+
+        self.assertEqual(asyncio.run(run()), ("running", "failed", "failed"))
+
+    def test_heartbeats_while_running(self):
+        runner = BlockingRunner()
+
+        async def run():
+            db = JobDatabase()
+            manager = self.manager(db, runner, heartbeat_interval=0.02)
+            await manager.start()
+            job = await manager.submit("export", {})
+            first = (await manager.get(job["id"]))["heartbeat_at"]
+            await asyncio.sleep(0.1)
+            latest = (await manager.get(job["id"]))
+            runner.release.set()
+            await self.wait_for(manager, job["id"])
+            await manager.close()
+            return job, first, latest
+
+        job, first, latest = asyncio.run(run())
+        self.assertEqual(latest["owner"], job["owner"])
+        self.assertEqual(latest["status"], "running")
+        self.assertGreater(latest["heartbeat_at"], first)
+
+    def test_limits_are_per_manager(self):
+        runner = BlockingRunner()
+
+        async def run():
+            db = JobDatabase()
+            managers = [self.manager(db, runner) for _ in range(2)]
+            jobs = [await manager.submit("import", {}) for manager in managers for _ in range(2)]
+            await asyncio.sleep(0.1)
+            runner.release.set()
+            for job in jobs:
+                await self.wait_for(managers[0], job["id"])
+            for manager in managers:
+                await manager.close()
+
+        asyncio.run(run())
+        # import=1 in each of two worker processes
+        self.assertEqual(runner.peak, 2)
+
+
+class TestJobProgress(unittest.TestCase):
+    def test_progress_is_throttled_and_sees_cancellation(self):
+        async def run():
+            db = JobDatabase()
+            await db.jobs.insert_one({"id": "j", "cancel_requested": False})
+            progress = JobProgress(db.jobs, "j", total=10)
+            progress.advance(3)
+            await progress.flush()
+            progress.advance(2)
+            await progress.flush()
+            written = dict(db.jobs.documents[0]["progress"])
+            db.jobs.documents[0]["cancel_requested"] = True
+            progress._last_flush = time.monotonic() - 60
+            with self.assertRaises(JobCancelled):
+                await progress.flush()
+            with self.assertRaises(JobCancelled):
+                progress.advance(1)
+            return written
+
+        self.assertEqual(asyncio.run(run()), {"done": 3, "total": 10, "unit": "records"})
+
+    def test_parse_type_limits(self):
+        self.assertEqual(parse_type_limits("export=3, import=2"), {"export": 3, "reconciliation": 1, "import": 2})
+        with self.assertRaises(ValueError):
+            parse_type_limits("bills=1")
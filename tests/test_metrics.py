@@ -0,0 +1,116 @@
+"""
+Metrics tests: route-template labels, slow-request log, Mongo command timings and the /metrics endpoint
+"""
+import sys
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+sys.path.append(str(Path(__file__).resolve().parent.parent / "backend"))
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from metrics import REGISTRY, CommandTimer, MetricsMiddleware, _request_commands, render_metrics
+from tests.memory_app import memory_app
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+class TestMetricsMiddleware(unittest.TestCase):
+    def setUp(self):
+        app = FastAPI()
+
+        @app.get("/items/{item_id}")
+        async def read_item(item_id: str):
+            return {"id": item_id}
+
+        @app.get("/in-flight/{name}")
+        async def in_flight(name: str):
+            return {route: sample("http_requests_in_flight", method="GET", route=route)
+                    for route in ("/in-flight/{name}", "/items/{item_id}", "unmatched")}
+
+        self.client = TestClient(MetricsMiddleware(app, slow_request_seconds=0.0))
+
+    def test_routes_labelled_by_template(self):
+        before = sample("http_requests_total", method="GET", route="/items/{item_id}", status="200")
+        self.client.get("/items/a")
+        self.client.get("/items/b")
+        after = sample("http_requests_total", method="GET", route="/items/{item_id}", status="200")
+        self.assertEqual(after - before, 2)
+
+    def test_unmatched_paths_share_one_label(self):
+        before = sample("http_requests_total", method="GET", route="unmatched", status="404")
+        self.client.get("/no/such/path")
+        after = sample("http_requests_total", method="GET", route="unmatched", status="404")
+        self.assertEqual(after - before, 1)
+        self.assertIsNone(REGISTRY.get_sample_value(
+            "http_requests_total", {"method": "GET", "route": "/no/such/path", "status": "404"}
+        ))
+
+    def test_in_flight_labelled_by_template(self):
+        with self.assertLogs(level="WARNING"):
+            seen = self.client.get("/in-flight/a").json()
+        self.assertEqual(seen, {"/in-flight/{name}": 1, "/items/{item_id}": 0, "unmatched": 0})
+        self.assertEqual(sample("http_requests_in_flight", method="GET", route="/in-flight/{name}"), 0)
+        with self.assertLogs(level="WARNING"):
+            self.client.post("/items/a")
+        self.assertIsNotNone(REGISTRY.get_sample_value(
+            "http_requests_in_flight", {"method": "POST", "route": "/items/{item_id}"}
+        ))
+
+    def test_slow_request_logged(self):
+        with self.assertLogs(level="WARNING") as logs:
+            self.client.get("/items/slow")
+        self.assertIn("Slow request: GET /items/slow (/items/{item_id}) -> 200", logs.output[0])
+
+
+class TestCommandTimer(unittest.TestCase):
+    def test_labels_by_collection_and_records_request_commands(self):
+        timer = CommandTimer()
+        token = _request_commands.set([])
+        try:
+            timer.started(SimpleNamespace(
+                command={"find": "reimbursement_records", "filter": {}}, command_name="find",
+                connection_id=("db", 27017), request_id=7
+            ))
+            timer.succeeded(SimpleNamespace(
+                command_name="find", connection_id=("db", 27017), request_id=7, duration_micros=2500
+            ))
+            self.assertEqual(_request_commands.get(), ["find reimbursement_records 2.5ms success"])
+        finally:
+            _request_commands.reset(token)
+        count = sample(
+            "mongodb_command_duration_seconds_count",
+            collection="reimbursement_records", command="find", outcome="success"
+        )
+        self.assertGreaterEqual(count, 1)
+
+    def test_exposition_format(self):
+        body, content_type = render_metrics()
+        self.assertTrue(content_type.startswith("text/plain"))
+        self.assertIn(b"# TYPE http_request_duration_seconds histogram", body)
+
+
+class TestMetricsEndpoint(unittest.TestCase):
+    def setUp(self):
+        self.app = memory_app(self, "test_metrics", slow_request_seconds=0.0)
+
+    def test_metrics_endpoint(self):
+        route = "/api/reimbursement/{record_id}"
+        before = sample("http_requests_total", method="GET", route=route, status="404")
+        with TestClient(self.app) as client:
+            with self.assertLogs(level="WARNING") as logs:
+                client.get("/api/reimbursement/missing")
+            response = client.get("/metrics")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["content-type"].startswith("text/plain"))
+        self.assertIn(f'http_requests_total{{method="GET",route="{route}",status="404"}}', response.text)
+        self.assertEqual(sample("http_requests_total", method="GET", route=route, status="404") - before, 1)
+        # Every request has finished, including the scrape
+        self.assertIn(f'http_requests_in_flight{{method="GET",route="{route}"}}', response.text)
+        self.assertEqual(sample("http_requests_in_flight", method="GET", route=route), 0)
+        self.assertEqual(sample("http_requests_in_flight", method="GET", route="/metrics"), 0)
+        self.assertRegex(logs.output[0],
+                         rf"Slow request: GET /api/reimbursement/missing \({route}\) -> 404 .*Mongo commands")
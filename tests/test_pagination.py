@@ -0,0 +1,133 @@
+"""
+Listing tests: keyset cursors, pages over tied sort values and field projections
+
+fetch_page runs against the in-memory stand-in (mongomock-motor); the
+listing endpoint through the API in its memory:// mode.
+"""
+import asyncio
+import sys
+import unittest
+from datetime import datetime, timedelta
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent / "backend"))
+
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+from pagination import InvalidCursorError, decode_cursor, encode_cursor, fetch_page
+from tests.memory_app import memory_app
+
+START = datetime(2024, 5, 1, 9, 30)
+
+
+class TestCursors(unittest.TestCase):
+    def test_round_trip(self):
+        cursor = encode_cursor(START, "rec-7")
+        self.assertNotIn("=", cursor)
+        self.assertEqual(decode_cursor(cursor), (START, "rec-7"))
+        self.assertEqual(decode_cursor(encode_cursor(None, "legacy")), (None, "legacy"))
+
+    def test_invalid(self):
+        for cursor in ("not a cursor", "e30", encode_cursor(START, "x")[:-3]):
+            with self.assertRaises(InvalidCursorError):
+                decode_cursor(cursor)
+
+
+class TestFetchPage(unittest.TestCase):
+    def setUp(self):
+        self.collection = AsyncMongoMockClient()["test_pagination"].reimbursement_records
+        # Three records share each created_at, so pages have to break ties on id
+        documents = [
+            {"id": f"r{i:02d}", "created_at": START + timedelta(minutes=i // 3), "name_user": f"Coordinator {i}",
+             "state_user": "Karnataka" if i % 2 else "Kerala"}
+            for i in range(20)
+        ]
+        asyncio.run(self.collection.insert_many(list(reversed(documents))))
+
+    def pages(self, query=None, limit=7, projection=None):
+        pages, cursor = [], None
+        while True:
+            page = asyncio.run(fetch_page(self.collection, query or {}, "created_at", limit, cursor, projection))
+            pages.append(page["items"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return pages
+
+    def test_pages_cover_every_record_once_in_order(self):
+        pages = self.pages()
+        self.assertEqual([len(page) for page in pages], [7, 7, 6])
+        self.assertEqual([item["id"] for page in pages for item in page], [f"r{i:02d}" for i in range(20)])
+
+    def test_exact_multiple_of_the_limit_has_no_empty_last_page(self):
+        pages = self.pages(limit=10)
+        self.assertEqual([len(page) for page in pages], [10, 10])
+
+    def test_filter_and_projection(self):
+        pages = self.pages({"state_user": "Kerala"}, limit=4, projection={"name_user": 1})
+        items = [item for page in pages for item in page]
+        self.assertEqual(len(items), 10)
+        # The keyset fields are always returned, _id never
+        self.assertEqual(set(items[0]), {"id", "created_at", "name_user"})
+
+    def test_exclusion_projection(self):
+        items = self.pages(limit=20, projection={"name_user": 0})[0]
+        self.assertEqual(set(items[0]), {"id", "created_at", "state_user"})
+
+    def test_documents_without_the_sort_field_come_first(self):
+        # Written before records had created_at
+        asyncio.run(self.collection.insert_many([{"id": "legacy-b"}, {"id": "legacy-a", "created_at": None}]))
+        pages = self.pages(limit=1)
+        self.assertEqual([item["id"] for page in pages[:3] for item in page], ["legacy-a", "legacy-b", "r00"])
+        self.assertEqual(len(pages), 22)
+
+
+class TestListEndpoint(unittest.TestCase):
+    def setUp(self):
+        self.app = memory_app(self, "test_list")
+
+    def test_projection_and_cursor(self):
+        with TestClient(self.app) as client:
+            for i in range(5):
+                client.post("/api/reimbursement", json={"name_user": f"Coordinator {i}", "bank_name_user": "SBI",
+                                                        "state_user": "Delhi"})
+            page = client.get("/api/reimbursement", params={"limit": 3, "fields": "bank"}).json()
+            self.assertEqual(len(page["items"]), 3)
+            self.assertIn("bank_name_user", page["items"][0])
+            self.assertIn("bank_name_excel", page["items"][0])
+            self.assertNotIn("name_user", page["items"][0])
+            rest = client.get("/api/reimbursement", params={"limit": 3, "cursor": page["next_cursor"]}).json()
+            self.assertIsNone(rest["next_cursor"])
+            self.assertEqual(len({item["id"] for item in page["items"] + rest["items"]}), 5)
+            # Without fields, everything but the search keys
+            self.assertNotIn("search_keys", rest["items"][0])
+            self.assertIn("name_user", rest["items"][0])
+
+            user = client.get("/api/reimbursement", params={"fields": "user"}).json()["items"][0]
+            self.assertTrue(all(name.endswith("_user") for name in set(user) - {"id", "created_at"}))
+            listed = client.get("/api/reimbursement", params={"fields": "name_user, state_user"}).json()["items"][0]
+            self.assertEqual(set(listed), {"id", "created_at", "name_user", "state_user"})
+
+    def test_records_without_created_at(self):
+        with TestClient(self.app) as client:
+            client.post("/api/reimbursement", json={"name_user": "Priya"})
+            asyncio.run(self.app.state.services.db.reimbursement_records.insert_many(
+                [{"id": "legacy-1", "name_user": "Meera"}, {"id": "legacy-2", "name_user": "Arjun"}]
+            ))
+            page = client.get("/api/reimbursement", params={"limit": 1})
+            self.assertEqual(page.status_code, 200)
+            ids = [item["id"] for item in page.json()["items"]]
+            while page.json()["next_cursor"]:
+                page = client.get("/api/reimbursement", params={"limit": 1, "cursor": page.json()["next_cursor"]})
+                ids += [item["id"] for item in page.json()["items"]]
+            self.assertEqual(ids[:2], ["legacy-1", "legacy-2"])
+            self.assertEqual(len(ids), 3)
+
+    def test_bad_requests(self):
+        with TestClient(self.app) as client:
+            self.assertEqual(client.get("/api/reimbursement", params={"fields": "name_user,bogus"}).status_code, 400)
+            self.assertEqual(client.get("/api/reimbursement", params={"cursor": "garbage"}).status_code, 400)
+            self.assertEqual(client.get("/api/reimbursement", params={"limit": 0}).status_code, 422)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+"""
+Reconciliation tests: tolerances, missing Excel/user values and the streamed report
+
+ReconciliationReport is checked directly; reconcile() streams from the
+in-memory stand-in (mongomock-motor).
+"""
+import asyncio
+import sys
+import unittest
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent / "backend"))
+
+from mongomock_motor import AsyncMongoMockClient
+
+from reconciliation import CATEGORIES, ReconciliationReport, reconcile
+
+
+def claim(record_id, excel=None, user=None, field="refreshment_claim"):
+    document = {"id": record_id}
+    if excel is not None:
+        document[f"{field}_excel"] = excel
+    if user is not None:
+        document[f"{field}_user"] = user
+    return document
+
+
+def category(summary, name="refreshment_claim"):
+    return next(row for row in summary["categories"] if row["category"] == name)
+
+
+class TestReconciliationReport(unittest.TestCase):
+    def test_tolerances(self):
+        documents = [claim("a", 1000.0, 1040.0), claim("b", 1000.0, 1060.0), claim("c", 100.0, 104.0),
+                     claim("d", 1000.0, 900.0)]
+        exact = ReconciliationReport()
+        exact.add_chunk(documents)
+        self.assertEqual(category(exact.summary())["over_claim_records"], 3)
+        self.assertEqual(category(exact.summary())["mismatched_records"], 4)
+
+        pct = ReconciliationReport(tolerance_pct=5)
+        pct.add_chunk(documents)
+        self.assertEqual(pct.summary()["flagged_records"], 1)
+        self.assertEqual([row["id"] for row in pct.summary()["top_over_claims"]], ["b"])
+
+        both = ReconciliationReport(tolerance_pct=5, tolerance_abs=5)
+        both.add_chunk(documents)
+        self.assertEqual(both.summary()["flagged_records"], 1)
+        self.assertEqual(ReconciliationReport(tolerance_abs=100).add_chunk(documents)["over_claim_categories"].sum(), 0)
+
+    def test_missing_values_are_not_compared(self):
+        report = ReconciliationReport()
+        rows = report.add_chunk([
+            # Claimed with no approved (master) value
+            claim("no-excel", user=100.0),
+            # Approved but not claimed
+            claim("no-user", excel=250.0),
+            claim("both", 100.0, 150.0),
+            claim("neither"),
+        ])
+        summary = report.summary()
+        row = category(summary)
+        self.assertEqual((row["over_claim_records"], row["mismatched_records"]), (1, 1))
+        self.assertEqual((row["missing_excel_records"], row["missing_user_records"]), (1, 1))
+        self.assertEqual((row["excel_total"], row["user_total"], row["variance"]), (350.0, 250.0, 50.0))
+        self.assertEqual((summary["flagged_records"], summary["records_with_missing_values"]), (1, 2))
+        self.assertEqual(summary["variance"], 50.0)
+        self.assertEqual([item["id"] for item in summary["top_over_claims"]], ["both"])
+        self.assertEqual(rows.set_index("id")["missing_values"].to_dict(),
+                         {"no-excel": 1, "no-user": 1, "both": 0, "neither": 0})
+        self.assertEqual(rows.set_index("id")["variance"].to_dict(),
+                         {"no-excel": 0.0, "no-user": 0.0, "both": 50.0, "neither": 0.0})
+        self.assertEqual(len(summary["categories"]), len(CATEGORIES))
+
+
+class TestReconcile(unittest.TestCase):
+    def test_streams_chunks(self):
+        collection = AsyncMongoMockClient()["test_reconciliation"].reimbursement_records
+        documents = [claim(f"r{i}", 100.0, 100.0 + i) for i in range(25)] + [claim("gap", user=500.0)]
+        asyncio.run(collection.insert_many(documents))
+        chunks = []
+        summary = asyncio.run(reconcile(collection, tolerance_abs=10, top=3, batch_size=10,
+                                        on_chunk=lambda rows: chunks.append(len(rows))))
+        self.assertEqual(sum(chunks), 26)
+        self.assertEqual((summary["records"], summary["flagged_records"]), (26, 14))
+        self.assertEqual([row["id"] for row in summary["top_over_claims"]], ["r24", "r23", "r22"])
+        self.assertEqual(category(summary)["missing_excel_records"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
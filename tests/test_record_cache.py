@@ -0,0 +1,200 @@
+"""
+Record cache tests: LRU/TTL behaviour, races with in-flight reads, invalidation on API writes
+and change-stream invalidation
+
+The change-stream test at the end needs a replica set (a single-node one is
+enough, e.g. `mongod --replSet rs0` + `rs.initiate()`); set MONGO_URL to run it.
+"""
+import asyncio
+import os
+import sys
+import time
+import unittest
+import uuid
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent / "backend"))
+
+from fastapi.testclient import TestClient
+from pymongo.errors import OperationFailure
+
+from record_cache import RecordCache
+from tests.memory_app import memory_app
+
+MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+
+
+class FakeStream:
+    def __init__(self, events, error=None):
+        self.events = events
+        self.error = error
+        self.resume_token = None
+
+    async def __aenter__(self):
+        if self.error:
+            raise self.error
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        event = await self.events.get()
+        self.resume_token = {"_data": id(event)}
+        return event
+
+
+class WatchedCollection:
+    def __init__(self, error=None):
+        self.events = asyncio.Queue()
+        self.error = error
+        self.opened = 0
+
+    def watch(self, pipeline, resume_after=None):
+        self.opened += 1
+        return FakeStream(self.events, self.error)
+
+
+class TestRecordCache(unittest.TestCase):
+    def test_hit_miss_and_lru_eviction(self):
+        cache = RecordCache(max_size=2)
+        for record_id in ("a", "b"):
+            cache.set(record_id, f"oid-{record_id}", b"{}", '"1"', cache.sequence())
+        cache.get("a")
+        cache.set("c", "oid-c", b"{}", '"1"', cache.sequence())
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), (b"{}", '"1"'))
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["size"]), (2, 1, 2))
+        self.assertEqual(stats["evictions"], {"capacity": 1})
+
+    def test_fallback_ttl_without_change_stream(self):
+        cache = RecordCache(ttl=300, fallback_ttl=0.01)
+        cache.set("a", "oid-a", b"{}", '"1"', cache.sequence())
+        time.sleep(0.02)
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.stats()["evictions"], {"expired": 1})
+
+    def test_change_during_read_is_not_cached(self):
+        cache = RecordCache()
+        read_sequence = cache.sequence()
+        cache.invalidate_object_id("oid-a")
+        cache.set("a", "oid-a", b"{}", '"1"', read_sequence)
+        self.assertIsNone(cache.get("a"))
+        cache.set("a", "oid-a", b"{}", '"2"', cache.sequence())
+        self.assertEqual(cache.get("a"), (b"{}", '"2"'))
+
+    def test_change_events_evict_by_object_id(self):
+        async def run():
+            cache, collection = RecordCache(fallback_ttl=0.01), WatchedCollection()
+            watcher = asyncio.create_task(cache.watch(collection))
+            await asyncio.sleep(0)
+            cache.set("a", "oid-a", b"{}", '"1"', cache.sequence())
+            cached_while_watching = cache.get("a")
+            collection.events.put_nowait({"operationType": "update", "documentKey": {"_id": "oid-a"}})
+            await asyncio.sleep(0.01)
+            after_update = cache.get("a")
+            watcher.cancel()
+            return cache, cached_while_watching, after_update
+
+        cache, cached_while_watching, after_update = asyncio.run(run())
+        self.assertIsNotNone(cached_while_watching)
+        self.assertIsNone(after_update)
+        self.assertEqual(cache.stats()["evictions"], {"change_stream": 1})
+        self.assertFalse(cache.watching)
+
+    def test_unsupported_change_streams_fall_back_to_ttl(self):
+        async def run():
+            cache = RecordCache()
+            error = OperationFailure("The $changeStream stage is only supported on replica sets", code=40573)
+            await asyncio.wait_for(cache.watch(WatchedCollection(error)), 1)
+            return cache
+
+        self.assertFalse(asyncio.run(run()).watching)
+
+
+class TestRecordCacheEndpoint(unittest.TestCase):
+    """GET /api/reimbursement/{id} serves from the cache until a write through the API invalidates it"""
+
+    def setUp(self):
+        # memory:// has no change streams, so entries live for the fallback TTL
+        self.app = memory_app(self, "test_record_cache", record_cache_fallback_ttl=0.2)
+
+    def test_writes_invalidate_the_cached_record(self):
+        with TestClient(self.app) as client:
+            cache = self.app.state.services.record_cache
+            record_id = client.post("/api/reimbursement", json={"name_user": "Priya"}).json()["id"]
+            first = client.get(f"/api/reimbursement/{record_id}")
+            self.assertEqual(client.get(f"/api/reimbursement/{record_id}").content, first.content)
+            self.assertEqual((cache.stats()["hits"], cache.stats()["size"]), (1, 1))
+
+            response = client.put(f"/api/reimbursement/{record_id}", json={"name_user": "Priya S"},
+                                  headers={"If-Match": first.headers["etag"]})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(cache.stats()["evictions"], {"write": 1})
+            record = client.get(f"/api/reimbursement/{record_id}")
+            self.assertEqual((record.json()["name_user"], record.headers["etag"]), ("Priya S", '"2"'))
+
+            # A write that loses its If-Match race still evicts, and the next read is current
+            stale = client.put(f"/api/reimbursement/{record_id}", json={"name_user": "Old"},
+                               headers={"If-Match": first.headers["etag"]})
+            self.assertEqual(stale.status_code, 409)
+            self.assertEqual(client.get(f"/api/reimbursement/{record_id}").json()["name_user"], "Priya S")
+
+    def test_writes_outside_the_api_expire_with_the_fallback_ttl(self):
+        with TestClient(self.app) as client:
+            record_id = client.post("/api/reimbursement", json={"name_user": "Priya"}).json()["id"]
+            client.get(f"/api/reimbursement/{record_id}")
+            asyncio.run(self.app.state.services.db.reimbursement_records.update_one(
+                {"id": record_id}, {"$set": {"name_user": "Changed elsewhere"}, "$inc": {"version": 1}}
+            ))
+            self.assertEqual(client.get(f"/api/reimbursement/{record_id}").json()["name_user"], "Priya")
+            time.sleep(0.25)
+            self.assertEqual(client.get(f"/api/reimbursement/{record_id}").json()["name_user"], "Changed elsewhere")
+            self.assertEqual(self.app.state.services.record_cache.stats()["evictions"], {"expired": 1})
+
+
+class TestRecordCacheReplicaSet(unittest.TestCase):
+    """Another client's update evicts the cached record through the change stream"""
+
+    def test_update_from_another_client_evicts(self):
+        from motor.motor_asyncio import AsyncIOMotorClient
+        from pymongo import MongoClient
+        from pymongo.errors import PyMongoError
+
+        try:
+            hello = MongoClient(MONGO_URL, serverSelectionTimeoutMS=1000).admin.command("hello")
+        except PyMongoError:
+            self.skipTest(f"No MongoDB reachable at {MONGO_URL}")
+        if "setName" not in hello:
+            self.skipTest(f"MongoDB at {MONGO_URL} is not a replica set")
+
+        async def run():
+            client = AsyncIOMotorClient(MONGO_URL)
+            collection = client["test_record_cache"][f"records_{uuid.uuid4().hex[:8]}"]
+            cache = RecordCache(fallback_ttl=0)
+            watcher = asyncio.create_task(cache.watch(collection))
+            try:
+                inserted = await collection.insert_one({"id": "a", "version": 1})
+                for _ in range(100):
+                    if cache.watching:
+                        break
+                    await asyncio.sleep(0.05)
+                cache.set("a", inserted.inserted_id, b"{}", '"1"', cache.sequence())
+                cached = cache.get("a")
+                await collection.update_one({"id": "a"}, {"$inc": {"version": 1}})
+                for _ in range(100):
+                    if cache.get("a") is None:
+                        break
+                    await asyncio.sleep(0.05)
+                return cached, cache.get("a")
+            finally:
+                watcher.cancel()
+                await collection.drop()
+                client.close()
+
+        cached, after_update = asyncio.run(run())
+        self.assertIsNotNone(cached)
+        self.assertIsNone(after_update)
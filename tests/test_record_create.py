@@ -0,0 +1,75 @@
+"""
+Record create tests: POST /api/reimbursement keeps the response shape of the
+hand-written ReimbursementRecord model it replaced
+
+Runs through the API in its memory:// mode.
+"""
+import asyncio
+import sys
+import unittest
+from datetime import datetime
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent / "backend"))
+
+from fastapi.testclient import TestClient
+
+from tests.memory_app import memory_app
+
+# Field order of the hand-written model: Excel then user fields per group
+BASIC = ["city_code", "name", "state", "city_assigned", "mobile", "email", "num_exam_centres"]
+BANK = ["bank_name", "ifsc", "beneficiary_name", "bank_account_number"]
+CLAIMS = [
+    "city_coordinator_claim", "admin_staff_claim", "support_staff_claim", "refreshment_claim", "observer_claim",
+    "num_observers", "claim_district_personnel", "assistant_staff_district", "support_staff_district",
+    "claim_police_personnel", "support_staff_police", "duty_magistrate_claim", "num_duty_magistrates",
+    "team_leader_claim", "num_team_leaders", "police_escort_claim", "num_police_escort", "police_frisking_claim",
+    "num_police_frisking", "security_personnel_claim", "num_security_personnel", "bank_custodian_claim",
+    "district_education_officer_claim", "support_staff_deo_claim",
+]
+HISTORICAL_FIELDS = [
+    "id", "sno",
+    *(f"{name}_{side}" for group in (BASIC, BANK, CLAIMS) for side in ("excel", "user") for name in group),
+    "supporting_document_bills", "version", "created_at", "updated_at",
+]
+
+
+class TestCreateResponse(unittest.TestCase):
+    def setUp(self):
+        self.app = memory_app(self, "test_record_create")
+
+    def test_response_shape(self):
+        with TestClient(self.app) as client:
+            response = client.post("/api/reimbursement", json={
+                "name_user": "Priya", "num_exam_centres_user": "3", "refreshment_claim_user": "150",
+                "observer_claim_user": 20,
+            })
+            self.assertEqual(response.status_code, 200)
+            record = response.json()
+            self.assertEqual(list(record), HISTORICAL_FIELDS)
+
+            # Numbers are coerced to the field types, and everything unset is a default
+            self.assertEqual(record["num_exam_centres_user"], 3)
+            self.assertEqual(record["refreshment_claim_user"], 150.0)
+            self.assertIsInstance(record["observer_claim_user"], float)
+            self.assertEqual(record["version"], 1)
+            unset = set(HISTORICAL_FIELDS) - {
+                "id", "name_user", "num_exam_centres_user", "refreshment_claim_user", "observer_claim_user",
+                "version", "created_at", "updated_at",
+            }
+            self.assertEqual({name: record[name] for name in unset}, dict.fromkeys(unset))
+            self.assertEqual(record["created_at"], record["updated_at"])
+            datetime.fromisoformat(record["created_at"])
+
+            # The stored document has the search fields; the response does not
+            stored = asyncio.run(self.app.state.services.db.reimbursement_records.find_one({"id": record["id"]}))
+            self.assertIn("search_keys", stored)
+            self.assertEqual(set(record), set(stored) - {"_id", "search_keys", "search_rank_keys"})
+
+    def test_invalid_number_is_rejected(self):
+        with TestClient(self.app) as client:
+            response = client.post("/api/reimbursement", json={"num_exam_centres_user": "three"})
+            self.assertEqual(response.status_code, 422)
+
+
+if __name__ == "__main__":
+    unittest.main()
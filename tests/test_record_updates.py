@@ -0,0 +1,88 @@
+"""
+Record update tests: PUT /api/reimbursement/{id} with If-Match version checks, and
+the search keys it refreshes
+
+Runs through the API in its memory:// mode.
+"""
+import asyncio
+import sys
+import unittest
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent / "backend"))
+
+from fastapi.testclient import TestClient
+
+from tests.memory_app import memory_app
+
+
+class TestIfMatch(unittest.TestCase):
+    def setUp(self):
+        self.app = memory_app(self, "test_record_updates")
+
+    def create(self, client) -> str:
+        return client.post("/api/reimbursement", json={"name_user": "Priya"}).json()["id"]
+
+    def put(self, client, record_id: str, if_match=None, name: str = "Priya S"):
+        headers = {"If-Match": if_match} if if_match is not None else {}
+        return client.put(f"/api/reimbursement/{record_id}", json={"name_user": name}, headers=headers)
+
+    def test_current_version_updates(self):
+        with TestClient(self.app) as client:
+            record_id = self.create(client)
+            response = self.put(client, record_id, '"1"')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual((response.json()["version"], response.headers["etag"]), (2, '"2"'))
+
+    def test_stale_version_is_a_conflict(self):
+        with TestClient(self.app) as client:
+            record_id = self.create(client)
+            self.assertEqual(self.put(client, record_id, '"1"').status_code, 200)
+            response = self.put(client, record_id, '"1"', name="Old")
+            self.assertEqual(response.status_code, 409)
+            self.assertEqual(client.get(f"/api/reimbursement/{record_id}").json()["name_user"], "Priya S")
+
+    def test_malformed_if_match_is_a_bad_request(self):
+        with TestClient(self.app) as client:
+            record_id = self.create(client)
+            for if_match in ("abc", '"v1"', '"1", "2"'):
+                self.assertEqual(self.put(client, record_id, if_match).status_code, 400, if_match)
+            self.assertEqual(client.get(f"/api/reimbursement/{record_id}").json()["version"], 1)
+
+    def test_any_and_weak_versions(self):
+        with TestClient(self.app) as client:
+            record_id = self.create(client)
+            self.assertEqual(self.put(client, record_id, "*").status_code, 200)
+            self.assertEqual(self.put(client, record_id, 'W/"2"').status_code, 200)
+            self.assertEqual(self.put(client, record_id, 'W/"2"').status_code, 409)
+            self.assertEqual(client.get(f"/api/reimbursement/{record_id}").json()["version"], 3)
+
+    def test_zero_matches_records_without_a_version(self):
+        with TestClient(self.app) as client:
+            # Written before records were versioned
+            asyncio.run(self.app.state.services.db.reimbursement_records.insert_one(
+                {"id": "legacy", "name_user": "Meera"}
+            ))
+            response = self.put(client, "legacy", '"0"')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.headers["etag"], '"1"')
+            self.assertEqual(self.put(client, "legacy", '"0"').status_code, 409)
+
+    def test_unknown_id_is_not_found(self):
+        with TestClient(self.app) as client:
+            self.assertEqual(self.put(client, "missing", '"1"').status_code, 404)
+            self.assertEqual(self.put(client, "missing").status_code, 404)
+
+    def test_search_keys_follow_search_fields(self):
+        with TestClient(self.app) as client:
+            record_id = self.create(client)
+            records = self.app.state.services.db.reimbursement_records
+            self.assertEqual(self.put(client, record_id, '"1"', name="Arjun").status_code, 200)
+            keys = asyncio.run(records.find_one({"id": record_id}))["search_keys"]
+            self.assertIn("arjun", keys)
+            self.assertNotIn("priya", keys)
+            results = client.get("/api/reimbursement/search", params={"q": "arj"}).json()["results"]
+            self.assertEqual([result["id"] for result in results], [record_id])
+
+
+if __name__ == "__main__":
+    unittest.main()
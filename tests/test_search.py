@@ -0,0 +1,148 @@
+"""
+Search tests: key normalization, query tokens, ranking and projection
+
+search_records runs against the in-memory stand-in (mongomock-motor), which
+evaluates the multikey prefix filter and the rank-key tier queries; the
+endpoint goes through the API in its memory:// mode.
+"""
+import asyncio
+import sys
+import unittest
+from pathlib import Path
+from unittest import mock
+sys.path.append(str(Path(__file__).resolve().parent.parent / "backend"))
+
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+from search import (
+    MIN_CANDIDATES, SEARCH_RANK_FIELD, prefix_candidates, query_tokens, rank, rank_tiers, search_keys, search_rank_keys, search_records,
+    touches_search_fields, with_search_keys
+)
+from tests.memory_app import memory_app
+
+RECORDS = [
+    {"id": "1", "name_excel": "Priya Sharma", "name_user": "Priya Sharma", "city_assigned_excel": "Pune",
+     "email_excel": "priya.sharma1@nta.gov.in", "mobile_excel": "+91 98765 43210", "ifsc_excel": "SBIN0001234",
+     "state_user": "Maharashtra"},
+    {"id": "2", "name_excel": "Rahul Priyadarshi", "city_assigned_excel": "Patna", "email_excel": "rahul.p2@nta.gov.in",
+     "mobile_excel": "9123456780", "ifsc_excel": "HDFC0000042", "state_user": "Bihar"},
+    {"id": "3", "name_excel": "Ananya Rao", "city_assigned_excel": "Bengaluru", "email_excel": "ananya.rao3@nta.gov.in",
+     "mobile_excel": "9988776655", "ifsc_excel": "ICIC0000077", "state_user": "Karnataka"},
+]
+
+
+def search(q, records=RECORDS, **options):
+    async def run():
+        collection = AsyncMongoMockClient()["test_search"].reimbursement_records
+        await collection.insert_many([with_search_keys(record) for record in records])
+        return await search_records(collection, q, **options)
+
+    return asyncio.run(run())
+
+
+class TestSearchKeys(unittest.TestCase):
+    def test_keys_are_normalized_tokens(self):
+        keys = search_keys({"name_excel": "José  D'Souza", "email_user": "J.DSouza@NTA.gov.in",
+                            "mobile_user": "+91 98765-43210", "ifsc_excel": "SBIN0001234"})
+        self.assertEqual(keys, ["9876543210", "d", "dsouza", "gov", "in", "j", "jose", "nta", "sbin0001234", "souza"])
+
+    def test_query_tokens(self):
+        self.assertEqual(query_tokens("  Priya SHAR "), ["priya", "shar"])
+        self.assertEqual(query_tokens("98765 43210"), ["9876543210"])
+        self.assertEqual(query_tokens("!!"), [])
+
+    def test_touches_search_fields(self):
+        self.assertTrue(touches_search_fields({"city_assigned_user": "Pune", "updated_at": None}))
+        self.assertFalse(touches_search_fields({"bank_name_user": "SBI"}))
+
+
+class TestSearchRecords(unittest.TestCase):
+    def test_prefix_match_ranks_name_start_first(self):
+        result = search("priya")
+        self.assertEqual(result["mode"], "prefix")
+        self.assertEqual([document["id"] for document in result["results"]], ["1", "2"])
+        self.assertGreater(result["results"][0]["score"], result["results"][1]["score"])
+
+    def test_all_tokens_must_match(self):
+        self.assertEqual([document["id"] for document in search("priya pat")["results"]], ["2"])
+
+    def test_mobile_email_and_ifsc(self):
+        self.assertEqual(search("98765")["results"][0]["id"], "1")
+        self.assertEqual(search("ananya.ra")["results"][0]["id"], "3")
+        self.assertEqual(search("hdfc00")["results"][0]["id"], "2")
+
+    def test_projection_filter_and_limit(self):
+        result = search("nta", limit=2, projection={"state_user": 1}, query={"state_user": "Bihar"})
+        self.assertEqual(result["results"], [{"id": "2", "state_user": "Bihar", "score": 15.0}])
+        self.assertEqual(len(search("nta", limit=2)["results"]), 2)
+
+    def test_top_k_does_not_depend_on_insertion_order(self):
+        # Many weak matches (a later word starts with the token) stored before the one exact name
+        weak = [{"id": f"w{i:03d}", "name_excel": f"Rahul Priyadarshi {i}", "city_assigned_excel": "Patna"}
+                for i in range(200)]
+        strong = {"id": "s", "name_excel": "Priya Sharma", "city_assigned_excel": "Pune"}
+        for records in (weak + [strong], [strong] + weak):
+            results = search("priya", records=records, limit=3)["results"]
+            self.assertEqual([document["id"] for document in results], ["s", "w000", "w001"])
+
+    def test_tier_scores_match_rank(self):
+        def tier_score(keys, token):
+            for score, tier in rank_tiers(token):
+                for condition in tier[SEARCH_RANK_FIELD]["$in"]:
+                    if any(key == condition if isinstance(condition, str) else condition.search(key) for key in keys):
+                        return score
+            return 0.0
+
+        records = RECORDS + [{"id": "4", "name_user": "José Élan", "city_assigned_user": "Thiruvananthapuram"}]
+        for record in records:
+            keys = search_rank_keys(record)
+            for token in ("priya", "sha", "pat", "98765", "9876543210", "ananya", "ra", "hdfc00", "nta", "jose",
+                          "elan", "thiru", "zzz"):
+                self.assertEqual(tier_score(keys, token), rank(record, [token]), (record["id"], token))
+
+    def test_candidates_are_bounded_by_the_limit(self):
+        # Every record matches "p"; only the best tiers are read, up to the candidate budget
+        records = [{"id": f"r{i:03d}", "name_excel": f"Pooja Patel {i}", "city_assigned_excel": "Pune"}
+                   for i in range(300)]
+        records.append({"id": "exact", "name_excel": "P Patel", "city_assigned_excel": "Pune"})
+
+        async def run():
+            collection = AsyncMongoMockClient()["test_search_bounded"].reimbursement_records
+            await collection.insert_many([with_search_keys(record) for record in records])
+            read = []
+
+            async def counting_candidates(*args):
+                candidates = await prefix_candidates(*args)
+                read.extend(candidates)
+                return candidates
+
+            with mock.patch("search.prefix_candidates", side_effect=counting_candidates):
+                return await search_records(collection, "p", limit=5), read
+
+        result, read = asyncio.run(run())
+        self.assertEqual([document["id"] for document in result["results"]], ["exact", "r000", "r001", "r002", "r003"])
+        self.assertEqual(result["results"][0]["score"], 30.0)
+        self.assertEqual(len(read), MIN_CANDIDATES)
+
+    def test_accented_names_rank_like_their_ascii_form(self):
+        records = [{"id": "1", "name_excel": "Jose Kumar"}, {"id": "2", "name_excel": "Kumar José"}]
+        results = search("jose", records=records)["results"]
+        self.assertEqual([(document["id"], document["score"]) for document in results], [("1", 30.0), ("2", 30.0)])
+
+
+class TestSearchEndpoint(unittest.TestCase):
+    def setUp(self):
+        self.app = memory_app(self, "test_search")
+
+    def test_no_match_is_an_empty_result(self):
+        with TestClient(self.app) as client:
+            client.post("/api/reimbursement", json={"name_user": "Priya Sharma", "city_assigned_user": "Pune"})
+            response = client.get("/api/reimbursement/search", params={"q": "zzzz"})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()["results"], [])
+            response = client.get("/api/reimbursement/search", params={"q": "priya", "mode": "text"})
+            self.assertEqual((response.status_code, response.json()["results"]), (200, []))
+            results = client.get("/api/reimbursement/search", params={"q": "pri"}).json()["results"]
+            self.assertEqual([document["name_user"] for document in results], ["Priya Sharma"])
+            self.assertNotIn("search_rank_keys", results[0])
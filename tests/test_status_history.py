@@ -0,0 +1,170 @@
+"""
+Status check history tests: TTL setup, latest-per-client and per-minute counts
+
+Queries run against the in-memory stand-in (mongomock-motor) and through the
+API in its memory:// mode. The time-series test needs a mongod 5.0+ at
+MONGO_URL and is skipped without one.
+"""
+import asyncio
+import os
+import sys
+import unittest
+import uuid
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent / "backend"))
+
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+from status_history import (
+    TTL_INDEX, counts_per_interval, ensure_status_collection, interval_start, latest_per_client, utc
+)
+from tests.memory_app import memory_app
+
+MONGO_URL = os.environ.get("MONGO_URL", "mongodb://localhost:27017")
+T0 = datetime(2026, 3, 1, 12, 0)
+
+
+def checks(t0: datetime = T0):
+    """Heartbeats: ci at t0+10s and t0+2m30s, web at t0+40s"""
+    return [
+        {"id": "a", "client_name": "ci", "timestamp": t0 + timedelta(seconds=10)},
+        {"id": "b", "client_name": "web", "timestamp": t0 + timedelta(seconds=40)},
+        {"id": "c", "client_name": "ci", "timestamp": t0 + timedelta(minutes=2, seconds=30)},
+    ]
+
+
+class TestIntervals(unittest.TestCase):
+    def test_interval_start(self):
+        self.assertEqual(interval_start(datetime(2026, 3, 1, 12, 7, 59), 1), datetime(2026, 3, 1, 12, 7))
+        self.assertEqual(interval_start(datetime(2026, 3, 1, 12, 7, 59), 5), datetime(2026, 3, 1, 12, 5))
+
+    def test_utc(self):
+        aware = datetime(2026, 3, 1, 17, 30, tzinfo=timezone(timedelta(hours=5, minutes=30)))
+        self.assertEqual(utc(aware), T0)
+        self.assertEqual(utc(T0), T0)
+
+
+class TestQueries(unittest.TestCase):
+    def setUp(self):
+        self.db = AsyncMongoMockClient()["test_status_history"]
+        asyncio.run(self.db.status_checks.insert_many(checks()))
+
+    def test_latest_per_client(self):
+        latest = asyncio.run(latest_per_client(self.db.status_checks))
+        self.assertEqual([(check["client_name"], check["id"]) for check in latest], [("ci", "c"), ("web", "b")])
+        recent = asyncio.run(latest_per_client(self.db.status_checks, since=T0 + timedelta(minutes=1)))
+        self.assertEqual([check["client_name"] for check in recent], ["ci"])
+
+    def test_counts_are_zero_filled(self):
+        counts = asyncio.run(counts_per_interval(self.db.status_checks, T0, T0 + timedelta(minutes=4)))
+        self.assertEqual([interval["count"] for interval in counts], [2, 0, 1, 0])
+        self.assertEqual(counts[2]["start"], T0 + timedelta(minutes=2))
+
+    def test_counts_per_client_and_width(self):
+        counts = asyncio.run(counts_per_interval(
+            self.db.status_checks, T0, T0 + timedelta(minutes=4), minutes=2, client_name="ci"
+        ))
+        self.assertEqual([(interval["start"], interval["count"]) for interval in counts],
+                         [(T0, 1), (T0 + timedelta(minutes=2), 1)])
+
+    def test_ttl_index_fallback(self):
+        self.assertEqual(asyncio.run(ensure_status_collection(self.db, 3600, timeseries=False)), "collection")
+        indexes = asyncio.run(self.db.status_checks.index_information())
+        self.assertEqual(indexes[TTL_INDEX]["expireAfterSeconds"], 3600)
+        asyncio.run(ensure_status_collection(self.db, 0, timeseries=False))
+        self.assertNotIn(TTL_INDEX, asyncio.run(self.db.status_checks.index_information()))
+
+
+class TestStatusEndpoints(unittest.TestCase):
+    def setUp(self):
+        self.app = memory_app(self, "test_status")
+
+    def test_latest_and_counts(self):
+        with TestClient(self.app) as client:
+            for name in ("ci", "web", "ci"):
+                self.assertEqual(client.post("/api/status", json={"client_name": name}).status_code, 200)
+            latest = client.get("/api/status/latest").json()["clients"]
+            self.assertEqual([check["client_name"] for check in latest], ["ci", "web"])
+            counts = client.get("/api/status/counts").json()
+            self.assertEqual(counts["total"], 3)
+            self.assertEqual(len(counts["counts"]), 61)
+            self.assertEqual(client.get("/api/status/counts", params={"client_name": "web"}).json()["total"], 1)
+
+    def test_counts_window_validation(self):
+        with TestClient(self.app) as client:
+            backwards = {"start": "2026-03-01T13:00:00", "end": "2026-03-01T12:00:00"}
+            self.assertEqual(client.get("/api/status/counts", params=backwards).status_code, 400)
+            week = {"start": "2026-03-01T00:00:00", "end": "2026-03-08T00:00:00"}
+            self.assertEqual(client.get("/api/status/counts", params=week).status_code, 400)
+            self.assertEqual(client.get("/api/status/counts", params={**week, "minutes": 60}).status_code, 200)
+
+    def test_counts_with_utc_offsets(self):
+        t0 = datetime.utcnow().replace(second=0, microsecond=0) - timedelta(minutes=10)
+        with TestClient(self.app) as client:
+            asyncio.run(self.app.state.services.db.status_checks.insert_many(checks(t0)))
+            counts = client.get("/api/status/counts", params={"start": f"{t0.isoformat()}Z"})
+            self.assertEqual(counts.status_code, 200)
+            self.assertEqual(counts.json()["total"], 3)
+            ist = (t0 + timedelta(hours=5, minutes=30)).isoformat() + "+05:30"
+            window = {"start": ist, "end": f"{(t0 + timedelta(minutes=1)).isoformat()}Z"}
+            self.assertEqual(client.get("/api/status/counts", params=window).json()["total"], 2)
+            backwards = {"start": f"{t0.isoformat()}Z", "end": f"{t0.isoformat()}Z"}
+            self.assertEqual(client.get("/api/status/counts", params=backwards).status_code, 400)
+
+    def test_listing_window(self):
+        # Recent, or the 30-day TTL index (which the stand-in enforces) would hide them
+        t0 = datetime.utcnow().replace(second=0, microsecond=0) - timedelta(minutes=10)
+        with TestClient(self.app) as client:
+            asyncio.run(self.app.state.services.db.status_checks.insert_many(checks(t0)))
+            window = {"start": (t0 + timedelta(seconds=30)).isoformat(), "end": (t0 + timedelta(minutes=5)).isoformat()}
+            items = client.get("/api/status", params=window).json()["items"]
+            self.assertEqual([item["id"] for item in items], ["b", "c"])
+
+
+class TestTimeSeries(unittest.TestCase):
+    """Time-series creation and queries against a real mongod"""
+
+    def setUp(self):
+        try:
+            version = MongoClient(MONGO_URL, serverSelectionTimeoutMS=1000).server_info()["versionArray"]
+        except PyMongoError:
+            self.skipTest(f"No MongoDB reachable at {MONGO_URL}")
+        if version < [5, 0]:
+            self.skipTest("Time-series collections need MongoDB 5.0+")
+        self.db_name = f"test_status_history_{uuid.uuid4().hex[:8]}"
+
+    def tearDown(self):
+        MongoClient(MONGO_URL).drop_database(self.db_name)
+
+    def test_timeseries_with_ttl(self):
+        from motor.motor_asyncio import AsyncIOMotorClient
+
+        async def run():
+            client = AsyncIOMotorClient(MONGO_URL)
+            db = client[self.db_name]
+            try:
+                kind = await ensure_status_collection(db, 3600)
+                await ensure_status_collection(db, 7200)
+                info = await (await db.list_collections(filter={"name": "status_checks"})).to_list(None)
+                now = datetime.utcnow().replace(microsecond=0)
+                await db.status_checks.insert_many(checks(now - timedelta(minutes=5)))
+                latest = await latest_per_client(db.status_checks)
+                counts = await counts_per_interval(db.status_checks, now - timedelta(minutes=10), now)
+                return kind, info[0], latest, counts
+            finally:
+                client.close()
+
+        kind, info, latest, counts = asyncio.run(run())
+        self.assertEqual(kind, "timeseries")
+        self.assertEqual(info["type"], "timeseries")
+        self.assertEqual(info["options"]["expireAfterSeconds"], 7200)
+        self.assertEqual([(check["client_name"], check["id"]) for check in latest], [("ci", "c"), ("web", "b")])
+        self.assertEqual(sum(interval["count"] for interval in counts), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+"""
+Summary tests: $inc delta maintenance, the stale marker on a lost delta or one applied
+during a rebuild, and the $out rebuild
+
+Runs against the in-memory stand-in (mongomock-motor), directly and through
+the API in its memory:// mode.
+"""
+import asyncio
+import json
+import sys
+import unittest
+from pathlib import Path
+from unittest import mock
+sys.path.append(str(Path(__file__).resolve().parent.parent / "backend"))
+
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+from summaries import (
+    SUMMARY_COLLECTION, live_summary, materialized_summary, rebuild_summaries, record_summary_changes, summaries_stale
+)
+from tests.memory_app import memory_app
+
+
+def record(state, city, refreshment=0.0, centres=1):
+    return {"state_user": state, "city_assigned_user": city, "refreshment_claim_user": refreshment,
+            "num_exam_centres_user": centres}
+
+
+def rows(summary):
+    return {(row["state"], row["city"]): (row["records"], row["refreshment_claim"], row["num_exam_centres"])
+            for row in summary}
+
+
+class TestDeltas(unittest.TestCase):
+    def setUp(self):
+        self.db = AsyncMongoMockClient()["test_summaries"]
+
+    def test_deltas_match_live_totals(self):
+        async def run():
+            records = [record("KA", "Mysuru", 100.0), record("KA", "Mysuru", 50.0, 2), record("TN", "Madurai", 10.0)]
+            await self.db.reimbursement_records.insert_many([dict(r) for r in records])
+            await record_summary_changes(self.db, [(None, r) for r in records])
+            # Edit one claim in place, move another to a new city
+            moved = {**records[2], "city_assigned_user": "Chennai"}
+            edited = {**records[0], "refreshment_claim_user": 120.0}
+            await self.db.reimbursement_records.update_one({"city_assigned_user": "Madurai"},
+                                                           {"$set": {"city_assigned_user": "Chennai"}})
+            await self.db.reimbursement_records.update_one({"refreshment_claim_user": 100.0},
+                                                           {"$set": {"refreshment_claim_user": 120.0}})
+            await record_summary_changes(self.db, [(records[2], moved), (records[0], edited)])
+            return (await materialized_summary(self.db[SUMMARY_COLLECTION]),
+                    await live_summary(self.db.reimbursement_records))
+
+        materialized, live = asyncio.run(run())
+        self.assertEqual(rows(materialized), rows(live))
+        self.assertEqual(rows(materialized), {("KA", "Mysuru"): (2, 170.0, 3), ("TN", "Chennai"): (1, 10.0, 1)})
+        self.assertFalse(asyncio.run(summaries_stale(self.db)))
+
+    def test_rebuild_replaces_drifted_rows(self):
+        async def run():
+            await self.db.reimbursement_records.insert_many([record("KA", "Mysuru", 100.0), record("KL", "Kochi", 5.0)])
+            await self.db[SUMMARY_COLLECTION].insert_one(
+                {"_id": {"state": "KA", "city": "Mysuru"}, "records": 7, "refreshment_claim": 1.0})
+            count = await rebuild_summaries(self.db.reimbursement_records)
+            return count, await materialized_summary(self.db[SUMMARY_COLLECTION])
+
+        count, materialized = asyncio.run(run())
+        self.assertEqual(count, 2)
+        self.assertEqual(rows(materialized), {("KA", "Mysuru"): (1, 100.0, 1), ("KL", "Kochi"): (1, 5.0, 1)})
+        self.assertFalse(asyncio.run(summaries_stale(self.db)))
+
+    def test_delta_during_rebuild_keeps_summaries_stale(self):
+        records = self.db.reimbursement_records
+        aggregate = records.aggregate
+        stale_while_rebuilding = []
+
+        def aggregate_with_delta(pipeline):
+            # A write lands after the rebuild read the records, and before $out replaces the rows
+            cursor = aggregate(pipeline)
+            to_list = cursor.to_list
+
+            async def delta_then_to_list(length):
+                stale_while_rebuilding.append(await summaries_stale(self.db))
+                await record_summary_changes(self.db, [(None, record("KA", "Udupi", 20.0))])
+                return await to_list(length)
+
+            cursor.to_list = delta_then_to_list
+            return cursor
+
+        asyncio.run(records.insert_one(record("KA", "Mysuru", 100.0)))
+        with mock.patch.object(records, "aggregate", aggregate_with_delta):
+            asyncio.run(rebuild_summaries(records))
+        self.assertEqual(stale_while_rebuilding, [True])
+        self.assertTrue(asyncio.run(summaries_stale(self.db)))
+
+        # Nothing lands during the next rebuild, which clears the marker
+        asyncio.run(rebuild_summaries(records))
+        self.assertFalse(asyncio.run(summaries_stale(self.db)))
+
+
+class TestImportSummaries(unittest.TestCase):
+    def setUp(self):
+        self.app = memory_app(self, "test_import_summaries")
+
+    def import_rows(self, client, records):
+        body = "\n".join(json.dumps(r) for r in records)
+        response = client.post("/api/reimbursement/import", files={"file": ("rows.ndjson", body)},
+                               params={"chunk_size": 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["inserted"], len(records))
+
+    def test_import_keeps_summaries_current(self):
+        with TestClient(self.app) as client:
+            self.import_rows(client, [record("KA", "Mysuru", 100.0), record("KA", "Udupi", 20.0),
+                                      record("KA", "Mysuru", 30.0)])
+            materialized = client.get("/api/reports/summary").json()
+            self.assertEqual(rows(materialized), rows(client.get("/api/reports/summary", params={"live": True}).json()))
+            self.assertEqual(rows(materialized)[("KA", "Mysuru")], (2, 130.0, 2))
+
+    def test_lost_delta_marks_summaries_for_rebuild(self):
+        with TestClient(self.app) as client:
+            db = self.app.state.services.db
+            self.import_rows(client, [record("KA", "Mysuru", 100.0)])
+            with mock.patch("summaries.apply_summary_deltas", side_effect=RuntimeError("write concern timeout")):
+                with self.assertLogs(level="ERROR"):
+                    self.import_rows(client, [record("KA", "Mysuru", 30.0), record("TN", "Madurai", 5.0)])
+            self.assertTrue(asyncio.run(summaries_stale(db)))
+            # The maintained rows missed the second import; readers get live totals meanwhile
+            self.assertEqual(rows(asyncio.run(materialized_summary(db[SUMMARY_COLLECTION]))),
+                             {("KA", "Mysuru"): (1, 100.0, 1)})
+            expected = {("KA", "Mysuru"): (2, 130.0, 2), ("TN", "Madurai"): (1, 5.0, 1)}
+            self.assertEqual(rows(client.get("/api/reports/summary").json()), expected)
+
+            asyncio.run(rebuild_summaries(db.reimbursement_records))
+            self.assertFalse(asyncio.run(summaries_stale(db)))
+            self.assertEqual(rows(asyncio.run(materialized_summary(db[SUMMARY_COLLECTION]))), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+"""
+Synthetic dataset tests: determinism, schema conformance and distributions
+"""
+import sys
+import unittest
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent / "backend"))
+
+from models import ReimbursementRecord
+from search import search_fields
+from synthetic_data import BASE_FIELDS, generate_record_batch, generate_status_check_batch
+
+
+class TestSyntheticRecords(unittest.TestCase):
+    def test_same_seed_same_batch(self):
+        self.assertEqual(generate_record_batch(7, 3, 100, 1000), generate_record_batch(7, 3, 100, 1000))
+        self.assertNotEqual(generate_record_batch(7, 3, 100, 1000), generate_record_batch(8, 3, 100, 1000))
+
+    def test_batches_cover_count_once(self):
+        batches = [generate_record_batch(1, index, 40, 100) for index in range(3)]
+        self.assertEqual([len(batch) for batch in batches], [40, 40, 20])
+        snos = [document["sno"] for batch in batches for document in batch]
+        self.assertEqual(snos, list(range(1, 101)))
+        self.assertEqual(len({document["id"] for batch in batches for document in batch}), 100)
+
+    def test_documents_match_record_schema(self):
+        for document in generate_record_batch(3, 0, 200, 200):
+            keys = {name: document.pop(name) for name in search_fields(document)}
+            self.assertEqual(list(document), list(ReimbursementRecord.model_fields))
+            self.assertEqual(ReimbursementRecord.model_validate(document).model_dump(), document)
+            self.assertEqual(keys, search_fields(document))
+
+    def test_mismatch_and_unsubmitted_rates(self):
+        documents = generate_record_batch(5, 0, 5000, 5000, mismatch_rate=0.2, unsubmitted_rate=0.1)
+        submitted = [document for document in documents if document["name_user"] is not None]
+        mismatched = [
+            document for document in submitted
+            if any(document[f"{name}_user"] != document[f"{name}_excel"] for name in BASE_FIELDS)
+        ]
+        self.assertAlmostEqual(1 - len(submitted) / len(documents), 0.1, delta=0.02)
+        self.assertAlmostEqual(len(mismatched) / len(submitted), 0.2, delta=0.03)
+
+
+class TestSyntheticStatusChecks(unittest.TestCase):
+    def test_timestamps_ascend_across_batches(self):
+        checks = [check for index in range(4) for check in generate_status_check_batch(2, index, 25, 100)]
+        self.assertEqual(len(checks), 100)
+        timestamps = [check["timestamp"] for check in checks]
+        self.assertEqual(timestamps, sorted(timestamps))
@@ -0,0 +1,124 @@
+"""
+Template-data tests: workbook index lookups, reloads on change and the template-data endpoints
+
+TemplateStore is checked against a workbook written to a temp dir; the
+endpoints go through the API in its memory:// mode.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent / "backend"))
+
+from fastapi.testclient import TestClient
+from openpyxl import Workbook
+
+from template_data import SAMPLE_TEMPLATE_DATA, TemplateStore
+from tests.memory_app import memory_app
+
+HEADERS = ["City Code", "name_excel", "city_assigned", "email", "num_exam_centres"]
+ROWS = [
+    ["MYS001", "Priya Sharma", "Mysuru", "priya@nta.gov.in", 4],
+    ["MYS002", "Arjun Rao", "mysuru ", "arjun@nta.gov.in", 2],
+    ["MDU001", "Meera Iyer", "Madurai", "meera@nta.gov.in", 3],
+]
+
+
+def write_workbook(path, rows):
+    workbook = Workbook()
+    workbook.active.append(HEADERS)
+    for row in rows:
+        workbook.active.append(row)
+    workbook.save(path)
+
+
+class TestTemplateStore(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.path = Path(self.dir.name) / "master.xlsx"
+        write_workbook(self.path, ROWS)
+        self.store = TemplateStore(self.path, check_interval=0)
+
+    def lookup(self, **kwargs):
+        return asyncio.run(self.store.lookup(**kwargs))
+
+    def test_lookups(self):
+        row = self.lookup(city_code=" mys002")
+        self.assertEqual((row["name_excel"], row["num_exam_centres_excel"]), ("Arjun Rao", 2))
+        self.assertEqual(self.lookup(email="MEERA@NTA.GOV.IN")["city_code_excel"], "MDU001")
+        self.assertIsNone(self.lookup(city="Chennai"))
+        self.assertEqual(self.lookup()["city_code_excel"], "MYS001")
+
+    def test_by_city_returns_first_match(self):
+        # Both Mysuru rows normalize to the same key; the first in the sheet wins
+        self.assertEqual(self.lookup(city="MYSURU")["city_code_excel"], "MYS001")
+        self.assertEqual(len(asyncio.run(self.store.get_index()).by_city), 2)
+
+    def test_reloads_changed_workbook(self):
+        etag = asyncio.run(self.store.etag())
+        write_workbook(self.path, ROWS[1:])
+        # Same-second writes can keep the mtime; bump it so the change is seen
+        stat = os.stat(self.path)
+        os.utime(self.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+        self.assertEqual(self.lookup(city="Mysuru")["city_code_excel"], "MYS002")
+        self.assertIsNone(self.lookup(city_code="MYS001"))
+        self.assertNotEqual(asyncio.run(self.store.etag()), etag)
+
+    def test_unconfigured(self):
+        store = TemplateStore(None)
+        self.assertFalse(store.configured)
+        self.assertIsNone(asyncio.run(store.lookup(city="Mysuru")))
+
+
+class TestTemplateEndpoints(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+        self.path = Path(self.dir.name) / "master.xlsx"
+        write_workbook(self.path, ROWS)
+
+    def client(self, **settings):
+        return TestClient(memory_app(self, "test_template_data", **settings))
+
+    def test_lookups(self):
+        with self.client(template_xlsx_path=str(self.path)) as client:
+            response = client.get("/api/template-data", params={"city": "mysuru"})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()["city_code_excel"], "MYS001")
+            etag = response.headers["etag"]
+            self.assertEqual(client.get("/api/template-data", params={"city": "Mysuru"},
+                                        headers={"If-None-Match": etag}).status_code, 304)
+
+            self.assertEqual(client.get("/api/template-data", params={"email": "arjun@nta.gov.in"}).json()["name_excel"],
+                             "Arjun Rao")
+            self.assertEqual(client.get("/api/template-data/mdu001").json()["name_excel"], "Meera Iyer")
+            self.assertEqual(client.get("/api/template-data", params={"city": "Chennai"}).status_code, 404)
+            self.assertEqual(client.get("/api/template-data/XXX999").status_code, 404)
+
+    def test_lookup_without_params(self):
+        with self.client(template_xlsx_path=str(self.path)) as client:
+            # The first row, as before lookups were added
+            response = client.get("/api/template-data")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()["city_code_excel"], "MYS001")
+            etag = response.headers["etag"]
+            self.assertEqual(client.get("/api/template-data", headers={"If-None-Match": etag}).status_code, 304)
+            self.assertEqual(client.get("/api/template-data", params={"city": ""}).status_code, 400)
+
+    def test_empty_workbook_without_params(self):
+        write_workbook(self.path, [])
+        with self.client(template_xlsx_path=str(self.path)) as client:
+            self.assertEqual(client.get("/api/template-data").status_code, 404)
+
+    def test_sample_data_without_workbook(self):
+        with self.client() as client:
+            response = client.get("/api/template-data")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), SAMPLE_TEMPLATE_DATA)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,188 @@
+"""
+Upload tests: one write per content among concurrent identical uploads, and the size cap ahead of body parsing
+
+Claims run against the in-memory stand-in (mongomock-motor); the size cap
+against the API in its memory:// mode.
+"""
+import asyncio
+import io
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent / "backend"))
+
+from fastapi.testclient import TestClient
+from mongomock_motor import AsyncMongoMockClient
+
+from storage import UPLOAD_METADATA_COLLECTION, UploadInProgressError, UploadMetadataCache, find_upload, save_upload
+from storage_backends import LocalStorage
+from tests.memory_app import memory_app, uploads_dir
+
+
+class FakeUpload:
+    def __init__(self, filename, data):
+        self.filename = filename
+        self._stream = io.BytesIO(data)
+
+    async def read(self, size=-1):
+        return self._stream.read(size)
+
+
+class SlowStorage(LocalStorage):
+    """Local storage whose writes take a while and are counted.
+
+    Fails while `failing` is set, or the next `failures` writes; with a
+    `gate` event, writes also wait for it.
+    """
+
+    def __init__(self, root):
+        super().__init__(root)
+        self.writes = 0
+        self.failing = False
+        self.failures = 0
+        self.gate = None
+        self.stored_when_returned = []
+
+    async def put_file(self, filename, spool_path, content_type):
+        self.writes += 1
+        await asyncio.sleep(0.05)
+        if self.gate is not None:
+            await self.gate.wait()
+        if self.failing or self.failures:
+            self.failures = max(self.failures - 1, 0)
+            raise OSError("disk full")
+        await super().put_file(filename, spool_path, content_type)
+
+
+class TestUploadClaims(unittest.TestCase):
+    data = b"%PDF-1.4 bill" * 1000
+
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+        self.backend = SlowStorage(Path(self.root.name))
+        self.db = AsyncMongoMockClient()["test_uploads"]
+        asyncio.run(self.db[UPLOAD_METADATA_COLLECTION].create_index("filename", unique=True))
+
+    async def upload(self, name="bill.pdf", **kwargs):
+        stored = await save_upload(FakeUpload(name, self.data), self.backend, db=self.db, **kwargs)
+        self.backend.stored_when_returned.append((Path(self.root.name) / stored["filename"]).exists())
+        return stored
+
+    def test_concurrent_identical_uploads_write_once(self):
+        async def run():
+            return await asyncio.gather(*(self.upload(f"copy-{i}.pdf") for i in range(5)))
+
+        results = asyncio.run(run())
+        self.assertEqual(self.backend.writes, 1)
+        self.assertEqual(sorted(result["deduplicated"] for result in results), [False] + [True] * 4)
+        # Every duplicate returned after the file was stored
+        self.assertEqual(self.backend.stored_when_returned, [True] * 5)
+        entry = asyncio.run(self.db[UPLOAD_METADATA_COLLECTION].find_one({}))
+        self.assertTrue(entry["stored"])
+        self.assertNotIn("claimed_at", entry)
+        self.assertEqual(list(self.backend.spool_dir.glob(".*.part")), [])
+
+    def test_failed_write_releases_the_claim(self):
+        self.backend.failing = True
+        with self.assertRaises(OSError):
+            asyncio.run(self.upload())
+        self.backend.failing = False
+        stored = asyncio.run(self.upload())
+        self.assertFalse(stored["deduplicated"])
+        self.assertTrue((Path(self.root.name) / stored["filename"]).exists())
+
+    async def claimed(self):
+        """Wait until an upload has claimed the write"""
+        while await self.db[UPLOAD_METADATA_COLLECTION].find_one({"stored": False}) is None:
+            await asyncio.sleep(0.01)
+
+    def test_duplicate_of_a_failed_write_writes_it(self):
+        async def run():
+            self.backend.gate = asyncio.Event()
+            self.backend.failures = 1
+            first = asyncio.create_task(self.upload("first.pdf"))
+            await self.claimed()
+            duplicate = asyncio.create_task(self.upload("second.pdf"))
+            # The first write fails while the duplicate is waiting for it
+            await asyncio.sleep(0.2)
+            self.backend.gate.set()
+            return await asyncio.gather(first, duplicate, return_exceptions=True)
+
+        first, duplicate = asyncio.run(run())
+        self.assertIsInstance(first, OSError)
+        self.assertFalse(duplicate["deduplicated"])
+        self.assertEqual(self.backend.writes, 2)
+        self.assertEqual(self.backend.stored_when_returned, [True])
+
+    def test_duplicate_gives_up_after_the_wait_timeout(self):
+        async def run():
+            self.backend.gate = asyncio.Event()
+            first = asyncio.create_task(self.upload("first.pdf"))
+            await self.claimed()
+            with self.assertRaises(UploadInProgressError):
+                await self.upload("second.pdf", wait_timeout=0.05)
+            self.backend.gate.set()
+            return await first
+
+        self.assertFalse(asyncio.run(run())["deduplicated"])
+        self.assertEqual(self.backend.writes, 1)
+
+    def test_stale_claim_is_taken_over(self):
+        stored = asyncio.run(save_upload(FakeUpload("bill.pdf", self.data), LocalStorage(Path(tempfile.mkdtemp()))))
+        # A writer that died mid-write long ago
+        asyncio.run(self.db[UPLOAD_METADATA_COLLECTION].insert_one({
+            "filename": stored["filename"], "stored": False, "claimed_at": datetime(2020, 1, 1),
+        }))
+        self.assertIsNone(asyncio.run(find_upload(self.db, UploadMetadataCache(), stored["filename"])))
+        self.assertFalse(asyncio.run(self.upload())["deduplicated"])
+        self.assertEqual(self.backend.writes, 1)
+        self.assertEqual(asyncio.run(find_upload(self.db, UploadMetadataCache(), stored["filename"]))["size"],
+                         len(self.data))
+
+
+class TestUploadSizeLimit(unittest.TestCase):
+    max_bytes = 1024
+
+    def setUp(self):
+        self.app = memory_app(self, "test_upload_limit", max_upload_bytes=self.max_bytes)
+
+    def test_content_length_over_the_limit(self):
+        with TestClient(self.app) as client:
+            response = client.post("/api/upload", files={"file": ("big.pdf", b"x" * 200_000)})
+            self.assertEqual(response.status_code, 413)
+            self.assertIn(str(self.max_bytes), response.json()["detail"])
+            # Within the multipart allowance, but still over the cap on the file itself
+            self.assertEqual(client.post("/api/upload", files={"file": ("big.pdf", b"x" * 2048)}).status_code, 413)
+            self.assertEqual(client.post("/api/upload", files={"file": ("small.pdf", b"x" * 512)}).status_code, 200)
+        self.assertEqual(len(list(uploads_dir(self.app).iterdir())), 1)
+
+    def test_chunked_body_is_cut_off(self):
+        chunk, chunks = b"x" * 16 * 1024, 100
+        head = b'--b\r\nContent-Disposition: form-data; name="file"; filename="big.pdf"\r\n\r\n'
+        pulled = 0
+        sent = []
+
+        async def receive():
+            nonlocal pulled
+            pulled += 1
+            return {"type": "http.request", "body": head if pulled == 1 else chunk, "more_body": pulled <= chunks}
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST", "scheme": "http",
+            "path": "/api/upload", "raw_path": b"/api/upload", "root_path": "", "query_string": b"",
+            "headers": [(b"content-type", b"multipart/form-data; boundary=b"), (b"transfer-encoding", b"chunked")],
+            "client": ("testclient", 50000), "server": ("testserver", 80),
+        }
+        asyncio.run(self.app(scope, receive, send))
+        self.assertEqual(sent[0]["status"], 413)
+        self.assertLess(pulled, chunks // 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
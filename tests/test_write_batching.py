@@ -0,0 +1,96 @@
+"""
+Group-commit tests: batching by size and delay, per-document errors, flush on close
+"""
+import asyncio
+import sys
+import unittest
+from pathlib import Path
+sys.path.append(str(Path(__file__).resolve().parent.parent / "backend"))
+
+from pymongo.errors import AutoReconnect, BulkWriteError, DuplicateKeyError
+
+from write_batching import WriteCoalescer
+
+
+class RecordingCollection:
+    name = "status_checks"
+
+    def __init__(self, duplicate_ids=(), error=None):
+        self.batches = []
+        self.duplicate_ids = set(duplicate_ids)
+        self.error = error
+
+    async def insert_many(self, documents, ordered=True):
+        self.batches.append([document["id"] for document in documents])
+        if self.error:
+            raise self.error
+        write_errors = []
+        for index, document in enumerate(documents):
+            if document["id"] in self.duplicate_ids:
+                write_errors.append({"index": index, "code": 11000, "errmsg": f"duplicate id {document['id']}"})
+            else:
+                document["_id"] = f"oid-{document['id']}"
+        if write_errors:
+            raise BulkWriteError({"writeErrors": write_errors, "nInserted": len(documents) - len(write_errors)})
+
+
+class TestWriteCoalescer(unittest.TestCase):
+    def test_concurrent_inserts_share_batches_of_max_size(self):
+        async def run():
+            collection = RecordingCollection()
+            coalescer = WriteCoalescer(max_batch=10, max_delay=1.0)
+            ids = await asyncio.gather(*(coalescer.insert(collection, {"id": i}) for i in range(25)))
+            await coalescer.close()
+            return collection, ids
+
+        collection, ids = asyncio.run(run())
+        self.assertEqual(ids, [f"oid-{i}" for i in range(25)])
+        self.assertEqual([len(batch) for batch in collection.batches], [10, 10, 5])
+
+    def test_lone_insert_flushed_after_delay(self):
+        async def run():
+            collection = RecordingCollection()
+            coalescer = WriteCoalescer(max_batch=100, max_delay=0.01)
+            started = asyncio.get_running_loop().time()
+            inserted_id = await coalescer.insert(collection, {"id": "a"})
+            return inserted_id, asyncio.get_running_loop().time() - started
+
+        inserted_id, elapsed = asyncio.run(run())
+        self.assertEqual(inserted_id, "oid-a")
+        self.assertGreaterEqual(elapsed, 0.009)
+
+    def test_each_caller_gets_its_own_error(self):
+        async def run():
+            collection = RecordingCollection(duplicate_ids={"b"})
+            coalescer = WriteCoalescer(max_batch=3, max_delay=1.0)
+            return await asyncio.gather(
+                *(coalescer.insert(collection, {"id": i}) for i in ("a", "b", "c")), return_exceptions=True
+            )
+
+        a, b, c = asyncio.run(run())
+        self.assertEqual((a, c), ("oid-a", "oid-c"))
+        self.assertIsInstance(b, DuplicateKeyError)
+
+    def test_batch_failure_reaches_every_caller(self):
+        async def run():
+            collection = RecordingCollection(error=AutoReconnect("connection reset"))
+            coalescer = WriteCoalescer(max_batch=2, max_delay=1.0)
+            return await asyncio.gather(
+                *(coalescer.insert(collection, {"id": i}) for i in range(2)), return_exceptions=True
+            )
+
+        for result in asyncio.run(run()):
+            self.assertIsInstance(result, AutoReconnect)
+
+    def test_close_flushes_pending_documents(self):
+        async def run():
+            collection = RecordingCollection()
+            coalescer = WriteCoalescer(max_batch=100, max_delay=60.0)
+            pending = asyncio.ensure_future(coalescer.insert(collection, {"id": "late"}))
+            await asyncio.sleep(0)
+            await coalescer.close()
+            return collection, await pending
+
+        collection, inserted_id = asyncio.run(run())
+        self.assertEqual(collection.batches, [["late"]])
+        self.assertEqual(inserted_id, "oid-late")